@@ -0,0 +1,221 @@
+"""
+Buffered writes for activity and analytics rows.
+
+Every authenticated mobile request used to confirm the user's daily
+'mobile_active' row (SELECT, then INSERT + COMMIT on the request's session),
+and the landing-page trackers and web activity log committed one row per
+event. Hot read endpoints paid a write transaction for bookkeeping.
+
+Now events go into a per-instance buffer:
+
+  * mark_active(user_id): at most one 'mobile_active' event per user per UTC
+    day per instance (the in-process memo skips repeats with no I/O);
+  * record_activity / record_page_view / record_link_click: one buffered row
+    each, stamped at record time.
+
+The buffer is written on its own connection (never the request's session)
+in bulk at the end of any request that left it non-empty: one existence
+check plus one multi-row INSERT for DAU rows, one multi-row INSERT per
+analytics table. Requests that queue nothing (the common case for an
+authenticated mobile call once the user's DAU row is in) do no I/O. Outside
+a Flask request the buffer flushes inline once it holds
+ACTIVITY_FLUSH_EVERY events or its oldest event is FLUSH_INTERVAL_S old.
+user_activity has no unique key, so DAU rows already written by another
+instance are filtered by the existence check rather than ON CONFLICT; the
+rare cross-instance duplicate is harmless because retention counts DISTINCT
+(user, day). A failed flush drops its rows and forgets the DAU memo for
+those users, so their next request queues them again.
+
+A frozen or recycled serverless instance never runs atexit, so nothing is
+left buffered between requests: at most the events of requests still in
+flight are lost.
+Benchmark against the old per-event commits: scripts/benchmark_activity_sink.py.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FLUSH_EVERY = max(1, int(os.environ.get('ACTIVITY_FLUSH_EVERY', '50')))
+FLUSH_INTERVAL_S = 30       # flush a partial buffer once it is this old
+ACTIVE_TYPE = 'mobile_active'
+
+
+class ActivityBuffer:
+    """Pending activity rows for this instance, plus the DAU memo."""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._seen = {}          # user_id -> date of the last queued/confirmed ping
+        self._active = {}        # (user_id, date) -> timestamp
+        self._rows = {}          # table name -> [row dict]
+        self._started = None
+
+    def _touch(self):
+        if self._started is None:
+            self._started = self._clock()
+
+    def mark_active(self, user_id, now=None):
+        now = now or datetime.utcnow()
+        day = now.date()
+        with self._lock:
+            if self._seen.get(user_id) == day:
+                return False
+            self._seen[user_id] = day
+            self._touch()
+            self._active[(user_id, day)] = now
+            return True
+
+    def add(self, table, row):
+        with self._lock:
+            self._touch()
+            self._rows.setdefault(table, []).append(row)
+
+    def pending(self):
+        return len(self._active) + sum(len(rows) for rows in self._rows.values())
+
+    def flush_due(self):
+        return self._started is not None and (
+            self.pending() >= FLUSH_EVERY or self._clock() - self._started >= FLUSH_INTERVAL_S)
+
+    def take(self):
+        with self._lock:
+            active, rows = self._active, self._rows
+            self._active, self._rows, self._started = {}, {}, None
+            return active, rows
+
+    def forget(self, keys):
+        """Let these (user_id, date) pings be queued again (their write failed)."""
+        with self._lock:
+            for user_id, day in keys:
+                if self._seen.get(user_id) == day:
+                    del self._seen[user_id]
+
+    def reset(self):
+        with self._lock:
+            self._seen.clear()
+            self._active, self._rows, self._started = {}, {}, None
+
+
+buffer = ActivityBuffer()
+_engine_getter = None       # set by init_app(); without it, flush inline when due
+
+
+def _default_engine():
+    from models import db
+    return db.engine
+
+
+def _flush_if_due():
+    if _engine_getter is None and buffer.flush_due():
+        flush()
+
+
+def mark_active(user_id):
+    """Queue today's 'mobile_active' row for user_id (once per day per instance)."""
+    if buffer.mark_active(user_id):
+        _flush_if_due()
+
+
+def record_activity(user_id, activity_type, ip_address=None, user_agent=None):
+    buffer.add('user_activity', {
+        'user_id': user_id, 'activity_type': activity_type, 'timestamp': datetime.utcnow(),
+        'ip_address': ip_address, 'user_agent': user_agent,
+    })
+    _flush_if_due()
+
+
+def record_page_view(page='/', referrer=None, utm_source=None, utm_medium=None,
+                     utm_campaign=None, user_agent=None, ip_hash=None):
+    buffer.add('page_view', {
+        'page': page, 'referrer': referrer, 'utm_source': utm_source, 'utm_medium': utm_medium,
+        'utm_campaign': utm_campaign, 'user_agent': user_agent, 'ip_hash': ip_hash,
+        'created_at': datetime.utcnow(),
+    })
+    _flush_if_due()
+
+
+def record_link_click(platform, source_page=None, utm_source=None, utm_campaign=None,
+                      user_agent=None, ip_hash=None):
+    buffer.add('link_click', {
+        'platform': platform, 'source_page': source_page, 'utm_source': utm_source,
+        'utm_campaign': utm_campaign, 'user_agent': user_agent, 'ip_hash': ip_hash,
+        'created_at': datetime.utcnow(),
+    })
+    _flush_if_due()
+
+
+def _write_active(conn, active):
+    from sqlalchemy import insert, select
+    from models import UserActivity
+    table = UserActivity.__table__
+    existing = {
+        (user_id, ts.date()) for user_id, ts in conn.execute(
+            select(table.c.user_id, table.c.timestamp).where(
+                table.c.activity_type == ACTIVE_TYPE,
+                table.c.user_id.in_(sorted({user_id for user_id, _day in active})),
+                table.c.timestamp >= datetime.combine(min(day for _uid, day in active), datetime.min.time()),
+                table.c.timestamp < datetime.combine(max(day for _uid, day in active), datetime.min.time())
+                + timedelta(days=1),
+            ))
+    }
+    rows = [{'user_id': user_id, 'activity_type': ACTIVE_TYPE, 'timestamp': ts}
+            for (user_id, day), ts in active.items() if (user_id, day) not in existing]
+    if rows:
+        conn.execute(insert(table), rows)
+    return len(rows)
+
+
+def flush(engine=None):
+    """Write everything buffered; returns rows inserted. Never raises."""
+    active, rows = buffer.take()
+    if not active and not rows:
+        return 0
+    from sqlalchemy import insert
+    from models import UserActivity, PageView, LinkClick
+    tables = {t.__tablename__: t.__table__ for t in (UserActivity, PageView, LinkClick)}
+    written = 0
+    try:
+        engine = engine or (_engine_getter or _default_engine)()
+        with engine.begin() as conn:
+            if active:
+                written += _write_active(conn, active)
+            for name, batch in rows.items():
+                conn.execute(insert(tables[name]), batch)
+                written += len(batch)
+        return written
+    except Exception as e:
+        buffer.forget(active)
+        logger.warning(f"activity flush failed ({len(active) + sum(map(len, rows.values()))} events dropped): {e}")
+        return 0
+
+
+def reset():
+    """Drop buffered events and the DAU memo (tests, benchmarks)."""
+    buffer.reset()
+
+
+def init_app(app, engine_getter):
+    """Flush at the end of every request that left events buffered (and at
+    interpreter exit, for local servers). `engine_getter()` is called lazily,
+    inside the app context."""
+    global _engine_getter
+    _engine_getter = engine_getter
+
+    @app.teardown_request
+    def flush_activity(exc=None):
+        if buffer.pending():
+            flush()
+
+    def flush_at_exit():
+        if buffer.pending():
+            with app.app_context():
+                flush()
+
+    atexit.register(flush_at_exit)
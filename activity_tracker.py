@@ -2,8 +2,8 @@
 User activity tracking utilities for accurate active user metrics
 """
 from datetime import datetime
-from models import db, UserActivity
 from flask import request
+import activity_sink
 
 def log_user_activity(user_id, activity_type, ip_address=None, user_agent=None):
     """
@@ -22,19 +22,11 @@ def log_user_activity(user_id, activity_type, ip_address=None, user_agent=None):
         if user_agent is None and request:
             user_agent = request.headers.get('User-Agent', '')[:255]  # Truncate to fit column
         
-        activity = UserActivity(
-            user_id=user_id,
-            activity_type=activity_type,
-            ip_address=ip_address,
-            user_agent=user_agent
-        )
-        
-        db.session.add(activity)
-        db.session.commit()
+        # Buffered: written in bulk by activity_sink, not committed per event
+        activity_sink.record_activity(user_id, activity_type, ip_address, user_agent)
         
     except Exception as e:
         print(f"Error logging user activity: {str(e)}")
-        db.session.rollback()
 
 def log_login_activity(user_id):
     """Log user login activity"""
@@ -628,6 +628,22 @@ def update_user_subscription():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/api/retier-subscriptions', methods=['POST'])
+@admin_required
+def retier_subscriptions():
+    """Re-tier every priced user from the 7-day trade counter in one set-based
+    UPDATE. With {"rebuild": true} the counter is first recounted from the
+    transaction ledger (after manual ledger fixes)."""
+    from subscription_utils import rebuild_trade_counts, retier_all_users
+    data = request.get_json(silent=True) or {}
+    try:
+        recounted = rebuild_trade_counts() if data.get('rebuild') else None
+        repriced = retier_all_users()
+        return jsonify({'success': True, 'counter_rows_rebuilt': recounted, 'users_repriced': repriced})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/comprehensive-leaderboard-fix')
 @admin_required
 def comprehensive_leaderboard_fix():
@@ -3,7 +3,7 @@ Admin dashboard metrics utilities for tracking platform health
 """
 from datetime import datetime, date, timedelta
 from models import db, Stock, StockInfo, User, UserActivity, AlphaVantageAPILog, PlatformMetrics, PortfolioSnapshot
-from sqlalchemy import func, distinct, and_
+from sqlalchemy import func, distinct, and_, case
 
 def log_alpha_vantage_call(endpoint, symbol=None, response_status='success', response_time_ms=None):
     """
@@ -28,24 +28,37 @@ def log_alpha_vantage_call(endpoint, symbol=None, response_status='success', res
         print(f"Error logging Alpha Vantage API call: {str(e)}")
         db.session.rollback()
 
+ACTIVE_USER_WINDOWS = (1, 7, 30, 90)  # days; PlatformMetrics.active_users_<n>d
+
 def calculate_unique_stocks_count():
     """Calculate the number of unique stocks being tracked"""
     try:
-        # Count distinct stock symbols from both Stock and StockInfo tables
-        stock_symbols = db.session.query(distinct(Stock.ticker)).all()
-        stock_info_symbols = db.session.query(distinct(StockInfo.ticker)).all()
-        
-        all_symbols = set()
-        for (symbol,) in stock_symbols:
-            all_symbols.add(symbol.upper())
-        for (symbol,) in stock_info_symbols:
-            all_symbols.add(symbol.upper())
-            
-        return len(all_symbols)
+        # Distinct symbols across both Stock and StockInfo, de-duplicated in SQL
+        symbols = db.session.query(Stock.ticker.label('ticker')).union(
+            db.session.query(StockInfo.ticker)
+        ).subquery()
+        return db.session.query(func.count(distinct(func.upper(symbols.c.ticker)))).scalar() or 0
     except Exception as e:
         print(f"Error calculating unique stocks count: {str(e)}")
         return 0
 
+def active_users_by_window(windows=ACTIVE_USER_WINDOWS, now=None):
+    """
+    Distinct active users for every look-back window in one scan of
+    user_activity: COUNT(DISTINCT CASE WHEN timestamp >= cutoff THEN user_id END)
+    per window over the widest window's rows.
+
+    Returns:
+        dict: {days: active user count}
+    """
+    now = now or datetime.utcnow()
+    windows = sorted(windows)
+    counts = db.session.query(*[
+        func.count(distinct(case((UserActivity.timestamp >= now - timedelta(days=days), UserActivity.user_id))))
+        for days in windows
+    ]).filter(UserActivity.timestamp >= now - timedelta(days=windows[-1])).one()
+    return {days: count or 0 for days, count in zip(windows, counts)}
+
 def get_active_users_count(days=1):
     """
     Get count of active users in the last N days based on actual user activity
@@ -56,71 +69,133 @@ def get_active_users_count(days=1):
     Returns:
         int: Number of unique active users
     """
-    cutoff_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Count users who have logged activity in the time period
-    active_users = db.session.query(distinct(UserActivity.user_id)).filter(
-        UserActivity.timestamp >= cutoff_date
-    ).count()
-    
-    return active_users
+    return active_users_by_window((days,))[days]
 
 def calculate_active_users(days):
     """Calculate number of active users in the last N days based on actual activity"""
     try:
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        # Count users who have logged activity in the period
-        active_users = db.session.query(distinct(UserActivity.user_id)).filter(
-            UserActivity.timestamp >= cutoff_date
-        ).count()
-        
-        return active_users
+        return get_active_users_count(days)
     except Exception as e:
         print(f"Error calculating active users for {days} days: {str(e)}")
         return 0
 
+def _minute_bucket(column):
+    """Timestamp truncated to the minute, as the dialect spells it"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.date_trunc('minute', column)
+    return func.strftime('%Y-%m-%d %H:%M:00', column)
+
 def calculate_api_call_metrics(days=7):
     """
     Calculate Alpha Vantage API call metrics for the last N days
     Returns: (total_calls, avg_per_minute, peak_per_minute, peak_time)
+
+    One query: calls are rolled up per minute in SQL and the busiest minute
+    comes back with the window total (SUM over the rollup), instead of
+    loading every log row to bucket them in Python.
     """
     try:
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        # Get all API calls in the period
-        api_calls = AlphaVantageAPILog.query.filter(
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        minute = _minute_bucket(AlphaVantageAPILog.timestamp).label('minute')
+        calls = func.count(AlphaVantageAPILog.id)
+        peak = db.session.query(
+            minute, calls.label('calls'), func.sum(calls).over().label('total')
+        ).filter(
             AlphaVantageAPILog.timestamp >= cutoff_date
-        ).all()
+        ).group_by(minute).order_by(calls.desc(), minute.desc()).first()
         
-        if not api_calls:
+        if not peak:
             return 0, 0.0, 0, None
         
-        total_calls = len(api_calls)
+        total_calls = int(peak.total)
         total_minutes = days * 24 * 60
         avg_per_minute = total_calls / total_minutes if total_minutes > 0 else 0
+        peak_time = peak.minute
+        if isinstance(peak_time, str):
+            peak_time = datetime.strptime(peak_time, '%Y-%m-%d %H:%M:%S')
         
-        # Calculate peak calls per minute
-        # Group calls by minute and find the highest count
-        calls_by_minute = {}
-        for call in api_calls:
-            minute_key = call.timestamp.replace(second=0, microsecond=0)
-            calls_by_minute[minute_key] = calls_by_minute.get(minute_key, 0) + 1
-        
-        if calls_by_minute:
-            peak_minute = max(calls_by_minute, key=calls_by_minute.get)
-            peak_per_minute = calls_by_minute[peak_minute]
-            peak_time = peak_minute
-        else:
-            peak_per_minute = 0
-            peak_time = None
-        
-        return total_calls, round(avg_per_minute, 2), peak_per_minute, peak_time
+        return total_calls, round(avg_per_minute, 2), peak.calls, peak_time
         
     except Exception as e:
         print(f"Error calculating API call metrics: {str(e)}")
         return 0, 0.0, 0, None
 
+def compute_platform_metrics():
+    """
+    All dashboard metrics in three aggregate queries (stocks, windowed active
+    users, API-call rollup), independent of user and log volume.
+    """
+    try:
+        active = active_users_by_window()
+    except Exception as e:
+        print(f"Error calculating active users: {str(e)}")
+        active = {days: 0 for days in ACTIVE_USER_WINDOWS}
+    total_calls, avg_per_min, peak_per_min, peak_time = calculate_api_call_metrics(7)
+    return {
+        'unique_stocks_count': calculate_unique_stocks_count(),
+        'active_users_1d': active[1],
+        'active_users_7d': active[7],
+        'active_users_30d': active[30],
+        'active_users_90d': active[90],
+        'api_calls_total': total_calls,
+        'api_calls_avg_per_minute': avg_per_min,
+        'api_calls_peak_per_minute': peak_per_min,
+        'api_calls_peak_time': peak_time,
+    }
+
+def subscriber_counts_by_creator():
+    """
+    Active real subscriptions and gifted (AdminSubscription bonus) subscribers
+    per creator, with the creator's User row, in one query.
+
+    Returns:
+        list of (user_id, User or None, real_subs, gifted_subs) for every
+        creator with at least one of either. Reads the creator_subscriber_count
+        rows once migrated; before that aggregates, falling back to real
+        subscriptions only if admin_subscription is missing.
+    """
+    from models import MobileSubscription, AdminSubscription, CreatorSubscriberCount as C
+    from sqlalchemy import literal, union
+    import subscriber_counts
+
+    if subscriber_counts.table_ready(db.session.connection(bind_arguments={'mapper': C.__mapper__})):
+        return [(uid, user, real or 0, gifted or 0) for uid, user, real, gifted in db.session.query(
+            C.user_id, User, C.real_subscriber_count, C.gifted_subscriber_count
+        ).outerjoin(User, User.id == C.user_id).filter(C.total_subscriber_count > 0).all()]
+
+    real = db.session.query(
+        MobileSubscription.subscribed_to_id.label('user_id'),
+        func.count(MobileSubscription.id).label('n'),
+    ).filter(MobileSubscription.status == 'active').group_by(MobileSubscription.subscribed_to_id).subquery()
+
+    def rows(include_gifted):
+        if include_gifted:
+            gifted = db.session.query(
+                AdminSubscription.portfolio_user_id.label('user_id'),
+                func.sum(AdminSubscription.bonus_subscriber_count).label('n'),
+            ).filter(AdminSubscription.bonus_subscriber_count > 0).group_by(
+                AdminSubscription.portfolio_user_id).subquery()
+            ids = union(db.session.query(real.c.user_id).statement,
+                        db.session.query(gifted.c.user_id).statement).subquery()
+            gifted_n = func.coalesce(gifted.c.n, 0)
+        else:
+            ids = db.session.query(real.c.user_id).subquery()
+            gifted_n = literal(0)
+        query = db.session.query(
+            ids.c.user_id, User, func.coalesce(real.c.n, 0), gifted_n
+        ).select_from(ids).outerjoin(User, User.id == ids.c.user_id).outerjoin(
+            real, real.c.user_id == ids.c.user_id)
+        if include_gifted:
+            query = query.outerjoin(gifted, gifted.c.user_id == ids.c.user_id)
+        return [(uid, user, int(r or 0), int(g or 0)) for uid, user, r, g in query.all()]
+
+    try:
+        return rows(include_gifted=True)
+    except Exception as e:
+        print(f"Gifted subscriptions unavailable, counting real only: {str(e)}")
+        db.session.rollback()
+        return rows(include_gifted=False)
+
 def update_daily_metrics():
     """
     Update daily platform metrics - called once per day
@@ -131,41 +206,15 @@ def update_daily_metrics():
         # Check if metrics already exist for today
         existing_metrics = PlatformMetrics.query.filter_by(date=today).first()
         
-        # Calculate all metrics
-        unique_stocks = calculate_unique_stocks_count()
-        active_1d = calculate_active_users(1)
-        active_7d = calculate_active_users(7)
-        active_30d = calculate_active_users(30)
-        active_90d = calculate_active_users(90)
-        
-        total_calls, avg_per_min, peak_per_min, peak_time = calculate_api_call_metrics(7)
+        values = compute_platform_metrics()
         
         if existing_metrics:
             # Update existing metrics
-            existing_metrics.unique_stocks_count = unique_stocks
-            existing_metrics.active_users_1d = active_1d
-            existing_metrics.active_users_7d = active_7d
-            existing_metrics.active_users_30d = active_30d
-            existing_metrics.active_users_90d = active_90d
-            existing_metrics.api_calls_total = total_calls
-            existing_metrics.api_calls_avg_per_minute = avg_per_min
-            existing_metrics.api_calls_peak_per_minute = peak_per_min
-            existing_metrics.api_calls_peak_time = peak_time
+            for field, value in values.items():
+                setattr(existing_metrics, field, value)
         else:
             # Create new metrics entry
-            metrics = PlatformMetrics(
-                date=today,
-                unique_stocks_count=unique_stocks,
-                active_users_1d=active_1d,
-                active_users_7d=active_7d,
-                active_users_30d=active_30d,
-                active_users_90d=active_90d,
-                api_calls_total=total_calls,
-                api_calls_avg_per_minute=avg_per_min,
-                api_calls_peak_per_minute=peak_per_min,
-                api_calls_peak_time=peak_time
-            )
-            db.session.add(metrics)
+            db.session.add(PlatformMetrics(date=today, **values))
         
         db.session.commit()
         return True
@@ -185,26 +234,22 @@ def get_admin_dashboard_metrics():
         
         if not latest_metrics:
             # Calculate on-demand if no cached metrics
-            unique_stocks = calculate_unique_stocks_count()
-            active_1d = calculate_active_users(1)
-            active_7d = calculate_active_users(7)
-            active_30d = calculate_active_users(30)
-            active_90d = calculate_active_users(90)
-            total_calls, avg_per_min, peak_per_min, peak_time = calculate_api_call_metrics(7)
+            values = compute_platform_metrics()
+            peak_time = values['api_calls_peak_time']
             
             return {
                 'date': date.today().isoformat(),
-                'unique_stocks_count': unique_stocks,
+                'unique_stocks_count': values['unique_stocks_count'],
                 'active_users': {
-                    '1_day': active_1d,
-                    '7_days': active_7d,
-                    '30_days': active_30d,
-                    '90_days': active_90d
+                    '1_day': values['active_users_1d'],
+                    '7_days': values['active_users_7d'],
+                    '30_days': values['active_users_30d'],
+                    '90_days': values['active_users_90d']
                 },
                 'api_calls': {
-                    'total_last_7_days': total_calls,
-                    'avg_per_minute_7_days': avg_per_min,
-                    'peak_per_minute_7_days': peak_per_min,
+                    'total_last_7_days': values['api_calls_total'],
+                    'avg_per_minute_7_days': values['api_calls_avg_per_minute'],
+                    'peak_per_minute_7_days': values['api_calls_peak_per_minute'],
                     'peak_time': peak_time.isoformat() if peak_time else None
                 },
                 'cached': False
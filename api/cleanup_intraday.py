@@ -1,10 +1,12 @@
 """
 Intraday data cleanup utility for the stock portfolio app.
-Removes old intraday snapshots while preserving 4:00 PM market close data.
+Removes old intraday snapshots while preserving 4:00 PM market close data,
+and prunes compact intraday series rows (intraday_series.py) past the same
+retention window.
 """
 
 from datetime import datetime, date, timedelta, time
-from models import db, PortfolioSnapshotIntraday
+from models import db, PortfolioSnapshotIntraday, PortfolioIntradaySeries
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,6 +14,9 @@ logger = logging.getLogger(__name__)
 def cleanup_old_intraday_data(days_to_keep=14):
     """
     Clean up old intraday snapshots while preserving 4:00 PM market close data.
+    Series rows for sessions before the cutoff are deleted outright (one
+    statement on ix_intraday_series_session_date); 4PM closes survive in the
+    legacy table.
     
     Args:
         days_to_keep (int): Number of days of intraday data to keep (default: 14)
@@ -26,6 +31,7 @@ def cleanup_old_intraday_data(days_to_keep=14):
         'snapshots_analyzed': 0,
         'snapshots_deleted': 0,
         'market_close_preserved': 0,
+        'series_deleted': 0,
         'errors': []
     }
     
@@ -54,9 +60,14 @@ def cleanup_old_intraday_data(days_to_keep=14):
                 results['errors'].append(error_msg)
                 logger.error(error_msg)
         
+        # Compact series: one row per user per session, nothing to preserve
+        results['series_deleted'] = PortfolioIntradaySeries.query.filter(
+            PortfolioIntradaySeries.session_date < cutoff_date
+        ).delete(synchronize_session=False)
+        
         # Commit deletions
         db.session.commit()
-        logger.info(f"Intraday cleanup completed: {results['snapshots_deleted']} deleted, {results['market_close_preserved']} preserved")
+        logger.info(f"Intraday cleanup completed: {results['snapshots_deleted']} deleted, {results['market_close_preserved']} preserved, {results['series_deleted']} series rows pruned")
         
     except Exception as e:
         db.session.rollback()
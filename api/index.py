@@ -22,11 +22,9 @@ from sqlalchemy.pool import NullPool
 from flask import Flask, render_template_string, render_template, redirect, url_for, request, session, flash, jsonify, send_from_directory, make_response
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_session import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
-from authlib.integrations.flask_client import OAuth
 import secrets
 import string
 import requests
@@ -82,7 +80,8 @@ def generate_portfolio_slug():
 def is_market_hours(dt=None):
     """
     Check if current time (or provided datetime) is during market hours
-    Market hours: Monday-Friday, 9:30 AM - 4:00 PM ET (excluding holidays)
+    Market hours: exchange sessions per trading_calendar, 9:30 AM - 4:00 PM ET
+    (1:00 PM on early-close days), excluding holidays
     
     Args:
         dt: datetime object (with timezone). If None, uses current ET time.
@@ -90,24 +89,8 @@ def is_market_hours(dt=None):
     Returns:
         bool: True if during market hours
     """
-    if dt is None:
-        dt = get_market_time()
-    
-    # Ensure datetime is in ET
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=MARKET_TZ)
-    elif dt.tzinfo != MARKET_TZ:
-        dt = dt.astimezone(MARKET_TZ)
-    
-    # Check if weekend
-    if dt.weekday() >= 5:  # Saturday=5, Sunday=6
-        return False
-    
-    # Check if within market hours (9:30 AM - 4:00 PM ET)
-    market_open = dt.replace(hour=9, minute=30, second=0, microsecond=0)
-    market_close = dt.replace(hour=16, minute=0, second=0, microsecond=0)
-    
-    return market_open <= dt <= market_close
+    import trading_calendar
+    return trading_calendar.is_open(dt)
 
 def is_market_holiday(check_date=None):
     """
@@ -117,74 +100,12 @@ def is_market_holiday(check_date=None):
         check_date: date object to check. If None, uses current ET date.
     
     Returns:
-        bool: True if market is closed for a holiday
+        bool: True if market is closed for a holiday (weekends are not holidays)
     """
+    import trading_calendar
     if check_date is None:
         check_date = get_market_date()
-    
-    year = check_date.year
-    month = check_date.month
-    day = check_date.day
-    
-    # Fixed holidays
-    holidays = [
-        date(year, 1, 1),   # New Year's Day
-        date(year, 7, 4),   # Independence Day
-        date(year, 12, 25), # Christmas
-    ]
-    
-    # NOTE: MLK Day is NOT a market holiday - NYSE/NASDAQ are open
-    
-    # Presidents Day - 3rd Monday in February
-    feb_1 = date(year, 2, 1)
-    presidents_day = feb_1 + timedelta(days=(7 - feb_1.weekday() + 14))  # 3rd Monday
-    holidays.append(presidents_day)
-    
-    # Good Friday - Friday before Easter (complex calculation)
-    # Simplified: Use a lookup table for common years
-    good_fridays = {
-        2024: date(2024, 3, 29),
-        2025: date(2025, 4, 18),
-        2026: date(2026, 4, 3),
-        2027: date(2027, 3, 26),
-        2028: date(2028, 4, 14),
-    }
-    if year in good_fridays:
-        holidays.append(good_fridays[year])
-    
-    # Memorial Day - Last Monday in May
-    may_31 = date(year, 5, 31)
-    memorial_day = may_31 - timedelta(days=(may_31.weekday() + 7) % 7)
-    holidays.append(memorial_day)
-    
-    # Juneteenth - June 19 (observed if weekend)
-    juneteenth = date(year, 6, 19)
-    if juneteenth.weekday() == 5:  # Saturday
-        juneteenth = date(year, 6, 18)
-    elif juneteenth.weekday() == 6:  # Sunday
-        juneteenth = date(year, 6, 20)
-    holidays.append(juneteenth)
-    
-    # Labor Day - 1st Monday in September
-    sep_1 = date(year, 9, 1)
-    labor_day = sep_1 + timedelta(days=(7 - sep_1.weekday()) % 7)
-    holidays.append(labor_day)
-    
-    # Thanksgiving - 4th Thursday in November
-    nov_1 = date(year, 11, 1)
-    thanksgiving = nov_1 + timedelta(days=(3 - nov_1.weekday() + 21) % 7 + 21)
-    holidays.append(thanksgiving)
-    
-    # NOTE: Columbus Day is NOT a market holiday - NYSE/NASDAQ are open
-    
-    # Observed holidays (if holiday falls on weekend, observe on Friday/Monday)
-    for holiday in list(holidays):
-        if holiday.weekday() == 5:  # Saturday -> observe Friday
-            holidays.append(holiday - timedelta(days=1))
-        elif holiday.weekday() == 6:  # Sunday -> observe Monday
-            holidays.append(holiday + timedelta(days=1))
-    
-    return check_date in holidays
+    return trading_calendar.is_holiday(check_date)
 
 def verify_cron_request(secret_env_var='CRON_SECRET'):
     """Verify that a cron request is authorized.
@@ -300,6 +221,13 @@ else:
 
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
 
+# Cold start: with APP_STARTUP_MODE=mobile only the mobile API and cron routes
+# are registered at import; admin / legacy-web / diagnostic routes and route
+# modules load on the first request that needs them (see lazy_routes.py).
+# Must be installed before the first @app.route below.
+from lazy_routes import DeferredRoutes, LazyObject, lazy_startup_enabled
+deferred_routes = DeferredRoutes(app) if lazy_startup_enabled() else None
+
 # Enable jinja2 template features in render_template_string
 app.jinja_env.globals.update({
     'len': len,
@@ -550,35 +478,56 @@ try:
     # app.config['STRIPE_WEBHOOK_SECRET'] = os.environ.get('STRIPE_WEBHOOK_SECRET')
     # stripe.api_key = app.config['STRIPE_SECRET_KEY']
 
-    # Initialize OAuth
-    oauth = OAuth(app)
-
-    # Configure OAuth providers
-    google = oauth.register(
-        name='google',
-        client_id=os.environ.get('GOOGLE_CLIENT_ID', 'google-client-id'),
-        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET', 'google-client-secret'),
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={
-            'scope': 'openid email profile'
-        }
-    )
+    # Initialize OAuth lazily: Authlib is one of the heaviest imports in this
+    # module and only the /login/google and /login/apple routes use it.
+    _oauth_clients = {}
+
+    def _oauth_client(name):
+        if not _oauth_clients:
+            from authlib.integrations.flask_client import OAuth
+            oauth = OAuth(app)
+            _oauth_clients['google'] = oauth.register(
+                name='google',
+                client_id=os.environ.get('GOOGLE_CLIENT_ID', 'google-client-id'),
+                client_secret=os.environ.get('GOOGLE_CLIENT_SECRET', 'google-client-secret'),
+                server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                client_kwargs={
+                    'scope': 'openid email profile'
+                }
+            )
+            _oauth_clients['apple'] = oauth.register(
+                name='apple',
+                client_id=os.environ.get('APPLE_CLIENT_ID', 'apple-client-id'),
+                client_secret=os.environ.get('APPLE_CLIENT_SECRET', 'apple-client-secret'),
+                access_token_url='https://appleid.apple.com/auth/token',
+                access_token_params=None,
+                authorize_url='https://appleid.apple.com/auth/authorize',
+                authorize_params=None,
+                api_base_url='https://appleid.apple.com/',
+                client_kwargs={'scope': 'name email'},
+            )
+        return _oauth_clients[name]
 
-    apple = oauth.register(
-        name='apple',
-        client_id=os.environ.get('APPLE_CLIENT_ID', 'apple-client-id'),
-        client_secret=os.environ.get('APPLE_CLIENT_SECRET', 'apple-client-secret'),
-        access_token_url='https://appleid.apple.com/auth/token',
-        access_token_params=None,
-        authorize_url='https://appleid.apple.com/auth/authorize',
-        authorize_params=None,
-        api_base_url='https://appleid.apple.com/',
-        client_kwargs={'scope': 'name email'},
-    )
+    google = LazyObject(lambda: _oauth_client('google'))
+    apple = LazyObject(lambda: _oauth_client('apple'))
 
     # Initialize SQLAlchemy
     db = SQLAlchemy(app)
-    migrate = Migrate(app, db)
+    # Flask-Migrate only backs the `flask db` CLI and pulls in Alembic (~0.2s
+    # of import); the serverless mobile startup never needs it.
+    if not lazy_startup_enabled():
+        from flask_migrate import Migrate
+        migrate = Migrate(app, db)
+
+    # Per-request tracing (queries, external calls, spans) for /api/mobile and
+    # /api/cron; summaries feed GET /api/mobile/admin/perf/routes.
+    import perf_tracing
+    perf_tracing.init_app(app, engine_getter=lambda: db.engine)
+
+    # DAU pings, page views and link clicks are buffered and bulk-inserted
+    # after the response instead of committed per event (activity_sink.py).
+    import activity_sink
+    activity_sink.init_app(app, engine_getter=lambda: db.engine)
     
     # Global engine event: on any disconnect error, invalidate the connection
     # so SQLAlchemy doesn't try to reuse a broken TCP socket
@@ -816,6 +765,12 @@ class UserPortfolioChartCache(db.Model):
     period = db.Column(db.String(10), nullable=False)  # '1D', '5D', '3M', 'YTD', '1Y', '5Y', 'MAX'
     chart_data = db.Column(db.Text, nullable=False)  # JSON string of chart data
     generated_at = db.Column(db.DateTime, nullable=False)
+    # Same preview columns as models.UserPortfolioChartCache, filled by the
+    # same chart_previews hook so writers here keep previews current.
+    preview_data = db.Column(db.Text, nullable=True)
+    y_min = db.Column(db.Float, nullable=True)
+    y_max = db.Column(db.Float, nullable=True)
+    preview_of = db.Column(db.DateTime, nullable=True)
     
     # Ensure one cache entry per user per period
     __table_args__ = (db.UniqueConstraint('user_id', 'period', name='unique_user_period_chart'),)
@@ -823,6 +778,9 @@ class UserPortfolioChartCache(db.Model):
     def __repr__(self):
         return f"<UserPortfolioChartCache user_id={self.user_id} {self.period} generated at {self.generated_at}>"
 
+from chart_previews import install_hooks as _install_chart_preview_hooks
+_install_chart_preview_hooks(UserPortfolioChartCache)
+
 # Secret key is already set in app.config
 
 # Check if we're running on Vercel
@@ -2025,12 +1983,12 @@ def waitlist_count():
 def track_pageview():
     """Log a landing page visit (called from frontend JS)"""
     try:
-        from models import PageView, db as _db
+        import activity_sink
         import hashlib
         data = request.get_json(silent=True) or {}
         ip_raw = request.headers.get('X-Forwarded-For', request.remote_addr or '')
         ip_hash = hashlib.sha256(ip_raw.encode()).hexdigest()[:16] if ip_raw else None
-        pv = PageView(
+        activity_sink.record_page_view(
             page=data.get('page', '/')[:100],
             referrer=(request.referrer or data.get('referrer', ''))[:500] or None,
             utm_source=data.get('utm_source', '')[:100] or None,
@@ -2039,8 +1997,6 @@ def track_pageview():
             user_agent=(request.headers.get('User-Agent', ''))[:500] or None,
             ip_hash=ip_hash,
         )
-        _db.session.add(pv)
-        _db.session.commit()
         return jsonify({'ok': True}), 201
     except Exception as e:
         logger.warning(f"Pageview track error: {e}")
@@ -2051,7 +2007,7 @@ def track_pageview():
 def track_linkclick():
     """Log an app store link click (called from frontend JS)"""
     try:
-        from models import LinkClick, db as _db
+        import activity_sink
         import hashlib
         data = request.get_json(silent=True) or {}
         platform = data.get('platform', 'unknown')[:20]
@@ -2059,7 +2015,7 @@ def track_linkclick():
             platform = 'unknown'
         ip_raw = request.headers.get('X-Forwarded-For', request.remote_addr or '')
         ip_hash = hashlib.sha256(ip_raw.encode()).hexdigest()[:16] if ip_raw else None
-        lc = LinkClick(
+        activity_sink.record_link_click(
             platform=platform,
             source_page=data.get('source_page', '/')[:100] or None,
             utm_source=data.get('utm_source', '')[:100] or None,
@@ -2067,8 +2023,6 @@ def track_linkclick():
             user_agent=(request.headers.get('User-Agent', ''))[:500] or None,
             ip_hash=ip_hash,
         )
-        _db.session.add(lc)
-        _db.session.commit()
         return jsonify({'ok': True}), 201
     except Exception as e:
         logger.warning(f"Link click track error: {e}")
@@ -2628,6 +2582,22 @@ def admin_audit_snapshot_cash_drift():
     })
 
 
+def _rebuild_intraday_series(user_ids):
+    """Re-derive the compact intraday series for users whose legacy
+    PortfolioSnapshotIntraday rows were just rewritten or deleted, so 1D/5D
+    charts don't keep serving the pre-repair values. Best-effort (savepoint):
+    a missing series table must not roll back the repair itself."""
+    if not user_ids:
+        return
+    try:
+        from intraday_series import rebuild_from_legacy
+        db.session.flush()
+        with db.session.begin_nested():
+            rebuild_from_legacy(set(user_ids))
+    except Exception as e:
+        logger.warning(f"Intraday series rebuild skipped for {len(user_ids)} users: {e}")
+
+
 @app.route('/admin/audit-intraday-anomalies')
 @admin_required
 def admin_audit_intraday_anomalies():
@@ -2796,6 +2766,7 @@ def admin_audit_intraday_anomalies():
                 rows_deleted += PortfolioSnapshotIntraday.query.filter(
                     PortfolioSnapshotIntraday.id.in_(chunk)
                 ).delete(synchronize_session=False)
+            _rebuild_intraday_series([i['user_id'] for i in issues])
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -6307,48 +6278,60 @@ def admin_stocks():
 # Removed duplicate admin_user_detail route - using admin_interface.py blueprint instead
 
 # ── Blueprint Registration ───────────────────────────────────────────────────
-try:
-    import sys
+# The mobile API is registered eagerly. The admin / web route modules go
+# through _register_route_module, which in APP_STARTUP_MODE=mobile defers the
+# import + registration to the first non-mobile request (lazy_routes.py).
+def _register_route_module(name, register):
+    def load():
+        try:
+            register()
+            logger.info(f"{name} registered successfully")
+        except Exception as e:
+            logger.warning(f"Could not register {name}: {e}")
+    if deferred_routes is not None:
+        deferred_routes.defer(name, load)
+    else:
+        load()
+
+
+def _register_admin_blueprint():
     from admin_interface import admin_bp
     app.register_blueprint(admin_bp, url_prefix='/admin')
-    logger.info("Admin interface blueprint registered successfully")
-except Exception as e:
-    logger.warning(f"Could not register admin blueprint: {e}")
 
-try:
+
+def _register_leaderboard_blueprint():
     from leaderboard_routes import leaderboard_bp
     app.register_blueprint(leaderboard_bp)
-    logger.info("Leaderboard blueprint registered successfully")
-except Exception as e:
-    logger.warning(f"Could not register leaderboard blueprint: {e}")
 
-try:
-    from mobile_api import mobile_api
-    app.register_blueprint(mobile_api)
-    logger.info("Mobile API blueprint registered successfully")
-except Exception as e:
-    logger.warning(f"Could not register mobile API blueprint: {e}")
 
-try:
+def _register_cash_tracking_routes():
     from admin_cash_tracking import register_cash_tracking_routes
     register_cash_tracking_routes(app, db)
-    logger.info("Cash tracking admin routes registered successfully")
-except Exception as e:
-    logger.warning(f"Could not register cash tracking routes: {e}")
 
-try:
+
+def _register_phase_5_cache_routes():
     from admin_phase_5_cache_clear import register_phase_5_cache_routes
     register_phase_5_cache_routes(app, db)
-    logger.info("Phase 5 cache clear routes registered successfully")
-except Exception as e:
-    logger.warning(f"Could not register phase 5 cache clear routes: {e}")
 
-try:
+
+def _register_phase_5_routes():
     from admin_phase_5_routes import register_phase_5_routes
     register_phase_5_routes(app, db)
-    logger.info("Phase 5 admin routes registered successfully")
+
+
+_register_route_module("Admin interface blueprint", _register_admin_blueprint)
+_register_route_module("Leaderboard blueprint", _register_leaderboard_blueprint)
+
+try:
+    from mobile_api import mobile_api
+    app.register_blueprint(mobile_api)
+    logger.info("Mobile API blueprint registered successfully")
 except Exception as e:
-    logger.warning(f"Could not register phase 5 admin routes: {e}")
+    logger.warning(f"Could not register mobile API blueprint: {e}")
+
+_register_route_module("Cash tracking admin routes", _register_cash_tracking_routes)
+_register_route_module("Phase 5 cache clear routes", _register_phase_5_cache_routes)
+_register_route_module("Phase 5 admin routes", _register_phase_5_routes)
 
 # Error handler
 @app.errorhandler(500)
@@ -9494,6 +9477,8 @@ def admin_recompute_portfolio_snapshots():
 
     if not dry_run:
         try:
+            if intraday_changes:
+                _rebuild_intraday_series([user_id])
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -9763,25 +9748,29 @@ def market_open_cron():
 @app.route('/api/cron/market-close', methods=['POST', 'GET'])
 def market_close_cron():
     """Market close cron job endpoint - creates EOD snapshots and updates leaderboards
-    
-    Pipeline phases:
+
+    Runs (or resumes) market_close_pipeline for today's ET trading date:
+
       0.5  – Dividend detection (must run BEFORE snapshots so today's dividends
              are reflected in each user's cash_proceeds at snapshot-write time)
-      1    – Portfolio snapshots
+      1    – Portfolio snapshots (chunked by user_id, watermark committed per chunk)
       1.5  – S&P 500 close data
-      1.75 – Commit core data
       2    – Leaderboard JSON cache
       2.25 – Portfolio stats
-      2.4  – Commit cache data
+      2.44 – Subscriber counter reconciliation
+      2.45 – Influencer ranking rebuild
       3.5  – S&P 500 verification
+
+    Each phase commits on its own and is checkpointed in
+    market_close_checkpoint. The work stops before MARKET_CLOSE_BUDGET_S
+    (default 45s) runs out; the next scheduled invocation resumes at the
+    first unfinished phase / chunk and is a no-op once the day is complete.
+    ?force=true re-runs every phase.
     """
-    # Force cache invalidation marker
-    _rebuild_marker = os.environ.get('VERCEL_DEPLOYMENT_ID', 'local')
-    
     # LOG DEPLOYMENT VERSION for debugging
     commit_sha = os.environ.get('VERCEL_GIT_COMMIT_SHA', 'UNKNOWN')
     logger.info(f"🔄 CRON DEPLOYMENT VERSION - Commit SHA: {commit_sha}")
-    logger.info(f"🔄 Deployment ID: {_rebuild_marker}")
+    logger.info(f"🔄 Deployment ID: {os.environ.get('VERCEL_DEPLOYMENT_ID', 'local')}")
     
     try:
         auth_error = verify_cron_request()
@@ -9790,10 +9779,7 @@ def market_close_cron():
         
         logger.info(f"Market close cron triggered via {request.method}")
         
-        from models import User, PortfolioSnapshot
-        from portfolio_performance import PortfolioPerformanceCalculator
-        from leaderboard_utils import update_leaderboard_cache
-        from cash_tracking import calculate_portfolio_value_with_cash
+        import market_close_pipeline
         
         # Use Eastern Time for market operations
         current_time = get_market_time()
@@ -9810,8 +9796,14 @@ def market_close_cron():
                 'message': f'Market closed for holiday on {today_et}'
             }), 200
         
+        force = request.args.get('force', 'false').lower() == 'true'
+        # Leave room inside Vercel's 60s cap for the last chunk's commit + response.
+        budget_s = float(os.environ.get('MARKET_CLOSE_BUDGET_S', '45'))
+        logger.info(f"Market close cron executing for {today_et} (ET)")
+        run = market_close_pipeline.run(today_et, deadline=time.monotonic() + budget_s, force=force)
+        
         results = {
-            'code_version': 'v5-lb-errors',
+            'code_version': 'v6-checkpointed',
             'timestamp': current_time.isoformat(),
             'market_date_et': today_et.isoformat(),
             'timezone': 'America/New_York',
@@ -9819,416 +9811,25 @@ def market_close_cron():
             'snapshots_created': 0,
             'snapshots_updated': 0,
             'leaderboard_updated': False,
-            'errors': [],
-            'pipeline_phases': []
         }
-        
-        logger.info(f"Market close cron executing for {today_et} (ET)")
-        
-        # ATOMIC MARKET CLOSE PIPELINE - All phases must succeed or all rollback
-        try:
-            # PHASE 0.5: Automatic Dividend Detection (must run BEFORE snapshots)
-            # Check all held tickers for ex-dividend dates and credit users.
-            # This MUST happen before Phase 1 so that the snapshot's cash_proceeds
-            # field reflects today's dividends. calculate_cash_proceeds_as_of_date()
-            # in Phase 1 replays from the Transaction table, so dividend rows must
-            # already exist (committed or session-pending) when snapshots are written.
-            try:
-                logger.info("PHASE 0.5: Checking for dividends (pre-snapshot)...")
-                results['pipeline_phases'].append('dividends_started')
-                
-                from dividend_tracker import process_dividends_for_date
-                div_results = process_dividends_for_date(db, target_date=today_et)
-                
-                results['dividends_found'] = div_results.get('dividends_found', 0)
-                results['dividends_recorded'] = div_results.get('dividends_recorded', 0)
-                results['dividend_total_amount'] = div_results.get('total_amount', 0.0)
-                
-                if div_results.get('dividends_recorded', 0) > 0:
-                    db.session.commit()
-                    logger.info(f"✅ PHASE 0.5 Complete: {div_results['dividends_recorded']} dividends recorded (${div_results['total_amount']:.2f} total) BEFORE snapshots")
-                else:
-                    logger.info(f"PHASE 0.5 Complete: No dividends for {today_et}")
-                
-                results['pipeline_phases'].append('dividends_completed')
-                
-            except Exception as e:
-                logger.warning(f"PHASE 0.5 WARNING: Dividend check failed (non-critical): {e}")
-                results['errors'].append(f"Dividend check failed: {str(e)}")
-                try:
-                    db.session.rollback()
-                except Exception:
-                    pass
-                # Non-critical — continue with snapshot writes (snapshots will be
-                # missing today's dividends, but the next cron run / drift detector
-                # will catch any drift on the user.cash_proceeds front)
-            
-            # PHASE 1: Create/Update Portfolio Snapshots
-            logger.info("PHASE 1: Creating portfolio snapshots...")
-            results['pipeline_phases'].append('snapshots_started')
-            
-            # OPTIMIZATION: Batch fetch all stock prices ONCE before processing users
-            from models import Stock
-            users = User.query.all()
-            
-            # Collect all unique tickers across all users
-            unique_tickers = set()
-            unique_tickers.add('SPY')  # Always include SPY for S&P 500
-            
-            for user in users:
-                user_stocks = Stock.query.filter_by(user_id=user.id).all()
-                for stock in user_stocks:
-                    if stock.quantity > 0:
-                        unique_tickers.add(stock.ticker.upper())
-            
-            logger.info(f"📊 Batch API (Market Close): Fetching {len(unique_tickers)} unique tickers for {len(users)} users")
-            
-            # Batch fetch all prices in 1-2 API calls
-            calculator = PortfolioPerformanceCalculator()
-            batch_prices = calculator.get_batch_stock_data(list(unique_tickers))
-            logger.info(f"✅ Batch API Success: Retrieved {len(batch_prices)} prices")
-            
-            # Now process each user (prices already cached from batch call above)
-            for user in users:
-                try:
-                    # Calculate portfolio value WITH cash tracking for today (using ET date)
-                    # Stock prices are now served from cache (batch call above)
-                    portfolio_data = calculate_portfolio_value_with_cash(user.id, today_et)
-                    
-                    total_value = portfolio_data['total_value']
-                    stock_value = portfolio_data['stock_value']
-                    cash_proceeds = portfolio_data['cash_proceeds']
-                    
-                    logger.info(f"User {user.id} ({user.username}): total=${total_value:.2f}, stock=${stock_value:.2f}, cash=${cash_proceeds:.2f} on {today_et}")
-                    
-                    # Skip if portfolio value is 0 or None (indicates calculation failure)
-                    if total_value is None or total_value <= 0:
-                        error_msg = f"User {user.id} ({user.username}): Skipping - portfolio value is {total_value}"
-                        results['errors'].append(error_msg)
-                        logger.warning(error_msg)
-                        continue
-                    
-                    # UPSERT: Atomic insert-or-update to avoid UniqueViolation
-                    # from Vercel read-replica lag (ORM query may miss existing rows)
-                    from sqlalchemy.dialects.postgresql import insert as pg_insert
-                    stmt = pg_insert(PortfolioSnapshot).values(
-                        user_id=user.id,
-                        date=today_et,
-                        total_value=total_value,
-                        stock_value=stock_value,
-                        cash_proceeds=cash_proceeds,
-                        max_cash_deployed=user.max_cash_deployed,
-                        cash_flow=0
-                    ).on_conflict_do_update(
-                        constraint='unique_user_date_snapshot',
-                        set_={
-                            'total_value': total_value,
-                            'stock_value': stock_value,
-                            'cash_proceeds': cash_proceeds,
-                            'max_cash_deployed': user.max_cash_deployed,
-                        }
-                    )
-                    result = db.session.execute(stmt)
-                    # rowcount == 1 for both insert and update in PostgreSQL
-                    results['snapshots_created'] += 1
-                    logger.info(f"Upserted snapshot for user {user.id}: ${total_value:.2f} on {today_et}")
-                    
-                    results['users_processed'] += 1
-                    
-                except Exception as e:
-                    error_msg = f"Error processing user {user.id} ({user.username}): {str(e)}"
-                    results['errors'].append(error_msg)
-                    logger.error(f"Market close user {user.id} error: {e}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-                    # Don't fail the entire pipeline for individual user errors
-            
-            results['pipeline_phases'].append('snapshots_completed')
-            logger.info(f"PHASE 1 Complete: {results['snapshots_created']} created, {results['snapshots_updated']} updated")
-            
-            # PHASE 1.5: Collect S&P 500 Market Close Data
-            logger.info("PHASE 1.5: Collecting S&P 500 market close data...")
-            results['pipeline_phases'].append('sp500_started')
-            
-            try:
-                # SPY data already fetched in batch call above - retrieve from cache
-                if 'SPY' in batch_prices:
-                    spy_price = batch_prices['SPY']
-                    logger.info(f"SPY data collected: ${spy_price} (S&P 500: ${spy_price * 10}) on {today_et}")
-                    spy_data = {'price': spy_price}
-                else:
-                    # Fallback: Individual call if batch somehow failed for SPY
-                    logger.warning("SPY not in batch results - falling back to individual call")
-                    spy_data = calculator.get_stock_data('SPY')
-                
-                if spy_data and spy_data.get('price'):
-                    spy_price = spy_data['price']
-                    sp500_value = spy_price * 10  # Convert SPY to S&P 500 approximation
-                    
-                    # Check if S&P 500 data already exists for today
-                    from models import MarketData
-                    existing_sp500 = MarketData.query.filter_by(
-                        ticker='SPY_SP500',
-                        date=today_et
-                    ).first()
-                    
-                    if existing_sp500:
-                        existing_sp500.close_price = sp500_value
-                        logger.info(f"Updated S&P 500 data for {today_et}: ${sp500_value:.2f}")
-                    else:
-                        market_data = MarketData(
-                            ticker='SPY_SP500',
-                            date=today_et,
-                            close_price=sp500_value
-                        )
-                        db.session.add(market_data)
-                        logger.info(f"Created S&P 500 data for {today_et}: ${sp500_value:.2f}")
-                    
-                    # Flush to write to DB immediately (but don't commit yet - part of atomic transaction)
-                    db.session.flush()
-                    logger.info(f"Flushed S&P 500 data to session")
-                    
-                    results['sp500_data_collected'] = True
-                else:
-                    error_msg = "Failed to fetch SPY data for S&P 500"
-                    results['errors'].append(error_msg)
-                    logger.error(error_msg)
-                    results['sp500_data_collected'] = False
-            
-            except Exception as e:
-                error_msg = f"Error collecting S&P 500 data: {str(e)}"
-                results['errors'].append(error_msg)
-                logger.error(error_msg)
-                results['sp500_data_collected'] = False
-            
-            results['pipeline_phases'].append('sp500_completed')
-            logger.info(f"PHASE 1.5 Complete: S&P 500 data collection {'succeeded' if results.get('sp500_data_collected') else 'failed'}")
-            
-            # PHASE 1.75: Commit ALL core data (snapshots + S&P 500) before cache operations
-            # This isolates critical data from potential session corruption in later phases
-            # Grok recommendation: Separate transactions for core data vs cache
-            logger.info("PHASE 1.75: Committing core data (snapshots + S&P 500) atomically...")
-            results['pipeline_phases'].append('core_commit_started')
-            
-            try:
-                db.session.commit()
-                logger.info(f"✅ PHASE 1.75 Complete: Committed {results['snapshots_created']} snapshots + S&P 500 data")
-                results['core_data_committed'] = True
-                results['pipeline_phases'].append('core_commit_completed')
-            except Exception as e:
-                logger.error(f"❌ PHASE 1.75 FAILED: Core data commit failed: {e}")
-                db.session.rollback()
-                results['core_data_committed'] = False
-                results['errors'].append(f"Core data commit failed: {str(e)}")
-                # CRITICAL FAILURE - return immediately
-                return jsonify({
-                    'success': False,
-                    'message': 'Core data commit failed - snapshots and S&P 500 not saved',
-                    'results': results
-                }), 500
-            
-            # PHASE 1.8: (moved to PHASE 0.5 — see top of pipeline)
-            # Dividend detection now runs BEFORE snapshot creation so today's
-            # dividends are reflected in each user's snapshot cash_proceeds.
-            
-            # PHASE 2: Update Leaderboard JSON Cache + Portfolio Stats
-            # Charts are now generated ON-DEMAND (not pre-generated here)
-            # This dramatically reduces market-close cron execution time
-            try:
-                # Force-dispose ALL pooled connections and reset the ORM session.
-                # db.session.rollback() and db.session.remove() are insufficient when
-                # the underlying PostgreSQL connection is in an aborted transaction state.
-                # db.engine.dispose() drops every connection in the pool, forcing new ones.
-                try:
-                    db.session.remove()
-                    db.engine.dispose()
-                except Exception:
-                    pass
-                
-                logger.info("PHASE 2: Updating leaderboard JSON cache...")
-                results['pipeline_phases'].append('leaderboard_started')
-                
-                updated_count = update_leaderboard_cache()
-                results['leaderboard_updated'] = True
-                results['leaderboard_entries_updated'] = updated_count
-                
-                # Surface any leaderboard calculation errors
-                lb_errors = getattr(update_leaderboard_cache, '_last_errors', [])
-                if lb_errors:
-                    results['leaderboard_errors'] = lb_errors
-                
-                results['pipeline_phases'].append('leaderboard_completed')
-                logger.info(f"PHASE 2 Complete: {updated_count} leaderboard entries updated (JSON only)")
-                
-                # PHASE 2.25: Update Portfolio Stats (unique stocks, trades/week, cap mix, industry mix, subscribers)
-                # Fresh connections for stats phase
-                try:
-                    db.session.remove()
-                    db.engine.dispose()
-                except Exception:
-                    pass
-                
-                logger.info("PHASE 2.25: Updating portfolio stats for all users...")
-                results['pipeline_phases'].append('portfolio_stats_started')
-                
-                try:
-                    from leaderboard_utils import calculate_user_portfolio_stats
-                    from models import UserPortfolioStats
-                    
-                    stats_updated = 0
-                    for user in users:
-                        try:
-                            stats = calculate_user_portfolio_stats(user.id)
-                            
-                            user_stats = UserPortfolioStats.query.filter_by(user_id=user.id).first()
-                            if not user_stats:
-                                user_stats = UserPortfolioStats(user_id=user.id)
-                                db.session.add(user_stats)
-                            
-                            user_stats.unique_stocks_count = stats['unique_stocks_count']
-                            user_stats.avg_trades_per_week = stats['avg_trades_per_week']
-                            user_stats.total_trades = stats['total_trades']
-                            user_stats.large_cap_percent = stats['large_cap_percent']
-                            user_stats.small_cap_percent = stats['small_cap_percent']
-                            user_stats.industry_mix = stats['industry_mix']
-                            user_stats.subscriber_count = stats['subscriber_count']
-                            # Phase E: fractional-shares flag for Discover/Leaderboard filter.
-                            user_stats.has_fractional_holdings = stats.get('has_fractional_holdings', False)
-                            user_stats.last_updated = stats['last_updated']
-                            
-                            stats_updated += 1
-                            
-                        except Exception as e:
-                            error_msg = f"Error updating stats for user {user.id}: {str(e)}"
-                            results['errors'].append(error_msg)
-                            logger.error(error_msg)
-                            try:
-                                db.session.rollback()
-                            except Exception:
-                                try:
-                                    db.session.remove()
-                                    db.engine.dispose()
-                                except Exception:
-                                    pass
-                    
-                    results['portfolio_stats_updated'] = stats_updated
-                    results['pipeline_phases'].append('portfolio_stats_completed')
-                    logger.info(f"PHASE 2.25 Complete: {stats_updated} user portfolio stats updated")
-                    
-                except Exception as e:
-                    error_msg = f"Portfolio stats update error: {str(e)}"
-                    results['errors'].append(error_msg)
-                    logger.error(f"PHASE 2.25 FAILED: {error_msg}")
-                
-            except Exception as e:
-                error_msg = f"Leaderboard cache update failed: {str(e)}"
-                results['errors'].append(error_msg)
-                logger.error(f"PHASE 2 FAILED: {error_msg}")
-                logger.error("Core data (snapshots + S&P 500) is safe (committed in Phase 1.75)")
-                import traceback
-                logger.error(f"Full traceback:\n{traceback.format_exc()}")
-            
-            # PHASE 2.4: Commit leaderboard cache + portfolio stats
-            try:
-                db.session.commit()
-                results['cache_committed'] = True
-                results['pipeline_phases'].append('cache_commit_completed')
-                logger.info("PHASE 2.4: Leaderboard cache + stats committed")
-            except Exception as e:
-                results['cache_committed'] = False
-                results['errors'].append(f"Cache commit failed: {str(e)}")
-                logger.error(f"PHASE 2.4 FAILED: {str(e)}")
-                try:
-                    db.session.rollback()
-                except Exception:
-                    pass
-            
-            # PHASE 3.5: VERIFICATION - Confirm S&P 500 data actually persisted
-            logger.info("PHASE 3.5: Verifying S&P 500 data persistence...")
-            from models import MarketData
-            from sqlalchemy import text
-            import time
-            
-            # FIX: Vercel Postgres uses read replicas with lag (50-500ms)
-            # Solution: Query PRIMARY connection directly + retry with sleep
-            
-            # Sleep to allow replica sync
-            time.sleep(0.5)
-            logger.info("Waited 500ms for replica sync")
-            
-            # Retry verification 3x with backoff (in case of replica lag)
-            verify_sp500 = None
-            for attempt in range(3):
-                try:
-                    # Use raw SQL on engine to force primary connection
-                    with db.engine.connect() as primary_conn:
-                        result = primary_conn.execute(text("""
-                            SELECT close_price FROM market_data 
-                            WHERE ticker = 'SPY_SP500' AND date = :date
-                        """), {'date': today_et})
-                        row = result.fetchone()
-                        
-                        if row:
-                            verify_sp500 = row[0]
-                            logger.info(f"✅ VERIFIED on PRIMARY (attempt {attempt+1}): S&P 500 data exists for {today_et}: ${float(verify_sp500):.2f}")
-                            break
-                        else:
-                            logger.warning(f"Attempt {attempt+1}: S&P 500 data not yet visible on primary")
-                            if attempt < 2:
-                                time.sleep(0.2 * (attempt + 1))  # Backoff: 200ms, 400ms
-                except Exception as verify_err:
-                    logger.error(f"Verification attempt {attempt+1} error: {verify_err}")
-                    if attempt < 2:
-                        time.sleep(0.2 * (attempt + 1))
-            
-            if verify_sp500:
-                results['sp500_verification'] = 'SUCCESS'
-                results['sp500_verified_value'] = float(verify_sp500)
-            else:
-                logger.error(f"❌ VERIFICATION FAILED on PRIMARY after 3 attempts: S&P 500 data NOT found for {today_et}")
-                logger.error(f"This indicates a write failure, not just replication lag")
-                results['sp500_verification'] = 'FAILED'
-                results['errors'].append(f"S&P 500 data missing after commit for {today_et}")
-            
-        except Exception as e:
-            # ROLLBACK: Only affects uncommitted changes (cache operations)
-            # Core data (snapshots + S&P 500) already committed in Phase 1.75
-            logger.error(f"PIPELINE FAILURE: {str(e)}")
-            db.session.rollback()
-            
-            error_msg = f"Pipeline failure: {str(e)}"
-            results['errors'].append(error_msg)
-            results['pipeline_phases'].append('rollback_completed')
-            
-            # Check if core data was committed before failure
-            if results.get('core_data_committed'):
-                logger.info("✅ Core data (snapshots + S&P 500) is safe despite failure")
-                response = jsonify({
-                    'success': True,  # Partial success - core data saved
-                    'partial': True,
-                    'message': 'Core data saved successfully, but cache updates failed',
-                    'results': results,
-                    'error': error_msg
-                })
-                response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                return response, 200
-            else:
-                response = jsonify({
-                    'success': False,
-                    'message': 'Market close pipeline failed - no data saved',
-                    'results': results,
-                    'error': error_msg
-                })
-                response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                return response, 500
-        
+        results.update(run.pop('results'))
+        status = run['status']
+        messages = {
+            'complete': 'Market close pipeline completed successfully',
+            'partial': 'Market close pipeline finished; some non-critical phases failed',
+            'incomplete': f"Market close pipeline paused before {run['next_phase']}; the next run resumes it",
+            'busy': 'Market close pipeline already running for this date',
+            'failed': 'Market close pipeline failed in a critical phase; the next run retries it',
+        }
         response = jsonify({
-            'success': True,
-            'message': 'Atomic market close pipeline completed successfully',
-            'results': results
+            'success': status != 'failed',
+            'partial': status in ('partial', 'incomplete'),
+            'message': messages[status],
+            'results': results,
+            'pipeline': run,
         })
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        return response, 200
+        return response, 500 if status == 'failed' else 200
     
     except Exception as e:
         logger.error(f"Unexpected error in market close: {str(e)}")
@@ -10236,6 +9837,50 @@ def market_close_cron():
         error_response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         return error_response, 500
 
+@app.route('/api/cron/market-close/status', methods=['GET'])
+def market_close_status():
+    """Checkpoint status of the market-close pipeline: ?date=YYYY-MM-DD for
+    one trading day, otherwise the last ?days= (default 5) days."""
+    try:
+        auth_error = verify_cron_request()
+        if auth_error:
+            return auth_error
+        
+        import market_close_pipeline
+        
+        trading_date = None
+        if request.args.get('date'):
+            trading_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date()
+        days = min(int(request.args.get('days', 5)), 60)
+        return jsonify({'success': True, 'days': market_close_pipeline.status(trading_date, days=days)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"market-close status error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/cron/data-exports', methods=['GET', 'POST'])
+def data_exports_cron():
+    """Build queued GDPR data exports (data_export.run_pending) within
+    DATA_EXPORT_BUDGET_S (default 45s), email their download links and
+    expire old artifacts. Unfinished jobs are picked up by the next run."""
+    try:
+        auth_error = verify_cron_request()
+        if auth_error:
+            return auth_error
+        
+        import data_export
+        if not data_export.table_ready():
+            return jsonify({'success': True, 'skipped': 'data_export_job table missing'})
+        
+        budget_s = float(os.environ.get('DATA_EXPORT_BUDGET_S', '45'))
+        summary = data_export.run_pending(deadline=time.monotonic() + budget_s)
+        logger.info(f"data-exports cron: {summary}")
+        return jsonify({'success': True, **summary})
+    except Exception as e:
+        logger.error(f"data-exports cron error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/admin/trigger-market-close-backfill', methods=['GET', 'POST'])
 @admin_2fa_required
 def admin_trigger_market_close_backfill():
@@ -10515,6 +10160,9 @@ def admin_trigger_market_close_backfill():
             results['pipeline_phases'].append('commit_started')
             
             db.session.commit()
+            if results.get('sp500_data_collected'):
+                import benchmark_series
+                benchmark_series.invalidate('daily')
             
             results['pipeline_phases'].append('commit_completed')
             logger.info("PHASE 3 Complete: All changes committed successfully")
@@ -10881,18 +10529,26 @@ def admin_historical_price_backfill_batch():
 
 @app.route('/api/cron/cleanup-intraday-data', methods=['POST', 'GET'])
 def cleanup_intraday_data_cron():
-    """Automated cron endpoint to clean up old intraday snapshots while preserving 4PM market close data"""
+    """Automated cron endpoint to clean up old intraday snapshots while preserving 4PM market close data,
+    and to prune portfolio_intraday_series sessions past the same window.
+
+    Also applies retention to request_perf_sample (perf_tracing) and
+    email_send_counter (services/email_limits), which the request path never prunes."""
     try:
         auth_error = verify_cron_request()
         if auth_error:
             return auth_error
         
         from api.cleanup_intraday import cleanup_old_intraday_data
+        import perf_tracing
+        from services import email_limits
         
         # Run cleanup (keep 14 days of data)
         results = cleanup_old_intraday_data(days_to_keep=14)
+        results['perf_samples_pruned'] = perf_tracing.prune(db.engine)
+        results['email_counters_pruned'] = email_limits.prune(db.engine)
         
-        logger.info(f"Automated cleanup completed: {results['snapshots_deleted']} deleted, {results['market_close_preserved']} preserved")
+        logger.info(f"Automated cleanup completed: {results['snapshots_deleted']} deleted, {results['market_close_preserved']} preserved, {results['series_deleted']} series rows pruned")
         
         return jsonify({
             'success': True,
@@ -10910,10 +10566,27 @@ def refresh_daily_bars_cron():
     Populate the `daily_price_bar` cache with the most recent ~100 trading
     days of OHLCV bars for every ticker in the bot universe.
 
-    Runs once per weekday after market close (vercel.json: 22:30 UTC = 6:30 PM ET).
-    Uses AlphaVantage TIME_SERIES_DAILY concurrently, respecting the 150/min
-    premium rate limit. With ~100 tickers this takes ~45s — fits within
-    Vercel's 60s maxDuration.
+    Self-sharding: each invocation refreshes the STALEST tickers first (never
+    fetched, then oldest `fetched_at`) for as long as one AV window's budget
+    and the invocation deadline allow, then returns. vercel.json fires it every
+    3 minutes through the post-market window; once everything is fresher than
+    `max_age_hours` a run is a single grouped query and a no-op. A ~1,000-ticker
+    universe therefore needs no hand-maintained `part`/`of` crons — it just
+    takes ~7 runs instead of 1.
+
+    Tickers AV answers with no usable bars (delisted / renamed) go into the
+    `daily_bar_fetch_miss` negative cache and are skipped until their backoff
+    (12h, doubling per miss, capped at 7 days) expires — otherwise, having no
+    rows, they would be the "stalest" tickers on every run forever.
+
+    AV pacing is the shared governor's job (av_rate_governor.py): 150/min
+    sliding window, backoff on throttle envelopes, workers block on it.
+
+    Query params (all optional, for manual runs):
+      - part / of:      restrict to a strided slice of the universe (legacy).
+      - force=1:        ignore freshness and refetch the selected tickers.
+      - max_age_hours:  freshness threshold (default 12).
+      - limit:          cap tickers per run (default: one AV window).
 
     Trade waves then read from this cache instead of refetching 100 days of
     history on every wave (which was the root cause of the 9:45 AM 500s
@@ -10925,9 +10598,11 @@ def refresh_daily_bars_cron():
             return auth_error
 
         from bot_data_hub import (
-            get_all_tickers, fetch_av_daily_bars_concurrent, ALPHA_VANTAGE_KEY,
-            flush_av_logs,
+            get_all_tickers, fetch_av_daily_bars_concurrent, daily_bar_rows,
+            ALPHA_VANTAGE_KEY, flush_av_logs,
+            backed_off_daily_bar_tickers, record_daily_bar_misses,
         )
+        from av_rate_governor import governor as av_governor
         from models import db, DailyPriceBar
         from sqlalchemy.dialects.postgresql import insert as pg_insert
 
@@ -10938,11 +10613,6 @@ def refresh_daily_bars_cron():
                 'message': 'ALPHA_VANTAGE_API_KEY env var is not set'
             }), 200  # 200 with diagnostics, NOT 500 — config issue surfaced cleanly
 
-        # Two-minute split: each cron invocation handles 1/`of` of the universe
-        # so the per-minute AV call burst stays well under the 150/min cap (138
-        # calls in one minute was ~92% of the limit). The crons fire two minutes
-        # apart (see vercel.json), each taking ~30s for ~69 tickers. `part`/`of`
-        # default to 1/1 (whole universe) for manual / single-shot invocations.
         try:
             part = int(request.args.get('part', 1))
             of = int(request.args.get('of', 1))
@@ -10950,59 +10620,115 @@ def refresh_daily_bars_cron():
             part, of = 1, 1
         of = max(of, 1)
         part = min(max(part, 1), of)
+        force = request.args.get('force', '').lower() in ('1', 'true', 'yes')
+        try:
+            max_age_hours = float(request.args.get('max_age_hours', 12))
+        except (TypeError, ValueError):
+            max_age_hours = 12.0
+        try:
+            limit = int(request.args.get('limit', av_governor.max_calls))
+        except (TypeError, ValueError):
+            limit = av_governor.max_calls
+        limit = max(1, limit)
 
         all_tickers = sorted(get_all_tickers())
         # Strided slice keeps the parts balanced even when the count is odd.
-        tickers = all_tickers[part - 1::of]
+        universe = all_tickers[part - 1::of]
+
+        # Stale-first selection: one grouped read of the last fetch per ticker.
+        started = datetime.utcnow()
+        last_fetched = {}
+        if not force:
+            last_fetched = dict(
+                db.session.query(DailyPriceBar.ticker, func.max(DailyPriceBar.fetched_at))
+                .filter(DailyPriceBar.ticker.in_(universe))
+                .group_by(DailyPriceBar.ticker)
+                .all()
+            )
+        # Negative cache: symbols AV recently had no bars for sit out their
+        # backoff. Missing table (pre-migration) = no negative cache.
+        backed_off = set()
+        miss_cache_ready = True
+        if not force:
+            try:
+                backed_off = backed_off_daily_bar_tickers(universe, started)
+            except Exception as miss_err:
+                db.session.rollback()
+                miss_cache_ready = False
+                logger.warning(f"refresh-daily-bars: negative cache unavailable: {miss_err}")
+        fresh_cutoff = started - timedelta(hours=max_age_hours)
+        stale = [t for t in universe if t not in backed_off and
+                 (force or not last_fetched.get(t) or last_fetched[t] < fresh_cutoff)]
+        stale.sort(key=lambda t: last_fetched.get(t) or datetime.min)
+        tickers = stale[:limit]
+
+        if not tickers:
+            return jsonify({
+                'success': True,
+                'complete': True,
+                'part': part,
+                'of': of,
+                'tickers_in_universe': len(all_tickers),
+                'tickers_total': 0,
+                'tickers_stale_remaining': 0,
+                'tickers_backed_off': len(backed_off),
+                'message': f'all tickers fresher than {max_age_hours}h',
+            })
+
         logger.info(
-            f"refresh-daily-bars: part {part}/{of} — fetching {len(tickers)} "
-            f"of {len(all_tickers)} tickers from AlphaVantage"
+            f"refresh-daily-bars: {len(tickers)} of {len(stale)} stale tickers "
+            f"(universe {len(universe)}) from AlphaVantage"
         )
-        started = datetime.utcnow()
 
-        # Concurrent fetch from AV (respects 140 req/min effective rate).
-        bars_by_ticker = fetch_av_daily_bars_concurrent(tickers, max_workers=4)
+        # Stop asking the governor for slots well before Vercel's 60s cap so
+        # the upsert + response still fit.
+        budget_s = float(os.environ.get('REFRESH_DAILY_BARS_BUDGET_S', '45'))
+        deadline = time.monotonic() + budget_s
+        missed = set()
+        bars_by_ticker = fetch_av_daily_bars_concurrent(tickers, deadline=deadline, misses=missed)
         fetched_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
 
-        # Upsert into daily_price_bar. Each ticker DF has up to 100 rows.
+        # Upsert into daily_price_bar in multi-ticker batches (ticker+date is
+        # the unique key). Rows are built column-wise, not via iterrows().
+        fetched_at = datetime.utcnow()
         upserted = 0
         failed_tickers = []
-        for ticker, df in bars_by_ticker.items():
+        batch, batch_tickers = [], []
+        items = list(bars_by_ticker.items())
+        for idx, (ticker, df) in enumerate(items):
+            rows = daily_bar_rows(ticker, df, fetched_at)
+            if rows:
+                batch.extend(rows)
+                batch_tickers.append(ticker)
+            if batch and (len(batch) >= 2000 or idx == len(items) - 1):
+                try:
+                    stmt = pg_insert(DailyPriceBar.__table__).values(batch)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['ticker', 'date'],
+                        set_={
+                            'open': stmt.excluded.open,
+                            'high': stmt.excluded.high,
+                            'low': stmt.excluded.low,
+                            'close': stmt.excluded.close,
+                            'volume': stmt.excluded.volume,
+                            'source': stmt.excluded.source,
+                            'fetched_at': stmt.excluded.fetched_at,
+                        }
+                    )
+                    with db.session.begin_nested():
+                        db.session.execute(stmt)
+                    upserted += len(batch)
+                except Exception as e:
+                    logger.warning(f"refresh-daily-bars upsert failed for {batch_tickers}: {e}")
+                    failed_tickers.extend(batch_tickers)
+                batch, batch_tickers = [], []
+
+        if miss_cache_ready:
             try:
-                rows_to_upsert = []
-                for date_idx, row in df.iterrows():
-                    rows_to_upsert.append({
-                        'ticker': ticker,
-                        'date': date_idx.date() if hasattr(date_idx, 'date') else date_idx,
-                        'open': float(row['Open']),
-                        'high': float(row['High']),
-                        'low': float(row['Low']),
-                        'close': float(row['Close']),
-                        'volume': float(row['Volume']),
-                        'source': 'av',
-                        'fetched_at': datetime.utcnow(),
-                    })
-                if not rows_to_upsert:
-                    continue
-                # Postgres ON CONFLICT upsert (ticker+date is the unique key).
-                stmt = pg_insert(DailyPriceBar.__table__).values(rows_to_upsert)
-                stmt = stmt.on_conflict_do_update(
-                    index_elements=['ticker', 'date'],
-                    set_={
-                        'open': stmt.excluded.open,
-                        'high': stmt.excluded.high,
-                        'low': stmt.excluded.low,
-                        'close': stmt.excluded.close,
-                        'volume': stmt.excluded.volume,
-                        'source': stmt.excluded.source,
-                        'fetched_at': stmt.excluded.fetched_at,
-                    }
-                )
-                db.session.execute(stmt)
-                upserted += len(rows_to_upsert)
-            except Exception as e:
-                logger.warning(f"refresh-daily-bars upsert failed for {ticker}: {e}")
-                failed_tickers.append(ticker)
+                with db.session.begin_nested():
+                    record_daily_bar_misses(missed, set(bars_by_ticker) - set(failed_tickers), fetched_at)
+            except Exception as miss_err:
+                logger.warning(f"refresh-daily-bars: recording misses failed: {miss_err}")
 
         db.session.commit()
         try:
@@ -11013,9 +10739,11 @@ def refresh_daily_bars_cron():
         finished = datetime.utcnow()
         elapsed_s = (finished - started).total_seconds()
         not_returned = [t for t in tickers if t not in bars_by_ticker]
+        stale_remaining = len(stale) - len(bars_by_ticker) - len(missed) + len(failed_tickers)
 
         return jsonify({
             'success': True,
+            'complete': stale_remaining == 0,
             'part': part,
             'of': of,
             'tickers_in_universe': len(all_tickers),
@@ -11023,10 +10751,14 @@ def refresh_daily_bars_cron():
             'tickers_fetched': len(bars_by_ticker),
             'tickers_missing_from_av': not_returned[:25],
             'tickers_missing_count': len(not_returned),
+            'tickers_no_bars': sorted(missed)[:25],
+            'tickers_backed_off': len(backed_off),
             'tickers_upsert_failed': failed_tickers,
+            'tickers_stale_remaining': stale_remaining,
             'rows_upserted': upserted,
             'fetch_ms': fetched_ms,
             'total_elapsed_s': round(elapsed_s, 1),
+            'av_governor': av_governor.stats(),
         })
     except Exception as e:
         logger.error(f"refresh-daily-bars cron error: {e}")
@@ -11219,7 +10951,7 @@ def refresh_fundamentals_cron():
         )
         started = datetime.utcnow()
 
-        fundamentals = fetch_overviews_concurrent(tickers, max_workers=4)
+        fundamentals = fetch_overviews_concurrent(tickers)
         fetched_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
 
         upserted = 0
@@ -11284,6 +11016,54 @@ def refresh_fundamentals_cron():
         }), 500
 
 
+@app.route('/api/cron/refresh-stock-info', methods=['GET', 'POST'])
+def refresh_stock_info_cron():
+    """
+    Refresh StockInfo (sector, industry, market cap, NAICS) for every
+    portfolio ticker from AlphaVantage OVERVIEW.
+
+    stock_metadata_utils.ingest_stock_info skips rows refreshed in the last
+    7 days, resolves ETF / manual fallbacks without an AV call and fetches the
+    rest concurrently under the shared AV governor, then upserts in bulk. AV
+    calls stop at a deadline inside Vercel's 60s maxDuration; tickers that did
+    not get a slot are reported as deferred and are picked up by the next run
+    (they are still stale).
+    """
+    try:
+        auth_error = verify_cron_request()
+        if auth_error:
+            return auth_error
+
+        from stock_metadata_utils import ingest_stock_info
+
+        force = request.args.get('force', 'false').lower() == 'true'
+        started = datetime.utcnow()
+        # Stop asking the governor for slots well before Vercel's 60s cap so
+        # the upsert + response still fit.
+        budget_s = float(os.environ.get('REFRESH_STOCK_INFO_BUDGET_S', '45'))
+        result = ingest_stock_info(force_update=force, deadline=time.monotonic() + budget_s)
+        elapsed_s = (datetime.utcnow() - started).total_seconds()
+        logger.info(
+            f"refresh-stock-info: {result['updated_count']} updated, {result['fallback_count']} fallback, "
+            f"{result['fresh_count']} fresh, {result['failed_count']} failed "
+            f"({result['deferred_count']} deferred) in {elapsed_s:.1f}s"
+        )
+        return jsonify({
+            'success': True,
+            'tickers_total': result['total_processed'],
+            'updated': result['updated_count'],
+            'fallback': result['fallback_count'],
+            'fresh': result['fresh_count'],
+            'failed': result['failed_count'] - result['deferred_count'],
+            'deferred': result['deferred_count'],
+            'failed_tickers': [r['ticker'] for r in result['results'] if r['status'] == 'failed'][:25],
+            'total_elapsed_s': round(elapsed_s, 1),
+        })
+    except Exception as e:
+        logger.error(f"refresh-stock-info cron error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/cron/get-fundamentals', methods=['GET'])
 def get_fundamentals_cron():
     """
@@ -11436,7 +11216,7 @@ def purge_deleted_accounts_cron():
     from datetime import timedelta
     from models import (db, User, Stock, Transaction, PortfolioSnapshot,
                         DeviceToken, PushNotificationLog, MobileSubscription,
-                        Subscription, FeaturePollVote, UserActivity)
+                        Subscription, FeaturePollVote, UserActivity, DataExportJob)
 
     GRACE_DAYS = 30  # must match the deletion endpoints
     commit = str(request.args.get('commit', '')).lower() == 'true'
@@ -11470,6 +11250,8 @@ def purge_deleted_accounts_cron():
                 (PushNotificationLog.portfolio_owner_id == uid)
             ).delete(synchronize_session=False)
             FeaturePollVote.query.filter_by(user_id=uid).delete(synchronize_session=False)
+            # Finished exports are a full copy of the user's data.
+            DataExportJob.query.filter_by(user_id=uid).delete(synchronize_session=False)
             # Activity trail (login/dashboard/mobile_active rows carry
             # timestamps + IP/user-agent on web rows) — personal data, purge it.
             UserActivity.query.filter_by(user_id=uid).delete(synchronize_session=False)
@@ -12138,25 +11920,13 @@ def collect_intraday_data():
                     'holiday': True
                 })
             
-            # DST-aware check: Only collect at valid 15-minute intervals during market hours (9:30 AM - 4:00 PM ET)
-            hour = current_time.hour
-            minute = current_time.minute
-            
-            valid_intervals = set()
-            for h in range(9, 17):  # 9 AM to 4 PM
-                for m in [0, 15, 30, 45]:
-                    if h == 9 and m < 30:
-                        continue
-                    if h == 16 and m > 0:
-                        continue
-                    valid_intervals.add((h, m))
+            # DST-aware check: Only collect at the session's 15-minute slots
+            # (9:30 AM - 4:00 PM ET, or 1:00 PM on early-close days)
+            import trading_calendar
+            slots = trading_calendar.minute_slots(today_et, step=15)
             
             # Allow +/- 2 minutes tolerance for cron timing variance
-            is_valid_time = False
-            for valid_hour, valid_minute in valid_intervals:
-                if hour == valid_hour and abs(minute - valid_minute) <= 2:
-                    is_valid_time = True
-                    break
+            is_valid_time = any(abs((current_time - slot).total_seconds()) < 180 for slot in slots)
             
             if not is_valid_time:
                 logger.info(f"Cron triggered at {current_time.strftime('%I:%M %p ET')} - outside market hours, skipping")
@@ -12173,7 +11943,7 @@ def collect_intraday_data():
         results = {
             'timestamp': current_time.isoformat(),
             'current_time_et': current_time.strftime('%Y-%m-%d %H:%M:%S ET'),
-            'market_status': 'CLOSED' if current_time.hour >= 16 else 'OPEN',
+            'market_status': 'OPEN' if is_market_hours(current_time) else 'CLOSED',
             'spy_data_collected': False,
             'users_processed': 0,
             'snapshots_created': 0,
@@ -12191,17 +11961,11 @@ def collect_intraday_data():
         # Step 1: Get all users and collect unique tickers (for batch API call)
         users = User.query.all()
         
-        # Collect all unique tickers across all users
-        from models import Stock
-        unique_tickers = set()
+        # Collect all unique tickers across all users (one query, not one per user)
+        from cash_tracking import held_tickers, live_portfolio_values
+        unique_tickers = held_tickers()
         unique_tickers.add('SPY')  # Always include SPY for S&P 500 benchmark
         
-        for user in users:
-            user_stocks = Stock.query.filter_by(user_id=user.id).all()
-            for stock in user_stocks:
-                if stock.quantity > 0:
-                    unique_tickers.add(stock.ticker.upper())
-        
         logger.info(f"📊 Batch API: Fetching {len(unique_tickers)} unique tickers for {len(users)} users")
         
         # Step 2: BATCH API CALL - Fetch all prices in ONE call (12-25x more efficient!)
@@ -12299,43 +12063,52 @@ def collect_intraday_data():
         # All stock prices are already in cache - no additional API calls needed!
         intraday_snapshots = []
         
+        # Calculate current portfolio values WITH cash tracking
+        portfolio_values, value_errors = live_portfolio_values(users)
+        results['errors'].extend(value_errors)
+        
         for user in users:
-            try:
-                # Calculate current portfolio value WITH cash tracking
-                from cash_tracking import calculate_portfolio_value_with_cash
-                portfolio_data = calculate_portfolio_value_with_cash(user.id)
-                
-                total_value = portfolio_data['total_value']
-                stock_value = portfolio_data['stock_value']
-                cash_proceeds = portfolio_data['cash_proceeds']
-                
-                if total_value > 0:  # Only create snapshots for users with portfolios
-                    # Create intraday snapshot with ALL fields (add to batch)
-                    intraday_snapshot = PortfolioSnapshotIntraday(
-                        user_id=user.id,
-                        timestamp=current_time,
-                        total_value=total_value,
-                        stock_value=stock_value,
-                        cash_proceeds=cash_proceeds,
-                        max_cash_deployed=user.max_cash_deployed
-                    )
-                    intraday_snapshots.append(intraday_snapshot)
-                    results['snapshots_created'] += 1
-                
-                results['users_processed'] += 1
-                
-            except Exception as e:
-                error_msg = f"Error processing user {user.id}: {str(e)}"
-                results['errors'].append(error_msg)
-                logger.error(error_msg)
+            portfolio_data = portfolio_values.get(user.id)
+            if portfolio_data is None:
+                continue
+            
+            if portfolio_data['total_value'] > 0:  # Only create snapshots for users with portfolios
+                # Create intraday snapshot with ALL fields (add to batch)
+                intraday_snapshot = PortfolioSnapshotIntraday(
+                    user_id=user.id,
+                    timestamp=current_time,
+                    total_value=portfolio_data['total_value'],
+                    stock_value=portfolio_data['stock_value'],
+                    cash_proceeds=portfolio_data['cash_proceeds'],
+                    max_cash_deployed=user.max_cash_deployed
+                )
+                intraday_snapshots.append(intraday_snapshot)
+                results['snapshots_created'] += 1
+            
+            results['users_processed'] += 1
         
         # Batch commit all intraday snapshots
         try:
             if intraday_snapshots:
                 db.session.bulk_save_objects(intraday_snapshots)
                 logger.info(f"Batch saved {len(intraday_snapshots)} intraday snapshots")
+                # Same tick into the compact per-day series (one row per user
+                # per session) that 1D/5D reads use. Best-effort: a missing
+                # table must not lose the legacy rows, so it gets a savepoint.
+                try:
+                    from intraday_series import record_tick
+                    with db.session.begin_nested():
+                        results['series_rows_written'] = record_tick(current_time, {
+                            s.user_id: (s.total_value, s.stock_value, s.cash_proceeds, s.max_cash_deployed)
+                            for s in intraday_snapshots
+                        })
+                except Exception as series_err:
+                    logger.warning(f"Intraday series write skipped: {series_err}")
             
             db.session.commit()
+            if results['spy_data_collected']:
+                import benchmark_series
+                benchmark_series.invalidate('intraday')
             logger.info(f"Intraday collection completed: {results['snapshots_created']} snapshots created")
         except Exception as e:
             db.session.rollback()
@@ -12681,16 +12454,15 @@ def public_portfolio_view(slug):
         
         # Track shared portfolio link click
         try:
-            from models import PageView, db as _db
+            import activity_sink
             import hashlib as _hl
             _ip = request.headers.get('X-Forwarded-For', request.remote_addr or '')
-            _db.session.add(PageView(
+            activity_sink.record_page_view(
                 page=f'/p/{slug}',
                 referrer=(request.referrer or '')[:500] or None,
                 user_agent=(request.headers.get('User-Agent', ''))[:500] or None,
                 ip_hash=_hl.sha256(_ip.encode()).hexdigest()[:16] if _ip else None,
-            ))
-            _db.session.commit()
+            )
         except Exception:
             pass
 
@@ -13007,7 +12779,7 @@ def public_portfolio_performance(slug, period):
     show identical numbers for the same portfolio.
     """
     try:
-        from models import User, MarketData
+        from models import User
 
         if period in ('1W', '7D'):
             period = '5D'
@@ -13023,8 +12795,8 @@ def public_portfolio_performance(slug, period):
         sp500_return = 0.0
 
         try:
-            from performance_calculator import calculate_portfolio_performance, get_period_dates, _sp500_benchmark_cache
-            _sp500_benchmark_cache.clear()
+            from performance_calculator import calculate_portfolio_performance, get_period_dates
+            import benchmark_series
 
             start_date, end_date = get_period_dates(period, user_id=user.id)
             result = calculate_portfolio_performance(
@@ -13036,33 +12808,8 @@ def public_portfolio_performance(slug, period):
                 portfolio_return = result.get('portfolio_return', 0.0)
 
             # Period-level S&P 500 return (full period range, not the user's
-            # first snapshot date) — identical to the mobile endpoint.
-            period_start, period_end = get_period_dates(period)
-            if period in ('1D', '5D'):
-                sp_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_INTRADAY',
-                    MarketData.date >= period_start,
-                    MarketData.date <= period_end,
-                    MarketData.timestamp.isnot(None)
-                ).order_by(MarketData.timestamp.asc()).all()
-                if not sp_records or len(sp_records) < 2:
-                    sp_records = MarketData.query.filter(
-                        MarketData.ticker == 'SPY_SP500',
-                        MarketData.date >= period_start,
-                        MarketData.date <= period_end
-                    ).order_by(MarketData.date.asc()).all()
-            else:
-                sp_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_SP500',
-                    MarketData.date >= period_start,
-                    MarketData.date <= period_end
-                ).order_by(MarketData.date.asc()).all()
-
-            if sp_records and len(sp_records) >= 2:
-                base_val = float(sp_records[0].close_price)
-                end_val = float(sp_records[-1].close_price)
-                if base_val > 0:
-                    sp500_return = round(((end_val - base_val) / base_val) * 100, 2)
+            # first snapshot date) — the shared series the mobile endpoint uses.
+            sp500_return = benchmark_series.for_period(period).period_return()
         except Exception as e:
             logger.warning(f"Unified calculator failed for public chart (user {user.id}): {e}")
 
@@ -6,7 +6,7 @@ Updated: 2025-09-22 - Fixed 5D chart distribution
 import json
 from datetime import datetime, timedelta, date
 from flask import request, jsonify
-from models import db, PortfolioSnapshotIntraday, MarketData
+from models import db, PortfolioSnapshotIntraday
 from portfolio_performance import PortfolioPerformanceCalculator
 import logging
 
@@ -100,13 +100,9 @@ def get_cached_sp500_chart(period: str):
         days_back = period_days.get(period, 30)
         start_date = today - timedelta(days=days_back)
         
-        # Query MarketData for SPY_SP500 daily closes
-        records = MarketData.query.filter(
-            MarketData.ticker == 'SPY_SP500',
-            MarketData.date >= start_date,
-            MarketData.date <= today,
-            MarketData.timestamp.is_(None)  # daily records only
-        ).order_by(MarketData.date.asc()).all()
+        # SPY_SP500 daily closes from the shared benchmark series
+        import benchmark_series
+        records = benchmark_series.daily().between(start_date, today).points
         
         if not records:
             logger.warning(f"No MarketData SPY_SP500 records found for period {period}")
@@ -17,6 +17,14 @@ performs full verification:
   4. Verify the JWS ES256 signature with the leaf certificate's public key.
   5. Return the decoded payload only if all checks pass; otherwise raise.
 
+Apple signs thousands of notifications/transactions with the same leaf +
+intermediate, so steps 1-3 are cached: a chain that verified once is keyed by
+the SHA-256 of its x5c entries (and the pinned root) in a bounded LRU holding
+the leaf public key and the chain's common validity window. A repeat chain
+skips parsing and link verification; only the validity window and step 4 run.
+Only successful verifications are cached. Benchmark:
+scripts/benchmark_apple_jws.py.
+
 TRUST ANCHOR (one-time setup): download Apple Root CA - G3 (DER) from
 https://www.apple.com/certificateauthority/AppleRootCA-G3.cer and commit it to
 certs/AppleRootCA-G3.cer (or point APPLE_ROOT_CA_PATH at it). Until the file is
@@ -24,11 +32,14 @@ present the caller falls back to decode-only (see iap_validation_service).
 """
 
 import base64
+import hashlib
 import json
 import logging
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Optional
+from typing import NamedTuple, Optional
 
 from cryptography import x509
 from cryptography.hazmat.primitives import hashes
@@ -96,6 +107,73 @@ def is_configured() -> bool:
     return _load_root_cert() is not None
 
 
+# ── Verified-chain cache ─────────────────────────────────────────────────────
+
+CHAIN_CACHE_SIZE = max(1, int(os.environ.get('APPLE_JWS_CHAIN_CACHE_SIZE', '64')))
+
+
+class VerifiedChain(NamedTuple):
+    leaf_key: object          # the leaf's public key
+    not_before: datetime      # latest not_valid_before in the chain
+    not_after: datetime       # earliest not_valid_after in the chain
+
+
+_chain_cache = OrderedDict()  # chain key -> VerifiedChain, least recently used first
+_chain_lock = threading.Lock()
+_chain_stats = {'hits': 0, 'misses': 0}
+
+
+def chain_cache_key(x5c, root: Optional[x509.Certificate] = None) -> bytes:
+    """Fingerprint of an x5c chain (as sent) plus the root it was pinned to."""
+    h = hashlib.sha256(root.fingerprint(hashes.SHA256()) if root is not None else b'unpinned')
+    for entry in x5c:
+        h.update(b'|')
+        h.update(entry.encode() if isinstance(entry, str) else entry)
+    return h.digest()
+
+
+def cached_leaf_key(key: bytes, now: Optional[datetime] = None):
+    """The leaf public key of a previously verified chain still inside its
+    validity window, or None (miss / expired — verify the chain again)."""
+    now = now or datetime.now(timezone.utc)
+    with _chain_lock:
+        entry = _chain_cache.get(key)
+        if entry is None or not (entry.not_before <= now <= entry.not_after):
+            if entry is not None:
+                del _chain_cache[key]
+            _chain_stats['misses'] += 1
+            return None
+        _chain_cache.move_to_end(key)
+        _chain_stats['hits'] += 1
+        return entry.leaf_key
+
+
+def remember_chain(key: bytes, chain) -> None:
+    """Cache a chain (list of certificates, leaf first) that just verified."""
+    entry = VerifiedChain(
+        leaf_key=chain[0].public_key(),
+        not_before=max(c.not_valid_before_utc for c in chain),
+        not_after=min(c.not_valid_after_utc for c in chain),
+    )
+    with _chain_lock:
+        _chain_cache[key] = entry
+        _chain_cache.move_to_end(key)
+        while len(_chain_cache) > CHAIN_CACHE_SIZE:
+            _chain_cache.popitem(last=False)
+
+
+def chain_cache_info() -> dict:
+    with _chain_lock:
+        return dict(_chain_stats, size=len(_chain_cache), max_size=CHAIN_CACHE_SIZE)
+
+
+def reset_chain_cache():
+    """Test/benchmark helper — forget every verified chain."""
+    with _chain_lock:
+        _chain_cache.clear()
+        _chain_stats.update(hits=0, misses=0)
+
+
 def _verify_cert_signed_by(child: x509.Certificate, parent: x509.Certificate):
     pub = parent.public_key()
     if isinstance(pub, ec.EllipticCurvePublicKey):
@@ -108,6 +186,37 @@ def _verify_cert_signed_by(child: x509.Certificate, parent: x509.Certificate):
         raise AppleJWSVerificationError('unsupported_parent_key_type')
 
 
+def _verify_chain(x5c, root, now, cache_key):
+    """Steps 1-3 of the module docstring for an uncached chain; caches and
+    returns the leaf public key, or raises AppleJWSVerificationError."""
+    try:
+        # x5c entries are standard (not url-safe) base64-encoded DER certs.
+        chain = [_load_cert(base64.b64decode(c)) for c in x5c]
+    except Exception:
+        raise AppleJWSVerificationError('invalid_x5c_certificate')
+    leaf = chain[0]
+
+    # 1) Pin: the chain must terminate at the Apple Root CA - G3 we ship.
+    if chain[-1].fingerprint(hashes.SHA256()) != root.fingerprint(hashes.SHA256()):
+        raise AppleJWSVerificationError('untrusted_root')
+
+    # 2) Validity windows + each link is really signed by its parent.
+    for i, cert in enumerate(chain):
+        if not (cert.not_valid_before_utc <= now <= cert.not_valid_after_utc):
+            raise AppleJWSVerificationError('certificate_expired_or_not_yet_valid')
+        if i + 1 < len(chain):
+            try:
+                _verify_cert_signed_by(cert, chain[i + 1])
+            except InvalidSignature:
+                raise AppleJWSVerificationError('broken_certificate_chain')
+
+    if not isinstance(leaf.public_key(), ec.EllipticCurvePublicKey):
+        raise AppleJWSVerificationError('unexpected_leaf_key_type')
+
+    remember_chain(cache_key, chain)
+    return leaf.public_key()
+
+
 def verify_and_decode(jws: str) -> dict:
     """Verify `jws` against Apple's pinned root and return its decoded payload.
 
@@ -133,32 +242,13 @@ def verify_and_decode(jws: str) -> dict:
     if not x5c or len(x5c) < 2:
         raise AppleJWSVerificationError('missing_x5c_chain')
 
-    try:
-        # x5c entries are standard (not url-safe) base64-encoded DER certs.
-        chain = [_load_cert(base64.b64decode(c)) for c in x5c]
-    except Exception:
-        raise AppleJWSVerificationError('invalid_x5c_certificate')
-    leaf = chain[0]
-
-    # 1) Pin: the chain must terminate at the Apple Root CA - G3 we ship.
-    if chain[-1].fingerprint(hashes.SHA256()) != root.fingerprint(hashes.SHA256()):
-        raise AppleJWSVerificationError('untrusted_root')
-
-    # 2) Validity windows + each link is really signed by its parent.
     now = datetime.now(timezone.utc)
-    for i, cert in enumerate(chain):
-        if not (cert.not_valid_before_utc <= now <= cert.not_valid_after_utc):
-            raise AppleJWSVerificationError('certificate_expired_or_not_yet_valid')
-        if i + 1 < len(chain):
-            try:
-                _verify_cert_signed_by(cert, chain[i + 1])
-            except InvalidSignature:
-                raise AppleJWSVerificationError('broken_certificate_chain')
+    cache_key = chain_cache_key(x5c, root)
+    leaf_pub = cached_leaf_key(cache_key, now)
+    if leaf_pub is None:
+        leaf_pub = _verify_chain(x5c, root, now, cache_key)
 
     # 3) Verify the JWS signature with the leaf's public key (ES256).
-    leaf_pub = leaf.public_key()
-    if not isinstance(leaf_pub, ec.EllipticCurvePublicKey):
-        raise AppleJWSVerificationError('unexpected_leaf_key_type')
     try:
         jwt.decode(jws, key=leaf_pub, algorithms=['ES256'],
                    options={'verify_signature': True, 'verify_exp': False,
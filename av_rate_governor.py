@@ -0,0 +1,216 @@
+"""
+AlphaVantage request governor — one rate budget for every AV caller.
+
+The Premium key allows 150 calls per rolling minute *per key*, but until now
+each caller paced itself independently: bot_data_hub slept a fixed 0.43s
+between submissions, portfolio_performance slept 100-150ms before single
+calls, and dividend_tracker / stock_metadata_utils did not pace at all. Two of
+them running in the same process could jointly blow the cap, while the daily
+bars refresh left most of the budget unused (fixed sleeps at 4 workers).
+
+This module replaces those sleeps with a single per-process governor:
+
+  * Sliding 60s window of call timestamps — a caller blocks only until the
+    oldest call in the window ages out, so bursts up to the full budget are
+    allowed and the steady state is exactly AV_CALLS_PER_MINUTE.
+  * Adaptive backoff — when AV answers with its {"Note": ...} /
+    {"Information": ...} throttle envelope (HTTP 200, no data), every caller
+    in the process pauses with exponential backoff, and the throttled request
+    is retried. A success resets the backoff.
+
+Request paths get a bounded wait: inside a Flask request that is not a cron
+or admin route, av_get gives up after AV_REQUEST_MAX_WAIT_S (raising
+AVBudgetExhausted, so the caller serves its cached value) instead of holding
+the user's request for up to a whole window. Crons and scripts keep blocking.
+
+The window is per process. Within a cron invocation (the only place that
+spends the budget in bulk) that is exact; across concurrently warm serverless
+instances the throttle backoff is the safety net.
+
+Usage:
+    from av_rate_governor import av_get
+    resp = av_get('https://www.alphavantage.co/query', params={...}, timeout=15)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+AV_CALLS_PER_MINUTE = int(os.environ.get('AV_CALLS_PER_MINUTE', '150'))
+AV_WINDOW_SECONDS = 60.0
+AV_REQUEST_MAX_WAIT_S = float(os.environ.get('AV_REQUEST_MAX_WAIT_S', '3'))
+
+# Request paths that spend the budget in bulk and may wait for it.
+_BLOCKING_PATH_PREFIXES = ('/api/cron/', '/admin')
+
+# Throttle backoff: first pause, multiplier, ceiling (seconds).
+_BACKOFF_INITIAL_S = 2.0
+_BACKOFF_FACTOR = 2.0
+_BACKOFF_MAX_S = 60.0
+
+# AV uses the same envelope keys for throttling and for a few non-throttle
+# notices (e.g. "this is a premium endpoint"). Only back off on the former.
+_THROTTLE_MARKERS = ('call frequency', 'rate limit', 'per minute', 'calls per', 'requests per')
+
+
+def is_throttle_response(data):
+    """True if an AV JSON body is the rate-limit envelope rather than data."""
+    if not isinstance(data, dict):
+        return False
+    note = data.get('Note') or data.get('Information')
+    if not note:
+        return False
+    note = str(note).lower()
+    return any(m in note for m in _THROTTLE_MARKERS)
+
+
+class AVRateGovernor:
+    """Thread-safe sliding-window limiter with shared throttle backoff.
+
+    `clock` / `sleep` are injectable so tests can drive it without waiting.
+    """
+
+    def __init__(self, max_calls=AV_CALLS_PER_MINUTE, window_s=AV_WINDOW_SECONDS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_calls = max(1, int(max_calls))
+        self.window_s = float(window_s)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._paused_until = 0.0
+        self._backoff_s = 0.0
+        self.total_calls = 0
+        self.total_throttled = 0
+        self.total_wait_s = 0.0
+
+    def _wait_needed(self, now):
+        """Seconds until a slot is free (0 = go now). Caller holds the lock."""
+        while self._calls and now - self._calls[0] >= self.window_s:
+            self._calls.popleft()
+        wait = max(0.0, self._paused_until - now)
+        if len(self._calls) >= self.max_calls:
+            wait = max(wait, self._calls[0] + self.window_s - now)
+        return wait
+
+    def acquire(self, deadline=None):
+        """Block until a call may be made, then record it.
+
+        `deadline` is an absolute value of the governor's clock; if no slot
+        opens before it, returns False without recording a call.
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                wait = self._wait_needed(now)
+                if wait <= 0:
+                    self._calls.append(now)
+                    self.total_calls += 1
+                    return True
+                if deadline is not None and now + wait > deadline:
+                    return False
+                nap = min(wait, 1.0)
+                self.total_wait_s += nap
+            # Re-check after waking: another thread may have taken the slot.
+            self._sleep(nap)
+
+    def report_throttle(self):
+        """AV returned a throttle envelope: pause every caller, grow backoff."""
+        with self._lock:
+            self._backoff_s = min(
+                _BACKOFF_MAX_S,
+                self._backoff_s * _BACKOFF_FACTOR if self._backoff_s else _BACKOFF_INITIAL_S,
+            )
+            self._paused_until = max(self._paused_until, self._clock() + self._backoff_s)
+            self.total_throttled += 1
+            backoff = self._backoff_s
+        logger.warning(f"AV throttle response — pausing all AV calls for {backoff:.0f}s")
+
+    def report_success(self):
+        with self._lock:
+            self._backoff_s = 0.0
+
+    def remaining(self):
+        """Calls still available in the current window (ignores backoff)."""
+        with self._lock:
+            self._wait_needed(self._clock())
+            return self.max_calls - len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_calls_per_window': self.max_calls,
+                'window_s': self.window_s,
+                'calls_in_window': len(self._calls),
+                'total_calls': self.total_calls,
+                'total_throttled': self.total_throttled,
+                'total_wait_s': round(self.total_wait_s, 2),
+                'backoff_s': self._backoff_s,
+            }
+
+
+governor = AVRateGovernor()
+
+# Pooled connection reuse for the bulk crons (hundreds of calls per invocation).
+_session = requests.Session()
+
+
+class AVBudgetExhausted(Exception):
+    """No AV slot opened before the caller's deadline."""
+
+
+def _default_deadline():
+    """Deadline for a caller that didn't pass one: short inside a user-facing
+    request, none (block) in crons, admin routes and outside Flask."""
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if not has_request_context() or request.path.startswith(_BLOCKING_PATH_PREFIXES):
+        return None
+    return time.monotonic() + AV_REQUEST_MAX_WAIT_S
+
+
+def av_get(url, params=None, timeout=15, max_throttle_retries=2, deadline=None):
+    """GET an AlphaVantage URL under the shared governor.
+
+    Returns the final `requests.Response`. Throttle envelopes are retried up to
+    `max_throttle_retries` times after the governor's backoff; if they persist
+    the last (throttled) response is returned so callers' existing
+    Note/Information handling still applies. Non-JSON bodies (EARNINGS_CALENDAR
+    is CSV) are passed through untouched.
+
+    Raises AVBudgetExhausted if `deadline` (time.monotonic()) passes first.
+    Without one, user-facing requests wait at most AV_REQUEST_MAX_WAIT_S.
+    """
+    if deadline is None:
+        deadline = _default_deadline()
+    from perf_tracing import span
+    label = f"av:{(params or {}).get('function', 'GET')}"
+    attempt = 0
+    while True:
+        with span('av_wait', kind='av_wait'):
+            acquired = governor.acquire(deadline=deadline)
+        if not acquired:
+            raise AVBudgetExhausted(f"no AV slot before deadline ({url})")
+        with span(label, kind='av'):
+            resp = _session.get(url, params=params, timeout=timeout)
+        throttled = False
+        if resp.status_code == 200 and resp.content[:1] == b'{':
+            try:
+                throttled = is_throttle_response(resp.json())
+            except ValueError:
+                throttled = False
+        if not throttled:
+            governor.report_success()
+            return resp
+        governor.report_throttle()
+        attempt += 1
+        if attempt > max_throttle_retries:
+            return resp
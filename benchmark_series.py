@@ -0,0 +1,352 @@
+"""
+Shared S&P 500 benchmark series: SPY_SP500 daily closes and SPY_INTRADAY ticks.
+
+The benchmark used to be rebuilt wherever it was shown: the performance
+calculator (with a per-process memo that the public chart endpoint cleared on
+every request), the leaderboard S&P sparkline, the public portfolio chart, the
+snapshot chart fallback and the intraday chart handler each queried
+MarketData and re-normalized the rows themselves.
+
+This module loads each series once and hands every caller the same compact,
+sorted point list:
+
+    daily()               every SPY_SP500 close (one series, sliced in memory)
+    intraday(start, end)  SPY_INTRADAY ticks of a session window
+    for_period(period)    the benchmark window of a leaderboard / chart period
+                          (get_period_dates), intraday for 1D/5D with the
+                          daily closes as fallback
+
+Series are cached in two layers: a per-instance dict (L1_TTL_SECONDS) in
+front of the shared benchmark_series_cache table (packed float64 arrays,
+keyed by series and FORMAT_VERSION), so one instance builds a series from
+market_data and the rest of the fleet reuses it. Writers of benchmark rows
+call invalidate() after committing, which bumps the kind's generation
+(benchmark_series_generation): shared rows are stamped with the generation
+they were built under and only served while it is current, so a build that
+was already running when the data changed can't put the old series back. The
+L2 TTLs bound staleness for anything else. All shared-cache operations run on
+their own engine connection and are best-effort: without the tables
+(pre-migration) the L1 layer still works.
+
+upsert_daily() is the bulk write path for SPY_SP500 closes (backfills).
+"""
+
+import logging
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DAILY_TICKER = 'SPY_SP500'
+INTRADAY_TICKER = 'SPY_INTRADAY'
+INTRADAY_PERIODS = ('1D', '5D')
+
+FORMAT_VERSION = 1
+L1_TTL_SECONDS = 60
+L2_TTL_SECONDS = {'daily': 3600, 'intraday': 900}
+
+_EPOCH = datetime(1970, 1, 1)
+_local = {}
+
+
+class BenchmarkPoint(NamedTuple):
+    """One benchmark value, shaped like the MarketData rows callers used to read."""
+    date: date
+    timestamp: Optional[datetime]   # naive UTC; None for daily closes
+    close_price: float
+
+
+class Series:
+    """Sorted benchmark points of one kind ('daily' or 'intraday')."""
+
+    __slots__ = ('kind', 'points', '_dates')
+
+    def __init__(self, kind, points):
+        self.kind = kind
+        self.points = points
+        self._dates = [p.date for p in points]
+
+    def __len__(self):
+        return len(self.points)
+
+    def between(self, start=None, end=None):
+        """Points with start <= date <= end (either bound optional)."""
+        lo = 0 if start is None else bisect_left(self._dates, start)
+        hi = len(self.points) if end is None else bisect_right(self._dates, end)
+        return Series(self.kind, self.points[lo:hi])
+
+    def on(self, day):
+        """Last point dated `day`, or None."""
+        i = bisect_right(self._dates, day)
+        return self.points[i - 1] if i and self._dates[i - 1] == day else None
+
+    def first_on_or_after(self, day):
+        i = bisect_left(self._dates, day)
+        return self.points[i] if i < len(self.points) else None
+
+    def last_on_or_before(self, day):
+        i = bisect_right(self._dates, day)
+        return self.points[i - 1] if i else None
+
+    def pct_changes(self):
+        """% change of every point from the first (2 decimals); [] with fewer
+        than two points or a zero base."""
+        if len(self.points) < 2 or not self.points[0].close_price:
+            return []
+        base = self.points[0].close_price
+        return [round((p.close_price - base) / base * 100, 2) for p in self.points]
+
+    def period_return(self):
+        changes = self.pct_changes()
+        return changes[-1] if changes else 0.0
+
+
+def _pack(values):
+    return array('d', values).tobytes()
+
+
+def _unpack(blob):
+    arr = array('d')
+    arr.frombytes(bytes(blob))
+    return arr.tolist()
+
+
+def _utc_naive(ts):
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _encode(series):
+    return {
+        'kind': series.kind,
+        'points': len(series),
+        'dates': _pack([p.date.toordinal() for p in series.points]),
+        'stamps': _pack([(_utc_naive(p.timestamp) - _EPOCH).total_seconds() if p.timestamp else math.nan
+                         for p in series.points]),
+        'closes': _pack([p.close_price for p in series.points]),
+    }
+
+
+def _decode(kind, dates, stamps, closes):
+    return Series(kind, [
+        BenchmarkPoint(date.fromordinal(int(d)), None if math.isnan(s) else _EPOCH + timedelta(seconds=s), c)
+        for d, s, c in zip(_unpack(dates), _unpack(stamps), _unpack(closes))
+    ])
+
+
+# ── shared (L2) cache ───────────────────────────────────────────────────────
+
+def _current_generation(kind):
+    """Scalar subquery: the kind's invalidation generation (0 if never bumped)."""
+    from sqlalchemy import func, select
+    from models import BenchmarkSeriesGeneration
+    gen = BenchmarkSeriesGeneration.__table__
+    return select(func.coalesce(
+        select(gen.c.generation).where(gen.c.kind == kind).scalar_subquery(), 0)).scalar_subquery()
+
+
+def _l2_get(key, kind):
+    """(series or None, current generation of `kind` or None if unavailable)."""
+    from sqlalchemy import select
+    from models import db, BenchmarkSeriesCache
+    table = BenchmarkSeriesCache.__table__
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=L2_TTL_SECONDS[kind])
+        current = _current_generation(kind)
+        with db.engine.connect() as conn:
+            row = conn.execute(select(table, current.label('current')).where(
+                table.c.series_key == key, table.c.version == FORMAT_VERSION, table.c.updated_at >= cutoff,
+            )).first()
+            if row is not None and row.generation == row.current:
+                return _decode(row.kind, row.dates, row.stamps, row.closes), row.current
+            return None, conn.execute(select(current)).scalar()
+    except Exception as e:
+        logger.debug(f"benchmark series L2 read skipped for {key}: {e}")
+    return None, None
+
+
+def _l2_set(key, series, generation):
+    """Store `series`, built under `generation`. Compare-and-set: an existing
+    row is only replaced while `generation` is still current, and a row that
+    lands after an invalidation is stamped stale and never served."""
+    from models import db, BenchmarkSeriesCache
+    table = BenchmarkSeriesCache.__table__
+    row = {'series_key': key, 'version': FORMAT_VERSION, 'generation': generation,
+           'updated_at': datetime.utcnow(), **_encode(series)}
+    try:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['series_key'], set_={c: stmt.excluded[c] for c in row if c != 'series_key'},
+            where=stmt.excluded.generation == _current_generation(series.kind))
+        with db.engine.begin() as conn:
+            conn.execute(stmt, row)
+    except Exception as e:
+        logger.debug(f"benchmark series L2 write skipped for {key}: {e}")
+
+
+def invalidate(kind=None):
+    """Drop cached series of `kind` ('daily', 'intraday' or None = all) on
+    this instance and in the shared table, and bump the kind's generation so
+    builds already in flight can't write their result back. Call after
+    committing benchmark rows; other instances pick the change up within
+    L1_TTL_SECONDS."""
+    from models import db, BenchmarkSeriesCache, BenchmarkSeriesGeneration
+    for key in [k for k in _local if kind is None or k.split(':', 1)[0] == kind]:
+        _local.pop(key, None)
+    table = BenchmarkSeriesCache.__table__
+    gen = BenchmarkSeriesGeneration.__table__
+    try:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        with db.engine.begin() as conn:
+            for k in sorted(L2_TTL_SECONDS) if kind is None else [kind]:
+                stmt = insert(gen).values(kind=k, generation=1)
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=['kind'], set_={'generation': gen.c.generation + 1}))
+            conn.execute(table.delete() if kind is None else table.delete().where(table.c.kind == kind))
+    except Exception as e:
+        logger.debug(f"benchmark series L2 invalidation skipped: {e}")
+
+
+def _cached(key, kind, load):
+    hit = _local.get(key)
+    now = time.monotonic()
+    if hit and hit[0] > now:
+        return hit[1]
+    series, generation = _l2_get(key, kind)
+    if series is None:
+        series = load()
+        if generation is not None:
+            _l2_set(key, series, generation)
+    _local[key] = (now + L1_TTL_SECONDS, series)
+    return series
+
+
+# ── series ──────────────────────────────────────────────────────────────────
+
+def _load_daily():
+    from models import db, MarketData
+    rows = db.session.query(MarketData.date, MarketData.close_price).filter(
+        MarketData.ticker == DAILY_TICKER, MarketData.timestamp.is_(None),
+    ).order_by(MarketData.date.asc(), MarketData.id.asc())
+    closes = {}
+    for day, close in rows:
+        closes[day] = float(close)   # one close per date (last write wins)
+    return Series('daily', [BenchmarkPoint(d, None, c) for d, c in closes.items()])
+
+
+def _load_intraday(start, end):
+    from models import db, MarketData
+    rows = db.session.query(MarketData.date, MarketData.timestamp, MarketData.close_price).filter(
+        MarketData.ticker == INTRADAY_TICKER,
+        MarketData.date >= start, MarketData.date <= end,
+        MarketData.timestamp.isnot(None),
+    ).order_by(MarketData.timestamp.asc())
+    # SPY_INTRADAY already holds the S&P 500 value (SPY * 10).
+    return Series('intraday', [BenchmarkPoint(d, _utc_naive(ts), float(c)) for d, ts, c in rows])
+
+
+def daily():
+    """Every SPY_SP500 close, oldest first."""
+    return _cached('daily', 'daily', _load_daily)
+
+
+def intraday(start, end):
+    """SPY_INTRADAY ticks dated start..end (ET session dates), in time order."""
+    return _cached(f'intraday:{start.isoformat()}:{end.isoformat()}', 'intraday',
+                   lambda: _load_intraday(start, end))
+
+
+def for_period(period):
+    """
+    Benchmark series for a chart / leaderboard period over the same window
+    as get_period_dates(period).
+
+    1D/5D use the intraday ticks; a window with a single tick gets the
+    previous session's close as its base point, and one without ticks falls
+    back to the daily closes. Other periods slice the daily closes.
+    """
+    import trading_calendar
+    from performance_calculator import get_period_dates
+    start, end = get_period_dates(period)
+    if period.upper() in INTRADAY_PERIODS:
+        ticks = intraday(start, end)
+        if len(ticks) == 1:
+            prev = daily().on(trading_calendar.previous_session(start))
+            if prev is not None:
+                return Series('intraday', [prev] + ticks.points)
+        if len(ticks):
+            return ticks
+    return daily().between(start, end)
+
+
+def simple_return(start, end):
+    """
+    S&P 500 % return from `start` to `end` (simple, not time-weighted).
+
+    Same day: first to last intraday tick, or the previous session's close to
+    the day's close when there are fewer than two ticks. Longer windows: the
+    first close on/after `start` to the last close on/before `end`. 0.0 when
+    data is missing.
+    """
+    import trading_calendar
+    closes = daily()
+    if start == end:
+        ticks = intraday(start, end)
+        if len(ticks) >= 2:
+            first, last = ticks.points[0], ticks.points[-1]
+        else:
+            first, last = closes.on(trading_calendar.previous_session(start)), closes.on(end)
+    else:
+        first, last = closes.first_on_or_after(start), closes.last_on_or_before(end)
+    if first is None or last is None or not first.close_price:
+        logger.warning(f"Missing S&P 500 data for {start} to {end}")
+        return 0.0
+    return (last.close_price - first.close_price) / first.close_price * 100
+
+
+# ── writes ──────────────────────────────────────────────────────────────────
+
+def upsert_daily(closes, tolerance=0.01):
+    """
+    Bulk insert-or-update SPY_SP500 closes ({date: value}): one read of the
+    existing closes in range, one multi-row INSERT for new dates and one
+    executemany UPDATE for changed ones. Does not commit; call invalidate()
+    after committing. Returns (inserted, updated, unchanged).
+    """
+    from sqlalchemy import bindparam, insert, update
+    from models import db, MarketData
+    if not closes:
+        return 0, 0, 0
+    existing = {}
+    for row_id, day, close in db.session.query(MarketData.id, MarketData.date, MarketData.close_price).filter(
+            MarketData.ticker == DAILY_TICKER, MarketData.timestamp.is_(None),
+            MarketData.date >= min(closes), MarketData.date <= max(closes)).order_by(MarketData.id):
+        existing[day] = (row_id, close)
+
+    now = datetime.utcnow()
+    new_rows, changed = [], []
+    for day, value in sorted(closes.items()):
+        if day not in existing:
+            new_rows.append({'ticker': DAILY_TICKER, 'date': day, 'close_price': value, 'created_at': now})
+        elif abs(existing[day][1] - value) > tolerance:
+            changed.append({'row_id': existing[day][0], 'value': value})
+    table = MarketData.__table__
+    if new_rows:
+        db.session.execute(insert(table), new_rows)
+    if changed:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('row_id')).values(close_price=bindparam('value')),
+            changed)
+    return len(new_rows), len(changed), len(closes) - len(new_rows) - len(changed)
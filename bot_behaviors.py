@@ -325,20 +325,10 @@ def _count_streak(recent_trades, streak_type):
 
 
 def is_market_hours():
-    """Check if US market is currently open (rough check)."""
-    now = datetime.utcnow()
-    # Market hours: 9:30 AM - 4:00 PM ET (14:30 - 21:00 UTC)
-    # Rough check — doesn't account for holidays
-    hour_utc = now.hour
-    weekday = now.weekday()
-
-    if weekday >= 5:  # Weekend
-        return False
-    if hour_utc < 14 or hour_utc >= 21:  # Before 9:30 AM or after 4 PM ET
-        return False
-    if hour_utc == 14 and now.minute < 30:  # Before 9:30 AM ET
-        return False
-    return True
+    """Check if US market is currently open (holidays and early closes
+    included; trading_calendar works offline)."""
+    import trading_calendar
+    return trading_calendar.is_open()
 
 
 def add_trade_delay():
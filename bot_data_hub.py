@@ -132,10 +132,15 @@ def get_sector_for_ticker(ticker):
 # the intraday tip; the daily refresh cron uses TIME_SERIES_DAILY concurrently.
 
 
-# How many seconds between AV calls to stay under 150/min. With a small
-# safety margin (140 req/min effective) the inter-call gap is ~0.43s.
-_AV_RATE_LIMIT_RPS = 140.0 / 60.0  # ~2.33 req/sec
-_AV_MIN_INTERVAL_S = 1.0 / _AV_RATE_LIMIT_RPS
+# Every AV call goes through av_rate_governor.av_get, which enforces the
+# 150/min sliding window for the whole process and backs off on throttle
+# envelopes — no per-call sleeps here.
+from av_rate_governor import av_get, governor as av_governor, AVBudgetExhausted
+
+# Workers for the per-ticker fetchers. The governor is the real limiter; this
+# only needs to be high enough that HTTP latency doesn't leave budget unused
+# (~0.3-0.8s per call -> 8 workers comfortably exceed 2.5 calls/sec).
+AV_FETCH_WORKERS = int(os.environ.get('AV_FETCH_WORKERS', '8'))
 
 
 def fetch_realtime_bulk_quotes(tickers, chunk_size=100):
@@ -164,7 +169,7 @@ def fetch_realtime_bulk_quotes(tickers, chunk_size=100):
                f"&symbol={symbols_str}&entitlement=realtime&apikey={ALPHA_VANTAGE_KEY}")
         t0 = time.time()
         try:
-            resp = requests.get(url, timeout=15)
+            resp = av_get(url, timeout=15)
             elapsed_ms = int((time.time() - t0) * 1000)
             data = resp.json() if resp.status_code == 200 else {}
             entries = data.get('data') or []
@@ -208,20 +213,19 @@ def fetch_realtime_bulk_quotes(tickers, chunk_size=100):
                              f'BULK({len(chunk)})', 'error', elapsed_ms)
             logger.warning(f"REALTIME_BULK_QUOTES chunk {chunk_idx+1} failed: {e}")
 
-        # Pause between chunks to stay well under 150/min (one bulk call per
-        # second is more than safe even at 100 chunks/minute).
-        if chunk_idx < len(chunks) - 1:
-            time.sleep(_AV_MIN_INTERVAL_S)
 
     logger.info(f"REALTIME_BULK_QUOTES returned {len(quotes)}/{len(tickers)} tickers")
     return quotes
 
 
-def _fetch_av_daily_bars_single(ticker):
+def _fetch_av_daily_bars_single(ticker, deadline=None, misses=None):
     """Fetch 100-day OHLCV from AlphaVantage TIME_SERIES_DAILY for one ticker.
 
     Returns (ticker, DataFrame) on success or (ticker, None) on failure.
-    Caller is responsible for rate limiting between calls.
+    Pacing is handled by the shared AV governor; `deadline` (time.monotonic())
+    makes the call give up instead of waiting for a slot past the cron window.
+    If AV answers but has no usable bars for the symbol (not a throttle,
+    deadline or network failure), the ticker is added to the `misses` set.
     """
     if np is None:
         # pandas is also a heavy dep; this function should never be called
@@ -233,7 +237,7 @@ def _fetch_av_daily_bars_single(ticker):
     try:
         url = (f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY"
                f"&symbol={ticker}&outputsize=compact&apikey={ALPHA_VANTAGE_KEY}")
-        resp = requests.get(url, timeout=15)
+        resp = av_get(url, timeout=15, deadline=deadline)
         elapsed_ms = int((time.time() - t0) * 1000)
         data = resp.json() if resp.status_code == 200 else {}
         ts = data.get('Time Series (Daily)') or {}
@@ -242,25 +246,28 @@ def _fetch_av_daily_bars_single(ticker):
             note = data.get('Note') or data.get('Information') or data.get('Error Message')
             status = 'rate_limited' if (note and 'limit' in str(note).lower()) else 'error'
             _log_av_api_call('TIME_SERIES_DAILY', ticker, status, elapsed_ms)
+            if misses is not None and status == 'error' and resp.status_code == 200:
+                misses.add(ticker)
             if note:
                 logger.warning(f"TIME_SERIES_DAILY {ticker}: {note}")
             return (ticker, None)
 
         _log_av_api_call('TIME_SERIES_DAILY', ticker, 'success', elapsed_ms)
-        rows = []
-        for date_str, vals in ts.items():
-            rows.append({
-                'Date': pd.Timestamp(date_str),
-                'Open': float(vals.get('1. open', 0)),
-                'High': float(vals.get('2. high', 0)),
-                'Low': float(vals.get('3. low', 0)),
-                'Close': float(vals.get('4. close', 0)),
-                'Volume': float(vals.get('5. volume', 0)),
-            })
-        df = pd.DataFrame(rows).set_index('Date').sort_index()
+        # Build the frame column-wise from AV's {date: {"1. open": "..."}} map
+        # instead of one dict per row.
+        df = pd.DataFrame.from_dict(ts, orient='index')
+        df = df.rename(columns=_AV_DAILY_COLUMNS)[list(_AV_DAILY_COLUMNS.values())]
+        df = df.apply(pd.to_numeric, errors='coerce').fillna(0.0).astype(float)
+        df.index = pd.to_datetime(df.index)
+        df.index.name = 'Date'
+        df = df.sort_index()
         if len(df) < 20:
+            if misses is not None:
+                misses.add(ticker)
             return (ticker, None)
         return (ticker, df)
+    except AVBudgetExhausted:
+        return (ticker, None)
     except Exception as e:
         elapsed_ms = int((time.time() - t0) * 1000)
         _log_av_api_call('TIME_SERIES_DAILY', ticker, 'error', elapsed_ms)
@@ -268,7 +275,16 @@ def _fetch_av_daily_bars_single(ticker):
         return (ticker, None)
 
 
-def fetch_av_daily_bars_concurrent(tickers, max_workers=4):
+_AV_DAILY_COLUMNS = {
+    '1. open': 'Open',
+    '2. high': 'High',
+    '3. low': 'Low',
+    '4. close': 'Close',
+    '5. volume': 'Volume',
+}
+
+
+def fetch_av_daily_bars_concurrent(tickers, max_workers=None, deadline=None, misses=None):
     """
     Fetch 100-day OHLCV history for `tickers` from AlphaVantage TIME_SERIES_DAILY
     with bounded concurrency. Used by /api/cron/refresh-daily-bars to populate
@@ -276,34 +292,32 @@ def fetch_av_daily_bars_concurrent(tickers, max_workers=4):
 
     Returns dict of {ticker: DataFrame[Open,High,Low,Close,Volume]}.
 
-    Rate-limit math (premium 150/min):
-        With max_workers=4 and 0.43s gap per worker = ~9.3 calls/sec total.
-        That's WAY over the 2.5/sec sustained limit, BUT AV throttles in
-        sliding 60s windows so short bursts are fine as long as the total
-        per minute stays <= 150. We pace each call to avg ~2.3 req/sec.
+    Rate limiting is the shared AV governor's job (150/min sliding window +
+    throttle backoff), so all tickers are submitted at once and workers block
+    on the governor. The first 150 calls of a fresh window go out as fast as
+    the workers can issue them. With `deadline` set, tickers that cannot get a
+    slot before it are skipped (absent from the result) rather than overrunning
+    the function timeout — the cron picks them up on its next run.
+
+    Pass a set as `misses` to collect the tickers AV answered for without
+    usable bars (see record_daily_bar_misses).
     """
     if not ALPHA_VANTAGE_KEY:
         logger.error("No ALPHA_VANTAGE_API_KEY set — cannot fetch daily bars")
         return {}
 
     from concurrent.futures import ThreadPoolExecutor, as_completed
+    from perf_tracing import bind
 
+    max_workers = max_workers or AV_FETCH_WORKERS
     result = {}
     n = len(tickers)
     logger.info(f"TIME_SERIES_DAILY concurrent fetch: {n} tickers, workers={max_workers}")
     start = time.time()
 
-    # Token-bucket-ish pacing: stagger submissions so total throughput
-    # stays near 2.3 req/sec (140/min effective, well under 150/min limit).
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for i, ticker in enumerate(tickers):
-            futures.append(executor.submit(_fetch_av_daily_bars_single, ticker))
-            # Sleep between submissions — this single-threadedly enforces
-            # the global rate. With max_workers=4 the workers run in parallel
-            # but submissions are paced so the steady-state is ~2.3 req/sec.
-            time.sleep(_AV_MIN_INTERVAL_S)
-
+        fetch = bind(_fetch_av_daily_bars_single)
+        futures = [executor.submit(fetch, t, deadline, misses) for t in tickers]
         for fut in as_completed(futures):
             try:
                 ticker, df = fut.result()
@@ -313,10 +327,72 @@ def fetch_av_daily_bars_concurrent(tickers, max_workers=4):
                 logger.warning(f"Daily-bars worker exception: {e}")
 
     elapsed = time.time() - start
-    logger.info(f"TIME_SERIES_DAILY concurrent fetch: {len(result)}/{n} ok in {elapsed:.1f}s")
+    logger.info(f"TIME_SERIES_DAILY concurrent fetch: {len(result)}/{n} ok in {elapsed:.1f}s "
+                f"(governor: {av_governor.stats()})")
     return result
 
 
+def daily_bar_rows(ticker, df, fetched_at, source='av'):
+    """DailyPriceBar upsert rows for one ticker's OHLCV frame.
+
+    Column-wise conversion (one numpy -> list pass) instead of df.iterrows(),
+    which boxes every row into a Series.
+    """
+    if df is None or df.empty:
+        return []
+    values = df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=float).tolist()
+    dates = df.index.date if hasattr(df.index, 'date') else list(df.index)
+    return [
+        {
+            'ticker': ticker, 'date': d,
+            'open': o, 'high': h, 'low': l, 'close': c, 'volume': v,
+            'source': source, 'fetched_at': fetched_at,
+        }
+        for d, (o, h, l, c, v) in zip(dates, values)
+    ]
+
+
+# Negative cache for symbols AV has no bars for: retry after 12h, doubling
+# per consecutive miss, capped at a week.
+DAILY_BAR_MISS_BACKOFF = timedelta(hours=12)
+DAILY_BAR_MISS_BACKOFF_MAX = timedelta(days=7)
+
+
+def daily_bar_miss_backoff(misses):
+    """How long to skip a ticker after its `misses`-th consecutive miss."""
+    return min(DAILY_BAR_MISS_BACKOFF * (2 ** max(0, misses - 1)), DAILY_BAR_MISS_BACKOFF_MAX)
+
+
+def backed_off_daily_bar_tickers(tickers, now):
+    """Subset of `tickers` whose last miss is still inside its backoff."""
+    from models import db, DailyBarFetchMiss
+    if not tickers:
+        return set()
+    return {t for (t,) in db.session.query(DailyBarFetchMiss.ticker).filter(
+        DailyBarFetchMiss.ticker.in_(list(tickers)), DailyBarFetchMiss.retry_after > now)}
+
+
+def record_daily_bar_misses(missed, fetched, now):
+    """Bump the miss counter / backoff of `missed` tickers and clear the
+    negative cache for `fetched` ones. Caller commits."""
+    from models import db, DailyBarFetchMiss
+    if fetched:
+        DailyBarFetchMiss.query.filter(DailyBarFetchMiss.ticker.in_(list(fetched))) \
+            .delete(synchronize_session=False)
+    if not missed:
+        return
+    existing = {row.ticker: row for row in
+                DailyBarFetchMiss.query.filter(DailyBarFetchMiss.ticker.in_(list(missed)))}
+    for ticker in sorted(missed):
+        row = existing.get(ticker)
+        if row is None:
+            row = DailyBarFetchMiss(ticker=ticker, misses=0)
+            db.session.add(row)
+        row.misses += 1
+        row.last_attempt_at = now
+        row.retry_after = now + daily_bar_miss_backoff(row.misses)
+
+
 def _load_cached_daily_bars_via_http(tickers, min_bars=20, max_bars=100):
     """Fetch DailyPriceBar cache via HTTP from the Vercel-hosted app.
 
@@ -875,7 +951,7 @@ def fetch_news_sentiment():
                    f"&topics={topic}&limit=50&sort=RELEVANCE"
                    f"&apikey={ALPHA_VANTAGE_KEY}")
             t0 = time.time()
-            resp = requests.get(url, timeout=20)
+            resp = av_get(url, timeout=20)
             elapsed_ms = int((time.time() - t0) * 1000)
             data = resp.json()
 
@@ -943,7 +1019,7 @@ def fetch_top_movers():
         url = (f"https://www.alphavantage.co/query?function=TOP_GAINERS_LOSERS"
                f"&apikey={ALPHA_VANTAGE_KEY}")
         t0 = time.time()
-        resp = requests.get(url, timeout=15)
+        resp = av_get(url, timeout=15)
         elapsed_ms = int((time.time() - t0) * 1000)
         data = resp.json()
         _log_av_api_call('TOP_GAINERS_LOSERS', 'MARKET',
@@ -998,7 +1074,7 @@ def fetch_earnings_calendar(horizon='3month'):
     try:
         url = (f"https://www.alphavantage.co/query?function=EARNINGS_CALENDAR"
                f"&horizon={horizon}&apikey={ALPHA_VANTAGE_KEY}")
-        resp = requests.get(url, timeout=20)
+        resp = av_get(url, timeout=20)
         elapsed_ms = int((time.time() - t0) * 1000)
         text = resp.text if resp.status_code == 200 else ''
 
@@ -1059,7 +1135,7 @@ def fetch_treasury_yield(maturity='10year'):
     try:
         url = (f"https://www.alphavantage.co/query?function=TREASURY_YIELD"
                f"&interval=daily&maturity={maturity}&apikey={ALPHA_VANTAGE_KEY}")
-        resp = requests.get(url, timeout=15)
+        resp = av_get(url, timeout=15)
         elapsed_ms = int((time.time() - t0) * 1000)
         data = resp.json() if resp.status_code == 200 else {}
         points = data.get('data') or []
@@ -1130,7 +1206,7 @@ def fetch_overview_single(ticker):
     try:
         url = (f"https://www.alphavantage.co/query?function=OVERVIEW"
                f"&symbol={ticker}&apikey={ALPHA_VANTAGE_KEY}")
-        resp = requests.get(url, timeout=15)
+        resp = av_get(url, timeout=15)
         elapsed_ms = int((time.time() - t0) * 1000)
         data = resp.json() if resp.status_code == 200 else {}
 
@@ -1165,12 +1241,12 @@ def fetch_overview_single(ticker):
         return (ticker, None)
 
 
-def fetch_overviews_concurrent(tickers, max_workers=4):
-    """Fetch OVERVIEW fundamentals for `tickers` with bounded, rate-paced concurrency.
+def fetch_overviews_concurrent(tickers, max_workers=None):
+    """Fetch OVERVIEW fundamentals for `tickers` with bounded concurrency.
 
-    Mirrors fetch_av_daily_bars_concurrent: submissions are paced one every
-    _AV_MIN_INTERVAL_S so steady-state stays ~140 calls/min (under the 150/min
-    premium cap). Used by /api/cron/refresh-fundamentals.
+    Mirrors fetch_av_daily_bars_concurrent: workers block on the shared AV
+    governor, which holds the 150/min premium cap. Used by
+    /api/cron/refresh-fundamentals.
 
     Returns {ticker: fundamentals_dict}.
     """
@@ -1179,17 +1255,17 @@ def fetch_overviews_concurrent(tickers, max_workers=4):
         return {}
 
     from concurrent.futures import ThreadPoolExecutor, as_completed
+    from perf_tracing import bind
 
+    max_workers = max_workers or AV_FETCH_WORKERS
     result = {}
     n = len(tickers)
     logger.info(f"OVERVIEW concurrent fetch: {n} tickers, workers={max_workers}")
     start = time.time()
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for ticker in tickers:
-            futures.append(executor.submit(fetch_overview_single, ticker))
-            time.sleep(_AV_MIN_INTERVAL_S)  # pace global submission rate
+        fetch = bind(fetch_overview_single)
+        futures = [executor.submit(fetch, t) for t in tickers]
 
         for fut in as_completed(futures):
             try:
@@ -65,11 +65,64 @@ def process_transaction(db, user_id, ticker, quantity, price, transaction_type,
     # multiple trades execute concurrently (e.g., rapid-fire buys/sells).
     # Without this lock, concurrent reads of cash_proceeds/max_cash_deployed
     # can cause stale values, leading to incorrect capital tracking.
-    from sqlalchemy import text as _text
     user = db.session.query(User).filter(User.id == user_id).with_for_update().first()
     if not user:
         raise ValueError(f"User {user_id} not found")
     
+    transaction_type = (transaction_type or '').strip().lower()
+    transaction_value = apply_cash_flow(user, ticker, quantity, price, transaction_type)
+    
+    # Create transaction record. price_source is clamped to its varchar(20)
+    # column — an over-long tag (e.g. 'public_email_backfill', 21 chars,
+    # 2026-08-07) must degrade to truncation, not fail the whole trade.
+    transaction = Transaction(
+        user_id=user_id,
+        ticker=ticker,
+        quantity=quantity,
+        price=price,
+        transaction_type=transaction_type,
+        timestamp=timestamp or datetime.utcnow(),
+        price_source=(price_source[:20] if price_source else price_source)
+    )
+    db.session.add(transaction)
+    
+    # CRITICAL: Merge user to handle cross-session scenarios (Vercel serverless)
+    # merge() updates the session's copy of the user with our changes
+    db.session.merge(user)
+
+    # Per-user, per-day trade counter (trade_limit), bumped in this same
+    # transaction so it commits or rolls back with the trade. Savepointed: a
+    # counter failure must never fail the trade itself.
+    trades_today = None
+    if transaction_type in ('buy', 'sell'):
+        try:
+            from subscription_utils import record_trade
+            with db.session.begin_nested():
+                day_count = record_trade(user_id, transaction.timestamp)
+            if transaction.timestamp.date() == datetime.utcnow().date():
+                trades_today = day_count
+        except Exception as e:
+            logger.warning(f"Trade counter update failed (non-fatal): {e}")
+
+    if not suppress_notifications:
+        notify_trade(db, user, transaction_type, ticker, quantity, price,
+                     position_before_qty=position_before_qty,
+                     suppress_trader_email=suppress_trader_email,
+                     trades_today=trades_today)
+
+    return {
+        'max_cash_deployed': user.max_cash_deployed,
+        'cash_proceeds': user.cash_proceeds,
+        'transaction_value': transaction_value
+    }
+
+
+def apply_cash_flow(user, ticker, quantity, price, transaction_type):
+    """
+    Apply one trade's cash effect to a (locked) User row in place and return
+    the transaction value. Shared by process_transaction and the batch
+    queued-trade settlement (services/trade_settlement.py).
+    """
     transaction_value = quantity * price
 
     # Normalize transaction_type to canonical lowercase. The cash-tracking replay
@@ -124,39 +177,32 @@ def process_transaction(db, user_id, ticker, quantity, price, transaction_type,
     
     else:
         raise ValueError(f"Invalid transaction_type: {transaction_type}")
-    
-    # Create transaction record. price_source is clamped to its varchar(20)
-    # column — an over-long tag (e.g. 'public_email_backfill', 21 chars,
-    # 2026-08-07) must degrade to truncation, not fail the whole trade.
-    transaction = Transaction(
-        user_id=user_id,
-        ticker=ticker,
-        quantity=quantity,
-        price=price,
-        transaction_type=transaction_type,
-        timestamp=timestamp or datetime.utcnow(),
-        price_source=(price_source[:20] if price_source else price_source)
-    )
-    db.session.add(transaction)
-    
-    # CRITICAL: Merge user to handle cross-session scenarios (Vercel serverless)
-    # merge() updates the session's copy of the user with our changes
-    db.session.merge(user)
-    
+
+    return transaction_value
+
+
+def notify_trade(db, user, transaction_type, ticker, quantity, price, position_before_qty=None,
+                 suppress_trader_email=False, trades_today=None):
+    """
+    Post-trade fan-out for a buy/sell: subscriber push + emails, the trader's
+    confirmation email (unless suppress_trader_email) and the daily-cap check.
+    Never raises. process_transaction calls it inline unless
+    suppress_notifications (admin bulk migrations, so 20+ rebalancing trades
+    don't spam every subscriber); the batch queued-trade settlement calls it
+    after its commits.
+    """
     # Calculate position percentage for sell notifications (shared by push + email)
     position_pct = None
     if transaction_type == 'sell' and position_before_qty and position_before_qty > 0:
         position_pct = round((quantity / position_before_qty) * 100, 1)
 
     # Send push notifications to subscribers (Phase 1 - Mobile App).
-    # Suppressed for admin bulk migrations so subscribers don't get spammed
-    # when we emit 20+ rebalancing trades in one shot.
-    if not suppress_notifications and PUSH_NOTIFICATIONS_ENABLED and transaction_type in ('buy', 'sell'):
+    if PUSH_NOTIFICATIONS_ENABLED and transaction_type in ('buy', 'sell'):
         try:
             from push_notification_service import notify_subscribers_of_trade
             notification_result = notify_subscribers_of_trade(
                 db=db,
-                trader_user_id=user_id,
+                trader_user_id=user.id,
                 action=transaction_type,
                 ticker=ticker,
                 quantity=quantity,
@@ -169,7 +215,7 @@ def process_transaction(db, user_id, ticker, quantity, price, transaction_type,
             logger.warning(f"Failed to send trade notifications: {e}")
 
     # Send email trade confirmation to trader + email notifications to subscribers
-    if not suppress_notifications and transaction_type in ('buy', 'sell'):
+    if transaction_type in ('buy', 'sell'):
         try:
             from services.notification_utils import send_trade_confirmation_email, notify_subscribers_via_email
             # Email confirmation to the trader (if they have email notifications on).
@@ -179,44 +225,37 @@ def process_transaction(db, user_id, ticker, quantity, price, transaction_type,
                 conf_result = send_trade_confirmation_email(user, transaction_type, ticker, quantity, price, position_pct)
                 logger.info(f"Trade confirmation email: {conf_result.get('status')}")
             # Email notifications to subscribers
-            email_result = notify_subscribers_via_email(db, user_id, transaction_type, ticker, quantity, price, position_pct)
+            email_result = notify_subscribers_via_email(db, user.id, transaction_type, ticker, quantity, price, position_pct)
             logger.info(f"Subscriber emails: {email_result.get('sent', 0)} sent, {email_result.get('failed', 0)} failed, {email_result.get('rate_limited', 0)} rate-limited")
         except Exception as e:
             logger.warning(f"Failed to send email notifications: {e}")
 
     # Check daily trade frequency cap (non-blocking, best-effort).
-    # Also skipped under suppress_notifications since bulk migrations will
-    # blow past the cap immediately and the alert isn't actionable.
-    if not suppress_notifications and transaction_type in ('buy', 'sell'):
+    if transaction_type in ('buy', 'sell'):
         try:
-            _check_daily_trade_cap(db, user_id, user)
+            _check_daily_trade_cap(db, user.id, user, trades_today)
         except Exception as e:
             logger.debug(f"Trade cap check failed (non-fatal): {e}")
 
-    return {
-        'max_cash_deployed': user.max_cash_deployed,
-        'cash_proceeds': user.cash_proceeds,
-        'transaction_value': transaction_value
-    }
-
 
 DAILY_TRADE_CAP = 50  # Notify user when they hit this many trades/day
 _trade_cap_notified = set()  # In-memory set of (user_id, date_str) already notified
 
-def _check_daily_trade_cap(db, user_id, user):
-    """Send a one-time email when a user hits the daily trade cap."""
+def _check_daily_trade_cap(db, user_id, user, trade_count=None):
+    """Send a one-time email when a user hits the daily trade cap.
+
+    trade_count is today's count as returned by the trade counter upsert;
+    without it, one primary-key read of trade_limit.
+    """
     from datetime import date as date_type
     today_str = date_type.today().isoformat()
     key = (user_id, today_str)
     if key in _trade_cap_notified:
         return
 
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    trade_count = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.timestamp >= today_start,
-        Transaction.transaction_type.in_(['buy', 'sell'])
-    ).count()
+    if trade_count is None:
+        from subscription_utils import get_user_trade_count
+        trade_count = get_user_trade_count(user_id, 1)
 
     if trade_count >= DAILY_TRADE_CAP:
         _trade_cap_notified.add(key)
@@ -293,6 +332,34 @@ def calculate_portfolio_value_with_cash(user_id, target_date=None):
         'total_value': total_value
     }
 
+def held_tickers():
+    """
+    Distinct upper-cased tickers with a positive position across all users.
+    One query (the intraday collector used to issue one Stock query per user
+    to build its batch-quote list).
+    """
+    from models import db
+    rows = db.session.query(Stock.ticker).filter(Stock.quantity > 0).distinct().all()
+    return {ticker.upper() for (ticker,) in rows if ticker}
+
+def live_portfolio_values(users):
+    """
+    Live calculate_portfolio_value_with_cash() for each user, as the intraday
+    collector takes them. Prices should already be in the price cache.
+
+    Returns:
+        (values, errors): {user_id: portfolio dict}, [error message, ...]
+    """
+    values = {}
+    errors = []
+    for user in users:
+        try:
+            values[user.id] = calculate_portfolio_value_with_cash(user.id)
+        except Exception as e:
+            errors.append(f"Error processing user {user.id}: {str(e)}")
+            logger.error(errors[-1])
+    return values, errors
+
 def calculate_cash_proceeds_as_of_date(user_id, target_date):
     """
     Calculate cash_proceeds as of a specific date by replaying transaction history.
@@ -0,0 +1,144 @@
+"""
+Pre-parsed, downsampled previews of cached portfolio charts
+(user_portfolio_chart_cache), for pages that show many charts at once.
+
+The web leaderboard used to run one UserPortfolioChartCache lookup per entry,
+json.loads every full chart and scan all of their points again to size a
+shared y-axis. Now each cache row carries, next to its full chart_data:
+
+    preview_data   the same Chart.js payload with every dataset (and the
+                   labels) downsampled to at most PREVIEW_POINTS points
+    y_min, y_max   the min / max over all datasets of the FULL chart
+    preview_of     the generated_at the preview was built for
+
+computed once when the row is written (a mapper hook on insert / update of
+chart_data), and load() hydrates a whole page with one keyed IN query.
+
+Rows whose preview is missing or stale (preview_of != generated_at: written
+before the migration, or by raw SQL) come back with chart_data in the same
+query and are summarized on read.
+Migration: scripts/migrations/2026_10_27_chart_cache_preview.sql
+"""
+
+import json
+import logging
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_POINTS = 60
+
+
+class ChartPreview(NamedTuple):
+    chart: dict
+    y_min: Optional[float]
+    y_max: Optional[float]
+
+
+def _indices(n, max_points):
+    """Evenly spaced indices into n points, always keeping the first and last."""
+    if n <= max_points:
+        return list(range(n))
+    step = (n - 1) / (max_points - 1)
+    return sorted({round(i * step) for i in range(max_points)})
+
+
+def downsample(chart, max_points=PREVIEW_POINTS):
+    """Copy of a Chart.js payload with labels and every dataset's data
+    reduced to at most max_points points (other keys kept as-is)."""
+    longest = max([len(chart.get('labels') or [])] +
+                  [len(ds.get('data') or []) for ds in chart.get('datasets') or []])
+    if longest <= max_points:
+        return chart
+    out = dict(chart)
+    if chart.get('labels'):
+        out['labels'] = [chart['labels'][i] for i in _indices(len(chart['labels']), max_points)]
+    out['datasets'] = [
+        dict(ds, data=[ds['data'][i] for i in _indices(len(ds['data']), max_points)]) if ds.get('data') else ds
+        for ds in chart.get('datasets') or []
+    ]
+    return out
+
+
+def value_range(chart):
+    """(min, max) over every dataset's non-null values, or (None, None)."""
+    values = [v for ds in chart.get('datasets') or [] for v in ds.get('data') or []
+              if isinstance(v, (int, float))]
+    return (min(values), max(values)) if values else (None, None)
+
+
+def summarize(chart_data):
+    """ChartPreview of a chart_data JSON string, or None when it can't be parsed."""
+    try:
+        chart = json.loads(chart_data) if isinstance(chart_data, str) else chart_data
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(chart, dict):
+        return None
+    y_min, y_max = value_range(chart)
+    return ChartPreview(downsample(chart), y_min, y_max)
+
+
+# ── write hook ──────────────────────────────────────────────────────────────
+
+def _refresh(mapper, connection, target):
+    from sqlalchemy import inspect
+    state = inspect(target)
+    if state.persistent and not state.attrs.chart_data.history.has_changes() and \
+            not state.attrs.generated_at.history.has_changes():
+        return
+    preview = summarize(target.chart_data)
+    if preview is None:
+        target.preview_data, target.y_min, target.y_max, target.preview_of = None, None, None, None
+        return
+    target.preview_data = json.dumps(preview.chart)
+    target.y_min, target.y_max = preview.y_min, preview.y_max
+    target.preview_of = target.generated_at
+
+
+_hooked = set()
+
+
+def install_hooks(model=None):
+    """Summarize chart_data whenever a UserPortfolioChartCache row is
+    inserted or its chart changes, whichever code path wrote it. `model`
+    defaults to models.UserPortfolioChartCache; api/index.py installs it on
+    its own mapping of the table too. Idempotent per model."""
+    from sqlalchemy import event
+    if model is None:
+        from models import UserPortfolioChartCache as model
+    if model in _hooked:
+        return
+    event.listen(model, 'before_insert', _refresh)
+    event.listen(model, 'before_update', _refresh)
+    _hooked.add(model)
+
+
+# ── reads ───────────────────────────────────────────────────────────────────
+
+def load(user_ids, period):
+    """{user_id: ChartPreview} for the users with a usable cached `period`
+    chart, in one query."""
+    from sqlalchemy import case, or_
+    from models import db, UserPortfolioChartCache as C
+    if not user_ids:
+        return {}
+    stale = or_(C.preview_of.is_(None), C.preview_of != C.generated_at, C.preview_data.is_(None))
+    rows = db.session.query(
+        C.user_id, C.preview_data, C.y_min, C.y_max, case((stale, C.chart_data), else_=None),
+    ).filter(C.user_id.in_(set(user_ids)), C.period == period)
+
+    previews = {}
+    for user_id, preview_data, y_min, y_max, chart_data in rows:
+        if chart_data is not None:
+            preview = summarize(chart_data)
+        else:
+            try:
+                preview = ChartPreview(json.loads(preview_data), y_min, y_max)
+            except (json.JSONDecodeError, TypeError):
+                preview = None
+        if preview is None:
+            logger.warning(f"Unreadable chart cache for user {user_id}, period {period}")
+            continue
+        previews[user_id] = preview
+    return previews
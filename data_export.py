@@ -0,0 +1,601 @@
+"""
+GDPR "Request My Data" export, built as a background job.
+
+POST /api/mobile/auth/data-export used to assemble the whole export as one
+dict inside the request (every Stock and Transaction row loaded with .all()),
+json.dumps it and paste it into an email body: memory grows with the user's
+history, and a long-lived trader or bot can run past the request window.
+
+Now the endpoint only queues a data_export_job row (enqueue()); the
+data-exports cron builds it (run_pending()):
+
+    * every section is streamed: list sections iterate a column query with
+      yield_per(BATCH_SIZE) (a server-side cursor on Postgres), one NDJSON
+      line per record, written straight into a gzip stream;
+    * the compressed artifact is bounded by MAX_ARTIFACT_BYTES and stored on
+      the job row, fetched through the job's unguessable token link (emailed
+      to the user) until LINK_TTL_DAYS. The download is served by a Vercel
+      function, whose response body is capped at 4.5MB, so the default stays
+      under that; a bigger export fails with error 'too_large' and status()
+      tells the user to ask support for a copy;
+    * progress (current section, records so far) and per-section record
+      counts / timings are committed after every section, so status() shows
+      where a job stands;
+    * the build is checkpointed by cursor: after every section, and when the
+      run's budget runs out mid-section, the artifact written so far and
+      progress['cursor'] = {'section': index, 'offset': records} are
+      committed. The next attempt appends to that artifact (each checkpoint
+      ends a gzip member; concatenated members are one gzip stream) from the
+      cursor instead of starting over;
+    * jobs are leased (LEASE_SECONDS) so overlapping cron runs never build the
+      same job; one that runs out of time or fails is re-queued. Only
+      attempts that fail, or run out of time without moving the cursor,
+      count towards MAX_ATTEMPTS.
+
+Artifact format (one JSON object per line):
+
+    {"type": "export", "format": "ndjson/1", "generated_at": ..., "user_id": ...}
+    {"section": "<name>", "data": {...}}          one line per record
+    {"section": "<name>", "records": n}            end of a section
+    {"section": "<name>", "error": "..."}          section failed (others kept)
+
+Sections are fault-isolated as before: a failing table walk degrades to an
+error line; a builder yielding nothing omits the section entirely.
+
+Until the migration (2026_10_26_data_export_job.sql) has run, the endpoint
+falls back to export_inline(): the same streamed sections, uncompressed, in
+the email body.
+"""
+
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'ndjson/1'
+BATCH_SIZE = int(os.environ.get('DATA_EXPORT_BATCH_SIZE', '500'))
+# Compressed. Served as one response body: keep it under Vercel's 4.5MB cap.
+MAX_ARTIFACT_BYTES = int(os.environ.get('DATA_EXPORT_MAX_BYTES', str(4 * 1024 * 1024)))
+LINK_TTL_DAYS = 7
+LEASE_SECONDS = 90                 # > Vercel maxDuration, so a dead run's lease lapses
+MAX_ATTEMPTS = 3
+MIN_JOB_SECONDS = 5                # don't start a job with less time left
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', 'https://apestogether.ai')
+
+SECTION_ERROR = 'This section could not be generated. Contact support@apestogether.ai for a manual copy.'
+TOO_LARGE_MESSAGE = ('Your data is too large to download from the app. Contact support@apestogether.ai '
+                     'and we will send you a copy.')
+
+
+class OutOfTime(Exception):
+    """The invocation deadline passed while a job was being built."""
+
+
+class ExportTooLarge(Exception):
+    """The compressed artifact would exceed MAX_ARTIFACT_BYTES."""
+
+
+def table_ready():
+    """True if data_export_job exists (checked once per process, db_tables)."""
+    import db_tables
+    from models import db
+    try:
+        return db_tables.table_ready(db.engine, 'data_export_job')
+    except Exception as e:
+        logger.warning(f"data_export_job lookup failed: {e}")
+        return False
+
+
+# ── writer ──────────────────────────────────────────────────────────────────
+
+class NdjsonWriter:
+    """Incremental NDJSON writer into memory, gzip-compressed on the fly
+    (compress=True) and bounded by max_bytes of output. `prefix` is output of
+    an earlier checkpoint() to append to (it counts towards max_bytes)."""
+
+    def __init__(self, compress=True, max_bytes=None, prefix=b''):
+        self._buf = io.BytesIO()
+        self._buf.write(prefix or b'')
+        self.compress = compress
+        self._member = None        # open gzip member, started on the next write
+        self.max_bytes = max_bytes
+        self.lines = 0
+        self.raw_bytes = 0
+
+    def write(self, obj):
+        line = (json.dumps(obj, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        if not self.compress:
+            self._buf.write(line)
+        else:
+            if self._member is None:
+                self._member = gzip.GzipFile(fileobj=self._buf, mode='wb', mtime=0)
+            self._member.write(line)
+        self.lines += 1
+        self.raw_bytes += len(line)
+        if self.max_bytes and self._buf.tell() > self.max_bytes:
+            raise ExportTooLarge(f"export exceeds {self.max_bytes} bytes")
+
+    def checkpoint(self):
+        """Flush everything written so far and return the output bytes; a
+        writer built with them as `prefix` carries on from here. Ends the
+        current gzip member (the next write starts another)."""
+        if self._member is not None:
+            self._member.close()
+            self._member = None
+        data = self._buf.getvalue()
+        if self.max_bytes and len(data) > self.max_bytes:
+            raise ExportTooLarge(f"export is {len(data)} bytes (limit {self.max_bytes})")
+        return data
+
+    def close(self):
+        """Finish the stream and return its bytes."""
+        return self.checkpoint()
+
+
+# ── sections ────────────────────────────────────────────────────────────────
+
+def _iso(dt):
+    return dt.isoformat() if dt else None
+
+
+def _stream(query):
+    """Iterate a column query in BATCH_SIZE batches (server-side cursor on
+    Postgres) instead of loading every row."""
+    return query.yield_per(BATCH_SIZE)
+
+
+def _profile(user):
+    from mobile_api import _has_founding_trader_badge
+    profile = {
+        'id': user.id,
+        'username': user.username,
+        'public_name': getattr(user, 'public_name', None),
+        'email': user.email,
+        'created_at': _iso(user.created_at),
+        'portfolio_slug': user.portfolio_slug,
+        # Lives in extra_data, NOT a column — getattr(user, ...) was
+        # always False here (data-export bug, fixed 2026-07-29).
+        'founding_trader': _has_founding_trader_badge(user),
+        'cash_proceeds': float(getattr(user, 'cash_proceeds', 0.0) or 0.0),
+    }
+    if getattr(user, 'phone_number', None):
+        profile['phone_number'] = user.phone_number
+    yield profile
+
+
+def _holdings(user):
+    from models import db, Stock
+    for ticker, quantity, price in _stream(db.session.query(Stock.ticker, Stock.quantity, Stock.purchase_price)
+                                           .filter(Stock.user_id == user.id).order_by(Stock.id)):
+        yield {'ticker': ticker, 'quantity': float(quantity or 0), 'purchase_price': float(price or 0)}
+
+
+def _transactions(user):
+    from models import db, Transaction
+    for ticker, kind, quantity, price, ts in _stream(db.session.query(
+            Transaction.ticker, Transaction.transaction_type, Transaction.quantity, Transaction.price,
+            Transaction.timestamp,
+    ).filter(Transaction.user_id == user.id).order_by(Transaction.timestamp.asc(), Transaction.id.asc())):
+        yield {'ticker': ticker, 'type': kind, 'quantity': float(quantity or 0), 'price': float(price or 0),
+               'timestamp': _iso(ts)}
+
+
+def _subscriptions_made(user):
+    # App Store / Google Play subscriptions (the real billing) plus any
+    # legacy web-era Stripe rows.
+    from models import db, MobileSubscription as MS, Subscription
+    for creator, status, slot, created, expires, push, target in _stream(db.session.query(
+            MS.subscribed_to_id, MS.status, MS.slot, MS.created_at, MS.expires_at,
+            MS.push_notifications_enabled, MS.target_dollars,
+    ).filter(MS.subscriber_id == user.id).order_by(MS.id)):
+        yield {'creator_user_id': creator, 'status': status, 'store_slot': slot, 'started': _iso(created),
+               'expires': _iso(expires), 'push_notifications_enabled': bool(push),
+               'copy_scale_target_dollars': target}
+    for sub in _stream(Subscription.query.filter_by(subscriber_id=user.id).order_by(Subscription.id)):
+        yield {'creator_user_id': sub.subscribed_to_id, 'status': sub.status, 'source': 'legacy_web',
+               'started': _iso(getattr(sub, 'start_date', None) or getattr(sub, 'created_at', None)),
+               'ends': _iso(getattr(sub, 'end_date', None))}
+
+
+def _subscribers(user):
+    # Subscriber identities are the SUBSCRIBERS' personal data, not the
+    # creator's — status/dates only.
+    from models import db, MobileSubscription as MS, Subscription
+    for status, created, expires in _stream(db.session.query(MS.status, MS.created_at, MS.expires_at)
+                                            .filter(MS.subscribed_to_id == user.id).order_by(MS.id)):
+        yield {'status': status, 'started': _iso(created), 'expires': _iso(expires)}
+    for sub in _stream(Subscription.query.filter_by(subscribed_to_id=user.id).order_by(Subscription.id)):
+        yield {'status': sub.status, 'source': 'legacy_web',
+               'started': _iso(getattr(sub, 'start_date', None) or getattr(sub, 'created_at', None))}
+
+
+def _tax_w9(user):
+    # W-9 / taxpayer profile. The full TIN is intentionally NOT stored on
+    # our servers (only its last 4) — it lives in our accounting system
+    # (Xero) as the 1099 system of record. Say so explicitly.
+    from models import TaxpayerProfile
+    tp = TaxpayerProfile.query.filter_by(user_id=user.id).first()
+    if not tp:
+        yield {'status': 'not_submitted', 'note': 'No W-9 information on file.'}
+        return
+    yield {
+        'status': tp.status,
+        'legal_name': tp.legal_name,
+        'business_name': tp.business_name,
+        'tax_classification': tp.tax_classification,
+        'tin_type': tp.tin_type,
+        'tin_last4': tp.tin_last4,
+        'address': {
+            'line1': tp.address_line1,
+            'line2': tp.address_line2,
+            'city': tp.city,
+            'state': tp.state,
+            'postal_code': tp.postal_code,
+            'country': tp.country,
+        },
+        'certified_at': _iso(tp.certified_at),
+        'submitted_at': _iso(tp.submitted_at),
+        'note': 'Your full SSN/EIN is never stored on ApesTogether servers — only its last 4 digits. The full TIN is held in our accounting system (Xero) solely for IRS 1099 reporting.',
+    }
+
+
+def _payouts(user):
+    # Creator payout history (earnings are the user's data too).
+    from models import db, XeroPayoutRecord as P
+    for start, end, subs, payout, bonus, status, paid_at in _stream(db.session.query(
+            P.period_start, P.period_end, P.total_subscriber_count, P.influencer_payout, P.bonus_payout,
+            P.payment_status, P.paid_at,
+    ).filter(P.portfolio_user_id == user.id).order_by(P.period_start.asc())):
+        yield {'period': f"{_iso(start)} to {_iso(end)}", 'subscriber_count': subs,
+               'payout_amount': round((payout or 0) + (bonus or 0), 2), 'payment_status': status,
+               'paid_at': _iso(paid_at)}
+
+
+def _devices(user):
+    # Registered devices — metadata only, never the raw push token (it's a
+    # credential, not user information).
+    from models import db, DeviceToken as D
+    for platform, app_version, os_version, active, created, last_used in _stream(db.session.query(
+            D.platform, D.app_version, D.os_version, D.is_active, D.created_at, D.last_used_at,
+    ).filter(D.user_id == user.id).order_by(D.id)):
+        yield {'platform': platform, 'app_version': app_version, 'os_version': os_version,
+               'active': bool(active), 'registered_at': _iso(created), 'last_notified_at': _iso(last_used)}
+
+
+def _sms_settings(user):
+    # Legacy web-era SMS alerts stored a real phone number (Twilio). The
+    # mobile apps never collect one (push = device tokens), so the section is
+    # omitted entirely when there's no row.
+    from models import SMSNotification
+    sms = SMSNotification.query.filter_by(user_id=user.id).first()
+    if sms:
+        yield {'phone_number': sms.phone_number, 'verified': bool(sms.is_verified),
+               'sms_enabled': bool(sms.sms_enabled), 'added_at': _iso(sms.created_at)}
+
+
+def _poll_votes(user):
+    # Feature-poll votes stay user-linked only while a poll is ACTIVE (one
+    # vote per user + "you voted X" in the app). Votes on closed polls are
+    # anonymized (user link severed), so they can't appear here.
+    from models import db, FeaturePollVote as V
+    for poll_id, choice, voted_at in _stream(db.session.query(V.poll_id, V.selected_option, V.voted_at)
+                                             .filter(V.user_id == user.id).order_by(V.id)):
+        yield {'poll_id': poll_id, 'choice': choice, 'voted_at': _iso(voted_at),
+               'note': 'Linked to your account only while the poll is open (one vote per user). When a poll closes, the link is removed and only the anonymous tally remains.'}
+
+
+def _portfolio_snapshots(user):
+    from sqlalchemy import func
+    from models import db, PortfolioSnapshot as S
+    count, first, last = db.session.query(func.count(S.id), func.min(S.date), func.max(S.date)).filter(
+        S.user_id == user.id).one()
+    yield {'count': count, 'first_date': _iso(first), 'last_date': _iso(last),
+           'note': 'Daily valuation snapshots. The full series is available on request to support@apestogether.ai.'}
+
+
+SECTIONS = (
+    ('profile', _profile),
+    ('holdings', _holdings),
+    ('transactions', _transactions),
+    ('subscriptions_made', _subscriptions_made),
+    ('subscribers', _subscribers),
+    ('tax_w9', _tax_w9),
+    ('payouts', _payouts),
+    ('devices', _devices),
+    ('sms_settings', _sms_settings),
+    ('poll_votes', _poll_votes),
+    ('portfolio_snapshots', _portfolio_snapshots),
+)
+
+
+def build(user, writer, check_time=None, on_section=None, cursor=None, report=None, on_checkpoint=None):
+    """
+    Stream every section of `user`'s export into `writer`.
+
+    check_time() is called every BATCH_SIZE records (raise to abort);
+    on_section(name, index, report) after each section. Returns
+    {section: {'records', 'ms'[, 'error']}}. ExportTooLarge and whatever
+    check_time raises propagate; any other section error is recorded in the
+    artifact and the report.
+
+    cursor ({'section': index, 'offset': records}) resumes a checkpointed
+    build: the header and everything before the cursor are already in the
+    writer's prefix and `report` holds their counts. When check_time raises
+    OutOfTime, on_checkpoint(cursor, report) is called with the position
+    reached before it propagates.
+    """
+    from models import db
+    start, skip = (cursor['section'], cursor['offset']) if cursor else (0, 0)
+    if not cursor:
+        writer.write({'type': 'export', 'format': FORMAT, 'generated_at': datetime.utcnow().isoformat() + 'Z',
+                      'user_id': user.id})
+    report = dict(report or {})
+    for index, (name, builder) in enumerate(SECTIONS):
+        if index < start:
+            continue
+        offset = skip if index == start else 0
+        prior_ms = report.get(name, {}).get('ms', 0) if offset else 0
+        started = time.perf_counter()
+        records = offset
+        try:
+            # Rows before the cursor are read again but not re-written.
+            for record in itertools.islice(builder(user), offset, None):
+                writer.write({'section': name, 'data': record})
+                records += 1
+                if check_time and records % BATCH_SIZE == 0:
+                    try:
+                        check_time()
+                    except OutOfTime:
+                        if on_checkpoint:
+                            report[name] = {'records': records, 'ms': prior_ms + int(
+                                (time.perf_counter() - started) * 1000)}
+                            on_checkpoint({'section': index, 'offset': records}, report)
+                        raise
+            if records:
+                writer.write({'section': name, 'records': records})
+            report[name] = {'records': records}
+        except (ExportTooLarge, OutOfTime):
+            raise
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Data export section '{name}' failed for user {user.id}: {e}")
+            writer.write({'section': name, 'error': SECTION_ERROR})
+            report[name] = {'records': records, 'error': str(e)[:200]}
+        report[name]['ms'] = prior_ms + int((time.perf_counter() - started) * 1000)
+        if on_section:
+            on_section(name, index, report)
+    return report
+
+
+def _greeting(user):
+    return (
+        f"Hi {user.username},\n\n"
+        "Here is a copy of the personal data ApesTogether holds for your account, "
+        "as requested from Settings.\n\n"
+    )
+
+
+_SIGNOFF = (
+    "If anything looks wrong, or you'd like this data corrected or deleted, reply to this "
+    "email or use Delete Account in Settings.\n\n"
+    "— ApesTogether\n"
+)
+
+
+def export_inline(user):
+    """Pre-migration fallback: build the export in-request (still streamed,
+    uncompressed) and email it in the body. Returns send_email's result."""
+    from services.notification_utils import send_email
+    writer = NdjsonWriter(compress=False, max_bytes=MAX_ARTIFACT_BYTES)
+    build(user, writer)
+    body = (_greeting(user) + _SIGNOFF + "\n----------------------------------------\n\n"
+            + writer.close().decode('utf-8'))
+    return send_email(to_email=user.email, subject='Your ApesTogether data export', body=body,
+                      reply_to='support@apestogether.ai')
+
+
+# ── jobs ────────────────────────────────────────────────────────────────────
+
+def download_url(job):
+    return f"{PUBLIC_BASE_URL}/api/mobile/data-export/{job.token}"
+
+
+def enqueue(user):
+    """Queue an export for `user`, or return the one already queued/running."""
+    from models import db, DataExportJob
+    job = DataExportJob.query.filter(
+        DataExportJob.user_id == user.id, DataExportJob.status.in_(('queued', 'running')),
+    ).order_by(DataExportJob.id.desc()).first()
+    if job:
+        return job
+    job = DataExportJob(user_id=user.id, token=secrets.token_urlsafe(32), status='queued',
+                        progress={'sections_done': 0, 'sections_total': len(SECTIONS), 'records': 0})
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def describe(job):
+    """Status payload of a job (no artifact bytes)."""
+    out = {
+        'job_id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'sections': job.sections,
+        'size_bytes': job.size_bytes,
+        'created_at': _iso(job.created_at),
+        'finished_at': _iso(job.finished_at),
+        'expires_at': _iso(job.expires_at),
+    }
+    if job.status == 'ready':
+        out['download_url'] = download_url(job)
+    if job.status == 'failed':
+        out['error'] = job.error
+        if job.error == 'too_large':
+            out['message'] = TOO_LARGE_MESSAGE
+    return out
+
+
+def status(user_id):
+    """describe() of the user's latest export job, or None."""
+    from models import DataExportJob
+    job = DataExportJob.query.filter_by(user_id=user_id).order_by(DataExportJob.id.desc()).first()
+    return describe(job) if job else None
+
+
+def fetch(token, now=None):
+    """The ready, unexpired job behind a download token, or None."""
+    from models import db, DataExportJob
+    now = now or datetime.utcnow()
+    job = DataExportJob.query.filter_by(token=token, status='ready').first()
+    if not job or job.artifact is None or (job.expires_at and job.expires_at < now):
+        return None
+    job.downloaded_at = now
+    db.session.commit()
+    return job
+
+
+def _claim(job_id, now):
+    """Atomically lease a due job. False if another run holds it."""
+    from sqlalchemy import or_
+    from models import db, DataExportJob as J
+    taken = db.session.query(J).filter(
+        J.id == job_id, J.status.in_(('queued', 'running')), J.attempts < MAX_ATTEMPTS,
+        or_(J.lease_until.is_(None), J.lease_until < now),
+    ).update({'status': 'running', 'lease_until': now + timedelta(seconds=LEASE_SECONDS),
+              'attempts': J.attempts + 1, 'started_at': now}, synchronize_session=False)
+    db.session.commit()
+    return taken == 1
+
+
+def _notify(user, job):
+    from services.notification_utils import send_email
+    body = (
+        _greeting(user)
+        + f"Download it here (link valid for {LINK_TTL_DAYS} days):\n{download_url(job)}\n\n"
+        "The file is gzip-compressed JSON Lines: one record per line, grouped by section "
+        "(profile, holdings, transactions, subscriptions, payouts, ...).\n\n"
+        + _SIGNOFF
+    )
+    return send_email(to_email=user.email, subject='Your ApesTogether data export is ready', body=body,
+                      reply_to='support@apestogether.ai')
+
+
+def _run_job(job, check_time):
+    from models import db, User
+    user = User.query.get(job.user_id)
+    if not user or not user.email:
+        job.status, job.error, job.lease_until = 'failed', 'user_not_found', None
+        db.session.commit()
+        return 'failed'
+
+    cursor = (job.progress or {}).get('cursor') if job.artifact else None
+    writer = NdjsonWriter(compress=True, max_bytes=MAX_ARTIFACT_BYTES,
+                          prefix=job.artifact if cursor else b'')
+
+    def checkpoint(cursor, report, section=None):
+        job.artifact = writer.checkpoint()
+        job.progress = {'section': section or SECTIONS[cursor['section']][0],
+                        'sections_done': cursor['section'], 'sections_total': len(SECTIONS),
+                        'records': sum(r['records'] for r in report.values()), 'cursor': cursor}
+        job.sections = dict(report)
+        db.session.commit()
+
+    def on_section(name, index, report):
+        checkpoint({'section': index + 1, 'offset': 0}, report, section=name)
+
+    report = build(user, writer, check_time=check_time, on_section=on_section,
+                   cursor=cursor, report=job.sections if cursor else None, on_checkpoint=checkpoint)
+    artifact = writer.close()
+    now = datetime.utcnow()
+    job.artifact, job.size_bytes, job.sections = artifact, len(artifact), report
+    job.status, job.lease_until, job.error = 'ready', None, None
+    job.finished_at, job.expires_at = now, now + timedelta(days=LINK_TTL_DAYS)
+    db.session.commit()
+    logger.info(f"Data export {job.id} for user {user.id}: {writer.lines} lines, "
+                f"{writer.raw_bytes} -> {len(artifact)} bytes, sections={report}")
+
+    result = _notify(user, job)
+    if result.get('status') != 'sent':
+        # The artifact stays downloadable; the app shows the link from status().
+        logger.error(f"Data export email failed for user {user.id}: {result.get('error')}")
+        job.error = f"email_{result.get('status')}"
+        db.session.commit()
+    return 'ready'
+
+
+def expire(now=None):
+    """Drop artifacts whose link has expired. Returns the number expired."""
+    from models import db, DataExportJob as J
+    now = now or datetime.utcnow()
+    n = db.session.query(J).filter(J.status == 'ready', J.expires_at < now).update(
+        {'status': 'expired', 'artifact': None}, synchronize_session=False)
+    db.session.commit()
+    return n
+
+
+def run_pending(deadline=None, clock=time.monotonic):
+    """
+    Build queued exports until `deadline` (a clock() value). Jobs that run
+    out of time or fail are re-queued and resume from their checkpoint (a
+    failure after MAX_ATTEMPTS, or an oversized export, is final). Also expires old artifacts. Returns a summary.
+    """
+    from models import db, DataExportJob as J
+    summary = {'ready': [], 'requeued': [], 'failed': [], 'expired': 0}
+    summary['expired'] = expire()
+
+    def check_time():
+        if deadline is not None and clock() >= deadline:
+            raise OutOfTime()
+
+    now = datetime.utcnow()
+    # Leased jobs out of attempts are dead, not running.
+    db.session.query(J).filter(
+        J.status.in_(('queued', 'running')), J.attempts >= MAX_ATTEMPTS,
+        (J.lease_until.is_(None)) | (J.lease_until < now),
+    ).update({'status': 'failed', 'error': 'gave_up', 'lease_until': None}, synchronize_session=False)
+    db.session.commit()
+
+    due = [job_id for (job_id,) in db.session.query(J.id).filter(J.status.in_(('queued', 'running')))
+           .order_by(J.created_at, J.id)]
+    for job_id in due:
+        if deadline is not None and deadline - clock() < MIN_JOB_SECONDS:
+            break
+        if not _claim(job_id, datetime.utcnow()):
+            continue
+        job = J.query.get(job_id)
+        cursor = (job.progress or {}).get('cursor')
+        try:
+            outcome = _run_job(job, check_time)
+        except ExportTooLarge as e:
+            db.session.rollback()
+            logger.warning(f"Data export {job_id} is too large to serve: {e}")
+            job.status, job.error, job.lease_until = 'failed', 'too_large', None
+            job.artifact, job.size_bytes = None, None
+            db.session.commit()
+            outcome = 'failed'
+        except Exception as e:
+            db.session.rollback()
+            out_of_time = isinstance(e, OutOfTime)
+            if out_of_time and (job.progress or {}).get('cursor') != cursor:
+                # Checkpointed further along: not a failed attempt.
+                job.attempts -= 1
+            final = job.attempts >= MAX_ATTEMPTS and not out_of_time
+            job.status = 'failed' if final else 'queued'
+            job.error = 'out_of_time' if out_of_time else str(e)[:500]
+            job.lease_until = None
+            if final:
+                job.artifact = None
+            db.session.commit()
+            if not isinstance(e, OutOfTime):
+                logger.error(f"Data export {job_id} failed (attempt {job.attempts}): {e}")
+            outcome = job.status if final else 'requeued'
+        summary['ready' if outcome == 'ready' else outcome].append(job_id)
+    return summary
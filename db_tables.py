@@ -0,0 +1,33 @@
+"""
+Per-process cache of "does this table exist yet?" checks.
+
+Tables added by scripts/migrations/ may lag a deploy, so the modules that use
+them (market_close_pipeline, subscriber_counts, influencer_ranking,
+data_export) fall back to a slower path until the table exists. They ask
+table_ready() instead of inspecting the schema on every call: one has_table
+lookup per engine and table per process, so a migration applied after a
+deploy is picked up on the next cold start.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_ready = {}   # (engine url, table name) -> bool
+
+
+def table_ready(conn, name, missing=None):
+    """True if table `name` exists on the database behind `conn` (a Connection
+    or Engine). `missing`, if given, is logged once when the table is absent."""
+    key = (str(conn.engine.url), name)
+    if key not in _ready:
+        from sqlalchemy import inspect
+        _ready[key] = inspect(conn).has_table(name)
+        if not _ready[key] and missing:
+            logger.info(missing)
+    return _ready[key]
+
+
+def reset():
+    """Forget every cached check (tests: each in-memory database starts empty)."""
+    _ready.clear()
@@ -11,9 +11,10 @@ API: AlphaVantage DIVIDENDS endpoint (1 call per ticker)
 """
 import os
 import logging
-import requests
 from datetime import date, datetime, timedelta
 
+from av_rate_governor import av_get
+
 logger = logging.getLogger(__name__)
 
 ALPHA_VANTAGE_KEY = os.environ.get('ALPHA_VANTAGE_API_KEY', '')
@@ -31,7 +32,7 @@ def fetch_recent_dividends(ticker: str, lookback_days: int = 7) -> list:
     
     try:
         url = f"https://www.alphavantage.co/query?function=DIVIDENDS&symbol={ticker}&apikey={ALPHA_VANTAGE_KEY}"
-        resp = requests.get(url, timeout=10)
+        resp = av_get(url, timeout=10)
         data = resp.json()
         
         if 'data' not in data:
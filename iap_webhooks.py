@@ -47,6 +47,8 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.exceptions import InvalidSignature
 
+from apple_jws_verifier import cached_leaf_key, chain_cache_key, remember_chain
+
 logger = logging.getLogger(__name__)
 
 APPLE_BUNDLE_ID = os.environ.get('APPLE_BUNDLE_ID', 'com.apestogether.ApesTogether')
@@ -64,36 +66,39 @@ _APPLE_EXPIRED_TYPES = {'EXPIRED', 'GRACE_PERIOD_EXPIRED'}
 # Apple JWS verification
 # ---------------------------------------------------------------------------
 
+_apple_root_memo = {}   # (PEM env value, cert file mtime) -> Certificate
+
+
 def _load_apple_root():
     """Load the pinned Apple Root CA - G3 certificate, if provided.
 
     Returns a cryptography Certificate or None (None => structural-only check).
+    Parsed once per distinct source (PEM env value / cert file mtime).
     """
     try:
         pem = os.environ.get('APPLE_ROOT_CA_G3_PEM')
-        if pem:
-            return x509.load_pem_x509_certificate(pem.encode())
         path = os.path.join(os.path.dirname(__file__), 'certs', 'AppleRootCA-G3.cer')
-        if os.path.exists(path):
+        source = (pem, None if pem else (os.path.getmtime(path) if os.path.exists(path) else None))
+        if source in _apple_root_memo:
+            return _apple_root_memo[source]
+        root = None
+        if pem:
+            root = x509.load_pem_x509_certificate(pem.encode())
+        elif source[1] is not None:
             with open(path, 'rb') as f:
-                return x509.load_der_x509_certificate(f.read())
+                root = x509.load_der_x509_certificate(f.read())
+        _apple_root_memo.clear()
+        _apple_root_memo[source] = root
+        return root
     except Exception as e:
         logger.warning(f"Could not load Apple root cert: {e}")
     return None
 
 
-def verify_apple_jws(signed_payload: str) -> dict:
-    """Verify an Apple JWS via its x5c chain and return the decoded payload.
-
-    Raises ValueError if verification fails.
-    """
-    header = jwt.get_unverified_header(signed_payload)
-    x5c = header.get('x5c')
-    if not x5c:
-        raise ValueError('missing x5c header')
-
+def _verify_apple_chain(x5c, pinned, cache_key):
+    """Parse and verify an uncached x5c chain; caches and returns the leaf
+    public key. Raises ValueError."""
     certs = [x509.load_der_x509_certificate(base64.b64decode(c)) for c in x5c]
-    leaf = certs[0]
 
     # Verify the chain links: cert[i] is signed by cert[i+1]'s public key.
     for i in range(len(certs) - 1):
@@ -108,7 +113,6 @@ def verify_apple_jws(signed_payload: str) -> dict:
             raise ValueError(f'broken certificate chain at index {i}')
 
     # Pin to Apple's root when available; otherwise warn (structural-only).
-    pinned = _load_apple_root()
     if pinned is not None:
         if certs[-1].fingerprint(hashes.SHA256()) != pinned.fingerprint(hashes.SHA256()):
             raise ValueError('root cert does not match pinned Apple Root CA - G3')
@@ -116,10 +120,34 @@ def verify_apple_jws(signed_payload: str) -> dict:
         logger.warning("Apple root cert not pinned (set APPLE_ROOT_CA_G3_PEM or add "
                        "certs/AppleRootCA-G3.cer) — verifying chain structure + leaf signature only")
 
+    remember_chain(cache_key, certs)
+    return certs[0].public_key()
+
+
+def verify_apple_jws(signed_payload: str) -> dict:
+    """Verify an Apple JWS via its x5c chain and return the decoded payload.
+
+    A chain that verified before (same x5c, same pinned root, still inside
+    its validity window) comes from apple_jws_verifier's cache, so repeat
+    notifications only pay for the leaf signature check.
+
+    Raises ValueError if verification fails.
+    """
+    header = jwt.get_unverified_header(signed_payload)
+    x5c = header.get('x5c')
+    if not x5c:
+        raise ValueError('missing x5c header')
+
+    pinned = _load_apple_root()
+    cache_key = chain_cache_key(x5c, pinned)
+    leaf_key = cached_leaf_key(cache_key)
+    if leaf_key is None:
+        leaf_key = _verify_apple_chain(x5c, pinned, cache_key)
+
     # Verify the JWS signature with the leaf certificate's public key.
     return jwt.decode(
         signed_payload,
-        key=leaf.public_key(),
+        key=leaf_key,
         algorithms=['ES256'],
         options={'verify_aud': False, 'verify_iss': False},
     )
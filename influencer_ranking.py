@@ -0,0 +1,238 @@
+"""
+Materialized top-influencers ranking (influencer_ranking table).
+
+/api/mobile/top-influencers used to rebuild the ranking on every request:
+GROUP BY over all active MobileSubscription rows, every AdminSubscription
+with bonus subs, then User and UserPortfolioStats for every creator with any
+subscriber, filtered by industry and sorted in Python. Now the ranking is a
+table keyed by (industry_key, total_subscribers DESC) and a request reads the
+top N with one index range scan.
+
+Rows are maintained incrementally: a Session hook notes the creators whose
+subscription status, gifted subs or portfolio stats (industry mix, fractional
+flag) change in a flush, and rewrites just those creators' rows in the same
+transaction. Totals come from the per-creator subscriber counters
+(subscriber_counts.py), whose hook runs first in the same flush. Writes that
+bypass the ORM unit of work (bulk Query.update / delete, raw SQL) aren't seen;
+rebuild() recomputes everything and runs after the daily stats pass and the
+counter reconciliation. Until scripts/migrations/2026_10_22_influencer_ranking.sql
+has run, the hook is a no-op and readers fall back to the aggregate.
+
+Benchmark: scripts/benchmark_top_influencers.py.
+"""
+
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ALL_KEY = '*'                 # industry_key of each creator's overall row
+MIN_INDUSTRY_PERCENT = 5      # an industry counts for a creator at >= 5% of holdings
+_PENDING_KEY = 'influencer_ranking_dirty'
+
+
+def ranking_rows(user_id, total, stats):
+    """Ranking rows for one creator: the '*' row plus one per industry."""
+    if total <= 0:
+        return []
+    mix = (stats.industry_mix if stats is not None else None) or {}
+    fractional = stats.has_fractional_holdings if stats is not None else None
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'industry_key': ALL_KEY, 'industry': None,
+             'total_subscribers': total, 'has_fractional': fractional, 'updated_at': now}]
+    seen = {ALL_KEY}
+    for name, pct in mix.items():
+        key = (name or '').strip().lower()[:100]
+        if not key or key in seen or (pct or 0) < MIN_INDUSTRY_PERCENT:
+            continue
+        seen.add(key)
+        rows.append({'user_id': user_id, 'industry_key': key, 'industry': name[:100],
+                     'total_subscribers': total, 'has_fractional': fractional, 'updated_at': now})
+    return rows
+
+
+def subscriber_totals(conn, user_ids=None):
+    """{creator_id: active real subs + gifted subs}, for `user_ids` or everyone
+    (the subscriber counters, already updated when called from a flush)."""
+    import subscriber_counts
+    return {uid: c.total for uid, c in subscriber_counts.read(conn, user_ids).items()}
+
+
+def _write(conn, user_ids, totals):
+    from sqlalchemy import delete, insert, select
+    from models import User, UserPortfolioStats, InfluencerRanking
+    table = InfluencerRanking.__table__
+    ranked = [uid for uid, n in totals.items() if n > 0]
+    stats = {}
+    if ranked:
+        ups = UserPortfolioStats.__table__
+        users = User.__table__
+        for row in conn.execute(
+                select(users.c.id, ups.c.industry_mix, ups.c.has_fractional_holdings)
+                .select_from(users.outerjoin(ups, ups.c.user_id == users.c.id))
+                .where(users.c.id.in_(ranked))):
+            stats[row.id] = row
+    rows = []
+    for uid in ranked:
+        if uid in stats:
+            rows.extend(ranking_rows(uid, totals[uid], stats[uid]))
+    if user_ids is None:
+        conn.execute(delete(table))
+    else:
+        conn.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+    if rows:
+        conn.execute(insert(table), rows)
+    return len(rows)
+
+
+def refresh(conn, user_ids):
+    """Rewrite the ranking rows of `user_ids` on `conn` (inside its transaction)."""
+    user_ids = sorted({uid for uid in user_ids if uid is not None})
+    if not user_ids:
+        return 0
+    return _write(conn, user_ids, subscriber_totals(conn, user_ids))
+
+
+def rebuild(engine=None):
+    """Recompute the whole ranking (backfill, drift repair). Returns rows written."""
+    if engine is None:
+        from models import db
+        engine = db.engine
+    with engine.begin() as conn:
+        written = _write(conn, None, subscriber_totals(conn))
+    logger.info(f"influencer ranking rebuilt: {written} rows")
+    return written
+
+
+def table_ready(conn):
+    import db_tables
+    return db_tables.table_ready(
+        conn, 'influencer_ranking',
+        missing="influencer_ranking table missing; top-influencers reads the aggregates")
+
+
+# ── Session hooks ────────────────────────────────────────────────────────────
+
+def _changed(obj, *attrs):
+    from sqlalchemy import inspect
+    state = inspect(obj)
+    return any(state.attrs[a].history.has_changes() for a in attrs)
+
+
+def _old_value(obj, attr):
+    from sqlalchemy import inspect
+    deleted = inspect(obj).attrs[attr].history.deleted
+    return deleted[0] if deleted else None
+
+
+def _collect(session, flush_context, instances):
+    from models import MobileSubscription, AdminSubscription, UserPortfolioStats, User
+    touched = set()
+    # New rows may only get their creator id during the flush (set through a
+    # relationship); keep the objects and read the id afterwards.
+    for obj in session.new:
+        if isinstance(obj, (MobileSubscription, AdminSubscription, UserPortfolioStats)):
+            touched.add(obj)
+    for obj in session.dirty:
+        if isinstance(obj, MobileSubscription) and _changed(obj, 'status', 'subscribed_to_id'):
+            touched.update((obj.subscribed_to_id, _old_value(obj, 'subscribed_to_id')))
+        elif isinstance(obj, AdminSubscription) and _changed(obj, 'bonus_subscriber_count', 'portfolio_user_id'):
+            touched.update((obj.portfolio_user_id, _old_value(obj, 'portfolio_user_id')))
+        elif isinstance(obj, UserPortfolioStats) and _changed(obj, 'industry_mix', 'has_fractional_holdings'):
+            touched.add(obj.user_id)
+    for obj in session.deleted:
+        if isinstance(obj, MobileSubscription):
+            touched.add(obj.subscribed_to_id)
+        elif isinstance(obj, AdminSubscription):
+            touched.add(obj.portfolio_user_id)
+        elif isinstance(obj, (UserPortfolioStats, User)):
+            touched.add(obj.user_id if isinstance(obj, UserPortfolioStats) else obj.id)
+    touched.discard(None)
+    if touched:
+        session.info.setdefault(_PENDING_KEY, set()).update(touched)
+
+
+def _creator_id(item):
+    if isinstance(item, int):
+        return item
+    for attr in ('subscribed_to_id', 'portfolio_user_id', 'user_id'):
+        if hasattr(item, attr):
+            return getattr(item, attr)
+    return None
+
+
+def _apply(session, flush_context):
+    touched = session.info.pop(_PENDING_KEY, None)
+    if not touched:
+        return
+    from models import InfluencerRanking
+    touched = {_creator_id(item) for item in touched}
+    # Only sessions bound to the models' metadata (not app.py's legacy db).
+    conn = session.connection(bind_arguments={'mapper': InfluencerRanking.__mapper__})
+    if table_ready(conn):
+        refresh(conn, touched)
+
+
+_hooks_installed = False
+
+
+def install_session_hooks():
+    """Listen on the Session class so every flush, whichever code path made it,
+    keeps the ranking current. Idempotent."""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    import subscriber_counts
+    subscriber_counts.install_session_hooks()   # must run first in each flush
+    event.listen(Session, 'before_flush', _collect)
+    event.listen(Session, 'after_flush_postexec', _apply)
+    _hooks_installed = True
+
+
+# ── Reads ────────────────────────────────────────────────────────────────────
+
+def top(limit, industry=None, hide_fractional=False):
+    """[(InfluencerRanking, User, UserPortfolioStats|None)] best first.
+
+    An exact industry name reads its index range; anything else (old clients
+    sending a fragment like 'tech') matches industry names by substring, as
+    the per-request ranking did.
+    """
+    from sqlalchemy import or_
+    from models import db, User, UserPortfolioStats, InfluencerRanking as R
+
+    def query(*criteria):
+        q = db.session.query(R, User, UserPortfolioStats).join(
+            User, User.id == R.user_id
+        ).outerjoin(UserPortfolioStats, UserPortfolioStats.user_id == R.user_id).filter(*criteria)
+        if hide_fractional:
+            # NULL = not computed yet: show (same rule as before).
+            q = q.filter(or_(R.has_fractional.is_(None), R.has_fractional.is_(False)))
+        return q.order_by(R.total_subscribers.desc(), R.user_id.asc()).limit(limit).all()
+
+    key = (industry or '').strip().lower()
+    if not key or key == 'all':
+        return query(R.industry_key == ALL_KEY)
+    rows = query(R.industry_key == key)
+    if rows:
+        return rows
+    matching = db.session.query(R.user_id).filter(
+        R.industry_key != ALL_KEY, R.industry_key.contains(key, autoescape=True))
+    return query(R.industry_key == ALL_KEY, R.user_id.in_(matching))
+
+
+def available_industries(industry=None, hide_fractional=False):
+    """Distinct industry names held (>= 5%) by ranked creators; with `industry`,
+    only by the creators that filter matches (as the old endpoint reported)."""
+    from sqlalchemy import or_
+    from models import db, InfluencerRanking as R
+    q = db.session.query(R.industry).filter(R.industry_key != ALL_KEY)
+    key = (industry or '').strip().lower()
+    if key and key != 'all':
+        q = q.filter(R.user_id.in_(db.session.query(R.user_id).filter(
+            R.industry_key != ALL_KEY, R.industry_key.contains(key, autoescape=True))))
+    if hide_fractional:
+        q = q.filter(or_(R.has_fractional.is_(None), R.has_fractional.is_(False)))
+    return sorted({name for (name,) in q.distinct()})
@@ -0,0 +1,265 @@
+"""
+Compact per-user intraday series: one row per user per trading day.
+
+`PortfolioSnapshotIntraday` stores a full ORM row per user per 15-minute tick
+(27 ticks/day), and every 1D/5D read re-filters those rows in Python with a
+per-row UTC->ET conversion. `PortfolioIntradaySeries` instead holds the day as
+four packed float64 arrays indexed by tick slot:
+
+    slot 0 = 09:30 ET, slot 1 = 09:45 ET, ... slot 26 = 16:00 ET
+
+plus a bitmask of which slots are filled. A 5D chart reads 5 rows and does no
+timestamp filtering; a collector tick is one batched read + one batched write
+for all users.
+
+PortfolioSnapshotIntraday is still written (admin diagnostics, the spike
+scanner and the recompute tools work on it) and remains the source of truth
+for repairs: anything that rewrites legacy rows calls `rebuild_from_legacy`
+for the affected users. Readers use the series for the sessions it has rows
+for and fill the trading sessions it is missing (pre-migration / partial
+backfill) from the legacy rows, so this is safe to deploy before
+scripts/migrations/2026_10_18_portfolio_intraday_series.sql.
+"""
+
+import logging
+import math
+from array import array
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+MARKET_TZ = ZoneInfo('America/New_York')
+UTC_TZ = ZoneInfo('UTC')
+
+SESSION_OPEN = time(9, 30)
+SLOT_MINUTES = 15
+SLOT_COUNT = 27          # 09:30 .. 16:00 ET inclusive
+# Collector crons and forced runs land a few minutes off the quarter-hour;
+# matches the +/- 3 min tolerance the legacy reader applied.
+SLOT_TOLERANCE_MINUTES = 3
+
+_FIELDS = ('total_values', 'stock_values', 'cash_proceeds', 'max_cash_deployed')
+_EMPTY = float('nan')
+
+
+def pack(values):
+    """Pack a SLOT_COUNT list of floats (NaN = empty) into bytes."""
+    arr = array('d', values)
+    if arr.itemsize != 8:  # pragma: no cover - every CPython platform is 8
+        raise RuntimeError('array("d") is not float64 on this platform')
+    return arr.tobytes()
+
+
+def unpack(blob):
+    """Inverse of pack(); a missing blob unpacks to all-empty slots."""
+    if not blob:
+        return [_EMPTY] * SLOT_COUNT
+    arr = array('d')
+    arr.frombytes(bytes(blob))
+    values = arr.tolist()
+    if len(values) < SLOT_COUNT:
+        values.extend([_EMPTY] * (SLOT_COUNT - len(values)))
+    return values[:SLOT_COUNT]
+
+
+def to_market_time(ts):
+    """Naive timestamps in this app are UTC (psycopg2 stores aware ET as UTC)."""
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=UTC_TZ).astimezone(MARKET_TZ)
+    return ts.astimezone(MARKET_TZ)
+
+
+def slot_for(ts):
+    """Return (session_date, slot) for a tick timestamp, or None if the time is
+    not within SLOT_TOLERANCE_MINUTES of a 09:30-16:00 ET quarter-hour."""
+    ts_et = to_market_time(ts)
+    minutes = (ts_et.hour * 60 + ts_et.minute) - (SESSION_OPEN.hour * 60 + SESSION_OPEN.minute)
+    slot, offset = divmod(minutes, SLOT_MINUTES)
+    if offset > SLOT_TOLERANCE_MINUTES:
+        if SLOT_MINUTES - offset > SLOT_TOLERANCE_MINUTES:
+            return None
+        slot += 1
+    if slot < 0 or slot >= SLOT_COUNT:
+        return None
+    return ts_et.date(), slot
+
+
+def slot_timestamp(session_date, slot):
+    """Naive-UTC timestamp of a slot (same convention as the legacy rows)."""
+    open_et = datetime.combine(session_date, SESSION_OPEN, tzinfo=MARKET_TZ)
+    slot_et = open_et + timedelta(minutes=SLOT_MINUTES * slot)
+    return slot_et.astimezone(UTC_TZ).replace(tzinfo=None)
+
+
+class IntradayPoint:
+    """One filled slot, shaped like the snapshot objects the performance and
+    chart code already consume (date / timestamp / values / is_intraday)."""
+
+    __slots__ = ('user_id', 'date', 'timestamp', 'slot', 'total_value',
+                 'stock_value', 'cash_proceeds', 'max_cash_deployed', 'is_intraday')
+
+    def __init__(self, user_id, session_date, slot, total, stock, cash, deployed):
+        self.user_id = user_id
+        self.date = session_date
+        self.slot = slot
+        self.timestamp = slot_timestamp(session_date, slot)
+        self.total_value = total
+        self.stock_value = stock
+        self.cash_proceeds = cash
+        self.max_cash_deployed = deployed
+        self.is_intraday = True
+
+
+def _row_points(row):
+    cols = [unpack(getattr(row, f)) for f in _FIELDS]
+    mask = row.slot_mask or 0
+    points = []
+    for slot in range(SLOT_COUNT):
+        if not (mask >> slot) & 1:
+            continue
+        total, stock, cash, deployed = (c[slot] for c in cols)
+        if math.isnan(total):
+            continue
+        points.append(IntradayPoint(
+            row.user_id, row.session_date, slot, total,
+            0.0 if math.isnan(stock) else stock,
+            0.0 if math.isnan(cash) else cash,
+            0.0 if math.isnan(deployed) else deployed,
+        ))
+    return points
+
+
+def load_points(user_id, start_date, end_date):
+    """Filled slots for one user between two ET session dates, in time order.
+
+    Returns (points, missing_sessions): `missing_sessions` are the trading
+    sessions in the range with no series row, which callers fill from the
+    legacy rows. Returns None when the table doesn't exist yet.
+    """
+    import trading_calendar
+    from models import db, PortfolioIntradaySeries
+    try:
+        rows = (PortfolioIntradaySeries.query
+                .filter(PortfolioIntradaySeries.user_id == user_id,
+                        PortfolioIntradaySeries.session_date >= start_date,
+                        PortfolioIntradaySeries.session_date <= end_date)
+                .order_by(PortfolioIntradaySeries.session_date.asc())
+                .all())
+    except Exception as e:
+        logger.debug(f"intraday series unavailable, using legacy rows: {e}")
+        db.session.rollback()
+        return None
+    points = []
+    for row in rows:
+        points.extend(_row_points(row))
+    covered = {row.session_date for row in rows}
+    missing = [d for d in trading_calendar.sessions_between(start_date, end_date) if d not in covered]
+    return points, missing
+
+
+def record_tick(tick_time, values_by_user):
+    """Write one collector tick for many users.
+
+    values_by_user: {user_id: (total_value, stock_value, cash_proceeds,
+    max_cash_deployed)}. One IN query loads the users' rows for the session,
+    slots are set in memory, then new rows are inserted and existing rows
+    updated in bulk. Does not commit. Returns the number of users written, or
+    0 if the tick is off-slot.
+    """
+    from models import db, PortfolioIntradaySeries
+    placed = slot_for(tick_time)
+    if placed is None or not values_by_user:
+        return 0
+    session_date, slot = placed
+    return _write_slots(db, PortfolioIntradaySeries, session_date,
+                        {uid: {slot: vals} for uid, vals in values_by_user.items()})
+
+
+def _write_slots(db, model, session_date, slots_by_user, replace=False):
+    """Merge {user_id: {slot: (total, stock, cash, deployed)}} into the
+    session's rows. With replace=True existing slots are cleared first."""
+    user_ids = list(slots_by_user)
+    existing = {}
+    for i in range(0, len(user_ids), 1000):
+        chunk = user_ids[i:i + 1000]
+        for row in model.query.filter(model.session_date == session_date,
+                                      model.user_id.in_(chunk)).all():
+            existing[row.user_id] = row
+
+    now = datetime.utcnow()
+    inserts, updates = [], []
+    for uid, slots in slots_by_user.items():
+        row = existing.get(uid)
+        if row is None or replace:
+            cols = [[_EMPTY] * SLOT_COUNT for _ in _FIELDS]
+            mask = 0
+        else:
+            cols = [unpack(getattr(row, f)) for f in _FIELDS]
+            mask = row.slot_mask or 0
+        for slot, vals in slots.items():
+            for col, v in zip(cols, vals):
+                col[slot] = _EMPTY if v is None else float(v)
+            mask |= 1 << slot
+        record = {f: pack(c) for f, c in zip(_FIELDS, cols)}
+        record.update(slot_mask=mask, updated_at=now)
+        if row is None:
+            record.update(user_id=uid, session_date=session_date)
+            inserts.append(record)
+        else:
+            record['id'] = row.id
+            updates.append(record)
+
+    if inserts:
+        db.session.bulk_insert_mappings(model, inserts)
+    if updates:
+        db.session.bulk_update_mappings(model, updates)
+    return len(inserts) + len(updates)
+
+
+def rebuild_from_legacy(user_ids, start_date=None):
+    """Regenerate series rows from PortfolioSnapshotIntraday for `user_ids`
+    (all sessions, or from `start_date`). Used as the one-off backfill and
+    after any tool rewrites legacy rows (rescale, recompute, spike repair).
+    Does not commit. Returns the number of series rows written."""
+    from models import db, PortfolioIntradaySeries, PortfolioSnapshotIntraday
+    from collections import defaultdict
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    q = (db.session.query(PortfolioSnapshotIntraday.user_id,
+                          PortfolioSnapshotIntraday.timestamp,
+                          PortfolioSnapshotIntraday.total_value,
+                          PortfolioSnapshotIntraday.stock_value,
+                          PortfolioSnapshotIntraday.cash_proceeds,
+                          PortfolioSnapshotIntraday.max_cash_deployed)
+         .filter(PortfolioSnapshotIntraday.user_id.in_(user_ids)))
+    if start_date is not None:
+        # One day of slack: naive-UTC timestamps run ahead of the ET date.
+        q = q.filter(PortfolioSnapshotIntraday.timestamp >=
+                     datetime.combine(start_date - timedelta(days=1), time.min))
+        q_delete = PortfolioIntradaySeries.query.filter(
+            PortfolioIntradaySeries.user_id.in_(user_ids),
+            PortfolioIntradaySeries.session_date >= start_date)
+    else:
+        q_delete = PortfolioIntradaySeries.query.filter(
+            PortfolioIntradaySeries.user_id.in_(user_ids))
+
+    by_session = defaultdict(lambda: defaultdict(dict))
+    for uid, ts, total, stock, cash, deployed in q.order_by(PortfolioSnapshotIntraday.timestamp.asc()):
+        placed = slot_for(ts)
+        if placed is None:
+            continue
+        session_date, slot = placed
+        if start_date is not None and session_date < start_date:
+            continue
+        # Later rows for the same slot win, matching the collector's overwrite.
+        by_session[session_date][uid][slot] = (total, stock, cash, deployed)
+
+    q_delete.delete(synchronize_session=False)
+    written = 0
+    for session_date, slots_by_user in by_session.items():
+        written += _write_slots(db, PortfolioIntradaySeries, session_date,
+                                slots_by_user, replace=True)
+    return written
@@ -0,0 +1,171 @@
+"""
+Deferred route registration for the serverless entry point.
+
+api/index.py defines ~300 routes. Only the mobile API and the crons are on the
+latency path users feel (the app's first calls at market open land on a cold
+Vercel instance); admin pages, the retired web app and diagnostic routes are
+hit a few times a day by us. With APP_STARTUP_MODE=mobile those routes are
+recorded at import time instead of being compiled into the URL map, and the
+admin/web route modules are not imported at all, until the first request that
+needs them:
+
+    routes = DeferredRoutes(app)          # before any @app.route runs
+    routes.defer('admin blueprint', _register_admin_blueprint)
+    ...
+    # any request outside EAGER_PREFIXES (or a url_for() to a deferred
+    # endpoint) loads everything deferred, once, before dispatch.
+
+The default APP_STARTUP_MODE=full keeps the old register-everything-at-import
+behaviour. Measure with scripts/profile_imports.py and
+scripts/benchmark_cold_start.py.
+
+Flask dependency: Flask rejects setup calls (add_url_rule, register_blueprint,
+...) once it has handled a request, through Scaffold._check_setup_finished.
+Deferred loading *is* app setup run late, so load() suspends that guard for
+the loading thread's registration calls. That hook is private; requirements.txt
+pins Flask, DeferredRoutes refuses to install if the hook is gone, and
+tests/test_lazy_routes.py covers late loading, so an upgrade that changes it
+fails loudly instead of silently dropping the admin routes.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MODE = os.environ.get('APP_STARTUP_MODE', 'full').strip().lower()
+
+# Path prefixes registered eagerly. Everything else is deferred.
+EAGER_PREFIXES = ('/api/mobile', '/api/cron', '/api/health', '/static/')
+
+
+def lazy_startup_enabled():
+    return STARTUP_MODE == 'mobile'
+
+
+class DeferredRoutes:
+    """Holds back add_url_rule() calls outside `eager_prefixes` and runs
+    deferred route-module loaders the first time a request needs them."""
+
+    def __init__(self, app, eager_prefixes=EAGER_PREFIXES):
+        if not callable(getattr(type(app), '_check_setup_finished', None)):
+            raise RuntimeError("lazy_routes: this Flask version has no _check_setup_finished "
+                               "setup guard; re-check lazy_routes.py before upgrading Flask")
+        self.app = app
+        self.eager_prefixes = tuple(eager_prefixes)
+        # Set only once every deferred rule and module is registered: the
+        # dispatch check reads it without the lock.
+        self.loaded = False
+        self._loading_thread = None
+        self.load_ms = None
+        self.load_reason = None
+        self._pending_rules = []
+        self._loaders = []
+        self._eager_rules = 0
+        self._lock = threading.Lock()
+
+        # Instance attribute shadows Flask.add_url_rule, so @app.route and
+        # blueprint registration both come through here.
+        self._add_url_rule = app.add_url_rule
+        app.add_url_rule = self._intercept_add_url_rule
+        app.url_build_error_handlers.append(self._on_build_error)
+        app.extensions['deferred_routes'] = self
+
+        inner = app.wsgi_app
+
+        def wsgi_app(environ, start_response):
+            if not self.loaded and not self.is_eager(environ.get('PATH_INFO', '')):
+                self.load(reason=environ.get('PATH_INFO', ''))
+            return inner(environ, start_response)
+
+        app.wsgi_app = wsgi_app
+
+    def is_eager(self, path):
+        return path.startswith(self.eager_prefixes)
+
+    def _loading_here(self):
+        return self._loading_thread == threading.get_ident()
+
+    def _intercept_add_url_rule(self, rule, endpoint=None, view_func=None, **options):
+        if self.loaded or self._loading_here() or self.is_eager(rule):
+            if not self.loaded and not self._loading_here():
+                self._eager_rules += 1
+            return self._add_url_rule(rule, endpoint, view_func, **options)
+        self._pending_rules.append((rule, endpoint, view_func, options))
+
+    def defer(self, name, loader):
+        """Run `loader()` (which imports and registers a route module) on
+        first load instead of now. Loaders handle their own errors."""
+        if self.loaded:
+            loader()
+        else:
+            self._loaders.append((name, loader))
+
+    def _check_setup_finished(self, f_name):
+        # Installed on the app instance during load(): the loading thread's
+        # setup calls pass, any other thread still gets Flask's check.
+        if not self._loading_here():
+            type(self.app)._check_setup_finished(self.app, f_name)
+
+    def load(self, reason=''):
+        """Register everything deferred. Returns False if already loaded.
+
+        Concurrent callers block on the lock until the URL map is complete."""
+        with self._lock:
+            if self.loaded:
+                return False
+            start = time.perf_counter()
+            app = self.app
+            self._loading_thread = threading.get_ident()
+            app._check_setup_finished = self._check_setup_finished
+            try:
+                for rule, endpoint, view_func, options in self._pending_rules:
+                    self._add_url_rule(rule, endpoint, view_func, **options)
+                for _name, loader in self._loaders:
+                    loader()
+            finally:
+                del app._check_setup_finished
+                self._loading_thread = None
+            self.loaded = True
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.load_reason = reason
+            logger.info(f"Deferred routes loaded in {self.load_ms}ms "
+                        f"({len(self._pending_rules)} rules, {len(self._loaders)} modules) "
+                        f"for {reason or 'explicit load'}")
+            return True
+
+    def _on_build_error(self, error, endpoint, values):
+        # url_for() to a deferred endpoint from an eager request (e.g. the
+        # login redirect): load, then build again. Returning None re-raises.
+        if self.loaded or self._loading_here():
+            return None
+        self.load(reason=f'url_for({endpoint})')
+        from flask import url_for
+        return url_for(endpoint, **values)
+
+    def stats(self):
+        return {
+            'mode': STARTUP_MODE,
+            'loaded': self.loaded,
+            'eager_rules': self._eager_rules,
+            'deferred_rules': len(self._pending_rules),
+            'deferred_modules': [name for name, _ in self._loaders],
+            'load_ms': self.load_ms,
+            'load_reason': self.load_reason,
+        }
+
+
+class LazyObject:
+    """Proxy that builds the wrapped object on first attribute access. Used
+    for clients whose import is expensive and only a few routes touch."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+
+    def __getattr__(self, name):
+        if self._obj is None:
+            self._obj = self._factory()
+        return getattr(self._obj, name)
@@ -4,8 +4,8 @@ Leaderboard routes for displaying performance rankings and subscription buttons
 from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import current_user
 from admin_auth import admin_required
-from models import db, User, Subscription
-from leaderboard_utils import get_leaderboard_data, update_leaderboard_entry, update_all_user_leaderboards
+from models import db, Subscription
+from leaderboard_utils import get_leaderboard_data, update_leaderboard_cache, update_all_user_leaderboards
 from subscription_utils import get_subscription_tier_info
 # Shared rate limiter (Postgres-backed fixed window; falls back to in-memory).
 # These legacy web leaderboard endpoints are PUBLIC and were unthrottled — the
@@ -22,40 +22,38 @@ def leaderboard_home():
     """
     Main leaderboard page - dynamically rendered with cached chart data
     Chart data embedded in HTML (no API calls, lazy-loaded client-side)
+    
+    Fixed query count: the market-close ranking (LeaderboardCache, computed
+    on demand only when missing) and every entry's downsampled chart preview
+    + value range in one keyed query (chart_previews).
+
+    Rankings are only as fresh as the LeaderboardCache row, not computed per
+    request: every period is rebuilt at market close, and 1D additionally by
+    the intraday collector on ticks with time to spare. During the session
+    1D can therefore lag the live portfolios (by a tick or more if the
+    collector skips the rebuild), and the other periods show the last close.
     """
     period = request.args.get('period', 'YTD')  # Default to YTD
     category = request.args.get('category', 'all')  # all, small_cap, large_cap
     
-    from models import UserPortfolioChartCache
+    import chart_previews
     from flask import make_response
-    from leaderboard_utils import calculate_leaderboard_data
+    from leaderboard_utils import calculate_leaderboard_data, get_cached_leaderboard, y_axis_range_from_bounds
     
-    leaderboard_data = calculate_leaderboard_data(period, limit=20, category=category)
+    leaderboard_data = get_cached_leaderboard(period, category)
+    if leaderboard_data is None:
+        leaderboard_data = calculate_leaderboard_data(period, limit=20, category=category)
+    leaderboard_data = leaderboard_data[:20]
     
     # Embed chart JSON data for each user (no API calls needed)
-    import json
-    from leaderboard_utils import calculate_chart_y_axis_range
-    
-    chart_data_list = []
+    previews = chart_previews.load([entry['user_id'] for entry in leaderboard_data], period)
     for entry in leaderboard_data:
-        chart_cache = UserPortfolioChartCache.query.filter_by(
-            user_id=entry['user_id'],
-            period=period
-        ).first()
-        
-        # Parse JSON string from database to dict for template
-        if chart_cache and chart_cache.chart_data:
-            try:
-                chart_data = json.loads(chart_cache.chart_data)
-                entry['chart_json'] = chart_data
-                chart_data_list.append(chart_data)
-            except (json.JSONDecodeError, TypeError):
-                entry['chart_json'] = None
-        else:
-            entry['chart_json'] = None
+        preview = previews.get(entry['user_id'])
+        entry['chart_json'] = preview.chart if preview else None
     
-    # Calculate consistent y-axis range for visual comparison
-    y_axis_range = calculate_chart_y_axis_range(chart_data_list)
+    # Consistent y-axis range for visual comparison, from the precomputed
+    # per-chart bounds
+    y_axis_range = y_axis_range_from_bounds([(p.y_min, p.y_max) for p in previews.values()])
     
     # Render template (auth state available for SSR, but client will handle overlay)
     response = make_response(render_template('leaderboard.html',
@@ -96,13 +94,9 @@ def api_leaderboard_data():
 @leaderboard_bp.route('/update/<period>')
 @admin_required
 def update_period(period):
-    """Update leaderboard for specific period (admin/debug use)"""
-    users = User.query.all()
-    updated_count = 0
-    
-    for user in users:
-        update_leaderboard_entry(user.id, period)
-        updated_count += 1
+    """Rebuild the cached leaderboard for one period (admin/debug use): every
+    user's metrics in one pass, the same path as the market-close cron."""
+    updated_count = update_leaderboard_cache(periods=[period])
     
     return jsonify({
         'success': True,
@@ -4,8 +4,9 @@ Leaderboard utilities for calculating performance metrics and market cap classif
 from datetime import datetime, date, timedelta
 from models import db, User, Stock, StockInfo, LeaderboardEntry, PortfolioSnapshot
 from flask import current_app
-import requests
 import os
+from av_rate_governor import av_get
+from perf_tracing import traced
 import logging
 
 logger = logging.getLogger(__name__)
@@ -46,7 +47,7 @@ def get_or_create_stock_info(ticker):
             'apikey': api_key
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = av_get(url, params=params, timeout=10)
         data = response.json()
         
         if 'MarketCapitalization' in data and data['MarketCapitalization'] != 'None':
@@ -315,6 +316,24 @@ def update_leaderboard_entry(user_id, period):
     # But if it's still called, it should not break atomic transactions
     return entry
 
+def get_cached_leaderboard(period='YTD', category='all'):
+    """
+    Ranked entries of the LeaderboardCache row for period + category (written at
+    market close), or None when there is no cache row. One query: the plain
+    key and the _auth/_anon suffixed keys written by the backfill are fetched
+    together, preferred in that order.
+    """
+    import json
+    from models import LeaderboardCache
+    
+    cache_key = f"{period}_{category}"
+    keys = [cache_key, f"{cache_key}_auth", f"{cache_key}_anon"]
+    rows = {row.period: row for row in LeaderboardCache.query.filter(LeaderboardCache.period.in_(keys))}
+    for key in keys:
+        if key in rows:
+            return json.loads(rows[key].leaderboard_data)
+    return None
+
 def get_leaderboard_data(period='YTD', limit=20, category='all', use_auth_suffix=False):
     """
     Get cached leaderboard data from LeaderboardCache table with chart data
@@ -327,37 +346,20 @@ def get_leaderboard_data(period='YTD', limit=20, category='all', use_auth_suffix
         use_auth_suffix: If True, looks for _auth/_anon suffixed cache keys (used by route)
     """
     import json
-    from models import LeaderboardCache, UserPortfolioChartCache
-    
-    # Create cache key for period + category
-    # MODERN FORMAT: period_category_auth or period_category_anon
-    # LEGACY FORMAT: period_category (no suffix)
-    cache_key = f"{period}_{category}"
-    
-    # Try all cache key formats: plain, _auth, _anon
-    # The backfill writes _auth/_anon suffixed keys, so we must always check those
-    cache_entry = LeaderboardCache.query.filter_by(period=cache_key).first()
-    if not cache_entry:
-        cache_entry = LeaderboardCache.query.filter_by(period=f"{cache_key}_auth").first()
-    if not cache_entry:
-        cache_entry = LeaderboardCache.query.filter_by(period=f"{cache_key}_anon").first()
-    
-    if cache_entry:
-        # Return cached data with chart data included
-        cached_data = json.loads(cache_entry.leaderboard_data)
-        
-        # Add chart data for each user if available
-        for entry in cached_data[:limit]:
-            chart_cache = UserPortfolioChartCache.query.filter_by(
-                user_id=entry['user_id'], period=period.split('_')[0]  # Use base period for chart lookup
-            ).first()
-            
-            if chart_cache:
-                entry['chart_data'] = json.loads(chart_cache.chart_data)
-            else:
-                entry['chart_data'] = None
-        
-        return cached_data[:limit]
+    from models import UserPortfolioChartCache
+    
+    cached_data = get_cached_leaderboard(period, category)
+    if cached_data is not None:
+        entries = cached_data[:limit]
+        # Chart data for every entry in one keyed query (base period for chart lookup)
+        charts = dict(db.session.query(UserPortfolioChartCache.user_id, UserPortfolioChartCache.chart_data).filter(
+            UserPortfolioChartCache.user_id.in_({e['user_id'] for e in entries}),
+            UserPortfolioChartCache.period == period.split('_')[0],
+        )) if entries else {}
+        for entry in entries:
+            chart_json = charts.get(entry['user_id'])
+            entry['chart_data'] = json.loads(chart_json) if chart_json else None
+        return entries
     
     # Fallback: calculate on-demand if no cache exists
     return calculate_leaderboard_data(period, limit, category)
@@ -437,27 +439,19 @@ def get_user_chart_data(user_id, period):
     return fresh_data
 
 def get_last_market_day():
-    """Get the last market day (Monday-Friday, excluding weekends)
+    """Get the last market day (today if the exchange trades today, else the
+    previous session; weekends and holidays skipped)
     
     IMPORTANT: Uses Eastern Time to avoid timezone mismatches.
     Vercel runs in UTC, so we must explicitly use ET for market dates.
     """
-    from datetime import date, timedelta
-    from zoneinfo import ZoneInfo
     from datetime import datetime
+    import trading_calendar
     
     # CRITICAL: Use Eastern Time, not UTC
-    MARKET_TZ = ZoneInfo('America/New_York')
-    today = datetime.now(MARKET_TZ).date()
-    
-    # If it's Saturday (5) or Sunday (6), go back to Friday
-    if today.weekday() == 5:  # Saturday
-        return today - timedelta(days=1)  # Friday
-    elif today.weekday() == 6:  # Sunday
-        return today - timedelta(days=2)  # Friday
-    else:
-        return today  # Monday-Friday
+    return trading_calendar.session_on_or_before(datetime.now(trading_calendar.MARKET_TZ).date())
 
+@traced()
 def _compute_all_user_metrics(period='YTD'):
     """
     Compute performance metrics for ALL users in a single pass.
@@ -748,7 +742,7 @@ def generate_user_portfolio_chart(user_id, period):
         
         if period == '1D':
             # For 1D charts, use intraday snapshots with proper time formatting
-            from models import PortfolioSnapshotIntraday, MarketData
+            from models import PortfolioSnapshotIntraday
             from sqlalchemy import func, and_, cast, Date
             
             # Try today first, then fall back to last trading day with data
@@ -790,11 +784,8 @@ def generate_user_portfolio_chart(user_id, period):
             
             # Get S&P 500 intraday data for same date
             sp500_pcts = []
-            spy_data = MarketData.query.filter(
-                MarketData.ticker == 'SPY_INTRADAY',
-                MarketData.date == target_date,
-                MarketData.timestamp.isnot(None)
-            ).order_by(MarketData.timestamp.asc()).all()
+            import benchmark_series
+            spy_data = benchmark_series.intraday(target_date, target_date).points
             
             if spy_data:
                 spy_base = float(spy_data[0].close_price)
@@ -872,12 +863,9 @@ def generate_user_portfolio_chart(user_id, period):
                 # For longer periods, show full dates (YYYY-MM-DD)
                 labels = [snapshot.date.strftime('%Y-%m-%d') for snapshot in snapshots]
             
-            # Fetch S&P 500 benchmark data for the same period
-            from models import MarketData
-            sp500_data = MarketData.query.filter_by(ticker='SPY_SP500')\
-                .filter(MarketData.date >= start_date)\
-                .filter(MarketData.date <= today)\
-                .order_by(MarketData.date.asc()).all()
+            # S&P 500 benchmark closes for the same period (shared series)
+            import benchmark_series
+            sp500_data = benchmark_series.daily().between(start_date, today).points
             
             # Create S&P 500 performance array aligned with portfolio dates
             sp500_performance = {
@@ -997,8 +985,10 @@ def update_leaderboard_cache(periods=None):
                 # (statement_timeout). On lock failure we skip this entry and move on
                 # — the other writer's update is just as good, and a later rebuild
                 # will overwrite it anyway.
+                # (SQLite has no row locks; the benchmark harness runs there.)
+                lock_clause = " FOR UPDATE NOWAIT" if db.engine.dialect.name == 'postgresql' else ""
                 select_sql = text(
-                    "SELECT id FROM leaderboard_cache WHERE period = :period FOR UPDATE NOWAIT"
+                    "SELECT id FROM leaderboard_cache WHERE period = :period" + lock_clause
                 )
                 try:
                     existing_id = db.session.execute(select_sql, {'period': cache_key}).scalar()
@@ -1169,7 +1159,7 @@ def generate_chart_from_snapshots_OLD_DEPRECATED(user_id, period):
     """
     from datetime import datetime, date, timedelta
     import json
-    from models import PortfolioSnapshotIntraday, MarketData
+    from models import PortfolioSnapshotIntraday
     from sqlalchemy import func, cast, Date
     
     # Use same date calculation logic as calculate_leaderboard_data
@@ -1263,12 +1253,8 @@ def generate_chart_from_snapshots_OLD_DEPRECATED(user_id, period):
             portfolio_data.append(round(performance_pct, 2))
         
         # Get S&P 500 intraday data
-        sp500_data = MarketData.query.filter(
-            MarketData.ticker == 'SPY_INTRADAY',
-            MarketData.date >= start_date,
-            MarketData.date <= end_date,
-            MarketData.timestamp.isnot(None)
-        ).order_by(MarketData.timestamp).all()
+        import benchmark_series
+        sp500_data = benchmark_series.intraday(start_date, end_date).points
         
         sp500_performance = []
         if sp500_data and len(sp500_data) > 0:
@@ -1334,12 +1320,8 @@ def generate_chart_from_snapshots_OLD_DEPRECATED(user_id, period):
             portfolio_data.append(round(performance_pct, 2))
         
         # Get S&P 500 EOD data - MUST align with portfolio snapshot dates!
-        from models import MarketData
-        sp500_snapshots = MarketData.query.filter(
-            MarketData.ticker == 'SPY_SP500',
-            MarketData.date >= start_date,
-            MarketData.date <= today
-        ).order_by(MarketData.date.asc()).all()
+        import benchmark_series
+        sp500_snapshots = benchmark_series.daily().between(start_date, today).points
         
         sp500_performance = []
         if sp500_snapshots and len(sp500_snapshots) > 0:
@@ -1557,75 +1539,11 @@ def calculate_industry_mix(user_id):
 def calculate_user_portfolio_stats(user_id):
     """
     Calculate all portfolio statistics for a user
-    Called during market close cron
-    Returns dict of stats
+    Returns dict of stats (the market-close cron computes every user at once
+    with portfolio_stats.compute())
     """
-    from models import Stock, Transaction, Subscription, StockInfo
-    from datetime import datetime, timedelta
-    
-    stats = {}
-    
-    # 1. UNIQUE STOCKS COUNT
-    stocks = Stock.query.filter_by(user_id=user_id).all()
-    stats['unique_stocks_count'] = len(stocks)
-
-    # 1b. FRACTIONAL HOLDINGS FLAG (Phase E)
-    # True iff at least one position has a non-integer quantity. Powers the
-    # "Hide portfolios with fractional shares" toggle on Discover/Leaderboard.
-    # 0.0001 tolerance covers floating-point fuzz from cost-basis division /
-    # fee adjustments without flagging genuinely-whole-share portfolios.
-    stats['has_fractional_holdings'] = any(
-        s.quantity is not None
-        and s.quantity > 0
-        and abs(s.quantity - round(s.quantity)) > 0.0001
-        for s in stocks
-    )
-    
-    # 2. TRADING ACTIVITY
-    # Get all transactions
-    transactions = Transaction.query.filter_by(user_id=user_id).all()
-    stats['total_trades'] = len(transactions)
-    
-    # Calculate avg trades per week (last 14 days)
-    fourteen_days_ago = datetime.now() - timedelta(days=14)
-    recent_transactions = [t for t in transactions if t.timestamp >= fourteen_days_ago]
-    avg_trades_per_day = len(recent_transactions) / 14
-    stats['avg_trades_per_week'] = round(avg_trades_per_day * 7, 2)
-    
-    # 3. LARGE CAP %
-    small_cap_percent, large_cap_percent = calculate_portfolio_cap_percentages(user_id)
-    stats['small_cap_percent'] = small_cap_percent
-    stats['large_cap_percent'] = large_cap_percent
-    
-    # 4. INDUSTRY MIX
-    industry_mix = calculate_industry_mix(user_id)
-    stats['industry_mix'] = industry_mix
-    
-    # 5. SUBSCRIBER COUNT (real + gifted from all sources)
-    subscriber_count = Subscription.query.filter_by(
-        subscribed_to_id=user_id,
-        status='active'
-    ).count()
-    try:
-        from models import MobileSubscription
-        subscriber_count += MobileSubscription.query.filter_by(
-            subscribed_to_id=user_id,
-            status='active'
-        ).count()
-    except Exception:
-        pass
-    try:
-        from models import AdminSubscription
-        admin_sub = AdminSubscription.query.filter_by(portfolio_user_id=user_id).first()
-        if admin_sub:
-            subscriber_count += admin_sub.bonus_subscriber_count or 0
-    except Exception:
-        pass
-    stats['subscriber_count'] = subscriber_count
-    
-    stats['last_updated'] = datetime.utcnow()
-    
-    return stats
+    import portfolio_stats
+    return portfolio_stats.compute([user_id])[user_id]
 
 def calculate_chart_y_axis_range(chart_data_list):
     """
@@ -1638,13 +1556,10 @@ def calculate_chart_y_axis_range(chart_data_list):
     Returns:
         dict with 'min' and 'max' values, with 10-15% padding for visual clarity
     """
-    if not chart_data_list:
-        return {'min': -10, 'max': 10}
-    
     all_values = []
     
     # Extract ALL values from both portfolio AND S&P 500 datasets
-    for chart_data in chart_data_list:
+    for chart_data in chart_data_list or []:
         if not chart_data or 'datasets' not in chart_data:
             continue
         
@@ -1655,9 +1570,20 @@ def calculate_chart_y_axis_range(chart_data_list):
     
     if not all_values:
         return {'min': -10, 'max': 10}
+    return y_axis_range_from_bounds([(min(all_values), max(all_values))])
+
+def y_axis_range_from_bounds(bounds):
+    """
+    calculate_chart_y_axis_range from per-chart (min, max) pairs precomputed
+    when the chart cache was written (chart_previews); (None, None) pairs are
+    skipped.
+    """
+    bounds = [(lo, hi) for lo, hi in bounds if lo is not None and hi is not None]
+    if not bounds:
+        return {'min': -10, 'max': 10}
     
-    min_val = min(all_values)
-    max_val = max(all_values)
+    min_val = min(lo for lo, _ in bounds)
+    max_val = max(hi for _, hi in bounds)
     
     # Add 10-15% padding to the actual range for visual clarity
     range_size = max_val - min_val
@@ -0,0 +1,491 @@
+"""
+Checkpointed, resumable market-close pipeline.
+
+/api/cron/market-close used to run every phase back to back inside one 60s
+invocation with progress kept only in the response dict: a timeout during the
+leaderboard phase left the day half-done, and the next run started from
+scratch.
+
+run() executes the same phases in order, recording each one durably in
+market_close_checkpoint (one row per trading day and phase):
+
+    dividends          0.5   ex-dividend credits (before snapshots)
+    snapshots          1     EOD PortfolioSnapshot upserts, chunked by user_id
+    sp500              1.5   S&P 500 close (MarketData SPY_SP500)
+    leaderboard        2     leaderboard JSON cache
+    portfolio_stats    2.25  user_portfolio_stats
+    subscriber_counts  2.44  counter reconciliation
+    influencer_ranking 2.45  materialized ranking rebuild
+    verify_sp500       3.5   S&P 500 row visible on the primary
+
+Every phase is idempotent (upserts, rebuilds, dedupe on Dividend), so
+re-running one is safe. A run skips phases already done, resumes the snapshot
+phase from its user_id watermark (committed with each chunk), and stops
+before the invocation deadline, leaving the rest for the next call. A failed
+critical phase (snapshots) stops the run; other failures are recorded and
+retried by the next run up to MAX_ATTEMPTS. The day's phase='pipeline' row
+holds a lease so overlapping invocations never run the same day twice.
+
+Until the migration (2026_10_24_market_close_checkpoint.sql) has run,
+checkpoints are kept in memory only and every phase runs in one pass.
+
+status() reports where each trading day's close stands.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+PIPELINE = 'pipeline'              # day-level row: lease + overall status
+LEASE_SECONDS = 90                 # > Vercel maxDuration, so a dead run's lease lapses
+MAX_ATTEMPTS = 3                   # per non-critical phase
+SNAPSHOT_CHUNK = int(os.environ.get('MARKET_CLOSE_SNAPSHOT_CHUNK', '200'))
+MIN_PHASE_SECONDS = 5              # don't start a phase or chunk with less time left
+
+
+class OutOfTime(Exception):
+    """The invocation deadline is too close to start more work."""
+
+
+class Phase(NamedTuple):
+    name: str
+    label: str
+    run: Callable
+    critical: bool = False
+
+
+class Context:
+    """Per-invocation state handed to every phase."""
+
+    def __init__(self, trading_date, deadline=None, clock=time.monotonic):
+        self.trading_date = trading_date
+        self.deadline = deadline
+        self.clock = clock
+        self.results = {'errors': [], 'pipeline_phases': []}
+        self._prices = None
+
+    def time_left(self):
+        return float('inf') if self.deadline is None else self.deadline - self.clock()
+
+    def check_time(self):
+        if self.time_left() < MIN_PHASE_SECONDS:
+            raise OutOfTime()
+
+    def prices(self):
+        """One batch price fetch per invocation (held tickers + SPY); also
+        warms the price cache that the per-user valuation reads."""
+        if self._prices is None:
+            from models import db, Stock
+            from portfolio_performance import PortfolioPerformanceCalculator
+            tickers = {'SPY'} | {t.upper() for (t,) in db.session.query(Stock.ticker).filter(
+                Stock.quantity > 0).distinct() if t}
+            logger.info(f"📊 Batch API (Market Close): Fetching {len(tickers)} unique tickers")
+            self._prices = PortfolioPerformanceCalculator().get_batch_stock_data(sorted(tickers)) or {}
+            logger.info(f"✅ Batch API Success: Retrieved {len(self._prices)} prices")
+        return self._prices
+
+
+def table_ready(conn):
+    import db_tables
+    return db_tables.table_ready(conn, 'market_close_checkpoint')
+
+
+# ── phases ──────────────────────────────────────────────────────────────────
+
+def _dividends(ctx, cp):
+    from models import db
+    from dividend_tracker import process_dividends_for_date
+    div_results = process_dividends_for_date(db, target_date=ctx.trading_date)
+    ctx.results['dividends_found'] = div_results.get('dividends_found', 0)
+    ctx.results['dividends_recorded'] = div_results.get('dividends_recorded', 0)
+    ctx.results['dividend_total_amount'] = div_results.get('total_amount', 0.0)
+    cp.records = div_results.get('dividends_recorded', 0)
+
+
+def _upsert_snapshots(rows):
+    from models import db, PortfolioSnapshot
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(PortfolioSnapshot.__table__)
+    # UPSERT: atomic insert-or-update avoids UniqueViolation from read-replica
+    # lag (an ORM lookup may miss an existing row).
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date'],
+        set_={c: stmt.excluded[c] for c in ('total_value', 'stock_value', 'cash_proceeds', 'max_cash_deployed')},
+    )
+    db.session.execute(stmt, rows)
+
+
+def _snapshots(ctx, cp):
+    """EOD snapshots in user_id chunks. Each chunk's upserts and the advanced
+    watermark commit together, so a timeout loses at most one chunk."""
+    from models import db, User
+    from cash_tracking import calculate_portfolio_value_with_cash
+
+    ctx.prices()
+    while True:
+        ctx.check_time()
+        users = User.query.filter(User.id > (cp.watermark or 0)).order_by(User.id).limit(SNAPSHOT_CHUNK).all()
+        if not users:
+            return
+        rows = []
+        for user in users:
+            try:
+                # Prices are served from the cache warmed by ctx.prices().
+                portfolio_data = calculate_portfolio_value_with_cash(user.id, ctx.trading_date)
+                total_value = portfolio_data['total_value']
+                # Skip if portfolio value is 0 or None (indicates calculation failure)
+                if total_value is None or total_value <= 0:
+                    error_msg = f"User {user.id} ({user.username}): Skipping - portfolio value is {total_value}"
+                    ctx.results['errors'].append(error_msg)
+                    logger.warning(error_msg)
+                    continue
+                rows.append({
+                    'user_id': user.id,
+                    'date': ctx.trading_date,
+                    'total_value': total_value,
+                    'stock_value': portfolio_data['stock_value'],
+                    'cash_proceeds': portfolio_data['cash_proceeds'],
+                    'max_cash_deployed': user.max_cash_deployed,
+                    'cash_flow': 0,
+                })
+            except Exception as e:
+                # Don't fail the entire pipeline for individual user errors
+                ctx.results['errors'].append(f"Error processing user {user.id} ({user.username}): {str(e)}")
+                logger.error(f"Market close user {user.id} error: {e}")
+        _upsert_snapshots(rows)
+        cp.watermark = users[-1].id
+        cp.chunks += 1
+        cp.records += len(rows)
+        ctx.results['snapshots_created'] = ctx.results.get('snapshots_created', 0) + len(rows)
+        ctx.results['users_processed'] = ctx.results.get('users_processed', 0) + len(rows)
+        db.session.commit()
+
+
+def _sp500(ctx, cp):
+    from models import db, MarketData
+    import benchmark_series
+    spy_price = ctx.prices().get('SPY')
+    if not spy_price:
+        # Fallback: individual call if the batch somehow missed SPY
+        logger.warning("SPY not in batch results - falling back to individual call")
+        from portfolio_performance import PortfolioPerformanceCalculator
+        spy_price = (PortfolioPerformanceCalculator().get_stock_data('SPY') or {}).get('price')
+    if not spy_price:
+        ctx.results['sp500_data_collected'] = False
+        raise RuntimeError("Failed to fetch SPY data for S&P 500")
+    sp500_value = spy_price * 10  # Convert SPY to S&P 500 approximation
+    existing = MarketData.query.filter_by(ticker='SPY_SP500', date=ctx.trading_date).first()
+    if existing:
+        existing.close_price = sp500_value
+    else:
+        db.session.add(MarketData(ticker='SPY_SP500', date=ctx.trading_date, close_price=sp500_value))
+    db.session.commit()
+    benchmark_series.invalidate('daily')
+    ctx.results['sp500_data_collected'] = True
+    cp.records = 1
+    cp.details = {'sp500_value': sp500_value}
+
+
+def _leaderboard(ctx, cp):
+    from models import db
+    from leaderboard_utils import update_leaderboard_cache
+    updated_count = update_leaderboard_cache()
+    db.session.commit()
+    ctx.results['leaderboard_updated'] = True
+    ctx.results['leaderboard_entries_updated'] = updated_count
+    # Surface any leaderboard calculation errors
+    lb_errors = getattr(update_leaderboard_cache, '_last_errors', [])
+    if lb_errors:
+        ctx.results['leaderboard_errors'] = lb_errors
+        cp.details = {'errors': lb_errors[:20]}
+    cp.records = updated_count or 0
+
+
+def _portfolio_stats(ctx, cp):
+    from models import db
+    import portfolio_stats
+    # Set-based: a handful of grouped queries for every user and one bulk upsert.
+    cp.records = portfolio_stats.update_all()
+    db.session.commit()
+    ctx.results['portfolio_stats_updated'] = cp.records
+
+
+def _subscriber_counts(ctx, cp):
+    from models import db
+    import subscriber_counts
+    # Repairs drift from writes that bypassed the ORM hook; runs before the
+    # ranking rebuild, which reads the counters.
+    if subscriber_counts.table_ready(db.session.connection()):
+        drift = subscriber_counts.reconcile(db.engine)
+        ctx.results['subscriber_count_drift'] = [uid for uid, _, _ in drift]
+        cp.records = len(drift)
+
+
+def _influencer_ranking(ctx, cp):
+    from models import db
+    import influencer_ranking
+    if influencer_ranking.table_ready(db.session.connection()):
+        cp.records = influencer_ranking.rebuild(db.engine)
+        ctx.results['influencer_ranking_rows'] = cp.records
+
+
+def _verify_sp500(ctx, cp):
+    """Confirm the S&P 500 row is visible on the primary (Vercel Postgres
+    read replicas lag 50-500ms): raw SQL on the engine, 3 tries with backoff."""
+    from sqlalchemy import text
+    from models import db
+    verify_sp500 = None
+    for attempt in range(3):
+        try:
+            with db.engine.connect() as primary_conn:
+                row = primary_conn.execute(text(
+                    "SELECT close_price FROM market_data WHERE ticker = 'SPY_SP500' AND date = :date"
+                ), {'date': ctx.trading_date}).fetchone()
+            if row:
+                verify_sp500 = row[0]
+                break
+            logger.warning(f"Attempt {attempt+1}: S&P 500 data not yet visible on primary")
+        except Exception as verify_err:
+            logger.error(f"Verification attempt {attempt+1} error: {verify_err}")
+        if attempt < 2:
+            time.sleep(0.2 * (attempt + 1))  # Backoff: 200ms, 400ms
+    if not verify_sp500:
+        ctx.results['sp500_verification'] = 'FAILED'
+        raise RuntimeError(f"S&P 500 data missing after commit for {ctx.trading_date}")
+    ctx.results['sp500_verification'] = 'SUCCESS'
+    ctx.results['sp500_verified_value'] = float(verify_sp500)
+    cp.records = 1
+
+
+PHASES = [
+    Phase('dividends', '0.5', _dividends),
+    Phase('snapshots', '1', _snapshots, critical=True),
+    Phase('sp500', '1.5', _sp500),
+    Phase('leaderboard', '2', _leaderboard),
+    Phase('portfolio_stats', '2.25', _portfolio_stats),
+    Phase('subscriber_counts', '2.44', _subscriber_counts),
+    Phase('influencer_ranking', '2.45', _influencer_ranking),
+    Phase('verify_sp500', '3.5', _verify_sp500),
+]
+
+
+# ── checkpoints ─────────────────────────────────────────────────────────────
+
+def _checkpoints(trading_date, durable):
+    """{phase: MarketCloseCheckpoint} for the day, creating missing rows.
+    Transient (never added to the session) when the table is missing."""
+    from models import db, MarketCloseCheckpoint as CP
+    rows = {}
+    if durable:
+        rows = {cp.phase: cp for cp in CP.query.filter_by(trading_date=trading_date)}
+    for name in [PIPELINE] + [p.name for p in PHASES]:
+        if name not in rows:
+            rows[name] = CP(trading_date=trading_date, phase=name, status='pending', chunks=0, records=0,
+                            attempts=0, duration_ms=0)
+            if durable:
+                db.session.add(rows[name])
+    if durable:
+        try:
+            db.session.commit()
+        except Exception:
+            # Another invocation created them first.
+            db.session.rollback()
+            rows = {cp.phase: cp for cp in CP.query.filter_by(trading_date=trading_date)}
+    return rows
+
+
+def _acquire_lease(trading_date, now):
+    """Atomically take the day's lease. False if a live run holds it."""
+    from sqlalchemy import or_
+    from models import db, MarketCloseCheckpoint as CP
+    taken = db.session.query(CP).filter(
+        CP.trading_date == trading_date, CP.phase == PIPELINE,
+        or_(CP.lease_until.is_(None), CP.lease_until < now),
+    ).update({'lease_until': now + timedelta(seconds=LEASE_SECONDS), 'attempts': CP.attempts + 1},
+             synchronize_session=False)
+    db.session.commit()
+    return taken == 1
+
+
+def _due(cp, force):
+    if force or cp.status in ('pending', 'running', 'partial'):
+        return True
+    return cp.status == 'failed' and cp.attempts < MAX_ATTEMPTS
+
+
+def _reset(cp):
+    cp.status, cp.watermark, cp.chunks, cp.records, cp.attempts = 'pending', None, 0, 0, 0
+    cp.duration_ms, cp.error, cp.details, cp.started_at, cp.finished_at = 0, None, None, None, None
+
+
+def _fresh_connections():
+    """Drop pooled connections between phases: after a failure a Postgres
+    connection can be stuck in an aborted transaction that rollback() alone
+    does not clear. The session (and the checkpoints in it) is kept; SQLite
+    pools are left alone."""
+    from models import db
+    try:
+        db.session.rollback()
+        if db.engine.dialect.name == 'postgresql':
+            db.engine.dispose()
+    except Exception:
+        pass
+
+
+def run(trading_date, deadline=None, force=False, clock=time.monotonic):
+    """
+    Run (or resume) the market close for `trading_date`.
+
+    Args:
+        deadline: clock() value after which no phase or chunk starts.
+        force: re-run every phase from scratch (checkpoints reset).
+
+    Returns dict: trading_date, status ('complete', 'partial', 'incomplete',
+    'failed' or 'busy'), phases_run, next_phase, results (legacy response
+    fields), checkpoints (see status()).
+    """
+    from models import db
+    durable = table_ready(db.session.connection())
+    ctx = Context(trading_date, deadline=deadline, clock=clock)
+    summary = {'trading_date': trading_date.isoformat(), 'durable': durable, 'phases_run': [],
+               'next_phase': None, 'results': ctx.results}
+
+    checkpoints = _checkpoints(trading_date, durable)
+    pipeline = checkpoints[PIPELINE]
+    if durable and not _acquire_lease(trading_date, datetime.utcnow()):
+        summary['status'] = 'busy'
+        summary['checkpoints'] = _describe(checkpoints.values())
+        return summary
+    if force:
+        for phase in PHASES:
+            _reset(checkpoints[phase.name])
+    pipeline.status = 'running'
+    pipeline.started_at = pipeline.started_at or datetime.utcnow()
+    db.session.commit()
+
+    stopped = None
+    for phase in PHASES:
+        cp = checkpoints[phase.name]
+        if not _due(cp, force=False):
+            continue
+        try:
+            ctx.check_time()
+        except OutOfTime:
+            stopped = phase.name
+            break
+        _fresh_connections()
+        logger.info(f"PHASE {phase.label}: {phase.name} (attempt {cp.attempts + 1})")
+        ctx.results['pipeline_phases'].append(f'{phase.name}_started')
+        cp.status, cp.attempts, cp.error = 'running', cp.attempts + 1, None
+        cp.started_at = cp.started_at or datetime.utcnow()
+        db.session.commit()
+        started = clock()
+        try:
+            phase.run(ctx, cp)
+            cp.status = 'done'
+            cp.finished_at = datetime.utcnow()
+            ctx.results['pipeline_phases'].append(f'{phase.name}_completed')
+            logger.info(f"PHASE {phase.label} Complete: {phase.name} ({cp.records} records)")
+        except OutOfTime:
+            db.session.rollback()
+            cp.status = 'partial'
+            stopped = phase.name
+        except Exception as e:
+            db.session.rollback()
+            cp.status = 'failed'
+            cp.error = str(e)[:2000]
+            ctx.results['errors'].append(f"{phase.name} failed: {str(e)}")
+            logger.error(f"PHASE {phase.label} FAILED: {phase.name}: {e}")
+            if phase.critical:
+                stopped = phase.name
+        cp.duration_ms += int((clock() - started) * 1000)
+        summary['phases_run'].append(phase.name)
+        db.session.commit()
+        if stopped:
+            break
+
+    due = [p.name for p in PHASES if _due(checkpoints[p.name], force=False)]
+    if stopped and checkpoints[stopped].status == 'failed':
+        status = 'failed'
+    elif due:
+        status = 'incomplete'
+    elif any(checkpoints[p.name].status == 'failed' for p in PHASES):
+        status = 'partial'
+    else:
+        status = 'complete'
+    pipeline.status = status
+    pipeline.finished_at = datetime.utcnow() if status in ('complete', 'partial') else None
+    pipeline.lease_until = None
+    pipeline.records = sum(1 for p in PHASES if checkpoints[p.name].status == 'done')
+    db.session.commit()
+
+    summary['status'] = status
+    summary['next_phase'] = due[0] if due else None
+    summary['checkpoints'] = _describe(checkpoints.values())
+    return summary
+
+
+# ── status ──────────────────────────────────────────────────────────────────
+
+def _iso(dt):
+    return dt.isoformat() if dt else None
+
+
+def _describe(checkpoints):
+    order = {p.name: i for i, p in enumerate(PHASES)}
+    return [{
+        'phase': cp.phase,
+        'status': cp.status,
+        'watermark': cp.watermark,
+        'chunks': cp.chunks,
+        'records': cp.records,
+        'attempts': cp.attempts,
+        'duration_ms': cp.duration_ms,
+        'started_at': _iso(cp.started_at),
+        'finished_at': _iso(cp.finished_at),
+        'error': cp.error,
+        'details': cp.details,
+    } for cp in sorted(checkpoints, key=lambda c: order.get(c.phase, -1)) if cp.phase != PIPELINE]
+
+
+def status(trading_date=None, days=5):
+    """Where the close stands for `trading_date`, or for the last `days`
+    trading dates with checkpoints (newest first)."""
+    from models import db, MarketCloseCheckpoint as CP
+    if not table_ready(db.session.connection()):
+        return []
+    query = CP.query
+    if trading_date is not None:
+        query = query.filter(CP.trading_date == trading_date)
+    else:
+        dates = [d for (d,) in db.session.query(CP.trading_date).distinct()
+                 .order_by(CP.trading_date.desc()).limit(days)]
+        query = query.filter(CP.trading_date.in_(dates))
+    by_day = {}
+    for cp in query:
+        by_day.setdefault(cp.trading_date, []).append(cp)
+    report = []
+    for day in sorted(by_day, reverse=True):
+        rows = {cp.phase: cp for cp in by_day[day]}
+        pipeline = rows.get(PIPELINE)
+        pending = [p.name for p in PHASES if p.name not in rows or _due(rows[p.name], force=False)]
+        report.append({
+            'trading_date': day.isoformat(),
+            'status': pipeline.status if pipeline else 'pending',
+            'invocations': pipeline.attempts if pipeline else 0,
+            'lease_until': _iso(pipeline.lease_until) if pipeline else None,
+            'finished_at': _iso(pipeline.finished_at) if pipeline else None,
+            'next_phase': pending[0] if pending else None,
+            'phases': _describe(by_day[day]),
+        })
+    return report
@@ -14,7 +14,7 @@ Endpoints:
 - PUT /api/mobile/notifications/settings - Update notification preferences
 """
 
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, current_app
 from functools import wraps
 from datetime import datetime, date, timedelta
 from collections import defaultdict
@@ -241,37 +241,19 @@ MAX_HOLDINGS_PER_PORTFOLIO = 200        # distinct tickers per portfolio
 # ── Mobile daily-active tracking ────────────────────────────────────────────
 # The web app logs UserActivity on login/dashboard views, but mobile users
 # previously left no daily-activity trail, making D1/D7/D30 retention
-# uncomputable for app users. This writes ONE UserActivity('mobile_active')
-# row per user per UTC day. The in-process memo skips the DB check entirely
-# on warm serverless instances; duplicate rows from cold-start races are
-# harmless because retention math uses DISTINCT (user, day).
-_dau_seen = {}  # user_id -> 'YYYY-MM-DD' last day we confirmed a ping
-
-
+# uncomputable for app users. This queues ONE UserActivity('mobile_active')
+# row per user per UTC day in activity_sink, which writes it in bulk after
+# the response — the request itself does no activity I/O. Duplicate rows
+# from cold-start races are harmless because retention math uses
+# DISTINCT (user, day).
 def _log_mobile_active(user_id):
     """Record that user_id was active today (at most one row/user/day)."""
-    today = datetime.utcnow().strftime('%Y-%m-%d')
-    if _dau_seen.get(user_id) == today:
-        return
-    try:
-        from models import db, UserActivity
-        day_start = datetime.strptime(today, '%Y-%m-%d')
-        exists = db.session.query(UserActivity.id).filter(
-            UserActivity.user_id == user_id,
-            UserActivity.activity_type == 'mobile_active',
-            UserActivity.timestamp >= day_start,
-        ).first()
-        if not exists:
-            db.session.add(UserActivity(user_id=user_id, activity_type='mobile_active'))
-            db.session.commit()
-        _dau_seen[user_id] = today
+    try:
+        import activity_sink
+        activity_sink.mark_active(user_id)
     except Exception:
         # Never let activity tracking break a real request
-        try:
-            from models import db
-            db.session.rollback()
-        except Exception:
-            pass
+        pass
 
 
 def require_auth(f):
@@ -712,20 +694,12 @@ def get_subscriptions():
                 'created_at': sub.created_at.isoformat()
             })
         
-        active_real_subs = len([s for s in received_subs if s.status == 'active'])
-        gifted_subs_count = 0
-        try:
-            from models import AdminSubscription
-            admin_sub = AdminSubscription.query.filter_by(portfolio_user_id=g.user_id).first()
-            if admin_sub:
-                gifted_subs_count = admin_sub.bonus_subscriber_count or 0
-        except Exception:
-            pass
+        import subscriber_counts
         
         return jsonify({
             'subscriptions_made': subscriptions_made,
             'subscribers': subscribers,
-            'subscriber_count': active_real_subs + gifted_subs_count
+            'subscriber_count': subscriber_counts.get(g.user_id).total
         })
         
     except Exception as e:
@@ -1107,18 +1081,14 @@ def creator_payouts():
     All amounts are estimates until a period closes and a XeroPayoutRecord is
     generated; the client labels them accordingly.
     """
-    from models import (TaxpayerProfile, XeroPayoutRecord, MobileSubscription,
-                        AdminSubscription)
+    from models import TaxpayerProfile, XeroPayoutRecord, AdminSubscription
+    import subscriber_counts
 
     uid = g.user_id
 
     # Current active real subscribers (matches the payable definition used by
-    # the payout pipeline) + any company-gifted subs.
-    real_subs = MobileSubscription.query.filter_by(
-        subscribed_to_id=uid, status='active'
-    ).count()
-    admin = AdminSubscription.query.filter_by(portfolio_user_id=uid).first()
-    bonus_subs = (admin.bonus_subscriber_count or 0) if admin else 0
+    # the payout pipeline) + any company-gifted subs, from the counter row.
+    real_subs, bonus_subs = subscriber_counts.get(uid)
 
     # Authoritative economics via the same model calc the pipeline uses, so the
     # estimate can never drift from the real revenue split.
@@ -1513,19 +1483,9 @@ def get_portfolio(slug):
             'accepts_new_subscribers': _get_accepts_new_subscribers(owner)
         }
         
-        # Get subscriber count (real + gifted)
-        subscriber_count = MobileSubscription.query.filter_by(
-            subscribed_to_id=owner.id,
-            status='active'
-        ).count()
-        try:
-            from models import AdminSubscription
-            admin_sub = AdminSubscription.query.filter_by(portfolio_user_id=owner.id).first()
-            if admin_sub:
-                subscriber_count += admin_sub.bonus_subscriber_count or 0
-        except Exception:
-            pass
-        response['subscriber_count'] = subscriber_count
+        # Subscriber count (real + gifted)
+        import subscriber_counts
+        response['subscriber_count'] = subscriber_counts.get(owner.id).total
         
         # Leaderboard badges — check if user ranks in top 20 for any period
         leaderboard_badges = []
@@ -2050,7 +2010,7 @@ def get_leaderboard():
       "unknown / show" so users mid-rollout don't disappear before the
       market-close cron has populated user_portfolio_stats.
     """
-    from models import db, User, Stock, Transaction, UserPortfolioStats, PortfolioSnapshot, MarketData, Subscription
+    from models import db, User, Stock, Transaction, UserPortfolioStats, PortfolioSnapshot
     from datetime import datetime, timedelta, date as dt_date
     import json as json_module
     
@@ -2138,77 +2098,15 @@ def get_leaderboard():
         except Exception:
             pass
         
-        # ── Compute S&P 500 return for this period directly from MarketData ──
+        # ── S&P 500 return for this period from the shared benchmark series ──
         # Uses the SAME date range as the performance calculator so sparklines align
         sp500_return_for_period = 0.0
         sp500_sparkline_global = []
         try:
-            from performance_calculator import get_period_dates
-            sp_start, sp_end = get_period_dates(cache_period)
-            
-            if cache_period in ('1D', '5D'):
-                # For intraday periods: use SPY_INTRADAY (collected every 15 min)
-                sp500_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_INTRADAY',
-                    MarketData.date >= sp_start,
-                    MarketData.date <= sp_end,
-                    MarketData.timestamp.isnot(None)
-                ).order_by(MarketData.timestamp.asc()).all()
-                
-                if sp500_records and len(sp500_records) >= 2:
-                    base_val = float(sp500_records[0].close_price)
-                    if base_val > 0:
-                        sp500_sparkline_global = [
-                            round(((float(r.close_price) - base_val) / base_val) * 100, 2)
-                            for r in sp500_records
-                        ]
-                        sp500_return_for_period = sp500_sparkline_global[-1]
-                elif sp500_records and len(sp500_records) == 1:
-                    # Only 1 intraday point — use previous close as baseline
-                    prev_day = sp_start - timedelta(days=1)
-                    while prev_day.weekday() >= 5:
-                        prev_day -= timedelta(days=1)
-                    prev_close = MarketData.query.filter(
-                        MarketData.ticker == 'SPY_SP500',
-                        MarketData.date == prev_day
-                    ).first()
-                    if prev_close and float(prev_close.close_price) > 0:
-                        base_val = float(prev_close.close_price)
-                        curr_val = float(sp500_records[0].close_price)
-                        sp500_return_for_period = round(((curr_val - base_val) / base_val) * 100, 2)
-                        sp500_sparkline_global = [0.0, sp500_return_for_period]
-                
-                # Fallback to daily SPY_SP500 if no intraday data
-                if not sp500_sparkline_global:
-                    sp500_records = MarketData.query.filter(
-                        MarketData.ticker == 'SPY_SP500',
-                        MarketData.date >= sp_start,
-                        MarketData.date <= sp_end
-                    ).order_by(MarketData.date.asc()).all()
-                    if sp500_records and len(sp500_records) >= 2:
-                        base_val = float(sp500_records[0].close_price)
-                        if base_val > 0:
-                            sp500_sparkline_global = [
-                                round(((float(r.close_price) - base_val) / base_val) * 100, 2)
-                                for r in sp500_records
-                            ]
-                            sp500_return_for_period = sp500_sparkline_global[-1]
-            else:
-                # For longer periods: use daily SPY_SP500 close
-                sp500_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_SP500',
-                    MarketData.date >= sp_start,
-                    MarketData.date <= sp_end
-                ).order_by(MarketData.date.asc()).all()
-                
-                if sp500_records and len(sp500_records) >= 2:
-                    base_val = float(sp500_records[0].close_price)
-                    if base_val > 0:
-                        sp500_sparkline_global = [
-                            round(((float(r.close_price) - base_val) / base_val) * 100, 2)
-                            for r in sp500_records
-                        ]
-                        sp500_return_for_period = sp500_sparkline_global[-1]
+            import benchmark_series
+            sp500_series = benchmark_series.for_period(cache_period)
+            sp500_sparkline_global = sp500_series.pct_changes()
+            sp500_return_for_period = sp500_series.period_return()
         except Exception as e:
             logger.warning(f"S&P 500 lookup failed: {e}")
         
@@ -2280,26 +2178,9 @@ def get_leaderboard():
             ).group_by(Stock.user_id).all()
             stock_count_map = {uid: cnt for uid, cnt in stock_counts}
         
-        # Batch load subscriber counts (real + gifted)
-        sub_count_map = {}
-        if raw_user_ids:
-            sub_counts = db.session.query(
-                Subscription.subscribed_to_id,
-                sqla_func.count(Subscription.id).label('cnt')
-            ).filter(
-                Subscription.subscribed_to_id.in_(raw_user_ids),
-                Subscription.status == 'active'
-            ).group_by(Subscription.subscribed_to_id).all()
-            sub_count_map = {uid: cnt for uid, cnt in sub_counts}
-            # Add gifted (admin) subscribers
-            try:
-                from models import AdminSubscription
-                for asub in AdminSubscription.query.filter(AdminSubscription.portfolio_user_id.in_(raw_user_ids)).all():
-                    bonus = asub.bonus_subscriber_count or 0
-                    if bonus > 0:
-                        sub_count_map[asub.portfolio_user_id] = sub_count_map.get(asub.portfolio_user_id, 0) + bonus
-            except Exception:
-                pass
+        # Batch load subscriber counts (real + gifted) from the counter rows
+        import subscriber_counts
+        sub_count_map = {uid: c.total for uid, c in subscriber_counts.get_many(raw_user_ids).items()}
         
         # API-time eligibility filter: ensure users have enough history for this period.
         # This catches stale cache entries that were computed before eligibility checks existed.
@@ -2784,6 +2665,66 @@ def update_notification_settings():
         return jsonify({'error': 'update_failed'}), 500
 
 
+def _encode_feed_cursor(timestamp, txn_id):
+    """Opaque keyset cursor for the trade-alerts feed: (timestamp, id) of the
+    last row returned."""
+    import base64
+    raw = f"{timestamp.isoformat()}|{txn_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_feed_cursor(cursor):
+    """Inverse of _encode_feed_cursor. Raises ValueError on garbage."""
+    import base64
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, txn_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(ts), int(txn_id)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+# Deepest ?offset= the trade-alerts feed serves. Offset paging (shipped
+# clients) still probes offset + limit + 1 rows per trader, so its cost grows
+# with depth; past this the feed ends for them. Cursor paging has no cap.
+FEED_MAX_OFFSET = 500
+
+
+def _trade_alert_rows(sub_start, n, before=None):
+    """Newest `n` buy/sell transactions across the followed traders, each
+    trader's only on/after its subscription start, strictly older than the
+    `before` (timestamp, id) keyset position.
+
+    One statement: a UNION ALL of per-trader `ORDER BY timestamp DESC, id DESC
+    LIMIT n` probes (each a short range scan of ix_stock_transaction_user_ts),
+    merged and cut to n. Cost is O(followed traders x n) whatever the page
+    depth, instead of a full count plus an OFFSET scan.
+    """
+    from models import db, Transaction
+    from sqlalchemy import and_, or_, select, union_all
+
+    cols = (Transaction.id, Transaction.user_id, Transaction.timestamp, Transaction.ticker,
+            Transaction.quantity, Transaction.price, Transaction.transaction_type)
+    probes = []
+    for trader_id, start in sub_start.items():
+        q = select(*cols).where(
+            Transaction.user_id == trader_id,
+            Transaction.timestamp >= start,
+            Transaction.transaction_type.in_(('buy', 'sell')),
+        )
+        if before is not None:
+            ts, txn_id = before
+            q = q.where(or_(Transaction.timestamp < ts,
+                            and_(Transaction.timestamp == ts, Transaction.id < txn_id)))
+        q = q.order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(n)
+        probes.append(select(q.subquery()))
+
+    merged = (probes[0] if len(probes) == 1 else union_all(*probes)).subquery()
+    return db.session.execute(
+        select(merged).order_by(merged.c.timestamp.desc(), merged.c.id.desc()).limit(n)
+    ).all()
+
+
 @mobile_api.route('/notifications/history', methods=['GET'])
 @require_auth
 def notification_history():
@@ -2803,21 +2744,37 @@ def notification_history():
 
     Only trades AT/AFTER each subscription's start (MobileSubscription.created_at)
     are shown, and 'initial'/seed rows are excluded — alerts are real buy/sell
-    trades. Query params: ?limit=50&offset=0
+    trades.
+
+    Query params: ?limit=50&cursor=<next_cursor from the previous page>
+    Keyset-paginated (see _trade_alert_rows): the response carries `has_more`
+    and `next_cursor`. `?offset=` is deprecated and kept only for shipped
+    clients: `total` is still returned for them, but only as a lower bound
+    (offset + returned, +1 when there are more) — enough for their "load more"
+    check without counting the whole feed. Offset pages stop at
+    FEED_MAX_OFFSET rows (has_more false from there), since each one still
+    reads offset + limit rows per trader.
     """
-    from models import MobileSubscription, Transaction, User
-    from sqlalchemy import and_, or_, desc
+    from models import MobileSubscription, User
 
-    limit = min(int(request.args.get('limit', 50)), 100)
-    offset = int(request.args.get('offset', 0))
+    limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    cursor = request.args.get('cursor')
+    before = None
+    if cursor:
+        try:
+            before = _decode_feed_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'invalid_cursor'}), 400
+        offset = 0
 
     try:
         subs = MobileSubscription.query.filter_by(
             subscriber_id=g.user_id, status='active'
         ).all()
         if not subs:
-            return jsonify({'notifications': [], 'total': 0,
-                            'limit': limit, 'offset': offset})
+            return jsonify({'notifications': [], 'total': 0, 'has_more': False,
+                            'next_cursor': None, 'limit': limit, 'offset': offset})
 
         # trader_id -> earliest active subscription start. Alerts only surface
         # trades made on/after the user subscribed to that portfolio.
@@ -2827,26 +2784,23 @@ def notification_history():
             start = s.created_at or datetime(1970, 1, 1)
             if tid not in sub_start or start < sub_start[tid]:
                 sub_start[tid] = start
-        trader_ids = list(sub_start.keys())
 
-        # Per-trader "trades since I subscribed" predicate, OR'd together so a
-        # single query covers all of the user's subscriptions.
-        per_trader = [
-            and_(Transaction.user_id == tid, Transaction.timestamp >= start)
-            for tid, start in sub_start.items()
-        ]
-        base_q = Transaction.query.filter(
-            Transaction.user_id.in_(trader_ids),
-            Transaction.transaction_type.in_(('buy', 'sell')),
-            or_(*per_trader),
-        )
+        # Deprecated offset paging: bounded depth (see FEED_MAX_OFFSET).
+        if before is None and offset:
+            limit = min(limit, max(0, FEED_MAX_OFFSET - offset))
+            if not limit:
+                return jsonify({'notifications': [], 'total': offset, 'has_more': False,
+                                'next_cursor': None, 'limit': 0, 'offset': offset})
 
-        total = base_q.count()
-        txns = (base_q.order_by(desc(Transaction.timestamp))
-                .limit(limit).offset(offset).all())
+        # One extra row tells us whether another page exists.
+        rows = _trade_alert_rows(sub_start, offset + limit + 1, before=before)
+        has_more = len(rows) > offset + limit
+        if before is None and offset and offset + limit >= FEED_MAX_OFFSET:
+            has_more = False
+        txns = rows[offset:offset + limit]
 
         traders = {u.id: u for u in
-                   User.query.filter(User.id.in_(trader_ids)).all()}
+                   User.query.filter(User.id.in_(list(sub_start.keys()))).all()}
 
         items = []
         for t in txns:
@@ -2873,9 +2827,12 @@ def notification_history():
                 'body': f"{verb.capitalize()} {qty_str} {t.ticker} @ ${price:,.2f}",
             })
 
+        next_cursor = _encode_feed_cursor(txns[-1].timestamp, txns[-1].id) if has_more and txns else None
         return jsonify({
             'notifications': items,
-            'total': total,
+            'total': offset + len(items) + (1 if has_more else 0),
+            'has_more': has_more,
+            'next_cursor': next_cursor,
             'limit': limit,
             'offset': offset,
         })
@@ -3476,22 +3433,19 @@ def get_current_user():
 @require_auth
 @rate_limit(2)
 def request_data_export():
-    """GDPR "Request My Data": assemble everything we hold about the user and
-    email it to their registered address as pretty-printed JSON.
+    """GDPR "Request My Data": queue an export of everything we hold about
+    the user. The data-exports cron streams it into a compressed file and
+    emails the user a download link (data_export.py).
 
     Replaces the old flow where Settings just opened a mailto: to support and
-    a human had to compile the export by hand. Rate-limited hard (2/hr) — the
-    export walks several tables.
+    a human had to compile the export by hand. Rate-limited hard; a request
+    while an export is already queued returns that job.
 
-    Sections are fault-isolated: one table failing (e.g. a migration gap)
-    degrades that section to an error note instead of killing the export.
+    Before the data_export_job migration the export is built in-request and
+    emailed in the body instead.
     """
-    import json as _json
-    from models import (
-        User, Stock, Transaction, Subscription, PortfolioSnapshot,
-        MobileSubscription, TaxpayerProfile, XeroPayoutRecord, DeviceToken,
-        SMSNotification, FeaturePollVote,
-    )
+    import data_export
+    from models import User
 
     try:
         user = User.query.get(g.user_id)
@@ -3500,223 +3454,57 @@ def request_data_export():
         if not user.email:
             return jsonify({'error': 'no_email_on_file'}), 400
 
-        def _iso(dt):
-            return dt.isoformat() if dt else None
+        if not data_export.table_ready():
+            result = data_export.export_inline(user)
+            if result.get('status') == 'failed':
+                logger.error(f"Data export email failed for user {user.id}: {result.get('error')}")
+                return jsonify({'error': 'email_send_failed'}), 502
+            logger.info(f"Data export sent for user {user.id}")
+            return jsonify({'success': True, 'sent_to': user.email})
 
-        export = {
-            'generated_at': datetime.utcnow().isoformat() + 'Z',
-            'profile': {
-                'id': user.id,
-                'username': user.username,
-                'public_name': getattr(user, 'public_name', None),
-                'email': user.email,
-                'created_at': _iso(user.created_at),
-                'portfolio_slug': user.portfolio_slug,
-                # Lives in extra_data, NOT a column — getattr(user, ...) was
-                # always False here (data-export bug, fixed 2026-07-29).
-                'founding_trader': _has_founding_trader_badge(user),
-                'cash_proceeds': float(getattr(user, 'cash_proceeds', 0.0) or 0.0),
-            },
-            'holdings': [
-                {
-                    'ticker': s.ticker,
-                    'quantity': float(s.quantity or 0),
-                    'purchase_price': float(s.purchase_price or 0),
-                    'created_at': _iso(getattr(s, 'created_at', None)),
-                }
-                for s in Stock.query.filter_by(user_id=user.id).all()
-            ],
-            'transactions': [
-                {
-                    'ticker': t.ticker,
-                    'type': getattr(t, 'transaction_type', None),
-                    'quantity': float(t.quantity or 0),
-                    'price': float(t.price or 0),
-                    'timestamp': _iso(t.timestamp),
-                }
-                for t in Transaction.query.filter_by(user_id=user.id)
-                    .order_by(Transaction.timestamp.asc()).all()
-            ],
-        }
-        if getattr(user, 'phone_number', None):
-            export['profile']['phone_number'] = user.phone_number
-
-        def _section(name, builder):
-            """Fault-isolate each table walk — a failing section degrades to a
-            note instead of failing the whole export. Builders may return None
-            to omit their section entirely (no data of that category exists —
-            don't imply we collect it)."""
-            try:
-                result = builder()
-                if result is not None:
-                    export[name] = result
-            except Exception as sec_err:
-                logger.warning(f"Data export section '{name}' failed for user {user.id}: {sec_err}")
-                export[name] = {'error': 'This section could not be generated. Contact support@apestogether.ai for a manual copy.'}
-
-        # App Store / Google Play subscriptions (the real billing) plus any
-        # legacy web-era Stripe rows.
-        _section('subscriptions_made', lambda: [
-            {
-                'creator_user_id': sub.subscribed_to_id,
-                'status': sub.status,
-                'store_slot': sub.slot,
-                'started': _iso(sub.created_at),
-                'expires': _iso(sub.expires_at),
-                'push_notifications_enabled': bool(sub.push_notifications_enabled),
-                'copy_scale_target_dollars': sub.target_dollars,
-            }
-            for sub in MobileSubscription.query.filter_by(subscriber_id=user.id).all()
-        ] + [
-            {
-                'creator_user_id': sub.subscribed_to_id,
-                'status': sub.status,
-                'source': 'legacy_web',
-                'started': _iso(getattr(sub, 'start_date', None) or getattr(sub, 'created_at', None)),
-                'ends': _iso(getattr(sub, 'end_date', None)),
-            }
-            for sub in Subscription.query.filter_by(subscriber_id=user.id).all()
-        ])
-
-        # Subscriber identities are the SUBSCRIBERS' personal data, not the
-        # creator's — status/dates only.
-        _section('subscribers', lambda: [
-            {'status': sub.status, 'started': _iso(sub.created_at), 'expires': _iso(sub.expires_at)}
-            for sub in MobileSubscription.query.filter_by(subscribed_to_id=user.id).all()
-        ] + [
-            {'status': sub.status, 'source': 'legacy_web',
-             'started': _iso(getattr(sub, 'start_date', None) or getattr(sub, 'created_at', None))}
-            for sub in Subscription.query.filter_by(subscribed_to_id=user.id).all()
-        ])
-
-        # W-9 / taxpayer profile. The full TIN is intentionally NOT stored on
-        # our servers (only its last 4) — it lives in our accounting system
-        # (Xero) as the 1099 system of record. Say so explicitly.
-        def _tax_section():
-            tp = TaxpayerProfile.query.filter_by(user_id=user.id).first()
-            if not tp:
-                return {'status': 'not_submitted', 'note': 'No W-9 information on file.'}
-            return {
-                'status': tp.status,
-                'legal_name': tp.legal_name,
-                'business_name': tp.business_name,
-                'tax_classification': tp.tax_classification,
-                'tin_type': tp.tin_type,
-                'tin_last4': tp.tin_last4,
-                'address': {
-                    'line1': tp.address_line1,
-                    'line2': tp.address_line2,
-                    'city': tp.city,
-                    'state': tp.state,
-                    'postal_code': tp.postal_code,
-                    'country': tp.country,
-                },
-                'certified_at': _iso(tp.certified_at),
-                'submitted_at': _iso(tp.submitted_at),
-                'note': 'Your full SSN/EIN is never stored on ApesTogether servers — only its last 4 digits. The full TIN is held in our accounting system (Xero) solely for IRS 1099 reporting.',
-            }
-        _section('tax_w9', _tax_section)
+        job = data_export.enqueue(user)
+        logger.info(f"Data export {job.id} queued for user {user.id}")
+        return jsonify({'success': True, 'sent_to': user.email, **data_export.describe(job)}), 202
 
-        # Creator payout history (earnings are the user's data too).
-        _section('payouts', lambda: [
-            {
-                'period': f"{_iso(p.period_start)} to {_iso(p.period_end)}",
-                'subscriber_count': p.total_subscriber_count,
-                'payout_amount': round((p.influencer_payout or 0) + (p.bonus_payout or 0), 2),
-                'payment_status': p.payment_status,
-                'paid_at': _iso(p.paid_at),
-            }
-            for p in XeroPayoutRecord.query.filter_by(portfolio_user_id=user.id)
-                .order_by(XeroPayoutRecord.period_start.asc()).all()
-        ])
-
-        # Registered devices — metadata only, never the raw push token (it's a
-        # credential, not user information).
-        _section('devices', lambda: [
-            {
-                'platform': d.platform,
-                'app_version': d.app_version,
-                'os_version': d.os_version,
-                'active': bool(d.is_active),
-                'registered_at': _iso(d.created_at),
-                'last_notified_at': _iso(d.last_used_at),
-            }
-            for d in DeviceToken.query.filter_by(user_id=user.id).all()
-        ])
-
-        # Legacy web-era SMS alerts stored a real phone number (Twilio).
-        # The mobile apps never collect one (push = device tokens), so the
-        # section is omitted entirely when there's no row — don't imply we
-        # collect phone numbers from app users.
-        def _sms_section():
-            sms = SMSNotification.query.filter_by(user_id=user.id).first()
-            if not sms:
-                return None
-            return {
-                'phone_number': sms.phone_number,
-                'verified': bool(sms.is_verified),
-                'sms_enabled': bool(sms.sms_enabled),
-                'added_at': _iso(sms.created_at),
-            }
-        _section('sms_settings', _sms_section)
-
-        # Feature-poll votes stay user-linked only while a poll is ACTIVE
-        # (one-vote-per-user + "you voted X" in the app). Votes on closed
-        # polls are anonymized (user link severed), so they can't appear
-        # here — and the section is omitted when there's nothing linked.
-        def _poll_section():
-            votes = FeaturePollVote.query.filter_by(user_id=user.id).all()
-            if not votes:
-                return None
-            return {
-                'votes': [
-                    {'poll_id': v.poll_id, 'choice': v.selected_option, 'voted_at': _iso(v.voted_at)}
-                    for v in votes
-                ],
-                'note': 'Votes are linked to your account only while the poll is open (to enforce one vote per user). When a poll closes, the link is removed and only the anonymous tally remains.',
-            }
-        _section('poll_votes', _poll_section)
+    except Exception as e:
+        logger.error(f"Data export error for user {g.user_id}: {e}")
+        return jsonify({'error': 'export_failed'}), 500
 
-        def _snapshot_section():
-            snapshots = PortfolioSnapshot.query.filter_by(user_id=user.id)
-            first = snapshots.order_by(PortfolioSnapshot.date.asc()).first()
-            last = snapshots.order_by(PortfolioSnapshot.date.desc()).first()
-            return {
-                'count': snapshots.count(),
-                'first_date': _iso(first.date) if first else None,
-                'last_date': _iso(last.date) if last else None,
-                'note': 'Daily valuation snapshots. The full series is available on request to support@apestogether.ai.',
-            }
-        _section('portfolio_snapshots', _snapshot_section)
-
-        body = (
-            f"Hi {user.username},\n\n"
-            "Attached below is a copy of the personal data ApesTogether holds for your account, "
-            "as requested from Settings.\n\n"
-            "If anything looks wrong, or you'd like this data corrected or deleted, reply to this "
-            "email or use Delete Account in Settings.\n\n"
-            "— ApesTogether\n\n"
-            "----------------------------------------\n\n"
-            + _json.dumps(export, indent=2)
-        )
 
-        from services.notification_utils import send_email
-        result = send_email(
-            to_email=user.email,
-            subject='Your ApesTogether data export',
-            body=body,
-            reply_to='support@apestogether.ai',
-        )
-        if result.get('status') == 'failed':
-            logger.error(f"Data export email failed for user {user.id}: {result.get('error')}")
-            return jsonify({'error': 'email_send_failed'}), 502
+@mobile_api.route('/auth/data-export', methods=['GET'])
+@require_auth
+def get_data_export_status():
+    """Status / progress of the user's latest data export (with its download
+    link once ready)."""
+    import data_export
+    try:
+        if not data_export.table_ready():
+            return jsonify({'export': None})
+        return jsonify({'export': data_export.status(g.user_id)})
+    except Exception as e:
+        logger.error(f"Data export status error for user {g.user_id}: {e}")
+        return jsonify({'error': 'export_status_failed'}), 500
 
-        logger.info(f"Data export sent for user {user.id}")
-        return jsonify({'success': True, 'sent_to': user.email})
 
+@mobile_api.route('/data-export/<token>', methods=['GET'])
+@rate_limit(10)
+def download_data_export(token):
+    """Download a finished export. The emailed link's token is the
+    credential (unguessable, expires after data_export.LINK_TTL_DAYS)."""
+    import data_export
+    from flask import Response
+    try:
+        job = data_export.fetch(token) if data_export.table_ready() else None
+        if not job:
+            return jsonify({'error': 'export_not_found_or_expired'}), 404
+        filename = f"apestogether-data-export-{job.finished_at:%Y-%m-%d}.ndjson.gz"
+        return Response(job.artifact, mimetype='application/gzip', headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store',
+        })
     except Exception as e:
-        logger.error(f"Data export error for user {g.user_id}: {e}")
-        return jsonify({'error': 'export_failed'}), 500
+        logger.error(f"Data export download error: {e}")
+        return jsonify({'error': 'export_download_failed'}), 500
 
 
 def _cancel_google_purchases(purchases, revoke=False):
@@ -4135,6 +3923,11 @@ def health_check():
         'status': 'configured' if jwt_configured else 'using_default'
     }
     
+    # Startup mode: whether admin/web routes are still deferred on this
+    # instance (APP_STARTUP_MODE, see lazy_routes.py)
+    deferred_routes = current_app.extensions.get('deferred_routes')
+    health['startup'] = deferred_routes.stats() if deferred_routes else {'mode': 'full'}
+
     # Overall status
     if not push_service.is_available:
         health['status'] = 'degraded'
@@ -4147,6 +3940,71 @@ def health_check():
 # Top Influencers (by Subscriber Count)
 # =============================================================================
 
+def _top_influencer_entry(user, stats, subscriber_count):
+    industry_mix = (stats.industry_mix if stats and stats.industry_mix else {}) or {}
+    top_industries = []
+    if industry_mix:
+        sorted_industries = sorted(industry_mix.items(), key=lambda x: x[1], reverse=True)
+        top_industries = [
+            {'name': name, 'percent': round(pct, 1)}
+            for name, pct in sorted_industries[:3]
+        ]
+    return {
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'display_name': user.public_name,
+            'portfolio_slug': user.portfolio_slug,
+            # Founding Trader — clients render a circled gold symbol
+            # on the Top Creators row (same as leaderboard rows).
+            'founding_trader': _has_founding_trader_badge(user)
+        },
+        'subscriber_count': subscriber_count,
+        'unique_stocks': (stats.unique_stocks_count if stats else 0) or 0,
+        'avg_trades_per_week': round((stats.avg_trades_per_week if stats else 0) or 0, 1),
+        'top_industries': top_industries
+    }
+
+
+def _top_influencers_from_aggregates(industry, limit, hide_fractional):
+    """Per-request ranking from the subscription tables. Only used until the
+    influencer_ranking table exists (pre-migration)."""
+    from models import db, User, UserPortfolioStats
+    import influencer_ranking
+
+    sub_totals = {uid: n for uid, n in influencer_ranking.subscriber_totals(
+        db.session.connection()).items() if n > 0}
+    if not sub_totals:
+        return {'entries': [], 'available_industries': [], 'total': 0}
+
+    users_map = {u.id: u for u in User.query.filter(User.id.in_(list(sub_totals))).all()}
+    stats_map = {s.user_id: s for s in UserPortfolioStats.query.filter(
+        UserPortfolioStats.user_id.in_(list(sub_totals))
+    ).all()}
+
+    raw_entries = []
+    all_industries = set()
+    for uid, count in sub_totals.items():
+        user = users_map.get(uid)
+        if not user:
+            continue
+        stats = stats_map.get(uid)
+        industry_mix = (stats.industry_mix if stats and stats.industry_mix else {}) or {}
+        if hide_fractional and stats is not None and stats.has_fractional_holdings is True:
+            continue
+        if industry and industry.lower() != 'all':
+            if not any(industry.lower() in name.lower() and pct >= 5 for name, pct in industry_mix.items()):
+                continue
+        all_industries.update(name for name, pct in industry_mix.items() if pct >= 5)
+        raw_entries.append(_top_influencer_entry(user, stats, count))
+
+    raw_entries.sort(key=lambda x: x['subscriber_count'], reverse=True)
+    entries = raw_entries[:limit]
+    for i, entry in enumerate(entries):
+        entry['rank'] = i + 1
+    return {'entries': entries, 'available_industries': sorted(all_industries), 'total': len(entries)}
+
+
 @mobile_api.route('/top-influencers', methods=['GET'])
 @require_auth
 def get_top_influencers():
@@ -4161,115 +4019,33 @@ def get_top_influencers():
       share position. Default 0. NULL flags treated as "show" so users not
       yet processed by the daily cron remain visible during rollout.
     """
-    from models import User, UserPortfolioStats, MobileSubscription
+    from models import db
+    import influencer_ranking
     
     industry = request.args.get('industry', 'all')
     limit = min(int(request.args.get('limit', 20)), 50)
     hide_fractional = request.args.get('hide_fractional', '0') == '1'
     
     try:
-        # Build a combined subscriber count map from all sources:
-        # 1. MobileSubscription (real subs)
-        # 2. AdminSubscription (gifted subs)
-        from models import AdminSubscription
-        sub_totals = {}  # user_id -> total subscriber count
+        if not influencer_ranking.table_ready(db.session.connection()):
+            return jsonify(_top_influencers_from_aggregates(industry, limit, hide_fractional))
         
-        try:
-            real_counts = db.session.query(
-                MobileSubscription.subscribed_to_id,
-                db.func.count(MobileSubscription.id)
-            ).filter_by(status='active').group_by(
-                MobileSubscription.subscribed_to_id
-            ).all()
-            for uid, cnt in real_counts:
-                sub_totals[uid] = sub_totals.get(uid, 0) + cnt
-        except Exception:
-            pass
-        
-        try:
-            for asub in AdminSubscription.query.filter(AdminSubscription.bonus_subscriber_count > 0).all():
-                sub_totals[asub.portfolio_user_id] = sub_totals.get(asub.portfolio_user_id, 0) + (asub.bonus_subscriber_count or 0)
-        except Exception:
-            pass
-        
-        # Filter to users with > 0 subs
-        user_ids_with_subs = [uid for uid, cnt in sub_totals.items() if cnt > 0]
-        if not user_ids_with_subs:
-            return jsonify({'entries': [], 'available_industries': [], 'total': 0})
-        
-        # Load users and their stats
-        users_map = {u.id: u for u in User.query.filter(User.id.in_(user_ids_with_subs)).all()}
-        stats_map = {s.user_id: s for s in UserPortfolioStats.query.filter(
-            UserPortfolioStats.user_id.in_(user_ids_with_subs)
-        ).all()}
-        
-        # Build entries sorted by subscriber count
-        raw_entries = []
-        all_industries = set()
-        for uid in user_ids_with_subs:
-            user = users_map.get(uid)
-            if not user:
-                continue
-            stats = stats_map.get(uid)
-            industry_mix = (stats.industry_mix if stats and stats.industry_mix else {}) or {}
-
-            # Hide-fractional filter (Phase E). Only hide when explicitly True;
-            # None / missing stats row means "unknown — show", so users with
-            # NULL flags survive until the cron has populated the column.
-            if hide_fractional and stats is not None and stats.has_fractional_holdings is True:
-                continue
-            
-            # Industry filter
-            if industry and industry.lower() != 'all':
-                matched = any(
-                    industry.lower() in ind_name.lower() and pct >= 5
-                    for ind_name, pct in industry_mix.items()
-                )
-                if not matched:
-                    continue
-            
-            # Collect available industries
-            for ind_name, pct in industry_mix.items():
-                if pct >= 5:
-                    all_industries.add(ind_name)
-            
-            top_industries = []
-            if industry_mix:
-                sorted_industries = sorted(industry_mix.items(), key=lambda x: x[1], reverse=True)
-                top_industries = [
-                    {'name': name, 'percent': round(pct, 1)}
-                    for name, pct in sorted_industries[:3]
-                ]
-            
-            raw_entries.append({
-                'user': {
-                    'id': user.id,
-                    'username': user.username,
-                    'display_name': user.public_name,
-                    'portfolio_slug': user.portfolio_slug,
-                    # Founding Trader — clients render a circled gold symbol
-                    # on the Top Creators row (same as leaderboard rows).
-                    'founding_trader': _has_founding_trader_badge(user)
-                },
-                'subscriber_count': sub_totals[uid],
-                'unique_stocks': (stats.unique_stocks_count if stats else 0) or 0,
-                'avg_trades_per_week': round((stats.avg_trades_per_week if stats else 0) or 0, 1),
-                'top_industries': top_industries
-            })
-        
-        # Sort by subscriber count desc, assign ranks, apply limit
-        raw_entries.sort(key=lambda x: x['subscriber_count'], reverse=True)
+        # One range scan of ix_influencer_ranking_industry_total (joined to
+        # User / UserPortfolioStats for the N rows returned).
+        rows = influencer_ranking.top(limit, industry=industry, hide_fractional=hide_fractional)
         entries = []
-        for i, entry in enumerate(raw_entries[:limit]):
+        for i, (ranking, user, stats) in enumerate(rows):
+            entry = _top_influencer_entry(user, stats, ranking.total_subscribers)
             entry['rank'] = i + 1
             entries.append(entry)
         
         return jsonify({
             'entries': entries,
-            'available_industries': sorted(list(all_industries)),
+            'available_industries': influencer_ranking.available_industries(
+                industry=industry, hide_fractional=hide_fractional),
             'total': len(entries)
         })
-        
+    
     except Exception as e:
         logger.error(f"Top influencers error: {e}")
         return jsonify({'entries': [], 'available_industries': [], 'total': 0})
@@ -4320,7 +4096,7 @@ def get_portfolio_chart(slug):
     
     Returns chart_data array with {date, portfolio, sp500} points.
     """
-    from models import User, PortfolioSnapshot, MarketData
+    from models import User, PortfolioSnapshot
     
     period = request.args.get('period', '1W')
     # Map 1W -> 5D for backend compatibility, accept legacy 5D/7D too
@@ -4343,9 +4119,8 @@ def get_portfolio_chart(slug):
         sp500_return = 0.0
         
         try:
-            from performance_calculator import calculate_portfolio_performance, get_period_dates, _sp500_benchmark_cache
-            # Clear stale S&P cache from previous requests in same serverless instance
-            _sp500_benchmark_cache.clear()
+            from performance_calculator import calculate_portfolio_performance, get_period_dates
+            import benchmark_series
             
             start_date, end_date = get_period_dates(period, user_id=owner.id)
             result = calculate_portfolio_performance(
@@ -4356,37 +4131,9 @@ def get_portfolio_chart(slug):
                 chart_data = result['chart_data']
                 portfolio_return = result.get('portfolio_return', 0.0)
             
-            # Compute PERIOD-LEVEL S&P 500 return (same as leaderboard header)
-            # This uses the full period range, not the user's first snapshot date
-            from models import MarketData
-            from datetime import timedelta as td
-            period_start, period_end = get_period_dates(period)  # No user_id = full period
-            
-            if period in ('1D', '5D'):
-                sp_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_INTRADAY',
-                    MarketData.date >= period_start,
-                    MarketData.date <= period_end,
-                    MarketData.timestamp.isnot(None)
-                ).order_by(MarketData.timestamp.asc()).all()
-                if not sp_records or len(sp_records) < 2:
-                    sp_records = MarketData.query.filter(
-                        MarketData.ticker == 'SPY_SP500',
-                        MarketData.date >= period_start,
-                        MarketData.date <= period_end
-                    ).order_by(MarketData.date.asc()).all()
-            else:
-                sp_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_SP500',
-                    MarketData.date >= period_start,
-                    MarketData.date <= period_end
-                ).order_by(MarketData.date.asc()).all()
-            
-            if sp_records and len(sp_records) >= 2:
-                base_val = float(sp_records[0].close_price)
-                end_val = float(sp_records[-1].close_price)
-                if base_val > 0:
-                    sp500_return = round(((end_val - base_val) / base_val) * 100, 2)
+            # PERIOD-LEVEL S&P 500 return (same shared series as the leaderboard
+            # header): the full period range, not the user's first snapshot date
+            sp500_return = benchmark_series.for_period(period).period_return()
         except Exception as e:
             logger.warning(f"Performance calculator failed for user {owner.id}: {e}")
         
@@ -4426,11 +4173,8 @@ def get_portfolio_chart(slug):
                 days_back = period_days.get(period, 7)
                 start = today - timedelta(days=days_back)
                 
-                sp500_records = MarketData.query.filter(
-                    MarketData.ticker == 'SPY_SP500',
-                    MarketData.date >= start,
-                    MarketData.date <= today
-                ).order_by(MarketData.date.asc()).all()
+                import benchmark_series
+                sp500_records = benchmark_series.daily().between(start, today).points
                 
                 if sp500_records:
                     base_sp500 = float(sp500_records[0].close_price)
@@ -5485,6 +5229,15 @@ def bot_scale_holdings():
             PortfolioSnapshotIntraday.max_cash_deployed: func.coalesce(PortfolioSnapshotIntraday.max_cash_deployed, 0) * multiplier,
         }, synchronize_session=False)
 
+        # The compact 1D/5D series is derived from the intraday rows above;
+        # rebuild it so short-period charts stay on the same scale.
+        try:
+            from intraday_series import rebuild_from_legacy
+            with db.session.begin_nested():
+                rebuild_from_legacy([user_id])
+        except Exception as series_err:
+            logger.warning(f"Intraday series rebuild skipped for user {user_id}: {series_err}")
+
         # Invalidate cached charts for this user so leaderboard sparklines and the
         # web dashboard regenerate from the rescaled snapshots. (The mobile
         # portfolio-detail chart is computed live and needs no invalidation.)
@@ -5868,18 +5621,10 @@ def bot_list_users():
         except Exception:
             pass
         try:
-            from models import MobileSubscription
-            from sqlalchemy import func
-            for uid, cnt in db.session.query(MobileSubscription.subscribed_to_id, func.count(MobileSubscription.id)).filter(MobileSubscription.status == 'active').group_by(MobileSubscription.subscribed_to_id).all():
-                real_sub_counts[uid] = cnt
-        except Exception:
-            pass
-        try:
-            from models import AdminSubscription
-            for asub in AdminSubscription.query.all():
-                bonus = asub.bonus_subscriber_count or 0
-                if bonus > 0:
-                    gifted_sub_counts[asub.portfolio_user_id] = bonus
+            import subscriber_counts
+            for uid, counts in subscriber_counts.get_all().items():
+                real_sub_counts[uid] = counts.real
+                gifted_sub_counts[uid] = counts.gifted
         except Exception:
             pass
         
@@ -6366,6 +6111,46 @@ def platform_growth():
         return jsonify({'error': str(e)}), 500
 
 
+@mobile_api.route('/admin/perf/routes', methods=['GET'])
+@require_admin_2fa
+@with_db_retry
+def perf_routes():
+    """
+    GET /api/mobile/admin/perf/routes?hours=24&limit=100
+
+    p50/p95 latency, SQL query count and external-call time per route, from
+    the request_perf_sample traces (perf_tracing.py), slowest p95 first. A
+    route whose queries_p95 grows with data size is the N+1 to look at.
+    `instance` is this serverless instance's own rolling window (includes
+    requests not yet flushed); it is the only source until the migration runs.
+    """
+    import perf_tracing
+    from models import db
+
+    started = _time.time()
+    hours = max(1, min(request.args.get('hours', 24, type=int), 24 * 14))
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    since = datetime.utcnow() - timedelta(hours=hours)
+
+    source = 'request_perf_sample'
+    try:
+        routes = perf_tracing.route_percentiles(db.session, since, limit=limit)
+    except Exception as e:
+        db.session.rollback()
+        logger.info(f"perf routes falling back to instance window: {e}")
+        source = 'instance'
+        routes = None
+
+    instance = perf_tracing.route_stats.snapshot()[:limit]
+    return jsonify({
+        'window_hours': hours,
+        'source': source,
+        'routes': routes if routes is not None else instance,
+        'instance': instance,
+        'duration_ms': int((_time.time() - started) * 1000),
+    })
+
+
 @mobile_api.route('/admin/alphavantage/usage', methods=['GET'])
 @require_admin_2fa
 @with_db_retry
@@ -8287,7 +8072,7 @@ def bot_process_pending_trades():
     Algorithm:
         1. Load pending trades sorted by created_at (= email_received_at).
         2. Split into CLUSTERS where adjacent trades are within
-           CLUSTER_GAP_SEC of each other.
+           CLUSTER_GAP_SEC (pending_trade_router) of each other.
         3. For each cluster, compute candidate bots from two sources:
              (a) sell_anchors = bots with auto_* Transactions in the
                  cluster's [start-pad, end+pad] window. SELLs are
@@ -8295,6 +8080,9 @@ def bot_process_pending_trades():
                  unique-holder sell).
              (b) unique_buy_holders = for each pending BUY, the unique
                  copytrade-bot holder of its ticker (if any).
+           Both come from two queries for the whole run — all bot holdings,
+           all anchors over the span of the clusters — swept into cluster
+           windows in memory (pending_trade_router.plan).
         4. Decide:
              - If sell_anchors is non-empty and unique → route cluster
                to that anchor.
@@ -8307,8 +8095,8 @@ def bot_process_pending_trades():
              - else (multiple candidates / mixed) → mark cluster
                unroutable + notify admin.
     """
-    from models import db, User, Stock, PendingTrade, Transaction
-    from datetime import timedelta
+    from models import db, User, PendingTrade
+    import pending_trade_router
 
     # Liveness heartbeat: the Apps Script calls this endpoint at the end of
     # EVERY 5-minute poll (even zero-email runs). Record it BEFORE any early
@@ -8329,10 +8117,6 @@ def bot_process_pending_trades():
             'message': 'Email-trade ingestion is paused; pending trades untouched.',
         })
 
-    # Tunables — feel free to tighten/loosen.
-    CLUSTER_GAP_SEC = 60     # max gap between adjacent emails in same cluster
-    WINDOW_PAD_SEC = 30      # tolerance when matching Transactions to cluster
-
     try:
         now = datetime.utcnow()
         pending = (
@@ -8343,34 +8127,12 @@ def bot_process_pending_trades():
         if not pending:
             return jsonify({'success': True, 'message': 'No pending trades', 'processed': 0})
 
-        # Cluster by email_received_at gap
-        clusters = []
-        current = []
-        for pt in pending:
-            if not current:
-                current = [pt]
-                continue
-            gap = (pt.created_at - current[-1].created_at).total_seconds()
-            if gap <= CLUSTER_GAP_SEC:
-                current.append(pt)
-            else:
-                clusters.append(current)
-                current = [pt]
-        if current:
-            clusters.append(current)
-
         all_agents = User.query.filter_by(role='agent').all()
-        copytrade_bots = [u for u in all_agents if _is_copytrade_bot(u)]
-        copytrade_by_id = {b.id: b for b in copytrade_bots}
-        copytrade_ids = list(copytrade_by_id.keys())
+        copytrade_by_id = {u.id: u for u in all_agents if _is_copytrade_bot(u)}
 
-        # Pre-build per-ticker holder map (positive holdings only)
-        holders_by_ticker = {}
-        for cb in copytrade_bots:
-            for s in Stock.query.filter_by(user_id=cb.id).all():
-                if (s.quantity or 0) > 0:
-                    tk = (s.ticker or '').upper()
-                    holders_by_ticker.setdefault(tk, []).append(cb)
+        # Holder map + sell anchors for every cluster in two queries
+        # (pending_trade_router.plan).
+        decisions = pending_trade_router.plan(pending, list(copytrade_by_id.keys()))
 
         routed_count = 0
         expired_count = 0
@@ -8379,94 +8141,11 @@ def bot_process_pending_trades():
         no_anchor_clusters_log = []
         routed_clusters_log = []
 
-        for cluster in clusters:
-            c_start = cluster[0].created_at - timedelta(seconds=WINDOW_PAD_SEC)
-            c_end = cluster[-1].created_at + timedelta(seconds=WINDOW_PAD_SEC)
-
-            # (a) Sell anchors: auto_* Transactions on copytrade bots in window
-            sell_anchor_bot_ids = set()
-            anchor_txns_detail = []
-            if copytrade_ids:
-                anchor_txns = (
-                    Transaction.query
-                    .filter(
-                        Transaction.user_id.in_(copytrade_ids),
-                        Transaction.timestamp >= c_start,
-                        Transaction.timestamp <= c_end,
-                        Transaction.price_source.like('auto_%'),
-                    )
-                    .all()
-                )
-                for tx in anchor_txns:
-                    sell_anchor_bot_ids.add(tx.user_id)
-                    anchor_txns_detail.append({
-                        'user_id': tx.user_id,
-                        'ticker': tx.ticker,
-                        'type': tx.transaction_type,
-                        'timestamp': tx.timestamp.isoformat() if tx.timestamp else None,
-                        'price_source': tx.price_source,
-                    })
-
-            # (b) Per-BUY unique-holder analysis
-            buy_holder_bot_ids = set()
-            buy_no_holder_count = 0
-            buy_ambig_holder_count = 0
-            for pt in cluster:
-                if pt.action != 'buy':
-                    continue
-                holders = holders_by_ticker.get(pt.ticker.upper(), [])
-                if len(holders) == 1:
-                    buy_holder_bot_ids.add(holders[0].id)
-                elif len(holders) == 0:
-                    buy_no_holder_count += 1
-                else:
-                    buy_ambig_holder_count += 1
-
-            chosen_bot_id = None
-            decision_reason = None
-
-            if len(sell_anchor_bot_ids) == 1:
-                chosen_bot_id = next(iter(sell_anchor_bot_ids))
-                decision_reason = 'sell_anchor_unique'
-            elif len(sell_anchor_bot_ids) >= 2:
-                decision_reason = 'sell_anchors_conflict'
-            elif (
-                not sell_anchor_bot_ids
-                and len(buy_holder_bot_ids) == 1
-                and buy_no_holder_count == 0
-                and buy_ambig_holder_count == 0
-            ):
-                chosen_bot_id = next(iter(buy_holder_bot_ids))
-                decision_reason = 'unanimous_buy_holders'
-            elif len(buy_holder_bot_ids) >= 2:
-                decision_reason = 'buy_holders_conflict'
-            elif (
-                not sell_anchor_bot_ids
-                and len(buy_holder_bot_ids) == 1
-                and (buy_no_holder_count > 0 or buy_ambig_holder_count > 0)
-            ):
-                # Single holder match alongside no-holder/ambiguous buys.
-                # Refuse to auto-route — this is the May-2026 misallocation
-                # shape (one matching ticker + several unknowns).
-                decision_reason = 'mixed_holder_signals'
-            else:
-                decision_reason = 'no_signal'
-
-            cluster_info = {
-                'window_start': c_start.isoformat(),
-                'window_end': c_end.isoformat(),
-                'reason': decision_reason,
-                'sell_anchor_bot_ids': sorted(sell_anchor_bot_ids),
-                'buy_holder_bot_ids': sorted(buy_holder_bot_ids),
-                'buy_no_holder_count': buy_no_holder_count,
-                'buy_ambig_holder_count': buy_ambig_holder_count,
-                'anchor_txns': anchor_txns_detail,
-                'trades': [
-                    {'id': pt.id, 'ticker': pt.ticker, 'action': pt.action,
-                     'quantity': pt.quantity, 'received_at': pt.created_at.isoformat() if pt.created_at else None}
-                    for pt in cluster
-                ],
-            }
+        for decision in decisions:
+            cluster = decision.trades
+            chosen_bot_id = decision.bot_id
+            decision_reason = decision.reason
+            cluster_info = decision.info()
 
             if chosen_bot_id is not None:
                 matched_bot = copytrade_by_id[chosen_bot_id]
@@ -8540,7 +8219,7 @@ def bot_process_pending_trades():
                         reason='duplicate_suspect', detail=cluster_info,
                     )
 
-            elif decision_reason in ('sell_anchors_conflict', 'buy_holders_conflict', 'mixed_holder_signals'):
+            elif decision_reason in pending_trade_router.AMBIGUOUS_REASONS:
                 for pt in cluster:
                     pt.status = 'unroutable'
                     expired_count += 1
@@ -8568,7 +8247,7 @@ def bot_process_pending_trades():
 
         return jsonify({
             'success': True,
-            'pending_clusters': len(clusters),
+            'pending_clusters': len(decisions),
             'routed': routed_count,
             'expired': expired_count,
             'still_pending': still_pending,
@@ -8830,12 +8509,14 @@ GET /admin/bot/pending-trades?status=unroutable
 def bot_sp500_backfill():
     """
     Backfill S&P 500 historical data from AlphaVantage SPY daily prices.
-    Uses the full outputsize to get 20+ years of data and stores SPY*10 as SPY_SP500.
+    Uses the full outputsize to get 20+ years of data and stores SPY*10 as SPY_SP500
+    in one bulk upsert (benchmark_series.upsert_daily).
     Query param: years (default 5)
     """
-    from models import db, MarketData
+    from models import db
     from datetime import timedelta
     import os
+    import benchmark_series
     
     years = int(request.args.get('years', 5))
     av_key = os.environ.get('ALPHA_VANTAGE_API_KEY')
@@ -8864,9 +8545,7 @@ def bot_sp500_backfill():
         today = datetime.utcnow().date()
         start_date = today - timedelta(days=years * 365)
         
-        inserted = 0
-        updated = 0
-        skipped = 0
+        closes = {}
         errors = []
         
         for date_str, daily in time_series.items():
@@ -8876,27 +8555,13 @@ def bot_sp500_backfill():
                     continue
                 
                 spy_close = float(daily['4. close'])
-                sp500_value = round(spy_close * 10, 2)
-                
-                existing = MarketData.query.filter_by(
-                    ticker='SPY_SP500', date=data_date
-                ).first()
-                
-                if existing:
-                    if abs(existing.close_price - sp500_value) > 0.01:
-                        existing.close_price = sp500_value
-                        updated += 1
-                    else:
-                        skipped += 1
-                else:
-                    db.session.add(MarketData(
-                        ticker='SPY_SP500', date=data_date, close_price=sp500_value
-                    ))
-                    inserted += 1
+                closes[data_date] = round(spy_close * 10, 2)
             except Exception as e:
                 errors.append(f"{date_str}: {str(e)}")
         
+        inserted, updated, skipped = benchmark_series.upsert_daily(closes)
         db.session.commit()
+        benchmark_series.invalidate('daily')
         
         return jsonify({
             'success': True,
@@ -9020,18 +8685,17 @@ def bot_holdings():
 def admin_backfill_sectors():
     """
     Backfill missing sector data for all stocks held by any user.
-    Fetches from Alpha Vantage OVERVIEW for any StockInfo with null sector.
+    Fetches from Alpha Vantage OVERVIEW for any StockInfo with null sector,
+    concurrently under the shared AV governor (stock_metadata_utils.ingest_stock_info).
     Query params:
-      - limit: max tickers to process (default 20, Alpha Vantage free = 25/day)
-      - sleep: seconds between API calls (default 2)
+      - limit: max tickers to process (default 20)
+      - sleep: ignored; calls are paced by the AV governor
       - dry_run: if true, just list tickers that need backfill
     """
     from models import db, Stock, StockInfo
-    from stock_metadata_utils import populate_stock_info
-    import time as _time
+    from stock_metadata_utils import ingest_stock_info
     
     limit = request.args.get('limit', 20, type=int)
-    sleep_sec = request.args.get('sleep', 2, type=int)
     dry_run = request.args.get('dry_run', 'false').lower() == 'true'
     
     try:
@@ -9041,12 +8705,11 @@ def admin_backfill_sectors():
         ).distinct().all()
         held_tickers = [t[0].upper() for t in held_tickers]
         
-        # Find which ones are missing sector data
-        missing = []
-        for ticker in held_tickers:
-            info = StockInfo.query.filter_by(ticker=ticker).first()
-            if not info or not info.sector:
-                missing.append(ticker)
+        # Find which ones are missing sector data (one IN query)
+        sectors = dict(db.session.query(StockInfo.ticker, StockInfo.sector).filter(
+            StockInfo.ticker.in_(held_tickers)
+        ).all()) if held_tickers else {}
+        missing = [t for t in held_tickers if not sectors.get(t)]
         
         if dry_run:
             return jsonify({
@@ -9056,19 +8719,17 @@ def admin_backfill_sectors():
             })
         
         # Process up to limit
+        batch = missing[:limit]
+        ingested = ingest_stock_info(batch, force_update=True)
+        sectors = dict(db.session.query(StockInfo.ticker, StockInfo.sector).filter(
+            StockInfo.ticker.in_(batch)
+        ).all()) if batch else {}
         results = []
-        for ticker in missing[:limit]:
-            try:
-                result = populate_stock_info(ticker, force_update=True)
-                if result and result.sector:
-                    results.append({'ticker': ticker, 'sector': result.sector, 'status': 'ok'})
-                else:
-                    results.append({'ticker': ticker, 'status': 'failed'})
-            except Exception as e:
-                results.append({'ticker': ticker, 'status': 'error', 'error': str(e)})
-            
-            if sleep_sec > 0 and ticker != missing[min(limit, len(missing)) - 1]:
-                _time.sleep(sleep_sec)
+        for r in ingested['results']:
+            if r['status'] in ('updated', 'fallback') and sectors.get(r['ticker']):
+                results.append({'ticker': r['ticker'], 'sector': sectors[r['ticker']], 'status': 'ok'})
+            else:
+                results.append({'ticker': r['ticker'], 'status': 'failed'})
         
         ok_count = sum(1 for r in results if r.get('status') == 'ok')
         return jsonify({
@@ -9462,6 +9123,48 @@ def recompute_fractional_holdings():
     })
 
 
+@mobile_api.route('/admin/intraday-series/backfill', methods=['POST'])
+@require_admin_2fa
+@with_db_retry
+def backfill_intraday_series():
+    """Rebuild `portfolio_intraday_series` rows from PortfolioSnapshotIntraday.
+
+    One-shot after running scripts/migrations/2026_10_18_portfolio_intraday_series.sql
+    (the collector keeps the series current from then on). Idempotent: each
+    user's sessions are cleared and rewritten from the legacy rows.
+
+    Query params:
+        days (int, default 14): how far back to rebuild (legacy retention).
+        batch (int, default 200): users per commit.
+    """
+    from models import db, PortfolioSnapshotIntraday
+    from intraday_series import rebuild_from_legacy
+    import time as _time
+
+    try:
+        days = max(1, int(request.args.get('days', 14)))
+        batch = max(1, int(request.args.get('batch', 200)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid_params'}), 400
+    started = _time.time()
+    since = date.today() - timedelta(days=days)
+
+    user_ids = [uid for (uid,) in db.session.query(PortfolioSnapshotIntraday.user_id)
+                .filter(PortfolioSnapshotIntraday.timestamp >= datetime.combine(since, datetime.min.time()))
+                .distinct().all()]
+    rows_written = 0
+    for i in range(0, len(user_ids), batch):
+        rows_written += rebuild_from_legacy(user_ids[i:i + batch], start_date=since)
+        db.session.commit()
+
+    return jsonify({
+        'since': since.isoformat(),
+        'users': len(user_ids),
+        'series_rows_written': rows_written,
+        'duration_ms': int((_time.time() - started) * 1000),
+    })
+
+
 @mobile_api.route('/admin/bot/diagnose-imports', methods=['GET'])
 @require_admin_2fa
 def bot_diagnose_imports():
@@ -9778,9 +9481,6 @@ def bot_alert_summary():
 @with_db_retry
 def bot_revenue_summary():
     """Revenue breakdown for the admin dashboard."""
-    from models import db, User
-    from sqlalchemy import func
-    
     # Pricing constants (same as AdminSubscription model)
     price = 9.00
     store_fee_pct = 0.15
@@ -9791,48 +9491,17 @@ def bot_revenue_summary():
     influencer_pay = round(after_store * (1 - platform_fee_pct), 2)  # $6.50
     
     try:
-        # Real subscriptions (table may not exist)
-        real_subs = 0
-        try:
-            from models import MobileSubscription
-            real_subs = MobileSubscription.query.filter_by(status='active').count()
-        except Exception:
-            pass
-        
-        # Per-user gifted breakdown (table may not exist)
-        gifted_rows = []
-        total_gifted = 0
-        try:
-            from models import AdminSubscription
-            gifted_rows = AdminSubscription.query.filter(
-                AdminSubscription.bonus_subscriber_count > 0
-            ).all()
-            total_gifted = sum(r.bonus_subscriber_count or 0 for r in gifted_rows)
-        except Exception:
-            pass
-        
-        # Per-influencer breakdown
+        from admin_metrics import subscriber_counts_by_creator
+
+        # Per-influencer breakdown: real + gifted counts and the User row for
+        # every creator in one grouped join (admin_metrics).
         influencers = []
-        for row in gifted_rows:
-            user = User.query.get(row.portfolio_user_id)
-            username = user.username if user else f'user_{row.portfolio_user_id}'
+        for uid, user, real_for_user, gifted_for_user in subscriber_counts_by_creator():
             is_bot = _user_is_company_owned(user)
-            
-            # Count real subs for this user
-            real_for_user = 0
-            try:
-                from models import MobileSubscription
-                real_for_user = MobileSubscription.query.filter_by(
-                    subscribed_to_id=row.portfolio_user_id, status='active'
-                ).count()
-            except Exception:
-                pass
-            
-            gifted_for_user = row.bonus_subscriber_count or 0
             total_for_user = real_for_user + gifted_for_user
             influencers.append({
-                'user_id': row.portfolio_user_id,
-                'username': username,
+                'user_id': uid,
+                'username': user.username if user else f'user_{uid}',
                 'is_company_bot': is_bot,
                 'real_subs': real_for_user,
                 'gifted_subs': gifted_for_user,
@@ -9841,45 +9510,8 @@ def bot_revenue_summary():
                 'gifted_payout': 0.0 if is_bot else round(gifted_for_user * influencer_pay, 2),
                 'total_payout': 0.0 if is_bot else round(total_for_user * influencer_pay, 2),
             })
-        
-        # Also include users with real subs but no gifted record
-        try:
-            from models import MobileSubscription
-            users_with_real = db.session.query(
-                MobileSubscription.subscribed_to_id,
-                func.count(MobileSubscription.id)
-            ).filter_by(status='active').group_by(
-                MobileSubscription.subscribed_to_id
-            ).all()
-            
-            existing_ids = {i['user_id'] for i in influencers}
-            for uid, cnt in users_with_real:
-                if uid not in existing_ids:
-                    user = User.query.get(uid)
-                    is_bot = _user_is_company_owned(user)
-                    influencers.append({
-                        'user_id': uid,
-                        'username': user.username if user else f'user_{uid}',
-                        'is_company_bot': is_bot,
-                        'real_subs': cnt,
-                        'gifted_subs': 0,
-                        'total_subs': cnt,
-                        'real_payout': 0.0 if is_bot else round(cnt * influencer_pay, 2),
-                        'gifted_payout': 0,
-                        'total_payout': 0.0 if is_bot else round(cnt * influencer_pay, 2),
-                    })
-        except Exception:
-            pass
-        
-        # Mark bot-owned influencers in existing list too
-        for inf in influencers:
-            if 'is_company_bot' not in inf:
-                user = User.query.get(inf['user_id'])
-                inf['is_company_bot'] = user and user.role == 'agent'
-                if inf['is_company_bot']:
-                    inf['real_payout'] = 0.0
-                    inf['gifted_payout'] = 0.0
-                    inf['total_payout'] = 0.0
+        real_subs = sum(i['real_subs'] for i in influencers)
+        total_gifted = sum(i['gifted_subs'] for i in influencers)
         
         # Compute bot-specific revenue summary
         bot_real_subs = sum(i['real_subs'] for i in influencers if i.get('is_company_bot'))
@@ -10050,37 +9682,19 @@ def bot_simulate_subscription_lifecycle():
     return jsonify(result)
 
 
-def _compute_creator_clawback(uid, period_start, budget):
-    """Compute the refund clawback to net against a creator's payout this month.
-
-    A clawback applies only to a refund that landed AFTER the creator was already
-    PAID for the month that purchase belongs to (`payout_reversed_at IS NULL` and
-    a `paid` XeroPayoutRecord exists for that earlier period). Refunds whose
-    period was never paid are handled by simple exclusion at generation time.
+def _net_refund_clawback(refunds, paid_periods, budget):
+    """Greedy whole-row netting of `refunds` (oldest first) against `budget`.
 
-    Greedy whole-row netting bounded by `budget` (this month's real earnings) so
-    the check is never negative; refunds that don't fit carry forward to a later
-    month. Returns (applied, carried_forward, netted_rows).
+    Only refunds whose own month is in `paid_periods` (period_start dates of
+    this creator's `paid` payout records) are clawed back. Returns
+    (applied, carried_forward, netted_rows).
     """
-    from models import InAppPurchase, XeroPayoutRecord
-
-    refunds = InAppPurchase.query.filter(
-        InAppPurchase.subscribed_to_id == uid,
-        InAppPurchase.status == 'refunded',
-        InAppPurchase.payout_reversed_at.is_(None),
-        InAppPurchase.purchase_date < datetime.combine(period_start, datetime.min.time()),
-    ).order_by(InAppPurchase.purchase_date.asc()).all()
-
     applied = 0.0
     carried = 0.0
     netted = []
     for r in refunds:
         rp = r.purchase_date.date() if hasattr(r.purchase_date, 'date') else r.purchase_date
-        r_period_start = date(rp.year, rp.month, 1)
-        already_paid = XeroPayoutRecord.query.filter_by(
-            portfolio_user_id=uid, period_start=r_period_start, payment_status='paid'
-        ).first()
-        if not already_paid:
+        if date(rp.year, rp.month, 1) not in paid_periods:
             continue  # not yet paid → excluded at that period's generation, no clawback
         amt = float(r.influencer_payout or 0.0)
         if applied + amt <= budget + 1e-9:
@@ -10091,6 +9705,75 @@ def _compute_creator_clawback(uid, period_start, budget):
     return round(applied, 2), round(carried, 2), netted
 
 
+def _clawback_candidates(period_start, uid=None):
+    """Refunds not yet reversed from before `period_start`, and the periods
+    already paid to their creators: two queries for every creator (or just
+    `uid`). Returns ({uid: [refund rows, oldest first]}, {uid: {period_start}})."""
+    from models import InAppPurchase, XeroPayoutRecord
+
+    query = InAppPurchase.query.filter(
+        InAppPurchase.status == 'refunded',
+        InAppPurchase.payout_reversed_at.is_(None),
+        InAppPurchase.purchase_date < datetime.combine(period_start, datetime.min.time()),
+    )
+    if uid is not None:
+        query = query.filter(InAppPurchase.subscribed_to_id == uid)
+    refunds = defaultdict(list)
+    for r in query.order_by(InAppPurchase.purchase_date.asc(), InAppPurchase.id.asc()).all():
+        refunds[r.subscribed_to_id].append(r)
+
+    paid = defaultdict(set)
+    if refunds:
+        for puid, pstart in XeroPayoutRecord.query.with_entities(
+                XeroPayoutRecord.portfolio_user_id, XeroPayoutRecord.period_start).filter(
+                XeroPayoutRecord.portfolio_user_id.in_(list(refunds)),
+                XeroPayoutRecord.payment_status == 'paid'):
+            paid[puid].add(pstart)
+    return refunds, paid
+
+
+def _compute_creator_clawback(uid, period_start, budget):
+    """Compute the refund clawback to net against a creator's payout this month.
+
+    A clawback applies only to a refund that landed AFTER the creator was already
+    PAID for the month that purchase belongs to (`payout_reversed_at IS NULL` and
+    a `paid` XeroPayoutRecord exists for that earlier period). Refunds whose
+    period was never paid are handled by simple exclusion at generation time.
+
+    Greedy whole-row netting bounded by `budget` (this month's real earnings) so
+    the check is never negative; refunds that don't fit carry forward to a later
+    month. Returns (applied, carried_forward, netted_rows).
+    """
+    refunds, paid = _clawback_candidates(period_start, uid=uid)
+    return _net_refund_clawback(refunds.get(uid, []), paid.get(uid, set()), budget)
+
+
+def _insert_payout_records(rows):
+    """Bulk-insert payout record mappings, skipping any (creator, period)
+    that already has one (uq_payout_user_period). Returns the creator ids
+    actually inserted."""
+    from models import db, XeroPayoutRecord
+
+    if not rows:
+        return set()
+    table = XeroPayoutRecord.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        db.session.execute(table.insert(), rows)
+        return {r['portfolio_user_id'] for r in rows}
+    inserted = set()
+    for start in range(0, len(rows), 1000):
+        stmt = insert(table).on_conflict_do_nothing(
+            index_elements=['portfolio_user_id', 'period_start', 'period_end']
+        ).returning(table.c.portfolio_user_id)
+        inserted.update(db.session.execute(stmt, rows[start:start + 1000]).scalars())
+    return inserted
+
+
 def _generate_payout_records_for_period(year, month):
     """Core month-end payout-record generation (transaction-driven, with refund
     clawback). Returns a JSON-serializable result dict.
@@ -10100,11 +9783,16 @@ def _generate_payout_records_for_period(year, month):
     DB unique index on (creator, period)). Raises on unexpected errors after
     rolling back, so callers decide how to surface them.
 
+    Set-based: one grouped join brings every creator's real earnings, gifted
+    count, User and TaxpayerProfile; refunds and paid periods for clawback are
+    two more queries; the records are bulk-inserted with ON CONFLICT DO
+    NOTHING on (creator, period). Query count does not grow with creators.
+
     Shared by ``POST /admin/bot/generate-payout-records`` (manual) and
     ``run_monthly_payout_pipeline`` (the monthly cron).
     """
-    from models import db, User, AdminSubscription, XeroPayoutRecord, MobileSubscription, TaxpayerProfile, InAppPurchase
-    from sqlalchemy import func
+    from models import db, User, AdminSubscription, XeroPayoutRecord, TaxpayerProfile, InAppPurchase
+    from sqlalchemy import func, union
     from calendar import monthrange
 
     period_start = date(year, month, 1)
@@ -10124,117 +9812,126 @@ def _generate_payout_records_for_period(year, month):
                 'existing_count': existing,
             }
 
-        records_created = []
         start_dt = datetime.combine(period_start, datetime.min.time())
         end_dt = datetime.combine(period_end, datetime.max.time())
 
         # 1. Real earnings per creator — summed transaction-by-transaction from
         #    this period's non-refunded InAppPurchase rows (annual-aware).
-        real_map = {}
-        real_rows = db.session.query(
-            InAppPurchase.subscribed_to_id,
-            func.count(InAppPurchase.id),
-            func.coalesce(func.sum(InAppPurchase.price), 0.0),
-            func.coalesce(func.sum(InAppPurchase.store_fee), 0.0),
-            func.coalesce(func.sum(InAppPurchase.platform_revenue), 0.0),
-            func.coalesce(func.sum(InAppPurchase.influencer_payout), 0.0),
+        real = db.session.query(
+            InAppPurchase.subscribed_to_id.label('uid'),
+            func.count(InAppPurchase.id).label('count'),
+            func.coalesce(func.sum(InAppPurchase.price), 0.0).label('gross'),
+            func.coalesce(func.sum(InAppPurchase.store_fee), 0.0).label('store_fees'),
+            func.coalesce(func.sum(InAppPurchase.platform_revenue), 0.0).label('platform_revenue'),
+            func.coalesce(func.sum(InAppPurchase.influencer_payout), 0.0).label('influencer_payout'),
         ).filter(
             InAppPurchase.status != 'refunded',
             InAppPurchase.purchase_date >= start_dt,
             InAppPurchase.purchase_date <= end_dt,
-        ).group_by(InAppPurchase.subscribed_to_id).all()
-        for uid, cnt, gross, fee, plat, payout in real_rows:
-            real_map[uid] = {
-                'count': int(cnt), 'gross': float(gross), 'store_fees': float(fee),
-                'platform_revenue': float(plat), 'influencer_payout': float(payout),
-            }
+        ).group_by(InAppPurchase.subscribed_to_id).subquery()
 
         # 2. Gifted/bonus subs (company-funded; no store fee, no subscriber refunds).
-        gifted_map = {}
-        gifted_rows = AdminSubscription.query.filter(
+        gifted = db.session.query(
+            AdminSubscription.portfolio_user_id.label('uid'),
+            func.sum(AdminSubscription.bonus_subscriber_count).label('count'),
+        ).filter(
             AdminSubscription.bonus_subscriber_count > 0
+        ).group_by(AdminSubscription.portfolio_user_id).subquery()
+
+        # 3. Every creator with either, joined to User and TaxpayerProfile.
+        creators = union(db.session.query(real.c.uid).statement,
+                         db.session.query(gifted.c.uid).statement).subquery()
+        rows = db.session.query(
+            User, TaxpayerProfile, real, func.coalesce(gifted.c.count, 0)
+        ).select_from(creators).join(
+            User, User.id == creators.c.uid
+        ).outerjoin(
+            TaxpayerProfile, TaxpayerProfile.user_id == creators.c.uid
+        ).outerjoin(
+            real, real.c.uid == creators.c.uid
+        ).outerjoin(
+            gifted, gifted.c.uid == creators.c.uid
         ).all()
-        for row in gifted_rows:
-            gifted_map[row.portfolio_user_id] = row.bonus_subscriber_count or 0
 
-        all_user_ids = set(gifted_map.keys()) | set(real_map.keys())
+        refunds_by_uid, paid_by_uid = _clawback_candidates(period_start)
         payout_per_sub = AdminSubscription.INFLUENCER_PAYOUT_PER_SUB
-        total_clawback_applied = 0.0
-        total_clawback_carried = 0.0
-
-        for uid in all_user_ids:
-            user = User.query.get(uid)
-            if not user:
-                continue
+        now_ts = datetime.utcnow()
+        mappings = []
+        summaries = {}
+        netted_by_uid = {}
 
+        for user, profile, _uid, real_count, gross, fees, plat, real_payout, bonus_count in rows:
+            uid = user.id
             # Skip company bots and the owner's own accounts — no money changes
             # hands for these, so they're never paid and never need a W-9.
             if _user_is_company_owned(user):
                 continue
 
-            real = real_map.get(uid)
-            real_count = real['count'] if real else 0
-            bonus_count = gifted_map.get(uid, 0)
-
+            real_count = int(real_count or 0)
+            bonus_count = int(bonus_count or 0)
             if real_count == 0 and bonus_count == 0:
                 continue
 
-            real_payout = real['influencer_payout'] if real else 0.0
+            real_payout = float(real_payout or 0.0)
             bonus_payout = bonus_count * payout_per_sub
 
             # Clawback: net refunds-after-payment against this month's REAL
             # earnings (bonus is company-gifted, never subject to refunds).
-            clawback_applied, clawback_carried, netted_rows = _compute_creator_clawback(
-                uid, period_start, budget=real_payout)
+            clawback_applied, clawback_carried, netted_rows = _net_refund_clawback(
+                refunds_by_uid.get(uid, []), paid_by_uid.get(uid, set()), budget=real_payout)
             real_net = max(0.0, real_payout - clawback_applied)
-            total_clawback_applied += clawback_applied
-            total_clawback_carried += clawback_carried
+            netted_by_uid[uid] = [r.id for r in netted_rows]
 
             # Hold the payout unless the creator's W-9 is on file (Layer 1).
             # Held records are skipped by sync-payouts and released automatically
             # when the creator submits their W-9 (POST /tax/w9).
-            profile = TaxpayerProfile.query.filter_by(user_id=uid).first()
             has_w9 = bool(profile and profile.has_tin_on_file)
 
-            record = XeroPayoutRecord(
-                portfolio_user_id=uid,
-                period_start=period_start,
-                period_end=period_end,
-                real_subscriber_count=real_count,
-                bonus_subscriber_count=bonus_count,
-                payment_status='pending' if has_w9 else 'held',
-                xero_contact_id=(profile.xero_contact_id if profile else None),
-            )
             # Transaction-driven amounts (do NOT call calculate_totals — that uses
             # count×rate math which overpays annual subs).
-            record.total_subscriber_count = real_count + bonus_count
-            record.gross_revenue = round(real['gross'], 2) if real else 0.0
-            record.store_fees = round(real['store_fees'], 2) if real else 0.0
-            record.platform_revenue = round(real['platform_revenue'], 2) if real else 0.0
-            record.influencer_payout = round(real_net, 2)
-            record.bonus_payout = round(bonus_payout, 2)
-            db.session.add(record)
-
-            # Mark the refund rows that were actually netted this month so they
-            # can't be clawed back again; unnetted ones carry to next month.
-            now_ts = datetime.utcnow()
-            for r in netted_rows:
-                r.payout_reversed_at = now_ts
-
-            records_created.append({
+            record = {
+                'portfolio_user_id': uid,
+                'period_start': period_start,
+                'period_end': period_end,
+                'real_subscriber_count': real_count,
+                'bonus_subscriber_count': bonus_count,
+                'total_subscriber_count': real_count + bonus_count,
+                'gross_revenue': round(float(gross or 0.0), 2),
+                'store_fees': round(float(fees or 0.0), 2),
+                'platform_revenue': round(float(plat or 0.0), 2),
+                'influencer_payout': round(real_net, 2),
+                'bonus_payout': round(bonus_payout, 2),
+                'payment_status': 'pending' if has_w9 else 'held',
+                'xero_sync_status': 'pending',
+                'xero_contact_id': (profile.xero_contact_id if profile else None),
+                'created_at': now_ts,
+                'updated_at': now_ts,
+            }
+            mappings.append(record)
+            summaries[uid] = {
                 'user_id': uid,
                 'username': user.username,
                 'real_subs': real_count,
                 'bonus_subs': bonus_count,
-                'total_subs': record.total_subscriber_count,
-                'influencer_payout': record.influencer_payout,
-                'bonus_payout': record.bonus_payout,
-                'total_payout': record.total_payout,
+                'total_subs': record['total_subscriber_count'],
+                'influencer_payout': record['influencer_payout'],
+                'bonus_payout': record['bonus_payout'],
+                'total_payout': record['influencer_payout'] + record['bonus_payout'],
                 'clawback_applied': round(clawback_applied, 2),
                 'clawback_carried_forward': round(clawback_carried, 2),
-                'payment_status': record.payment_status,
+                'payment_status': record['payment_status'],
                 'w9_on_file': has_w9,
-            })
+            }
+
+        inserted = _insert_payout_records(mappings)
+        records_created = [summaries[uid] for uid in summaries if uid in inserted]
+
+        # Mark the refund rows that were actually netted this month so they
+        # can't be clawed back again; unnetted ones carry to next month.
+        netted_ids = [rid for uid in inserted for rid in netted_by_uid.get(uid, [])]
+        if netted_ids:
+            InAppPurchase.query.filter(InAppPurchase.id.in_(netted_ids)).update(
+                {InAppPurchase.payout_reversed_at: now_ts}, synchronize_session=False)
 
         db.session.commit()
 
@@ -10249,8 +9946,9 @@ def _generate_payout_records_for_period(year, month):
             'held_obligation': round(
                 sum(r['total_payout'] for r in records_created if r['payment_status'] == 'held'), 2),
             'total_payout_obligation': round(total_obligation, 2),
-            'refund_clawback_applied': round(total_clawback_applied, 2),
-            'refund_clawback_carried_forward': round(total_clawback_carried, 2),
+            'refund_clawback_applied': round(sum(r['clawback_applied'] for r in records_created), 2),
+            'refund_clawback_carried_forward': round(
+                sum(r['clawback_carried_forward'] for r in records_created), 2),
             'records': sorted(records_created, key=lambda x: x['total_payout'], reverse=True),
         }
     except Exception:
@@ -11160,12 +10858,11 @@ def bot_cron_health():
         
         # Helper: get last market day
         def get_last_market_day():
+            import trading_calendar
             d = today
             if now.hour < 21:  # Before 9 PM UTC (5 PM ET) — market close hasn't run yet today
                 d = d - timedelta(days=1)
-            while d.weekday() >= 5:  # Skip weekends
-                d -= timedelta(days=1)
-            return d
+            return trading_calendar.session_on_or_before(d)  # Skip weekends + holidays
         
         last_market_day = get_last_market_day()
         
@@ -12098,12 +11795,11 @@ def debug_sparkline(username, period):
 
     Auth: admin 2FA required. Without it this would publicly expose every
     user's sparkline + performance time series by username (a useful
-    leaderboard-bypass for scraping individual performance curves), plus
-    clear the SP500 benchmark cache as a side effect on each call.
+    leaderboard-bypass for scraping individual performance curves).
     """
     import json
     from models import User, LeaderboardCache
-    from performance_calculator import calculate_portfolio_performance, get_period_dates, _sp500_benchmark_cache
+    from performance_calculator import calculate_portfolio_performance, get_period_dates
     
     user = User.query.filter_by(username=username).first()
     if not user:
@@ -12124,7 +11820,6 @@ def debug_sparkline(username, period):
                 break
     
     # 2) Compute live chart data
-    _sp500_benchmark_cache.clear()
     chart_period = '5D' if period == '1W' else period
     start_date, end_date = get_period_dates(chart_period, user_id=user.id)
     result = calculate_portfolio_performance(
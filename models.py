@@ -138,6 +138,11 @@ class Transaction(db.Model):
     def __repr__(self):
         return f"<Transaction {self.transaction_type} {self.quantity} {self.ticker} @ ${self.price}>"
 
+# Trade-alerts feed keyset scans (mobile_api._trade_alert_rows); same column
+# order and directions as scripts/migrations/2026_10_21_transaction_feed_index.sql
+db.Index('ix_stock_transaction_user_ts', Transaction.user_id,
+         Transaction.timestamp.desc(), Transaction.id.desc())
+
 class PortfolioSnapshot(db.Model):
     """Daily portfolio value snapshot"""
     __tablename__ = 'portfolio_snapshot'
@@ -203,6 +208,76 @@ class PortfolioSnapshotIntraday(db.Model):
     def __repr__(self):
         return f"<PortfolioSnapshotIntraday {self.user_id} {self.timestamp} ${self.total_value}>"
 
+class PortfolioIntradaySeries(db.Model):
+    """Compact intraday series: one row per user per ET trading session.
+
+    Each value column is SLOT_COUNT (27) packed float64s indexed by tick slot
+    (slot 0 = 09:30 ET ... slot 26 = 16:00 ET); `slot_mask` bit N is set when
+    slot N holds data. Written alongside PortfolioSnapshotIntraday by the
+    intraday collector; 1D/5D reads use this table. See intraday_series.py.
+    """
+    __tablename__ = 'portfolio_intraday_series'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    session_date = db.Column(db.Date, nullable=False)
+    slot_mask = db.Column(db.Integer, nullable=False, default=0)
+    total_values = db.Column(db.LargeBinary, nullable=False)
+    stock_values = db.Column(db.LargeBinary, nullable=False)
+    cash_proceeds = db.Column(db.LargeBinary, nullable=False)
+    max_cash_deployed = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'session_date', name='uq_intraday_series_user_session'),
+        db.Index('ix_intraday_series_session_date', 'session_date'),
+    )
+
+    def __repr__(self):
+        return f"<PortfolioIntradaySeries {self.user_id} {self.session_date} slots={bin(self.slot_mask or 0).count('1')}>"
+
+class BenchmarkSeriesCache(db.Model):
+    """Shared (cross-instance) cache of precomputed S&P 500 benchmark series.
+
+    One row per series key ('daily' = every SPY_SP500 close, 'intraday:<start>:<end>'
+    = SPY_INTRADAY ticks of a session window) holding packed float64 arrays of
+    date ordinals, naive-UTC epoch seconds (NaN for daily points) and closes.
+    Rows whose `version` differs from benchmark_series.FORMAT_VERSION are
+    ignored. See benchmark_series.py.
+    """
+    __tablename__ = 'benchmark_series_cache'
+
+    series_key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'daily' or 'intraday'
+    points = db.Column(db.Integer, nullable=False, default=0)
+    dates = db.Column(db.LargeBinary, nullable=False)
+    stamps = db.Column(db.LargeBinary, nullable=False)
+    closes = db.Column(db.LargeBinary, nullable=False)
+    # BenchmarkSeriesGeneration.generation of `kind` the series was built
+    # under; rows from an older generation are ignored.
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<BenchmarkSeriesCache {self.series_key} v{self.version} g{self.generation} n={self.points}>"
+
+
+class BenchmarkSeriesGeneration(db.Model):
+    """Invalidation counter per benchmark series kind ('daily' / 'intraday').
+
+    benchmark_series.invalidate() bumps it; cache rows stamped with an older
+    generation are ignored and can't be written back over a newer one, so a
+    build that started before an invalidation never serves stale data.
+    """
+    __tablename__ = 'benchmark_series_generation'
+
+    kind = db.Column(db.String(10), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BenchmarkSeriesGeneration {self.kind} g{self.generation}>"
+
 class LeaderboardCache(db.Model):
     """Pre-generated leaderboard JSON cache updated at market close"""
     __tablename__ = 'leaderboard_cache'
@@ -227,6 +302,12 @@ class UserPortfolioChartCache(db.Model):
     period = db.Column(db.String(10), nullable=False)  # '1D', '5D', '3M', 'YTD', '1Y', '5Y', 'MAX'
     chart_data = db.Column(db.Text, nullable=False)  # JSON string of chart data
     generated_at = db.Column(db.DateTime, nullable=False)
+    # Written with chart_data by chart_previews' mapper hook: downsampled
+    # payload + full-chart value range, for pages hydrating many charts.
+    preview_data = db.Column(db.Text, nullable=True)
+    y_min = db.Column(db.Float, nullable=True)
+    y_max = db.Column(db.Float, nullable=True)
+    preview_of = db.Column(db.DateTime, nullable=True)  # generated_at the preview was built from
     
     # Ensure one cache entry per user per period
     __table_args__ = (db.UniqueConstraint('user_id', 'period', name='unique_user_period_chart'),)
@@ -465,6 +546,120 @@ class UserPortfolioStats(db.Model):
     def __repr__(self):
         return f"<UserPortfolioStats user_id={self.user_id} stocks={self.unique_stocks_count}>"
 
+class InfluencerRanking(db.Model):
+    """Materialized /top-influencers ranking: one row per creator with any
+    subscribers under industry_key '*', plus one per industry holding >= 5%
+    of their portfolio (industry_key = lowercased name).
+
+    Derived data, rewritten per creator by influencer_ranking.py whenever a
+    flush touches their subscriptions, gifted subs or portfolio stats. No FK
+    to user: readers inner-join User, so rows of deleted accounts just drop
+    out until the next refresh. Migration: 2026_10_22_influencer_ranking.sql
+    """
+    __tablename__ = 'influencer_ranking'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    industry_key = db.Column(db.String(100), nullable=False)  # '*' or lower(industry)
+    industry = db.Column(db.String(100), nullable=True)       # display name; NULL for '*'
+    total_subscribers = db.Column(db.Integer, nullable=False, default=0)  # real + gifted
+    has_fractional = db.Column(db.Boolean, nullable=True)     # copy of UserPortfolioStats flag
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'industry_key', name='uq_influencer_ranking_user_industry'),
+        db.Index('ix_influencer_ranking_industry_total', 'industry_key',
+                 total_subscribers.desc(), 'user_id'),
+    )
+
+    def __repr__(self):
+        return f"<InfluencerRanking {self.user_id} {self.industry_key} subs={self.total_subscribers}>"
+
+class MarketCloseCheckpoint(db.Model):
+    """Durable progress of the market-close pipeline (market_close_pipeline.py):
+    one row per (trading_date, phase) with status, user_id watermark for
+    chunked phases, counters and timings, plus a phase='pipeline' row per day
+    that holds the run lease. Migration: 2026_10_24_market_close_checkpoint.sql
+    """
+    __tablename__ = 'market_close_checkpoint'
+
+    id = db.Column(db.Integer, primary_key=True)
+    trading_date = db.Column(db.Date, nullable=False)
+    phase = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, partial, done, failed
+    watermark = db.Column(db.Integer, nullable=True)  # last user_id committed by a chunked phase
+    chunks = db.Column(db.Integer, nullable=False, default=0)
+    records = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    duration_ms = db.Column(db.Integer, nullable=False, default=0)  # summed across invocations
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    lease_until = db.Column(db.DateTime, nullable=True)  # phase='pipeline' only
+    error = db.Column(db.Text, nullable=True)
+    details = db.Column(db.JSON, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('trading_date', 'phase', name='uq_market_close_checkpoint_date_phase'),)
+
+    def __repr__(self):
+        return f"<MarketCloseCheckpoint {self.trading_date} {self.phase} {self.status}>"
+
+class DataExportJob(db.Model):
+    """GDPR "Request My Data" export job (data_export.py).
+
+    Queued by POST /api/mobile/auth/data-export and built by the data-exports
+    cron: each section is streamed into a gzip-compressed NDJSON artifact
+    stored on the row (bounded by data_export.MAX_ARTIFACT_BYTES) and fetched
+    through the unguessable `token` link emailed to the user until
+    `expires_at`. `progress` / `sections` carry row counts and per-section
+    timings; while a job is unfinished, `artifact` holds what was written up
+    to `progress['cursor']` so the next attempt resumes there.
+    Migration: 2026_10_26_data_export_job.sql
+    """
+    __tablename__ = 'data_export_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    token = db.Column(db.String(64), unique=True, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, ready, failed, expired
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    lease_until = db.Column(db.DateTime, nullable=True)
+    progress = db.Column(db.JSON, nullable=True)   # {'section', 'sections_done', 'sections_total', 'records', 'cursor'}
+    sections = db.Column(db.JSON, nullable=True)   # {name: {'records', 'ms'[, 'error']}}
+    artifact = db.Column(db.LargeBinary, nullable=True)
+    size_bytes = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    downloaded_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<DataExportJob {self.id} user={self.user_id} {self.status}>"
+
+class CreatorSubscriberCount(db.Model):
+    """Authoritative per-creator subscriber counters: active real
+    subscriptions (MobileSubscription) and gifted subscribers
+    (AdminSubscription bonus > 0), read by primary key instead of aggregated.
+
+    Incremented in the same transaction as every ORM flush that changes a
+    subscription's status / creator / bonus (subscriber_counts.py) and
+    reconciled against the aggregates by the market-close cron. No FK to
+    user, like influencer_ranking. Migration: 2026_10_23_creator_subscriber_count.sql
+    """
+    __tablename__ = 'creator_subscriber_count'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    real_subscriber_count = db.Column(db.Integer, nullable=False, default=0)
+    gifted_subscriber_count = db.Column(db.Integer, nullable=False, default=0)
+    total_subscriber_count = db.Column(db.Integer, nullable=False, default=0)  # real + gifted
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return (f"<CreatorSubscriberCount {self.user_id} real={self.real_subscriber_count} "
+                f"gifted={self.gifted_subscriber_count}>")
+
 class OldNotificationLog(db.Model):
     """DEPRECATED - Old notification log (keeping for migration compatibility)"""
     __tablename__ = 'notification_log_old'
@@ -1183,6 +1378,24 @@ class DailyPriceBar(db.Model):
         return f"<DailyPriceBar {self.ticker} {self.date} close=${self.close}>"
 
 
+class DailyBarFetchMiss(db.Model):
+    """Tickers AV answered with no usable daily bars (delisted / renamed symbols).
+
+    /api/cron/refresh-daily-bars skips a ticker until `retry_after`, which
+    backs off exponentially with `misses`, so dead symbols stop winning the
+    stale-first selection on every run. A successful fetch deletes the row.
+    """
+    __tablename__ = 'daily_bar_fetch_miss'
+
+    ticker = db.Column(db.String(20), primary_key=True)
+    misses = db.Column(db.Integer, nullable=False, default=1)
+    last_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    retry_after = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<DailyBarFetchMiss {self.ticker} misses={self.misses} retry_after={self.retry_after}>"
+
+
 class StockFundamentals(db.Model):
     """Cached per-ticker fundamentals from AlphaVantage OVERVIEW. One row per ticker.
 
@@ -1271,3 +1484,18 @@ class BotWaveLog(db.Model):
 
     def __repr__(self):
         return f"<BotWaveLog wave={self.wave} status={self.status} trades={self.trades_executed} at={self.started_at}>"
+
+
+# Keep the per-creator subscriber counters and the materialized top-influencers
+# ranking in step with subscription, gifted-sub and portfolio-stats writes (see
+# subscriber_counts.py, influencer_ranking.py). Counters first: the ranking
+# reads them in the same flush.
+from subscriber_counts import install_session_hooks as _install_counter_hooks  # noqa: E402
+from influencer_ranking import install_session_hooks as _install_ranking_hooks  # noqa: E402
+_install_counter_hooks()
+_install_ranking_hooks()
+
+# Chart-cache rows carry a downsampled preview + value range written with the
+# chart itself (chart_previews.py).
+from chart_previews import install_hooks as _install_chart_preview_hooks  # noqa: E402
+_install_chart_preview_hooks()
@@ -0,0 +1,194 @@
+"""
+Single-pass routing plan for PendingTrade rows (copytrade email ingestion).
+
+bot_process_pending_trades runs on every 5-minute poll of the Gmail parser.
+It used to build the ticker -> holder map with one Stock query per copytrade
+bot and look for sell anchors with one windowed Transaction query per
+cluster: O(bots + clusters) round-trips on the heartbeat path.
+
+plan() makes the same decisions with two queries whatever the batch size:
+
+  * every copytrade bot's positive holdings in one query;
+  * every auto_* Transaction of those bots over the full span of the pending
+    clusters in one range query, ordered by timestamp;
+
+then assigns anchors to cluster windows in memory with a sorted sweep
+(assign_anchors) and applies the decision rules per cluster (decide).
+Execution, status updates and admin notifications stay in the endpoint.
+
+Recorded batches: tests/fixtures/pending_trade_batches.json.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_GAP_SEC = 60     # max gap between adjacent emails in same cluster
+WINDOW_PAD_SEC = 30      # tolerance when matching Transactions to cluster
+
+AMBIGUOUS_REASONS = ('sell_anchors_conflict', 'buy_holders_conflict', 'mixed_holder_signals')
+
+
+class Anchor(NamedTuple):
+    user_id: int
+    ticker: str
+    transaction_type: str
+    timestamp: object
+    price_source: str
+
+
+class ClusterDecision(NamedTuple):
+    trades: list
+    window_start: object
+    window_end: object
+    bot_id: Optional[int]
+    reason: str
+    sell_anchor_bot_ids: set
+    buy_holder_bot_ids: set
+    buy_no_holder_count: int
+    buy_ambig_holder_count: int
+    anchors: list
+
+    def info(self):
+        """The cluster_info dict the endpoint logs and returns."""
+        return {
+            'window_start': self.window_start.isoformat(),
+            'window_end': self.window_end.isoformat(),
+            'reason': self.reason,
+            'sell_anchor_bot_ids': sorted(self.sell_anchor_bot_ids),
+            'buy_holder_bot_ids': sorted(self.buy_holder_bot_ids),
+            'buy_no_holder_count': self.buy_no_holder_count,
+            'buy_ambig_holder_count': self.buy_ambig_holder_count,
+            'anchor_txns': [{
+                'user_id': a.user_id,
+                'ticker': a.ticker,
+                'type': a.transaction_type,
+                'timestamp': a.timestamp.isoformat() if a.timestamp else None,
+                'price_source': a.price_source,
+            } for a in self.anchors],
+            'trades': [
+                {'id': pt.id, 'ticker': pt.ticker, 'action': pt.action,
+                 'quantity': pt.quantity, 'received_at': pt.created_at.isoformat() if pt.created_at else None}
+                for pt in self.trades
+            ],
+        }
+
+
+def cluster(pending, gap_sec=CLUSTER_GAP_SEC):
+    """Split pending trades (sorted by created_at) into clusters whose
+    adjacent trades are at most `gap_sec` apart."""
+    clusters = []
+    current = []
+    for pt in pending:
+        if current and (pt.created_at - current[-1].created_at).total_seconds() > gap_sec:
+            clusters.append(current)
+            current = []
+        current.append(pt)
+    if current:
+        clusters.append(current)
+    return clusters
+
+
+def load_holders(bot_ids):
+    """{TICKER: [bot id per positive Stock row]} for the given bots, one query."""
+    from models import db, Stock
+    holders = {}
+    if not bot_ids:
+        return holders
+    for user_id, ticker in db.session.query(Stock.user_id, Stock.ticker).filter(
+            Stock.user_id.in_(bot_ids), Stock.quantity > 0).order_by(Stock.id):
+        holders.setdefault((ticker or '').upper(), []).append(user_id)
+    return holders
+
+
+def load_anchors(bot_ids, windows):
+    """auto_* Transactions of `bot_ids` spanning all (start, end) `windows`,
+    one range query, sorted by timestamp."""
+    from models import db, Transaction
+    if not bot_ids or not windows:
+        return []
+    rows = db.session.query(
+        Transaction.user_id, Transaction.ticker, Transaction.transaction_type,
+        Transaction.timestamp, Transaction.price_source,
+    ).filter(
+        Transaction.user_id.in_(bot_ids),
+        Transaction.timestamp >= min(start for start, _ in windows),
+        Transaction.timestamp <= max(end for _, end in windows),
+        Transaction.price_source.like('auto_%'),
+    ).order_by(Transaction.timestamp, Transaction.id)
+    return [Anchor(*row) for row in rows]
+
+
+def assign_anchors(windows, anchors, key=lambda a: a.timestamp):
+    """For each inclusive (start, end) window, the anchors whose key falls
+    inside it. `anchors` must be sorted by key; each window costs two
+    bisections instead of a query."""
+    keys = [key(a) for a in anchors]
+    return [anchors[bisect_left(keys, start):bisect_right(keys, end)] for start, end in windows]
+
+
+def decide(trades, anchors, holders_by_ticker):
+    """(bot_id or None, reason, sell anchor ids, buy holder ids, no-holder
+    buys, ambiguous-holder buys) for one cluster.
+
+    A unique sell anchor wins; otherwise every BUY must have the same single
+    copytrade holder. Conflicting or mixed signals are ambiguous; no signal
+    at all waits for the next run (or expiry).
+    """
+    sell_anchor_bot_ids = {a.user_id for a in anchors}
+    buy_holder_bot_ids = set()
+    buy_no_holder_count = 0
+    buy_ambig_holder_count = 0
+    for pt in trades:
+        if pt.action != 'buy':
+            continue
+        holders = holders_by_ticker.get(pt.ticker.upper(), [])
+        if len(holders) == 1:
+            buy_holder_bot_ids.add(holders[0])
+        elif not holders:
+            buy_no_holder_count += 1
+        else:
+            buy_ambig_holder_count += 1
+
+    bot_id = None
+    if len(sell_anchor_bot_ids) == 1:
+        bot_id = next(iter(sell_anchor_bot_ids))
+        reason = 'sell_anchor_unique'
+    elif len(sell_anchor_bot_ids) >= 2:
+        reason = 'sell_anchors_conflict'
+    elif len(buy_holder_bot_ids) == 1 and buy_no_holder_count == 0 and buy_ambig_holder_count == 0:
+        bot_id = next(iter(buy_holder_bot_ids))
+        reason = 'unanimous_buy_holders'
+    elif len(buy_holder_bot_ids) >= 2:
+        reason = 'buy_holders_conflict'
+    elif len(buy_holder_bot_ids) == 1:
+        # Single holder match alongside no-holder/ambiguous buys.
+        # Refuse to auto-route — this is the May-2026 misallocation
+        # shape (one matching ticker + several unknowns).
+        reason = 'mixed_holder_signals'
+    else:
+        reason = 'no_signal'
+    return bot_id, reason, sell_anchor_bot_ids, buy_holder_bot_ids, buy_no_holder_count, buy_ambig_holder_count
+
+
+def plan(pending, bot_ids, gap_sec=CLUSTER_GAP_SEC, pad_sec=WINDOW_PAD_SEC):
+    """
+    Routing decision for every cluster of `pending` (PendingTrade rows sorted
+    by created_at) against the copytrade bots `bot_ids`.
+
+    Returns [ClusterDecision] in cluster order. Two queries in total.
+    """
+    clusters = cluster(pending, gap_sec)
+    pad = timedelta(seconds=pad_sec)
+    windows = [(c[0].created_at - pad, c[-1].created_at + pad) for c in clusters]
+    holders_by_ticker = load_holders(bot_ids)
+    in_window = assign_anchors(windows, load_anchors(bot_ids, windows))
+
+    decisions = []
+    for trades, (start, end), anchors in zip(clusters, windows, in_window):
+        decisions.append(ClusterDecision(trades, start, end, *decide(trades, anchors, holders_by_ticker),
+                                         anchors))
+    return decisions
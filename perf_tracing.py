@@ -0,0 +1,407 @@
+"""
+Per-request performance tracing for the mobile API and crons.
+
+Every request under TRACED_PREFIXES gets a Trace for its lifetime:
+
+  * SQL: query count and time, from SQLAlchemy engine events (all engines)
+  * external calls: AlphaVantage / FCM / email time, via span(kind=...)
+  * spans: nested named timings via `with span('name'):` or `@traced()`
+
+At the end of the request the summary (total ms, queries, query ms, external
+ms, slowest spans) is
+
+  * sent back as a `Server-Timing` header (visible in any HTTP inspector),
+  * logged as one `[TRACE]` line when slower than PERF_TRACE_LOG_MS,
+  * kept in a per-instance rolling window, and
+  * buffered and bulk-inserted into request_perf_sample (one INSERT per
+    PERF_TRACE_FLUSH_EVERY requests) so GET /api/mobile/admin/perf/routes
+    can report p50/p95 per route across all serverless instances; the
+    weekly intraday cleanup cron prunes samples past TRACE_RETENTION_DAYS.
+
+Outside a request (scripts, bot runners) span() and the SQL hooks are no-ops.
+Degrades to the per-instance window when the table is missing
+(scripts/migrations/2026_10_19_request_perf_sample.sql).
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+TRACED_PREFIXES = ('/api/mobile', '/api/cron')
+TRACE_ENABLED = os.environ.get('PERF_TRACE_ENABLED', '1').lower() not in ('0', 'false', 'off', 'no')
+TRACE_LOG_MS = float(os.environ.get('PERF_TRACE_LOG_MS', '1500'))
+TRACE_FLUSH_EVERY = max(1, int(os.environ.get('PERF_TRACE_FLUSH_EVERY', '25')))
+TRACE_FLUSH_INTERVAL_S = 120   # flush a partial buffer once it is this old
+TRACE_RETENTION_DAYS = 14
+_RECENT_PER_ROUTE = 500        # per-instance rolling window
+_MAX_SPANS = 64                # per request; deeper loops only add time
+
+_current = contextvars.ContextVar('perf_trace', default=None)
+
+
+class Trace:
+    """Timings for one request. Spans from worker threads (see bind())
+    count towards external/query time but are not added to the span tree."""
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.status = None
+        self.started = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.external = defaultdict(lambda: [0, 0.0])  # kind -> [calls, ms]
+        self.spans = []                                 # (depth, name, ms, queries)
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def add_query(self, ms):
+        with self._lock:
+            self.query_count += 1
+            self.query_ms += ms
+
+    def add_external(self, kind, ms):
+        with self._lock:
+            entry = self.external[kind]
+            entry[0] += 1
+            entry[1] += ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self):
+        external_ms = sum(ms for _calls, ms in self.external.values())
+        return {
+            'method': self.method,
+            'route': self.route,
+            'status': self.status,
+            'total_ms': round(self.elapsed_ms(), 1),
+            'query_count': self.query_count,
+            'query_ms': round(self.query_ms, 1),
+            'external_ms': round(external_ms, 1),
+            'external': {k: {'calls': c, 'ms': round(ms, 1)} for k, (c, ms) in self.external.items()},
+            'spans': [{'depth': d, 'name': n, 'ms': ms, 'queries': q} for d, n, ms, q in self.spans],
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name, kind=None):
+    """Time a block. `kind` ('av', 'fcm', 'email', ...) also counts the block
+    as external-call time for the request summary."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    own_thread = threading.get_ident() == trace.thread_id
+    depth = trace._depth
+    if own_thread:
+        trace._depth += 1
+    queries_before = trace.query_count
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        if kind:
+            trace.add_external(kind, ms)
+        if own_thread:
+            trace._depth = depth
+            if len(trace.spans) < _MAX_SPANS:
+                trace.spans.append((depth, name, round(ms, 1), trace.query_count - queries_before))
+
+
+def traced(name=None, kind=None):
+    """Decorator form of span(); defaults to the function's name."""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label, kind=kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn):
+    """Carry the current request's trace into a worker thread, e.g.
+    pool.submit(bind(fetch), ticker). No-op outside a traced request."""
+    trace = _current.get()
+    if trace is None:
+        return fn
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+@contextmanager
+def capture(route, method='RUN'):
+    """Trace a block outside a request (benchmarks, one-off scripts) and
+    yield the Trace: `with capture('cron') as t: ...; t.query_count`."""
+    install_sql_hooks()
+    trace = Trace(method, route)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+# ── SQL hooks ────────────────────────────────────────────────────────────────
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._perf_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    started = getattr(context, '_perf_started', None)
+    if trace is not None and started is not None:
+        trace.add_query((time.perf_counter() - started) * 1000)
+
+
+_sql_hooks_installed = False
+
+
+def install_sql_hooks():
+    """Listen on the Engine class so every engine (index.py's and models.db's)
+    is counted. Idempotent."""
+    global _sql_hooks_installed
+    if _sql_hooks_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _sql_hooks_installed = True
+
+
+# ── Aggregation ──────────────────────────────────────────────────────────────
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list (p in 0..100)."""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class RouteStats:
+    """Per-instance rolling window per route, plus the buffer of summaries
+    waiting to be written to request_perf_sample."""
+
+    def __init__(self, window=_RECENT_PER_ROUTE):
+        self._recent = defaultdict(lambda: deque(maxlen=window))
+        self._buffer = []
+        self._buffer_started = None
+        self._lock = threading.Lock()
+        self.persist = True   # cleared for this instance if the table is missing
+
+    def record(self, summary):
+        key = (summary['method'], summary['route'])
+        row = (summary['total_ms'], summary['query_count'], summary['query_ms'], summary['external_ms'])
+        with self._lock:
+            self._recent[key].append(row)
+            if self.persist:
+                if not self._buffer:
+                    self._buffer_started = time.time()
+                self._buffer.append({
+                    'recorded_at': datetime.utcnow(),
+                    'method': summary['method'][:8],
+                    'route': summary['route'][:200],
+                    'status': summary['status'],
+                    'total_ms': summary['total_ms'],
+                    'query_count': summary['query_count'],
+                    'query_ms': summary['query_ms'],
+                    'external_ms': summary['external_ms'],
+                })
+
+    def flush_due(self):
+        return bool(self._buffer) and (
+            len(self._buffer) >= TRACE_FLUSH_EVERY
+            or time.time() - self._buffer_started >= TRACE_FLUSH_INTERVAL_S)
+
+    def take_buffer(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            return rows
+
+    def snapshot(self):
+        """p50/p95 per route over this instance's rolling window."""
+        with self._lock:
+            items = [(key, list(rows)) for key, rows in self._recent.items()]
+        out = []
+        for (method, route), rows in items:
+            totals = [r[0] for r in rows]
+            queries = [r[1] for r in rows]
+            out.append({
+                'method': method,
+                'route': route,
+                'count': len(rows),
+                'p50_ms': percentile(totals, 50),
+                'p95_ms': percentile(totals, 95),
+                'queries_p50': percentile(queries, 50),
+                'queries_p95': percentile(queries, 95),
+                'queries_max': max(queries),
+                'query_ms_p95': percentile([r[2] for r in rows], 95),
+                'external_ms_p95': percentile([r[3] for r in rows], 95),
+            })
+        out.sort(key=lambda r: r['p95_ms'], reverse=True)
+        return out
+
+
+route_stats = RouteStats()
+
+
+def flush(engine):
+    """Bulk-insert buffered summaries on a separate connection (never the
+    request's session). On a missing table, stop buffering on this instance."""
+    rows = route_stats.take_buffer()
+    if not rows:
+        return 0
+    from sqlalchemy import text
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO request_perf_sample "
+                "(recorded_at, method, route, status, total_ms, query_count, query_ms, external_ms) "
+                "VALUES (:recorded_at, :method, :route, :status, :total_ms, :query_count, :query_ms, :external_ms)"
+            ), rows)
+        return len(rows)
+    except Exception as e:
+        msg = str(e).lower()
+        if 'request_perf_sample' in msg and ('does not exist' in msg or 'no such table' in msg):
+            route_stats.persist = False
+            logger.info("request_perf_sample table missing; perf traces kept per-instance only")
+        else:
+            logger.warning(f"perf trace flush failed ({len(rows)} rows dropped): {e}")
+        return 0
+
+
+def prune(engine):
+    """Delete samples older than TRACE_RETENTION_DAYS. Run by the intraday
+    cleanup cron (/api/cron/cleanup-intraday-data), not per flush. Returns
+    rows deleted; 0 when the table is missing."""
+    from sqlalchemy import text
+    try:
+        with engine.begin() as conn:
+            return conn.execute(text("DELETE FROM request_perf_sample WHERE recorded_at < :cut"),
+                                {'cut': datetime.utcnow() - timedelta(days=TRACE_RETENTION_DAYS)}).rowcount
+    except Exception as e:
+        logger.warning(f"perf trace retention failed: {e}")
+        return 0
+
+
+def route_percentiles(session, since, limit=100):
+    """p50/p95 per route from request_perf_sample (Postgres). Raises if the
+    table is missing so the caller can fall back to route_stats.snapshot()."""
+    from sqlalchemy import text
+    rows = session.execute(text("""
+        SELECT method, route, count(*) AS n,
+               percentile_cont(0.5)  WITHIN GROUP (ORDER BY total_ms)    AS p50_ms,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY total_ms)    AS p95_ms,
+               percentile_cont(0.5)  WITHIN GROUP (ORDER BY query_count) AS queries_p50,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY query_count) AS queries_p95,
+               max(query_count)                                          AS queries_max,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY query_ms)    AS query_ms_p95,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY external_ms) AS external_ms_p95
+        FROM request_perf_sample
+        WHERE recorded_at >= :since
+        GROUP BY method, route
+        ORDER BY p95_ms DESC
+        LIMIT :limit
+    """), {'since': since, 'limit': limit}).fetchall()
+    return [{
+        'method': r.method,
+        'route': r.route,
+        'count': r.n,
+        'p50_ms': round(float(r.p50_ms), 1),
+        'p95_ms': round(float(r.p95_ms), 1),
+        'queries_p50': float(r.queries_p50),
+        'queries_p95': float(r.queries_p95),
+        'queries_max': r.queries_max,
+        'query_ms_p95': round(float(r.query_ms_p95), 1),
+        'external_ms_p95': round(float(r.external_ms_p95), 1),
+    } for r in rows]
+
+
+# ── Flask integration ────────────────────────────────────────────────────────
+
+def _server_timing(summary):
+    parts = [f"db;desc=\"{summary['query_count']} queries\";dur={summary['query_ms']}"]
+    for kind, ext in summary['external'].items():
+        parts.append(f"{kind};desc=\"{ext['calls']} calls\";dur={ext['ms']}")
+    parts.append(f"total;dur={summary['total_ms']}")
+    return ', '.join(parts)
+
+
+def init_app(app, engine_getter, prefixes=TRACED_PREFIXES):
+    """Trace requests under `prefixes`. `engine_getter()` returns the engine
+    used to flush summaries (called lazily, inside the app context)."""
+    if not TRACE_ENABLED:
+        return
+    from flask import request
+
+    install_sql_hooks()
+    prefixes = tuple(prefixes)
+
+    def start_trace():
+        if request.path.startswith(prefixes):
+            route = request.url_rule.rule if request.url_rule is not None else request.path
+            request.environ['perf_trace.token'] = _current.set(Trace(request.method, route))
+
+    # First before_request hook, so auth / rate-limit queries are counted too.
+    app.before_request_funcs.setdefault(None, []).insert(0, start_trace)
+
+    @app.after_request
+    def add_server_timing(response):
+        trace = _current.get()
+        if trace is not None:
+            trace.status = response.status_code
+            response.headers['Server-Timing'] = _server_timing(trace.summary())
+        return response
+
+    @app.teardown_request
+    def finish_trace(exc=None):
+        token = request.environ.pop('perf_trace.token', None)
+        if token is None:
+            return
+        trace = _current.get()
+        _current.reset(token)
+        if trace is None:
+            return
+        if trace.status is None:
+            trace.status = 500 if exc is not None else 200
+        summary = trace.summary()
+        route_stats.record(summary)
+        if summary['total_ms'] >= TRACE_LOG_MS:
+            spans = sorted(summary['spans'], key=lambda s: s['ms'], reverse=True)[:5]
+            logger.info(
+                f"[TRACE] {summary['method']} {summary['route']} {summary['status']} "
+                f"{summary['total_ms']}ms queries={summary['query_count']}/{summary['query_ms']}ms "
+                f"external={summary['external_ms']}ms "
+                + ' '.join(f"{s['name']}={s['ms']}ms/{s['queries']}q" for s in spans))
+        if route_stats.persist and route_stats.flush_due():
+            try:
+                flush(engine_getter())
+            except Exception as e:
+                logger.warning(f"perf trace flush skipped: {e}")
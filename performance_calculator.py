@@ -29,10 +29,12 @@ Key Design Decisions:
 
 from datetime import date, timedelta, datetime
 from typing import Dict, List, Optional, Tuple
-from models import PortfolioSnapshot, MarketData
+from models import PortfolioSnapshot
 from sqlalchemy import and_
 import logging
 
+from perf_tracing import span, traced
+
 logger = logging.getLogger(__name__)
 
 
@@ -193,6 +195,7 @@ def get_leaderboard_eligibility(user_id: int, period: str) -> dict:
     }
 
 
+@traced()
 def calculate_portfolio_performance(
     user_id: int,
     start_date: date,
@@ -239,8 +242,6 @@ def calculate_portfolio_performance(
         - Negative CF (sales > buys): Handled correctly (can have negative returns)
         - All-zero snapshots: Skipped, uses first non-zero as baseline
     """
-    import time as _time
-    _t0 = _time.time()
     logger.info(f"Calculating performance for user {user_id} from {start_date} to {end_date}")
     
     # Determine if we should include intraday snapshots (for 1D and 5D periods only)
@@ -248,122 +249,42 @@ def calculate_portfolio_performance(
     include_intraday = period in ['1D', '5D'] if period else False
     
     # Get daily snapshots for period
-    _tq = _time.time()
-    snapshots = PortfolioSnapshot.query.filter(
-        and_(
-            PortfolioSnapshot.user_id == user_id,
-            PortfolioSnapshot.date >= start_date,
-            PortfolioSnapshot.date <= end_date
-        )
-    ).order_by(PortfolioSnapshot.date.asc()).all()
-    logger.info(f"[PERF-TIMING] user={user_id} daily_snapshots_query: {round(_time.time()-_tq,2)}s, got {len(snapshots)} rows")
+    with span('daily_snapshots_query'):
+        snapshots = PortfolioSnapshot.query.filter(
+            and_(
+                PortfolioSnapshot.user_id == user_id,
+                PortfolioSnapshot.date >= start_date,
+                PortfolioSnapshot.date <= end_date
+            )
+        ).order_by(PortfolioSnapshot.date.asc()).all()
     
     # For 1D and 5D periods, also include intraday snapshots
     if include_intraday:
-        from models import PortfolioSnapshotIntraday
-        from datetime import datetime, time
-        from zoneinfo import ZoneInfo
-        
-        start_datetime = datetime.combine(start_date, time.min)
-        end_datetime = datetime.combine(end_date, time.max)
+        from intraday_series import load_points
         
-        _tq2 = _time.time()
-        intraday_snapshots = PortfolioSnapshotIntraday.query.filter(
-            and_(
-                PortfolioSnapshotIntraday.user_id == user_id,
-                PortfolioSnapshotIntraday.timestamp >= start_datetime,
-                PortfolioSnapshotIntraday.timestamp <= end_datetime
-            )
-        ).order_by(PortfolioSnapshotIntraday.timestamp.asc()).all()
-        logger.info(f"[PERF-TIMING] user={user_id} intraday_query: {round(_time.time()-_tq2,2)}s, got {len(intraday_snapshots)} rows")
-        
-        # Filter to only valid 15-minute market intervals (9:30 AM - 4:00 PM EST)
-        # Valid times: 09:30, 09:45, 10:00, ..., 15:45, 16:00 (27 intervals)
-        valid_minutes = set()
-        for hour in range(9, 17):  # 9 AM to 4 PM
-            for minute in [0, 15, 30, 45]:
-                # Skip 9:00 AM and 9:15 AM (market opens at 9:30)
-                if hour == 9 and minute < 30:
-                    continue
-                # Skip times after 4:00 PM
-                if hour == 16 and minute > 0:
-                    continue
-                valid_minutes.add((hour, minute))
-        
-        # Filter snapshots to only valid intervals in ET
-        MARKET_TZ = ZoneInfo('America/New_York')
-        UTC_TZ = ZoneInfo('UTC')
-        filtered_intraday = []
-        filtered_out = []
-        
-        for snap in intraday_snapshots:
-            # Convert timestamp to ET
-            # IMPORTANT: PostgreSQL DateTime (without timezone) stores UTC when given
-            # a timezone-aware datetime. get_market_time() returns ET-aware, but
-            # psycopg2 converts to UTC before storing in a naive column.
-            # So naive timestamps here are UTC — must convert to ET.
-            if snap.timestamp.tzinfo is None:
-                # Treat as UTC-naive, convert to ET
-                snap_time_est = snap.timestamp.replace(tzinfo=UTC_TZ).astimezone(MARKET_TZ)
-            else:
-                snap_time_est = snap.timestamp.astimezone(MARKET_TZ)
-            
-            # Check if this is within market hours (9:30 AM - 4:00 PM ET)
-            # Allow +/- 3 min tolerance for cron timing variance and force calls
-            snap_h, snap_m = snap_time_est.hour, snap_time_est.minute
-            in_market_hours = (
-                (snap_h == 9 and snap_m >= 27) or  # 9:27+ (tolerance for 9:30)
-                (10 <= snap_h <= 15) or             # 10:00 AM - 3:59 PM
-                (snap_h == 16 and snap_m <= 3)      # Up to 4:03 PM (tolerance for 4:00)
-            )
-            
-            if in_market_hours:
-                filtered_intraday.append(snap)
-            else:
-                filtered_out.append(f"{snap_time_est.strftime('%H:%M ET')} (stored as {snap.timestamp.strftime('%H:%M UTC')})")
-        
-        logger.info(f"Filtered {len(intraday_snapshots)} intraday snapshots to {len(filtered_intraday)} valid market-hours snapshots")
-        if filtered_out:
-            logger.info(f"Filtered OUT these times: {', '.join(filtered_out[:10])}")
-        
-        intraday_snapshots = filtered_intraday
+        # Compact series first: one row per session, already slotted to the
+        # 09:30-16:00 ET quarter-hours, so no per-row timestamp filtering.
+        # Sessions the series has no row for (table not migrated yet, partial
+        # backfill) come from the legacy per-tick rows.
+        with span('intraday_series_query'):
+            loaded = load_points(user_id, start_date, end_date)
+        if loaded is None:
+            with span('intraday_legacy_query'):
+                intraday_snapshots = _load_legacy_intraday(user_id, start_date, end_date)
+        else:
+            intraday_snapshots, missing_sessions = loaded
+            if missing_sessions:
+                with span('intraday_legacy_query'):
+                    legacy = _load_legacy_intraday(user_id, missing_sessions[0], missing_sessions[-1])
+                missing_sessions = set(missing_sessions)
+                legacy = [s for s in legacy if s.date in missing_sessions]
+                if legacy:
+                    intraday_snapshots = sorted(intraday_snapshots + legacy, key=lambda s: s.timestamp)
         
         if intraday_snapshots:
-            # Wrapper class to make intraday snapshots compatible with daily snapshot interface
-            class IntradayWrapper:
-                def __init__(self, intraday_snap):
-                    # Timestamps are stored in UTC; convert to ET for date extraction
-                    ts = intraday_snap.timestamp
-                    if ts.tzinfo is None:
-                        ts_et = ts.replace(tzinfo=ZoneInfo('UTC')).astimezone(MARKET_TZ)
-                    else:
-                        ts_et = ts.astimezone(MARKET_TZ)
-                    self.date = ts_et.date()
-                    self.timestamp = intraday_snap.timestamp
-                    self.total_value = intraday_snap.total_value
-                    self.stock_value = intraday_snap.stock_value or 0.0
-                    self.cash_proceeds = intraday_snap.cash_proceeds or 0.0
-                    self.max_cash_deployed = intraday_snap.max_cash_deployed or 0.0
-                    self.user_id = intraday_snap.user_id
-                    self.is_intraday = True
-            
-            # Wrap intraday snapshots
-            wrapped_intraday = [IntradayWrapper(s) for s in intraday_snapshots]
-            
             # For 1D and 5D periods, ONLY use intraday snapshots (exclude daily snapshots to avoid duplicates)
-            # For longer periods (1M+), merge daily snapshots with intraday snapshots
-            if period in ['1D', '5D']:
-                snapshots = wrapped_intraday
-                logger.info(f"Using ONLY {len(intraday_snapshots)} intraday snapshots for {period} period (excluding daily)")
-            else:
-                # Add timestamp to daily snapshots for sorting
-                for snap in snapshots:
-                    snap.timestamp = datetime.combine(snap.date, time(16, 0))
-                    snap.is_intraday = False
-                
-                # Merge and sort all snapshots by timestamp
-                snapshots = sorted(snapshots + wrapped_intraday, key=lambda s: s.timestamp)
-                logger.info(f"Including {len(intraday_snapshots)} intraday + {len(snapshots) - len(intraday_snapshots)} daily snapshots for {period} period")
+            snapshots = intraday_snapshots
+            logger.info(f"Using ONLY {len(intraday_snapshots)} intraday snapshots for {period} period (excluding daily)")
     
     # For 1D: if we only have 0 or 1 snapshot (e.g. market closed, no intraday),
     # expand to include the previous trading day's daily close as a baseline
@@ -484,19 +405,15 @@ def calculate_portfolio_performance(
     # Generate chart data if requested (uses simple per-point formula for speed)
     chart_data = None
     if include_chart_data:
-        _tc = _time.time()
         chart_data = _generate_chart_points(snapshots, start_date, end_date, period)
-        logger.info(f"[PERF-TIMING] user={user_id} chart_points: {round(_time.time()-_tc,2)}s, {len(chart_data) if chart_data else 0} points")
     
     # Calculate S&P 500 benchmark (simple percentage, not time-weighted)
     # IMPORTANT: Use user's actual start date (first snapshot), not period start.
     # This ensures apples-to-apples comparison — if user has only been active 3 weeks,
     # S&P return is also calculated over those same 3 weeks, not the full 3-month period.
     sp500_start = first_snapshot.date if first_snapshot.date > start_date else start_date
-    _ts = _time.time()
-    sp500_return = _calculate_sp500_benchmark(sp500_start, end_date)
-    logger.info(f"[PERF-TIMING] user={user_id} sp500_benchmark: {round(_time.time()-_ts,2)}s (sp500_start={sp500_start})")
-    logger.info(f"[PERF-TIMING] user={user_id} TOTAL: {round(_time.time()-_t0,2)}s")
+    with span('sp500_benchmark'):
+        sp500_return = _calculate_sp500_benchmark(sp500_start, end_date)
     
     return {
         'portfolio_return': round(portfolio_return, 2),
@@ -514,6 +431,84 @@ def calculate_portfolio_performance(
     }
 
 
+_SPY_SLOT_TOLERANCE = timedelta(minutes=3)
+
+
+def _load_legacy_intraday(user_id: int, start_date: date, end_date: date) -> list:
+    """Per-tick PortfolioSnapshotIntraday rows for the range, filtered to
+    market-hours ticks and wrapped to the daily-snapshot interface.
+
+    Fallback for calculate_portfolio_performance for the sessions the compact
+    intraday series (intraday_series.py) has no rows for yet.
+    """
+    from models import PortfolioSnapshotIntraday
+    from datetime import datetime, time
+    from zoneinfo import ZoneInfo
+
+    start_datetime = datetime.combine(start_date, time.min)
+    end_datetime = datetime.combine(end_date, time.max)
+
+    intraday_snapshots = PortfolioSnapshotIntraday.query.filter(
+        and_(
+            PortfolioSnapshotIntraday.user_id == user_id,
+            PortfolioSnapshotIntraday.timestamp >= start_datetime,
+            PortfolioSnapshotIntraday.timestamp <= end_datetime
+        )
+    ).order_by(PortfolioSnapshotIntraday.timestamp.asc()).all()
+
+    # Filter snapshots to only valid intervals in ET
+    MARKET_TZ = ZoneInfo('America/New_York')
+    UTC_TZ = ZoneInfo('UTC')
+    filtered_intraday = []
+    filtered_out = []
+
+    for snap in intraday_snapshots:
+        # Convert timestamp to ET
+        # IMPORTANT: PostgreSQL DateTime (without timezone) stores UTC when given
+        # a timezone-aware datetime. get_market_time() returns ET-aware, but
+        # psycopg2 converts to UTC before storing in a naive column.
+        # So naive timestamps here are UTC — must convert to ET.
+        if snap.timestamp.tzinfo is None:
+            snap_time_est = snap.timestamp.replace(tzinfo=UTC_TZ).astimezone(MARKET_TZ)
+        else:
+            snap_time_est = snap.timestamp.astimezone(MARKET_TZ)
+
+        # Check if this is within market hours (9:30 AM - 4:00 PM ET)
+        # Allow +/- 3 min tolerance for cron timing variance and force calls
+        snap_h, snap_m = snap_time_est.hour, snap_time_est.minute
+        in_market_hours = (
+            (snap_h == 9 and snap_m >= 27) or  # 9:27+ (tolerance for 9:30)
+            (10 <= snap_h <= 15) or             # 10:00 AM - 3:59 PM
+            (snap_h == 16 and snap_m <= 3)      # Up to 4:03 PM (tolerance for 4:00)
+        )
+
+        if in_market_hours:
+            filtered_intraday.append(_IntradayWrapper(snap, snap_time_est.date()))
+        else:
+            filtered_out.append(f"{snap_time_est.strftime('%H:%M ET')} (stored as {snap.timestamp.strftime('%H:%M UTC')})")
+
+    logger.info(f"Filtered {len(intraday_snapshots)} intraday snapshots to {len(filtered_intraday)} valid market-hours snapshots")
+    if filtered_out:
+        logger.info(f"Filtered OUT these times: {', '.join(filtered_out[:10])}")
+    return filtered_intraday
+
+
+class _IntradayWrapper:
+    """Make a PortfolioSnapshotIntraday row look like a daily snapshot
+    (ET `date`, zero-filled cash fields, `is_intraday` flag)."""
+
+    def __init__(self, intraday_snap, et_date):
+        self.date = et_date
+        self.timestamp = intraday_snap.timestamp
+        self.total_value = intraday_snap.total_value
+        self.stock_value = intraday_snap.stock_value or 0.0
+        self.cash_proceeds = intraday_snap.cash_proceeds or 0.0
+        self.max_cash_deployed = intraday_snap.max_cash_deployed or 0.0
+        self.user_id = intraday_snap.user_id
+        self.is_intraday = True
+
+
+@traced()
 def _generate_chart_points(
     snapshots: List[PortfolioSnapshot],
     period_start: date,
@@ -537,8 +532,6 @@ def _generate_chart_points(
     Returns:
         List of chart points: [{'date': 'Oct 25', 'portfolio': 28.57, 'sp500': 15.32}, ...]
     """
-    import time as _time
-    _tcp0 = _time.time()
     chart_data = []
     
     # Find first non-zero snapshot as baseline
@@ -555,44 +548,19 @@ def _generate_chart_points(
     baseline_value = baseline_snapshot.total_value
     baseline_date = baseline_snapshot.date
     logger.debug(f"Chart baseline: ${baseline_value:.2f} on {baseline_date}")
-    logger.info(f"[CHART-TIMING] snapshots_count={len(snapshots)}, baseline={baseline_date}")
     
     # S&P 500 data starts from user's baseline_date (not period_start) so the chart
     # only shows data points since the user had assets. Both lines start at 0%.
     sp500_baseline_date = baseline_date  # User's first non-zero snapshot date
-    _tsp = _time.time()
-    if period in ['1D', '5D']:
-        # Query intraday S&P 500 data from user's baseline
-        sp500_data = MarketData.query.filter(
-            and_(
-                MarketData.ticker == 'SPY_INTRADAY',
-                MarketData.date >= sp500_baseline_date,
-                MarketData.date <= period_end,
-                MarketData.timestamp.isnot(None)
-            )
-        ).order_by(MarketData.timestamp.asc()).all()
-        
-        # FALLBACK: If no intraday S&P 500 data, use daily close
-        if not sp500_data:
-            logger.warning(f"No SPY_INTRADAY data found for {period}, falling back to daily SPY_SP500")
-            sp500_data = MarketData.query.filter(
-                and_(
-                    MarketData.ticker == 'SPY_SP500',
-                    MarketData.date >= sp500_baseline_date,
-                    MarketData.date <= period_end
-                )
-            ).order_by(MarketData.date.asc()).all()
-    else:
-        # Query daily S&P 500 data from user's baseline date
-        sp500_data = MarketData.query.filter(
-            and_(
-                MarketData.ticker == 'SPY_SP500',
-                MarketData.date >= sp500_baseline_date,
-                MarketData.date <= period_end
-            )
-        ).order_by(MarketData.date.asc()).all()
-    
-    logger.info(f"[CHART-TIMING] sp500_query: {round(_time.time()-_tsp,2)}s, got {len(sp500_data)} rows")
+    with span('sp500_query'):
+        # Shared benchmark series (intraday ticks for 1D/5D with daily fallback),
+        # sliced to the user's window in memory.
+        import benchmark_series
+        if period in ['1D', '5D']:
+            sp500_series = benchmark_series.for_period(period)
+        else:
+            sp500_series = benchmark_series.daily()
+        sp500_data = sp500_series.between(sp500_baseline_date, period_end).points
     
     # DEBUG: Log what dates we actually got
     if sp500_data:
@@ -668,7 +636,6 @@ def _generate_chart_points(
             # Off-the-hour fallback (e.g., last point at 3:45 PM)
             return f"{h12}:{m:02d} {ampm}"
 
-        _tloop = _time.time()
         for idx, snapshot in enumerate(snapshots):
             if snapshot.total_value <= 0:
                 continue
@@ -711,8 +678,11 @@ def _generate_chart_points(
             if hasattr(snapshot, 'is_intraday') and snapshot.is_intraday and sp500_map_timestamp:
                 # Find closest S&P 500 value at or before this timestamp
                 sp500_value = baseline_sp500
+                # Series points sit exactly on the slot (e.g. 10:45:00) while the
+                # SPY tick for that slot was stamped when the cron ran (10:45:40),
+                # so allow the slot tolerance when matching.
                 for spy_ts, spy_price in sorted(sp500_map_timestamp.items()):
-                    if spy_ts <= snapshot.timestamp:
+                    if spy_ts <= snapshot.timestamp + _SPY_SLOT_TOLERANCE:
                         sp500_value = spy_price
                     else:
                         break
@@ -764,7 +734,6 @@ def _generate_chart_points(
                 'portfolio': round(portfolio_pct, 2),
                 'sp500': round(sp500_pct, 2)
             })
-        logger.info(f"[CHART-TIMING] intraday_loop: {round(_time.time()-_tloop,2)}s for {len(chart_data)} points from {len(snapshots)} snapshots")
     else:
         # For longer periods: Generate points for S&P 500 dates
         # Sample data to avoid overcrowded charts on mobile screens
@@ -892,8 +861,6 @@ def _generate_chart_points(
     return chart_data
 
 
-_sp500_benchmark_cache: Dict[tuple, float] = {}
-
 def _calculate_sp500_benchmark(start_date: date, end_date: date) -> float:
     """
     Calculate S&P 500 return for the period using simple percentage.
@@ -901,8 +868,9 @@ def _calculate_sp500_benchmark(start_date: date, end_date: date) -> float:
     Note: Uses simple return (not Modified Dietz) since it's a passive benchmark
     with no cash flows. Just measures market movement.
     
-    Cached in-memory: many users share the same start/end dates during bulk
-    leaderboard computation, avoiding redundant DB queries at 10k scale.
+    Reads the shared benchmark series (benchmark_series), so the many users
+    sharing the same start/end dates during bulk leaderboard computation cost
+    in-memory lookups, not DB queries.
     
     Args:
         start_date: Period start
@@ -911,99 +879,8 @@ def _calculate_sp500_benchmark(start_date: date, end_date: date) -> float:
     Returns:
         S&P 500 percentage return
     """
-    cache_key = (start_date, end_date)
-    if cache_key in _sp500_benchmark_cache:
-        return _sp500_benchmark_cache[cache_key]
-    # For 1D periods (start_date == end_date), try intraday data first, fall back to daily
-    if start_date == end_date:
-        # Query intraday SPY data for this date
-        intraday_data = MarketData.query.filter(
-            and_(
-                MarketData.ticker == 'SPY_INTRADAY',
-                MarketData.date == start_date,
-                MarketData.timestamp.isnot(None)
-            )
-        ).order_by(MarketData.timestamp.asc()).all()
-        
-        if not intraday_data or len(intraday_data) < 2:
-            # Fallback: use previous trading day close vs this day close from daily data
-            prev_day = start_date - timedelta(days=1)
-            while prev_day.weekday() >= 5:
-                prev_day = prev_day - timedelta(days=1)
-            
-            prev_sp500 = MarketData.query.filter(
-                and_(MarketData.ticker == 'SPY_SP500', MarketData.date == prev_day)
-            ).first()
-            curr_sp500 = MarketData.query.filter(
-                and_(MarketData.ticker == 'SPY_SP500', MarketData.date == end_date)
-            ).first()
-            
-            if prev_sp500 and curr_sp500 and float(prev_sp500.close_price) > 0:
-                result = ((float(curr_sp500.close_price) - float(prev_sp500.close_price)) / float(prev_sp500.close_price)) * 100
-                _sp500_benchmark_cache[cache_key] = result
-                return result
-            
-            logger.warning(f"Missing SPY data for 1D: intraday and daily fallback both failed for {start_date}")
-            _sp500_benchmark_cache[cache_key] = 0.0
-            return 0.0
-        
-        # SPY_INTRADAY already contains S&P 500 value (spy_price * 10 from intraday cron)
-        # Do NOT multiply by 10 again or you'll get ~900% gains!
-        start_price = intraday_data[0].close_price
-        end_price = intraday_data[-1].close_price
-        
-        if start_price == 0:
-            logger.warning(f"Zero SPY_INTRADAY start price on {start_date}")
-            _sp500_benchmark_cache[cache_key] = 0.0
-            return 0.0
-        
-        sp500_return = ((end_price - start_price) / start_price) * 100
-        
-        logger.debug(
-            f"S&P 500 intraday return: {sp500_return:.2f}% "
-            f"({start_date} 9:30 AM: ${start_price:.2f} -> 4:00 PM: ${end_price:.2f})"
-        )
-        
-        _sp500_benchmark_cache[cache_key] = sp500_return
-        return sp500_return
-    
-    # For multi-day periods, use daily SPY_SP500 data
-    start_price_data = MarketData.query.filter(
-        and_(
-            MarketData.ticker == 'SPY_SP500',
-            MarketData.date >= start_date
-        )
-    ).order_by(MarketData.date.asc()).first()
-    
-    end_price_data = MarketData.query.filter(
-        and_(
-            MarketData.ticker == 'SPY_SP500',
-            MarketData.date <= end_date
-        )
-    ).order_by(MarketData.date.desc()).first()
-    
-    if not start_price_data or not end_price_data:
-        logger.warning(f"Missing SPY_SP500 data for period {start_date} to {end_date}")
-        _sp500_benchmark_cache[cache_key] = 0.0
-        return 0.0
-    
-    start_price = start_price_data.close_price
-    end_price = end_price_data.close_price
-    
-    if start_price == 0:
-        logger.warning(f"Zero S&P 500 start price on {start_price_data.date}")
-        _sp500_benchmark_cache[cache_key] = 0.0
-        return 0.0
-    
-    sp500_return = ((end_price - start_price) / start_price) * 100
-    
-    logger.debug(
-        f"S&P 500 return: {sp500_return:.2f}% "
-        f"({start_price_data.date}: ${start_price:.2f} -> {end_price_data.date}: ${end_price:.2f})"
-    )
-    
-    _sp500_benchmark_cache[cache_key] = sp500_return
-    return sp500_return
+    import benchmark_series
+    return benchmark_series.simple_return(start_date, end_date)
 
 
 def get_period_dates(period: str, user_id: Optional[int] = None) -> Tuple[date, date]:
@@ -1034,10 +911,9 @@ def get_period_dates(period: str, user_id: Optional[int] = None) -> Tuple[date,
     
     today = get_market_date()  # Today in ET timezone
     
-    # Find most recent market day (Mon-Fri) - important for weekends
-    end_date = today
-    while end_date.weekday() >= 5:  # Saturday=5, Sunday=6
-        end_date = end_date - timedelta(days=1)
+    # Find most recent trading session - important for weekends and holidays
+    import trading_calendar
+    end_date = trading_calendar.session_on_or_before(today)
     
     period_upper = period.upper()
     
@@ -1045,19 +921,8 @@ def get_period_dates(period: str, user_id: Optional[int] = None) -> Tuple[date,
         # Show most recent market day's intraday data
         start_date = end_date
     elif period_upper == '5D':
-        # Get last 5 trading days (Mon-Fri), skipping weekends
-        # Start from the day before end_date and count back 4 more trading days
-        trading_days_needed = 4  # We already have end_date
-        current_date = end_date - timedelta(days=1)
-        
-        while trading_days_needed > 0:
-            # Skip weekends (Saturday=5, Sunday=6)
-            if current_date.weekday() < 5:
-                trading_days_needed -= 1
-            current_date = current_date - timedelta(days=1)
-        
-        # current_date is now 1 day before the start date, so add 1 day
-        start_date = current_date + timedelta(days=1)
+        # Last 5 trading sessions, end_date included
+        start_date = trading_calendar.sessions_back(end_date, 4)
     elif period_upper == '1M':
         start_date = end_date - timedelta(days=30)
     elif period_upper == '3M':
@@ -1,7 +1,6 @@
 """
 Portfolio performance calculation using Modified Dietz method and market benchmarking.
 """
-import requests
 import os
 from datetime import datetime, date, timedelta, timezone
 from zoneinfo import ZoneInfo
@@ -9,6 +8,7 @@ import logging
 from typing import Dict, List
 from models import PortfolioSnapshot, MarketData, Stock, Transaction, User, db
 from sqlalchemy import func, and_, or_, text, bindparam
+from av_rate_governor import av_get, is_throttle_response, AVBudgetExhausted
 try:
     from timezone_utils import get_market_timezone, is_market_hours
 except ImportError:
@@ -205,27 +205,13 @@ class PortfolioPerformanceCalculator:
         
         current_time = datetime.now()
         
-        # Determine if market is open for real-time pricing
+        # Determine if market is open for real-time pricing, and the most
+        # recent market close date (for cache validation); holidays and
+        # early closes per trading_calendar
+        import trading_calendar
         market_tz_time = datetime.now(MARKET_TZ)
-        is_weekday = market_tz_time.weekday() < 5
-        is_market_hours = (
-            is_weekday and 
-            market_tz_time.hour >= 9 and 
-            (market_tz_time.hour < 16 or (market_tz_time.hour == 9 and market_tz_time.minute >= 30))
-        )
-        
-        # Determine the most recent market close date (for cache validation)
-        if is_weekday:
-            if market_tz_time.hour >= 16:
-                most_recent_close_date = market_tz_time.date()
-            else:
-                if market_tz_time.weekday() == 0:  # Monday
-                    most_recent_close_date = (market_tz_time - timedelta(days=3)).date()  # Friday
-                else:
-                    most_recent_close_date = (market_tz_time - timedelta(days=1)).date()
-        else:
-            days_since_friday = (market_tz_time.weekday() - 4) % 7
-            most_recent_close_date = (market_tz_time - timedelta(days=days_since_friday)).date()
+        is_market_hours = trading_calendar.is_open(market_tz_time)
+        most_recent_close_date = trading_calendar.last_completed_session(market_tz_time)
         
         # Check cache first with smart cache validation
         uncached_tickers = []
@@ -243,6 +229,7 @@ class PortfolioPerformanceCalculator:
             else:
                 l1_miss.append(ticker_upper)
 
+        l2_map = {}
         if l1_miss:
             l2_map = _shared_cache_get_many(l1_miss)
             for ticker_upper in l1_miss:
@@ -277,7 +264,7 @@ class PortfolioPerformanceCalculator:
                 
                 # Use REALTIME_BULK_QUOTES for premium tier (up to 100 symbols)
                 url = f'https://www.alphavantage.co/query?function=REALTIME_BULK_QUOTES&symbol={symbols_str}&entitlement=realtime&apikey={api_key}'
-                response = requests.get(url, timeout=10)
+                response = av_get(url, timeout=10)
                 data = response.json()
                 
                 # Parse bulk quotes response
@@ -338,6 +325,15 @@ class PortfolioPerformanceCalculator:
             
             return result
             
+        except AVBudgetExhausted as e:
+            # No AV slot within the request's wait: serve the last known
+            # (stale) prices rather than holding the request.
+            logger.warning(f"Batch fetch out of AV budget, serving cached prices: {e}")
+            for ticker_upper in uncached_tickers:
+                stale = stock_price_cache.get(ticker_upper) or l2_map.get(ticker_upper)
+                if ticker_upper not in result and stale:
+                    result[ticker_upper] = stale['price']
+            return result
         except Exception as e:
             logger.error(f"Error in batch fetch: {e}")
             return result
@@ -356,30 +352,13 @@ class PortfolioPerformanceCalculator:
         current_time = datetime.now()
         ticker_upper = ticker_symbol.upper()
         
-        # Determine if market is open for real-time pricing
+        # Determine if market is open for real-time pricing, and the most
+        # recent market close date (for cache validation); holidays and
+        # early closes per trading_calendar
+        import trading_calendar
         market_tz_time = datetime.now(MARKET_TZ)
-        is_weekday = market_tz_time.weekday() < 5  # Monday=0, Friday=4
-        is_market_hours = (
-            is_weekday and 
-            market_tz_time.hour >= 9 and 
-            (market_tz_time.hour < 16 or (market_tz_time.hour == 9 and market_tz_time.minute >= 30))
-        )
-        
-        # Determine the most recent market close date (for cache validation)
-        if is_weekday:
-            if market_tz_time.hour >= 16:
-                # After 4pm on weekday: most recent close is today
-                most_recent_close_date = market_tz_time.date()
-            else:
-                # Before market close: most recent close is previous trading day
-                if market_tz_time.weekday() == 0:  # Monday
-                    most_recent_close_date = (market_tz_time - timedelta(days=3)).date()  # Friday
-                else:
-                    most_recent_close_date = (market_tz_time - timedelta(days=1)).date()  # Yesterday
-        else:
-            # Weekend: most recent close is Friday
-            days_since_friday = (market_tz_time.weekday() - 4) % 7
-            most_recent_close_date = (market_tz_time - timedelta(days=days_since_friday)).date()
+        is_market_hours = trading_calendar.is_open(market_tz_time)
+        most_recent_close_date = trading_calendar.last_completed_session(market_tz_time)
         
         # Check caches: L1 (per-instance memory) then L2 (shared Postgres), with
         # a tiered TTL (hot tickers refresh faster). See the W9 helpers above.
@@ -400,10 +379,8 @@ class PortfolioPerformanceCalculator:
                 logger.warning("Alpha Vantage API key not found, cannot fetch stock price")
                 return None
             
-            # Use Alpha Vantage API with real-time entitlement and slight delay to avoid rate limiting
-            import time
-            time.sleep(0.1)  # 100ms delay between API calls
-            
+            # Use Alpha Vantage API with real-time entitlement. Pacing is the
+            # shared AV governor's job (see av_rate_governor.py).
             url = f'https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={_to_av_symbol(ticker_symbol)}&entitlement=realtime&apikey={api_key}'
             
             # Log why we're making API call
@@ -414,7 +391,7 @@ class PortfolioPerformanceCalculator:
             
             # 10-second timeout is reasonable for premium API
             # Real timeouts were caused by db.session.commit() bottleneck (now fixed)
-            response = requests.get(url, timeout=10)
+            response = av_get(url, timeout=10)
             
             # Check HTTP status first
             if response.status_code != 200:
@@ -432,8 +409,8 @@ class PortfolioPerformanceCalculator:
                 logger.error(f"❌ Alpha Vantage API Error for {ticker_symbol}: {data['Error Message']}")
                 return None
             
-            if 'Note' in data:
-                logger.error(f"❌ Alpha Vantage Rate Limit for {ticker_symbol}: {data['Note']}")
+            if is_throttle_response(data):
+                logger.error(f"❌ Alpha Vantage Rate Limit for {ticker_symbol}: {data.get('Note') or data.get('Information')}")
                 return None
             
             # Log the API call (NOTE: Do NOT commit - let caller handle atomic transaction)
@@ -470,9 +447,12 @@ class PortfolioPerformanceCalculator:
                 
         except Exception as e:
             logger.error(f"Error fetching data for {ticker_symbol}: {e}")
-            # Return cached data if available, otherwise None
+            # Return cached data if available (also when the AV budget ran
+            # out for this request), otherwise None
             if ticker_upper in stock_price_cache:
                 return {'price': stock_price_cache[ticker_upper]['price']}
+            if l2:
+                return {'price': l2['price']}
             return None
         # NOTE: Removed finally block that was committing after every API call
         # This was breaking atomic transactions and causing cascading timeouts
@@ -523,14 +503,11 @@ class PortfolioPerformanceCalculator:
                 logger.warning("Alpha Vantage API key not found")
                 return None
             
-            import time
-            time.sleep(0.15)  # Rate limit: ~7 calls per second
-            
             # Use compact (100 days) which should cover our date range and works on all API tiers.
             # Send AV the hyphen form for class shares (BRK.B -> BRK-B); results are cached under
             # the internal ticker_upper, so no response-symbol mapping is needed here.
             url = f'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={_to_av_symbol(ticker)}&outputsize=compact&apikey={self.alpha_vantage_api_key}'
-            response = requests.get(url, timeout=10)
+            response = av_get(url, timeout=10)
             data = response.json()
             
             # Log API call
@@ -849,7 +826,7 @@ class PortfolioPerformanceCalculator:
             }
             
             logger.info("Making single AlphaVantage API call for full SPY history...")
-            response = requests.get(url, params=params, timeout=20)
+            response = av_get(url, params=params, timeout=20)
             response.raise_for_status()
             data = response.json()
             
@@ -945,24 +922,14 @@ class PortfolioPerformanceCalculator:
     
     def get_sp500_data(self, start_date: date, end_date: date) -> Dict[date, float]:
         """Fetch and cache S&P 500 data using AlphaVantage - optimized for incremental updates"""
-        # Check cache first
-        cached_data = MarketData.query.filter(
-            and_(
-                MarketData.ticker == self.sp500_ticker,
-                MarketData.date >= start_date,
-                MarketData.date <= end_date
-            )
-        ).all()
+        import benchmark_series
+        import trading_calendar
+        # Check cache first (shared benchmark series)
+        cached_dates = {p.date: p.close_price for p in benchmark_series.daily().between(start_date, end_date).points}
+        added = False
         
-        cached_dates = {data.date: data.close_price for data in cached_data}
-        
-        # Only fetch missing dates (incremental approach)
-        missing_dates = []
-        current_date = start_date
-        while current_date <= end_date:
-            if current_date not in cached_dates and current_date.weekday() < 5:  # Skip weekends
-                missing_dates.append(current_date)
-            current_date += timedelta(days=1)
+        # Only fetch missing dates (incremental approach); sessions only
+        missing_dates = [d for d in trading_calendar.sessions_between(start_date, end_date) if d not in cached_dates]
         
         # Only fetch missing recent dates (avoid historical API calls)
         if missing_dates:
@@ -987,6 +954,7 @@ class PortfolioPerformanceCalculator:
                             )
                             db.session.add(market_data)
                             cached_dates[missing_date] = sp500_price
+                            added = True
                             
                 except Exception as e:
                     logger.error(f"Error fetching recent S&P 500 data: {e}")
@@ -1027,6 +995,8 @@ class PortfolioPerformanceCalculator:
         
         try:
             db.session.commit()
+            if added:
+                benchmark_series.invalidate('daily')
         except Exception as e:
             logger.error(f"Error committing S&P 500 data: {e}")
         
@@ -1035,15 +1005,8 @@ class PortfolioPerformanceCalculator:
     def get_cached_sp500_data(self, start_date: date, end_date: date) -> Dict[date, float]:
         """Get S&P 500 data from cache only - NO API calls for performance charts"""
         try:
-            cached_data = MarketData.query.filter(
-                and_(
-                    MarketData.ticker == self.sp500_ticker,
-                    MarketData.date >= start_date,
-                    MarketData.date <= end_date
-                )
-            ).all()
-            
-            result = {data.date: data.close_price for data in cached_data}
+            import benchmark_series
+            result = {p.date: p.close_price for p in benchmark_series.daily().between(start_date, end_date).points}
             logger.info(f"Retrieved {len(result)} cached S&P 500 data points for {start_date} to {end_date}")
             
             if result:
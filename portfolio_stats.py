@@ -0,0 +1,207 @@
+"""
+Set-based portfolio stats engine (user_portfolio_stats).
+
+PHASE 2.25 of the market-close cron used to call
+leaderboard_utils.calculate_user_portfolio_stats once per user: every Stock
+row and the whole Transaction history loaded into Python, separate subscriber
+COUNTs, two snapshot + StockInfo lookups for the cap and industry mix, then a
+UserPortfolioStats lookup to write the result. About ten statements per user.
+
+compute() produces the same stats for every user (or a given set) with a fixed
+handful of grouped queries:
+
+  * holdings grouped per (user, sector, small/large cap, ticker if no sector)
+    joined against StockInfo, with row count, cost basis and fractional flag;
+  * each user's latest PortfolioSnapshot value;
+  * transaction totals and last-14-day counts;
+  * subscriber counts (subscriber_counts plus legacy web subscriptions);
+
+and write() stores them with one bulk upsert on user_portfolio_stats.user_id.
+The bulk upsert bypasses the ORM flush hooks, so the cron rebuilds the
+influencer ranking after this phase (PHASE 2.45).
+
+Benchmark: scripts/benchmark_portfolio_stats.py.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FRACTIONAL_TOLERANCE = 0.0001   # quantity this far off an integer is fractional
+RECENT_TRADE_DAYS = 14          # window for avg_trades_per_week
+SMALL_CAP_CEILING = 10_000_000_000   # 'small' and 'mid' (StockInfo.get_market_cap_category)
+UPSERT_CHUNK = 1000
+
+FIELDS = ('unique_stocks_count', 'has_fractional_holdings', 'total_trades', 'avg_trades_per_week',
+          'small_cap_percent', 'large_cap_percent', 'industry_mix', 'subscriber_count', 'last_updated')
+
+
+def _in(column, user_ids):
+    from sqlalchemy import true
+    return column.in_(user_ids) if user_ids is not None else true()
+
+
+def _holdings(session, user_ids):
+    """{user_id: [(sector or None, ticker or None, is_small, rows, cost, fractional rows)]}"""
+    from sqlalchemy import and_, case, func
+    from models import Stock, StockInfo
+
+    # Same classification as calculate_portfolio_cap_percentages did per stock:
+    # market cap if known, else the stored classification; no StockInfo = large.
+    is_small = case(
+        (StockInfo.id.is_(None), False),
+        (func.coalesce(StockInfo.market_cap, 0) != 0, StockInfo.market_cap < SMALL_CAP_CEILING),
+        else_=StockInfo.cap_classification.in_(['small', 'mid']),
+    )
+    has_sector = and_(StockInfo.sector.isnot(None), StockInfo.sector != '')
+    sector = case((has_sector, StockInfo.sector), else_=None)
+    # Rows without a sector fall back per ticker (ETF / manual override map).
+    ticker = case((has_sector, None), else_=func.upper(Stock.ticker))
+    fractional = case((and_(Stock.quantity > 0,
+                            func.abs(Stock.quantity - func.round(Stock.quantity)) > FRACTIONAL_TOLERANCE), 1),
+                      else_=0)
+    query = session.query(
+        Stock.user_id, sector, ticker, is_small,
+        func.count(Stock.id),
+        func.sum(func.coalesce(Stock.quantity, 0) * func.coalesce(Stock.purchase_price, 0)),
+        func.sum(fractional),
+    ).outerjoin(StockInfo, StockInfo.ticker == func.upper(Stock.ticker)).filter(
+        _in(Stock.user_id, user_ids)
+    ).group_by(Stock.user_id, sector, ticker, is_small)
+    groups = {}
+    for uid, sec, tick, small, rows, cost, frac in query:
+        groups.setdefault(uid, []).append((sec, tick, bool(small), rows, float(cost or 0), frac or 0))
+    return groups
+
+
+def _latest_values(session, user_ids):
+    """{user_id: total_value of the latest PortfolioSnapshot}"""
+    from sqlalchemy import func
+    from models import PortfolioSnapshot as PS
+    latest = session.query(PS.user_id, func.max(PS.date).label('date')).filter(
+        _in(PS.user_id, user_ids)).group_by(PS.user_id).subquery()
+    return {uid: value for uid, value in session.query(PS.user_id, PS.total_value).join(
+        latest, (latest.c.user_id == PS.user_id) & (latest.c.date == PS.date))}
+
+
+def _trade_counts(session, user_ids, since):
+    """{user_id: (total trades, trades since `since`)}"""
+    from sqlalchemy import case, func
+    from models import Transaction
+    recent = func.sum(case((Transaction.timestamp >= since, 1), else_=0))
+    return {uid: (total, int(n or 0)) for uid, total, n in session.query(
+        Transaction.user_id, func.count(Transaction.id), recent
+    ).filter(_in(Transaction.user_id, user_ids)).group_by(Transaction.user_id)}
+
+
+def _subscriber_counts(session, user_ids):
+    """{user_id: active legacy web + mobile subscriptions + gifted subs}"""
+    from sqlalchemy import func
+    from models import Subscription
+    import subscriber_counts
+    counts = {uid: n for uid, n in session.query(Subscription.subscribed_to_id, func.count(Subscription.id))
+              .filter(Subscription.status == 'active', _in(Subscription.subscribed_to_id, user_ids))
+              .group_by(Subscription.subscribed_to_id)}
+    current = subscriber_counts.get_all() if user_ids is None else subscriber_counts.get_many(user_ids)
+    for uid, c in current.items():
+        counts[uid] = counts.get(uid, 0) + c.total
+    return counts
+
+
+def _mix(groups, total_value):
+    """(small_cap_percent, large_cap_percent, industry_mix) for one user's holdings."""
+    from stock_metadata_utils import normalize_sector_name, get_etf_sector_fallback
+    if not groups or not total_value:
+        return 0.0, 0.0, {}
+    total_cost = sum(cost for *_, cost, _frac in groups)
+    if total_cost <= 0:
+        return 0.0, 0.0, {}
+    small = large = 0.0
+    sectors = {}
+    for sector, ticker, is_small, _rows, cost, _frac in groups:
+        value = cost / total_cost * total_value
+        if is_small:
+            small += value
+        else:
+            large += value
+        name = normalize_sector_name(sector) if sector else (get_etf_sector_fallback(ticker) or 'Other')
+        sectors[name] = sectors.get(name, 0) + value
+    industry = {name: round(value / total_value * 100, 1) for name, value in sectors.items()}
+    return (round(small / total_value * 100, 2), round(large / total_value * 100, 2),
+            dict(sorted(industry.items(), key=lambda x: x[1], reverse=True)))
+
+
+def compute(user_ids=None, session=None, now=None):
+    """
+    Portfolio stats for `user_ids` (every user if None), as
+    {user_id: stats dict} with the keys calculate_user_portfolio_stats returned.
+    """
+    from models import db, User
+    session = session or db.session
+    if user_ids is not None:
+        user_ids = sorted({uid for uid in user_ids if uid is not None})
+        if not user_ids:
+            return {}
+    everyone = user_ids if user_ids is not None else [uid for (uid,) in session.query(User.id)]
+    since = (now or datetime.now()) - timedelta(days=RECENT_TRADE_DAYS)
+
+    holdings = _holdings(session, user_ids)
+    values = _latest_values(session, user_ids)
+    trades = _trade_counts(session, user_ids, since)
+    subscribers = _subscriber_counts(session, user_ids)
+
+    updated = datetime.utcnow()
+    stats = {}
+    for uid in everyone:
+        groups = holdings.get(uid, [])
+        total_trades, recent = trades.get(uid, (0, 0))
+        small, large, industry = _mix(groups, values.get(uid))
+        stats[uid] = {
+            'unique_stocks_count': sum(rows for *_, rows, _cost, _frac in groups),
+            'has_fractional_holdings': any(frac for *_, frac in groups),
+            'total_trades': total_trades,
+            'avg_trades_per_week': round(recent / RECENT_TRADE_DAYS * 7, 2),
+            'small_cap_percent': small,
+            'large_cap_percent': large,
+            'industry_mix': industry,
+            'subscriber_count': subscribers.get(uid, 0),
+            'last_updated': updated,
+        }
+    return stats
+
+
+def write(stats, session=None):
+    """Upsert `stats` ({user_id: stats dict}) into user_portfolio_stats in
+    chunked multi-row statements. Does not commit. Returns rows written."""
+    from models import db, UserPortfolioStats
+    session = session or db.session
+    if not stats:
+        return 0
+    table = UserPortfolioStats.__table__
+    rows = [{'user_id': uid, **{f: s[f] for f in FIELDS}} for uid, s in sorted(stats.items())]
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for uid, s in stats.items():
+            row = UserPortfolioStats.query.filter_by(user_id=uid).first()
+            if row is None:
+                row = UserPortfolioStats(user_id=uid)
+                session.add(row)
+            for field in FIELDS:
+                setattr(row, field, s[field])
+        return len(rows)
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id'], set_={f: stmt.excluded[f] for f in FIELDS})
+        session.execute(stmt, rows[start:start + UPSERT_CHUNK])
+    return len(rows)
+
+
+def update_all(user_ids=None, session=None):
+    """compute() + write() for `user_ids` (every user if None). Returns rows written."""
+    return write(compute(user_ids, session=session), session=session)
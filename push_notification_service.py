@@ -29,6 +29,8 @@ except ImportError:
     firebase_admin = None
     messaging = None
 
+from perf_tracing import span
+
 logger = logging.getLogger(__name__)
 
 
@@ -275,7 +277,8 @@ class PushNotificationService:
                 )
             )
             
-            response = messaging.send(message)
+            with span('fcm_send', kind='fcm'):
+                response = messaging.send(message)
             logger.info(f"Successfully sent message: {response}")
             return {'success_count': 1, 'failure_count': 0, 'failed_tokens': [], 'message_id': response}
             
@@ -332,7 +335,8 @@ class PushNotificationService:
                     )
                 )
                 
-                response = messaging.send_each_for_multicast(message)
+                with span('fcm_multicast', kind='fcm'):
+                    response = messaging.send_each_for_multicast(message)
                 total_success += response.success_count
                 total_failure += response.failure_count
                 
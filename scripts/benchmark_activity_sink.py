@@ -0,0 +1,142 @@
+"""Per-request cost of activity bookkeeping, per-event commits vs activity_sink.
+
+Simulates N requests from N distinct users, each logging its daily
+'mobile_active' ping and one page view, two ways:
+
+  * commit: the old path, a SELECT + INSERT + COMMIT for the DAU row and an
+    INSERT + COMMIT for the page view on the request's session;
+  * buffered: activity_sink.mark_active() / record_page_view(), with the
+    bulk flush at the end of each request timed separately.
+
+    python scripts/benchmark_activity_sink.py                     # SQLite file in a temp dir
+    python scripts/benchmark_activity_sink.py --database-url postgresql://localhost/apes_bench
+    python scripts/benchmark_activity_sink.py --requests 2000 --json
+
+The target database gets the app's tables (db.create_all()); the benchmark
+deletes the rows it wrote afterwards.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_PAGE = '/bench-activity'
+
+
+def make_app(url):
+    from flask import Flask
+    from models import db
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def commit_per_event(user_id):
+    """The pre-buffering request path (mobile_api._log_mobile_active + track_pageview)."""
+    from models import db, UserActivity, PageView
+    day_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    exists = db.session.query(UserActivity.id).filter(
+        UserActivity.user_id == user_id,
+        UserActivity.activity_type == 'mobile_active',
+        UserActivity.timestamp >= day_start,
+    ).first()
+    if not exists:
+        db.session.add(UserActivity(user_id=user_id, activity_type='mobile_active'))
+        db.session.commit()
+    db.session.add(PageView(page=BENCH_PAGE))
+    db.session.commit()
+
+
+def buffered(user_id):
+    import activity_sink
+    activity_sink.mark_active(user_id)
+    activity_sink.record_page_view(page=BENCH_PAGE)
+
+
+def measure(fn, user_ids, engine):
+    import activity_sink
+    import perf_tracing
+    timings, statements, flush_ms, flushes = [], 0, 0.0, 0
+    for user_id in user_ids:
+        with perf_tracing.capture('request') as trace:
+            t0 = time.perf_counter()
+            fn(user_id)
+            timings.append((time.perf_counter() - t0) * 1000)
+        statements += trace.query_count
+        if activity_sink.buffer.pending():   # what teardown_request does
+            t0 = time.perf_counter()
+            activity_sink.flush(engine)
+            flush_ms += (time.perf_counter() - t0) * 1000
+            flushes += 1
+    if activity_sink.buffer.pending():
+        t0 = time.perf_counter()
+        activity_sink.flush(engine)
+        flush_ms += (time.perf_counter() - t0) * 1000
+        flushes += 1
+    return {
+        'request_p50_us': round(statistics.median(timings) * 1000, 1),
+        'request_p95_us': round(perf_tracing.percentile(timings, 95) * 1000, 1),
+        'request_statements': statements,
+        'after_response_flushes': flushes,
+        'after_response_ms_per_event': round(flush_ms / (2 * len(user_ids)), 3) if flushes else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    import activity_sink
+    from models import db, User, UserActivity, PageView
+
+    url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'activity.db')
+    app = make_app(url)
+    # As in api/index.py: flushes happen after the response, not inline.
+    activity_sink.init_app(app, engine_getter=lambda: db.engine)
+    report = {'requests': args.requests, 'flush_every': activity_sink.FLUSH_EVERY, 'modes': {}}
+    with app.app_context():
+        db.create_all()
+        report['database'] = db.engine.dialect.name
+        tag = f'bench-activity-{int(time.time())}'
+        users = [User(email=f'{tag}-{i}@example.com', username=f'{tag}-{i}', password_hash='x')
+                 for i in range(2 * args.requests)]
+        db.session.add_all(users)
+        db.session.commit()
+        ids = [u.id for u in users]
+        try:
+            activity_sink.reset()
+            report['modes']['commit'] = measure(commit_per_event, ids[:args.requests], db.engine)
+            activity_sink.reset()
+            report['modes']['buffered'] = measure(buffered, ids[args.requests:], db.engine)
+        finally:
+            UserActivity.query.filter(UserActivity.user_id.in_(ids)).delete(synchronize_session=False)
+            PageView.query.filter(PageView.page == BENCH_PAGE).delete(synchronize_session=False)
+            User.query.filter(User.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{report['database']}, {args.requests} requests, flush every {report['flush_every']} events")
+    print(f"{'mode':9s} {'p50 us':>9s} {'p95 us':>9s} {'stmts':>7s} {'flushes':>8s} {'flush ms/event':>15s}")
+    for name, r in report['modes'].items():
+        print(f"{name:9s} {r['request_p50_us']:>9.1f} {r['request_p95_us']:>9.1f} {r['request_statements']:>7d} "
+              f"{r['after_response_flushes']:>8d} {r['after_response_ms_per_event']:>15.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Per-notification CPU cost of Apple JWS verification, with and without the verified-chain cache.
+
+Builds a synthetic P-256 root -> intermediate -> leaf chain (the shape Apple
+uses), signs N distinct payloads with the leaf, and verifies each through
+
+  * apple_jws_verifier.verify_and_decode   (StoreKit 2 transactions), and
+  * iap_webhooks.verify_apple_jws          (App Store Server Notifications),
+
+once with the chain cache cleared before every call (the pre-cache cost:
+parse x5c, verify every link, pin the root) and once warm (repeat chain:
+cache hit + leaf ES256 signature only). CPU time is time.process_time().
+
+    python scripts/benchmark_apple_jws.py
+    python scripts/benchmark_apple_jws.py --notifications 5000 --json
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_chain():
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    def cert(cn, key, issuer_key, issuer_cn, ca=True):
+        now = datetime.now(timezone.utc)
+        return (x509.CertificateBuilder()
+                .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)]))
+                .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer_cn)]))
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - timedelta(days=1))
+                .not_valid_after(now + timedelta(days=365))
+                .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+                .sign(private_key=issuer_key, algorithm=hashes.SHA256()))
+
+    root_key, int_key, leaf_key = (ec.generate_private_key(ec.SECP256R1()) for _ in range(3))
+    root = cert('Bench Root CA - G3', root_key, root_key, 'Bench Root CA - G3')
+    intermediate = cert('Bench WWDR', int_key, root_key, 'Bench Root CA - G3')
+    leaf = cert('Bench Leaf', leaf_key, int_key, 'Bench WWDR', ca=False)
+    return leaf_key, [leaf, intermediate, root]
+
+
+def measure(verify, tokens, cold):
+    import apple_jws_verifier
+    apple_jws_verifier.reset_chain_cache()
+    samples = []
+    for token in tokens:
+        if cold:
+            apple_jws_verifier.reset_chain_cache()
+        t0 = time.process_time()
+        verify(token)
+        samples.append((time.process_time() - t0) * 1e6)
+    return {'mean_us': round(statistics.fmean(samples), 1),
+            'p50_us': round(statistics.median(samples), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notifications', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    import jwt
+    from cryptography.hazmat.primitives import serialization
+
+    leaf_key, chain = build_chain()
+    x5c = [base64.b64encode(c.public_bytes(serialization.Encoding.DER)).decode() for c in chain]
+    root_path = os.path.join(tempfile.mkdtemp(), 'root.cer')
+    with open(root_path, 'wb') as f:
+        f.write(chain[-1].public_bytes(serialization.Encoding.DER))
+    os.environ['APPLE_ROOT_CA_PATH'] = root_path
+    os.environ['APPLE_ROOT_CA_G3_PEM'] = chain[-1].public_bytes(serialization.Encoding.PEM).decode()
+
+    import apple_jws_verifier
+    import iap_webhooks
+    apple_jws_verifier.reset_root_cache()
+    tokens = [jwt.encode({'transactionId': str(i), 'productId': 'com.apestogether.sub.s01.monthly'},
+                         key=leaf_key, algorithm='ES256', headers={'x5c': x5c})
+              for i in range(args.notifications)]
+
+    report = {'notifications': args.notifications, 'paths': {}}
+    for name, verify in (('verify_and_decode', apple_jws_verifier.verify_and_decode),
+                         ('verify_apple_jws', iap_webhooks.verify_apple_jws)):
+        cold = measure(verify, tokens, cold=True)
+        warm = measure(verify, tokens, cold=False)
+        report['paths'][name] = {'uncached': cold, 'cached': warm,
+                                 'speedup': round(cold['mean_us'] / warm['mean_us'], 2)}
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{args.notifications} notifications, CPU microseconds per verification")
+    print(f"{'path':20s} {'uncached mean':>14s} {'cached mean':>12s} {'p50 before':>11s} {'p50 after':>10s} {'speedup':>8s}")
+    for name, r in report['paths'].items():
+        print(f"{name:20s} {r['uncached']['mean_us']:>14.1f} {r['cached']['mean_us']:>12.1f} "
+              f"{r['uncached']['p50_us']:>11.1f} {r['cached']['p50_us']:>10.1f} {r['speedup']:>7.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
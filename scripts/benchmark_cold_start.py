@@ -0,0 +1,97 @@
+"""Cold-start benchmark for the serverless entry point.
+
+Each run is a fresh interpreter (what a cold Vercel instance is) that imports
+the app like api/vercel.py and serves one request through the test client.
+Reports import time, first-request time and their sum per APP_STARTUP_MODE:
+
+    python scripts/benchmark_cold_start.py                          # 10 runs/mode
+    python scripts/benchmark_cold_start.py --runs 20 --path /api/mobile/health
+    python scripts/benchmark_cold_start.py --mode mobile --json
+
+The default path needs no auth or database. Runs alternate between modes so
+background noise hits both equally. Profile where the time goes with
+scripts/profile_imports.py.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {api!r}); sys.path.insert(0, {root!r})
+from index import app
+t1 = time.perf_counter()
+status = app.test_client().get({path!r}).status_code
+t2 = time.perf_counter()
+print(json.dumps({{'import_ms': (t1 - t0) * 1000, 'first_request_ms': (t2 - t1) * 1000,
+                   'status': status, 'rules': len(list(app.url_map.iter_rules()))}}))
+'''
+
+
+def run_once(mode, path):
+    code = CHILD.format(api=os.path.join(ROOT, 'api'), root=ROOT, path=path)
+    env = dict(os.environ, APP_STARTUP_MODE=mode)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f'run failed in mode={mode}:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def pct(values, p):
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(samples):
+    out = {}
+    for key in ('import_ms', 'first_request_ms', 'total_ms'):
+        values = [s[key] for s in samples]
+        out[key] = {'p50': round(statistics.median(values), 1),
+                    'p95': round(pct(values, 95), 1),
+                    'min': round(min(values), 1)}
+    out['rules_at_first_request'] = samples[0]['rules']
+    out['statuses'] = sorted({s['status'] for s in samples})
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('full', 'mobile', 'both'), default='both')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/mobile/health')
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    modes = ('full', 'mobile') if args.mode == 'both' else (args.mode,)
+    run_once(modes[0], args.path)  # warm the bytecode cache, not measured
+    samples = {m: [] for m in modes}
+    for _ in range(args.runs):
+        for mode in modes:
+            s = run_once(mode, args.path)
+            s['total_ms'] = s['import_ms'] + s['first_request_ms']
+            samples[mode].append(s)
+
+    report = {mode: summarize(s) for mode, s in samples.items()}
+    if args.json:
+        json.dump({'path': args.path, 'runs': args.runs, 'modes': report}, sys.stdout, indent=2)
+        print()
+        return 0
+
+    print(f'{args.runs} cold starts per mode, first request GET {args.path}')
+    print(f'{"mode":8s} {"import p50/p95":>18s} {"1st req p50/p95":>18s} {"total p50/p95":>18s} {"rules":>6s}')
+    for mode, r in report.items():
+        cols = [f'{r[k]["p50"]:.0f}/{r[k]["p95"]:.0f} ms' for k in ('import_ms', 'first_request_ms', 'total_ms')]
+        print(f'{mode:8s} {cols[0]:>18s} {cols[1]:>18s} {cols[2]:>18s} {r["rules_at_first_request"]:>6d}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
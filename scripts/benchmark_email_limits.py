@@ -0,0 +1,105 @@
+"""Per-send overhead of the shared email limiter (services/email_limits.py).
+
+Reserves sends in batches of 1, 10, 100 and 1,000 recipients against the
+database-backed store and the in-memory one, and reports time per
+reservation, amortized time per send, and SQL statements per reservation:
+
+    python scripts/benchmark_email_limits.py                     # SQLite file in a temp dir
+    python scripts/benchmark_email_limits.py --database-url postgresql://localhost/apes_bench
+    python scripts/benchmark_email_limits.py --reps 200 --json
+
+The target database only needs the two tables from
+scripts/migrations/2026_10_20_email_send_limits.sql (created if missing);
+the benchmark deletes its own counter rows afterwards. On Postgres each
+reservation is one statement regardless of batch size.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MIGRATION = os.path.join(ROOT, 'scripts', 'migrations', '2026_10_20_email_send_limits.sql')
+BATCH_SIZES = (1, 10, 100, 1000)
+
+
+def create_tables(engine):
+    from sqlalchemy import text
+    with open(MIGRATION) as f:
+        sql = '\n'.join(line.split('--')[0] for line in f)
+    statements = [s for s in sql.split(';') if s.strip()]
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def measure(store, batch, reps, run_id):
+    import perf_tracing
+    timings, statements = [], []
+    for rep in range(reps):
+        recipients = [f'bench-{run_id}-{rep}-{i}@example.com' for i in range(batch)]
+        with perf_tracing.capture('reserve') as trace:
+            t0 = time.perf_counter()
+            result = store.reserve(recipients)
+            timings.append((time.perf_counter() - t0) * 1000)
+        statements.append(trace.query_count)
+        assert len(result['allowed']) == batch, result
+    p50 = statistics.median(timings)
+    return {
+        'batch': batch,
+        'reservation_p50_ms': round(p50, 3),
+        'reservation_p95_ms': round(perf_tracing.percentile(timings, 95), 3),
+        'per_send_us': round(p50 * 1000 / batch, 1),
+        'statements_per_reservation': max(statements),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--reps', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine, text
+    from services import email_limits
+
+    email_limits.MAX_EMAILS_PER_HOUR_GLOBAL = 10 ** 9
+    url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'email_limits.db')
+    engine = create_engine(url)
+    create_tables(engine)
+
+    report = {'database': engine.dialect.name, 'reps': args.reps, 'stores': {}}
+    run_id = int(time.time())
+    try:
+        for name, store in (('db', email_limits.DbLimitStore(lambda: engine)),
+                            ('memory', email_limits.MemoryLimitStore())):
+            store.reserve(['warmup@example.com'])
+            report['stores'][name] = [measure(store, b, args.reps, run_id) for b in BATCH_SIZES]
+            if name == 'db' and store.disabled:
+                raise SystemExit('db store fell back to memory; are the tables there?')
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM email_send_counter WHERE counter_key LIKE 'rcpt:%' "
+                              "OR counter_key = :g"), {'g': email_limits.GLOBAL_KEY})
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{report['database']}, {args.reps} reservations per batch size")
+    print(f"{'store':8s} {'batch':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'us/send':>9s} {'stmts':>6s}")
+    for name, rows in report['stores'].items():
+        for r in rows:
+            print(f"{name:8s} {r['batch']:>6d} {r['reservation_p50_ms']:>9.3f} {r['reservation_p95_ms']:>9.3f} "
+                  f"{r['per_send_us']:>9.1f} {r['statements_per_reservation']:>6d}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
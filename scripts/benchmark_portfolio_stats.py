@@ -0,0 +1,162 @@
+"""Market-close PHASE 2.25 (portfolio stats) runtime, per-user loop vs set-based engine.
+
+Seeds N users with holdings across a StockInfo universe, a transaction history,
+portfolio snapshots and some subscriptions, then times:
+
+  * per-user: the pre-engine phase (per user: load every Stock and
+    Transaction row, cap % and industry mix with their own snapshot +
+    StockInfo queries, subscriber COUNTs, UserPortfolioStats lookup and ORM
+    write). Timed on a sample of users and extrapolated to N;
+  * set-based: portfolio_stats.compute() + write() for all N users.
+
+The market-close cron runs inside the 60 s Vercel function limit, with the
+snapshot and leaderboard phases ahead of this one.
+
+    python scripts/benchmark_portfolio_stats.py                         # 1k, 10k, 50k users, SQLite
+    python scripts/benchmark_portfolio_stats.py --sizes 1000 --legacy-sample 1000
+    python scripts/benchmark_portfolio_stats.py --database-url postgresql://localhost/apes_bench --json
+
+The database must be empty and disposable (tables are created and dropped).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+SECTORS = ['Technology', 'Healthcare', 'Financial Services', 'Energy', 'Utilities',
+           'Consumer Cyclical', 'Industrials', 'Real Estate', '']
+
+
+def seed(engine, users, rng, tickers=500, stocks_per_user=8, trades_per_user=12):
+    """Core bulk inserts (no ORM flushes), then one subscriber-counter reconcile."""
+    from sqlalchemy import insert
+    from models import (User, Stock, StockInfo, Transaction, PortfolioSnapshot,
+                        MobileSubscription, AdminSubscription)
+    import subscriber_counts
+    universe = [f'T{i:03d}' for i in range(tickers)]
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(StockInfo.__table__), [
+            {'ticker': t, 'sector': rng.choice(SECTORS),
+             'market_cap': rng.choice([None, rng.randint(10 ** 8, 10 ** 12)]),
+             'cap_classification': rng.choice(['small', 'mid', 'large'])}
+            for t in universe[:int(tickers * 0.9)]])
+        for start in range(1, users + 1, 5000):
+            ids = range(start, min(start + 5000, users + 1))
+            conn.execute(insert(User.__table__), [
+                {'id': i, 'email': f'bench{i}@example.com', 'username': f'bench{i}'} for i in ids])
+            conn.execute(insert(Stock.__table__), [
+                {'user_id': i, 'ticker': t, 'purchase_price': rng.uniform(5, 500),
+                 'quantity': rng.choice([rng.randint(1, 50), round(rng.uniform(0.1, 20), 3)])}
+                for i in ids for t in rng.sample(universe, rng.randint(0, stocks_per_user))])
+            conn.execute(insert(Transaction.__table__), [
+                {'user_id': i, 'ticker': rng.choice(universe), 'quantity': 1, 'price': 10.0,
+                 'transaction_type': 'buy', 'timestamp': now - timedelta(days=rng.randint(0, 90))}
+                for i in ids for _ in range(rng.randint(0, trades_per_user * 2))])
+            conn.execute(insert(PortfolioSnapshot.__table__), [
+                {'user_id': i, 'date': date.today() - timedelta(days=d), 'total_value': rng.uniform(1e3, 1e5)}
+                for i in ids for d in (0, 1)])
+        conn.execute(insert(MobileSubscription.__table__), [
+            {'subscriber_id': rng.randint(1, users), 'subscribed_to_id': rng.randint(1, max(1, users // 20)),
+             'in_app_purchase_id': 1, 'status': 'active'} for _ in range(users // 2)])
+        conn.execute(insert(AdminSubscription.__table__), [
+            {'portfolio_user_id': rng.randint(1, users), 'bonus_subscriber_count': rng.randint(1, 5)}
+            for _ in range(users // 50)])
+    subscriber_counts.reconcile(engine)
+
+
+def legacy_user_stats(user_id):
+    """The per-user phase body as it ran before portfolio_stats (one user)."""
+    from models import (db, Stock, Transaction, Subscription, MobileSubscription,
+                        AdminSubscription, UserPortfolioStats)
+    from leaderboard_utils import calculate_industry_mix, calculate_portfolio_cap_percentages
+    stocks = Stock.query.filter_by(user_id=user_id).all()
+    transactions = Transaction.query.filter_by(user_id=user_id).all()
+    cutoff = datetime.now() - timedelta(days=14)
+    small, large = calculate_portfolio_cap_percentages(user_id)
+    mix = calculate_industry_mix(user_id)
+    subs = Subscription.query.filter_by(subscribed_to_id=user_id, status='active').count()
+    subs += MobileSubscription.query.filter_by(subscribed_to_id=user_id, status='active').count()
+    admin = AdminSubscription.query.filter_by(portfolio_user_id=user_id).first()
+    subs += (admin.bonus_subscriber_count or 0) if admin else 0
+    row = UserPortfolioStats.query.filter_by(user_id=user_id).first()
+    if not row:
+        row = UserPortfolioStats(user_id=user_id)
+        db.session.add(row)
+    row.unique_stocks_count = len(stocks)
+    row.total_trades = len(transactions)
+    row.avg_trades_per_week = round(len([t for t in transactions if t.timestamp >= cutoff]) / 2, 2)
+    row.small_cap_percent, row.large_cap_percent, row.industry_mix = small, large, mix
+    row.subscriber_count = subs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='comma-separated user counts')
+    parser.add_argument('--legacy-sample', type=int, default=300, help='users timed on the per-user path')
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    import query_budget
+    import perf_tracing
+    import portfolio_stats
+    from models import db
+
+    report = {'sizes': {}}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stats.db')
+        app = query_budget.make_app(url)
+        with app.app_context():
+            db.create_all()
+            try:
+                report['database'] = db.engine.dialect.name
+                seed(db.engine, size, random.Random(size))
+
+                sample = random.Random(0).sample(range(1, size + 1), min(args.legacy_sample, size))
+                with perf_tracing.capture('legacy') as trace:
+                    t0 = time.perf_counter()
+                    for uid in sample:
+                        legacy_user_stats(uid)
+                    db.session.commit()
+                    elapsed = time.perf_counter() - t0
+                legacy = {'seconds': round(elapsed / len(sample) * size, 2),
+                          'statements': round(trace.query_count / len(sample) * size),
+                          'extrapolated_from': len(sample)}
+                db.session.remove()
+
+                with perf_tracing.capture('set') as trace:
+                    t0 = time.perf_counter()
+                    written = portfolio_stats.update_all()
+                    db.session.commit()
+                    elapsed = time.perf_counter() - t0
+                assert written == size, written
+                report['sizes'][size] = {'per_user': legacy,
+                                         'set_based': {'seconds': round(elapsed, 2),
+                                                       'statements': trace.query_count}}
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{report['database']}: PHASE 2.25 for all users (per-user path extrapolated from a sample)")
+    print(f"{'users':>7s} {'per-user s':>11s} {'stmts':>9s} {'set-based s':>12s} {'stmts':>6s}")
+    for size, r in report['sizes'].items():
+        print(f"{size:>7d} {r['per_user']['seconds']:>11.2f} {r['per_user']['statements']:>9d} "
+              f"{r['set_based']['seconds']:>12.2f} {r['set_based']['statements']:>6d}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
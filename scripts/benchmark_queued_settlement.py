@@ -0,0 +1,136 @@
+"""Market-open settlement of a queued after-hours backlog, per-trade loop vs batch engine.
+
+Seeds users with holdings and a backlog of queued buys/sells, then settles it
+two ways on fresh copies of the same data:
+
+  * per-trade: the pre-engine loop (per trade: User + Stock lookups,
+    process_transaction under its own row lock, one commit). Notifications
+    are off in both modes, so this is a lower bound for the old path, which
+    also ran the subscriber fan-out inline;
+  * batch: services.trade_settlement.settle_queued_trades (one transaction
+    and lock per user, one multi-row ledger insert, notifications after).
+
+    python scripts/benchmark_queued_settlement.py                      # 5,000 trades over 500 users
+    python scripts/benchmark_queued_settlement.py --trades 20000 --users 2000 --json
+
+The database must be empty and disposable (tables are created and dropped).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+TICKERS = [f'T{i:02d}' for i in range(60)]
+
+
+def seed(engine, users, trades, rng):
+    from sqlalchemy import insert
+    from models import User, Stock, QueuedEmailTrade
+    start = datetime.utcnow() - timedelta(hours=14)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'id': i, 'email': f'bench{i}@example.com', 'username': f'bench{i}',
+             'max_cash_deployed': 0.0, 'cash_proceeds': 0.0} for i in range(1, users + 1)])
+        conn.execute(insert(Stock.__table__), [
+            {'user_id': i, 'ticker': t, 'quantity': 50, 'purchase_price': 20.0}
+            for i in range(1, users + 1) for t in rng.sample(TICKERS, 5)])
+        conn.execute(insert(QueuedEmailTrade.__table__), [
+            {'user_id': rng.randint(1, users), 'user_email': 'bench@example.com', 'ticker': rng.choice(TICKERS),
+             'action': rng.choice(['buy', 'sell']), 'quantity': rng.randint(1, 5), 'status': 'queued',
+             'queued_at': start + timedelta(seconds=n)} for n in range(trades)])
+
+
+def per_trade(prices):
+    """The settle loop as it ran before the batch engine (notifications off)."""
+    from models import db, QueuedEmailTrade, User, Stock
+    from cash_tracking import process_transaction
+    for qt in QueuedEmailTrade.query.filter_by(status='queued').all():
+        price = prices[qt.ticker]
+        try:
+            User.query.get(qt.user_id)
+            existing = Stock.query.filter_by(user_id=qt.user_id, ticker=qt.ticker).first()
+            position_before_qty = existing.quantity if existing and qt.action == 'sell' else None
+            if qt.action == 'sell':
+                if not existing or existing.quantity < qt.quantity:
+                    raise ValueError('Insufficient shares')
+                existing.quantity -= qt.quantity
+                if existing.quantity == 0:
+                    db.session.delete(existing)
+            elif existing:
+                total_cost = existing.purchase_price * existing.quantity + price * qt.quantity
+                existing.quantity += qt.quantity
+                existing.purchase_price = total_cost / existing.quantity
+            else:
+                db.session.add(Stock(ticker=qt.ticker, quantity=qt.quantity, purchase_price=price,
+                                     user_id=qt.user_id))
+            process_transaction(db, qt.user_id, qt.ticker, qt.quantity, price, qt.action,
+                                timestamp=datetime.utcnow(), price_source='queued_email',
+                                position_before_qty=position_before_qty, suppress_notifications=True)
+            qt.status = 'executed'
+            qt.executed_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            qt.status = 'failed'
+            qt.error_message = str(e)
+            db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--trades', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    import query_budget
+    import perf_tracing
+    from models import db, QueuedEmailTrade
+    from services.trade_settlement import settle_queued_trades
+
+    prices = {t: 20.0 + i for i, t in enumerate(TICKERS)}
+    report = {'trades': args.trades, 'users': args.users, 'modes': {}}
+    for mode in ('per_trade', 'batch'):
+        url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'settle.db')
+        app = query_budget.make_app(url)
+        with app.app_context():
+            db.create_all()
+            try:
+                report['database'] = db.engine.dialect.name
+                seed(db.engine, args.users, args.trades, random.Random(args.trades))
+                with perf_tracing.capture(mode) as trace:
+                    t0 = time.perf_counter()
+                    if mode == 'batch':
+                        settle_queued_trades(prices=prices, send_notifications=False)
+                    else:
+                        per_trade(prices)
+                    elapsed = time.perf_counter() - t0
+                executed = QueuedEmailTrade.query.filter_by(status='executed').count()
+                report['modes'][mode] = {'seconds': round(elapsed, 2), 'statements': trace.query_count,
+                                         'executed': executed}
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{report['database']}: {args.trades} queued trades over {args.users} users")
+    print(f"{'mode':10s} {'seconds':>8s} {'stmts':>7s} {'executed':>9s}")
+    for mode, r in report['modes'].items():
+        print(f"{mode:10s} {r['seconds']:>8.2f} {r['statements']:>7d} {r['executed']:>9d}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""GET /api/mobile/top-influencers latency, per-request aggregate vs materialized ranking.
+
+Seeds creators with portfolio stats and N active subscriptions spread over
+them (plus some gifted subs), then times the endpoint two ways:
+
+  * aggregate: the pre-ranking path (GROUP BY over every active subscription,
+    every creator's User + stats loaded, filtered and sorted in Python), which
+    the endpoint still uses until the influencer_ranking table exists;
+  * ranking: the influencer_ranking index range scan.
+
+    python scripts/benchmark_top_influencers.py                          # 10k and 100k subs, SQLite
+    python scripts/benchmark_top_influencers.py --sizes 100000 --creators 5000
+    python scripts/benchmark_top_influencers.py --database-url postgresql://localhost/apes_bench --json
+
+The database must be empty and disposable (tables are created and dropped).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+SECTORS = ['Technology', 'Healthcare', 'Financial Services', 'Energy', 'Utilities',
+           'Consumer Cyclical', 'Industrials', 'Real Estate']
+QUERIES = ['limit=20', 'industry=Technology&limit=20', 'industry=Energy&limit=50&hide_fractional=1']
+
+
+def seed(engine, creators, subscriptions, rng):
+    """Core bulk inserts (no ORM flushes), then one ranking rebuild."""
+    from sqlalchemy import insert
+    from models import User, UserPortfolioStats, MobileSubscription, AdminSubscription
+    import influencer_ranking
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'id': i, 'email': f'bench{i}@example.com', 'username': f'bench{i}'} for i in range(1, creators + 1)])
+        conn.execute(insert(UserPortfolioStats.__table__), [
+            {'user_id': i, 'unique_stocks_count': rng.randint(1, 30), 'avg_trades_per_week': rng.random() * 10,
+             'has_fractional_holdings': rng.random() < 0.2,
+             'industry_mix': {s: round(rng.uniform(5, 60), 1) for s in rng.sample(SECTORS, 3)}}
+            for i in range(1, creators + 1)])
+        # Skewed popularity: a few creators hold most subscriptions.
+        weights = [1.0 / (rank + 1) for rank in range(creators)]
+        targets = rng.choices(range(1, creators + 1), weights=weights, k=subscriptions)
+        for start in range(0, subscriptions, 10000):
+            conn.execute(insert(MobileSubscription.__table__), [
+                {'subscriber_id': rng.randint(1, creators), 'subscribed_to_id': t, 'in_app_purchase_id': 1,
+                 'status': 'active' if rng.random() < 0.9 else 'canceled'}
+                for t in targets[start:start + 10000]])
+        conn.execute(insert(AdminSubscription.__table__), [
+            {'portfolio_user_id': rng.randint(1, creators), 'bonus_subscriber_count': rng.randint(1, 5)}
+            for _ in range(creators // 10)])
+    influencer_ranking.rebuild(engine)
+
+
+def measure(client, headers, repeat):
+    import perf_tracing
+    timings, statements = [], 0
+    for _ in range(repeat):
+        for qs in QUERIES:
+            with perf_tracing.capture('top') as trace:
+                t0 = time.perf_counter()
+                resp = client.get(f'/api/mobile/top-influencers?{qs}', headers=headers)
+                timings.append((time.perf_counter() - t0) * 1000)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+            statements = max(statements, trace.query_count)
+    return {'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(perf_tracing.percentile(timings, 95), 2),
+            'max_statements': statements}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--sizes', default='10000,100000', help='comma-separated subscription counts')
+    parser.add_argument('--creators', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    import db_tables
+    import query_budget
+    from models import db
+    from mobile_api import generate_jwt_token
+
+    report = {'creators': args.creators, 'sizes': {}}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'ranking.db')
+        app = query_budget.make_app(url)
+        with app.app_context():
+            db.create_all()
+            try:
+                report['database'] = db.engine.dialect.name
+                seed(db.engine, args.creators, size, random.Random(size))
+                client = app.test_client()
+                headers = {'Authorization': f'Bearer {generate_jwt_token(1, "bench1@example.com")}'}
+                key = (str(db.engine.url), 'influencer_ranking')
+                db_tables._ready[key] = False
+                aggregate = measure(client, headers, args.repeat)
+                db_tables._ready[key] = True
+                ranking = measure(client, headers, args.repeat)
+                report['sizes'][size] = {'aggregate': aggregate, 'ranking': ranking}
+            finally:
+                db_tables.reset()
+                db.session.remove()
+                db.drop_all()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{report['database']}, {args.creators} creators, {len(QUERIES)} query shapes x {args.repeat}")
+    print(f"{'subs':>8s} {'mode':10s} {'p50 ms':>8s} {'p95 ms':>8s} {'stmts':>6s}")
+    for size, modes in report['sizes'].items():
+        for name, r in modes.items():
+            print(f"{size:>8d} {name:10s} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['max_statements']:>6d}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Local stand-in for SendGrid's /v3/mail/send, for offline throughput tests.
+
+Accepts mail-send requests the way SendGrid does (202 + X-Message-Id, 400 on
+more than 1,000 personalizations or a missing bearer token) after an
+optional simulated round-trip latency, and counts requests and recipients.
+
+    python scripts/fake_sendgrid.py --port 8025 --latency-ms 120
+    SENDGRID_API_BASE=http://127.0.0.1:8025 SENDGRID_API_KEY=x python ...
+
+    python scripts/fake_sendgrid.py --bench 2000 --latency-ms 120
+
+--bench starts the server in-process and sends one trade alert to N
+recipients both ways: one send_email() per recipient (the old fan-out) and
+send_bulk_email() (services/notification_utils.py).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAX_PERSONALIZATIONS = 1000
+
+
+class FakeSendGrid:
+    """ThreadingHTTPServer on 127.0.0.1 that records what it was sent."""
+
+    def __init__(self, port=0, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self.recipients = 0
+        self.rejected = 0
+        self.payloads = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'   # keep-alive, like the real API
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if fake.latency_ms:
+                    time.sleep(fake.latency_ms / 1000)
+                status, body = fake.handle(self.path, self.headers.get('Authorization', ''), raw)
+                self.send_response(status)
+                if status == 202:
+                    self.send_header('X-Message-Id', uuid.uuid4().hex[:22])
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def handle(self, path, authorization, raw):
+        if path != '/v3/mail/send':
+            return 404, b'{"errors":[{"message":"not found"}]}'
+        if not authorization.startswith('Bearer '):
+            return 401, b'{"errors":[{"message":"authorization required"}]}'
+        try:
+            payload = json.loads(raw)
+            personalizations = payload['personalizations']
+        except (ValueError, KeyError, TypeError):
+            return 400, b'{"errors":[{"message":"invalid JSON"}]}'
+        if not 1 <= len(personalizations) <= MAX_PERSONALIZATIONS:
+            with self._lock:
+                self.rejected += 1
+            return 400, b'{"errors":[{"field":"personalizations","message":"must have 1-1000 items"}]}'
+        with self._lock:
+            self.requests += 1
+            self.recipients += sum(len(p.get('to', [])) for p in personalizations)
+            self.payloads.append(payload)
+        return 202, b''
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def bench(n, latency_ms):
+    sys.path.insert(0, ROOT)
+    from services import email_limits, notification_utils as nu
+
+    email_limits.MAX_EMAILS_PER_HOUR_GLOBAL = 10 ** 9
+    recipients = [f'sub{i}@example.com' for i in range(n)]
+    subject, body, html_body = nu.build_subscriber_trade_email('bench', 'buy', 'AAPL', 10, 182.5)
+    report = {'recipients': n, 'latency_ms': latency_ms}
+
+    with FakeSendGrid(latency_ms=latency_ms) as fake:
+        os.environ['SENDGRID_API_BASE'] = fake.url
+        os.environ.setdefault('SENDGRID_API_KEY', 'fake')
+
+        email_limits.set_store(email_limits.MemoryLimitStore())
+        t0 = time.perf_counter()
+        for email in recipients:
+            nu.send_email(email, subject, body, html_body=html_body)
+        report['per_recipient'] = {'seconds': round(time.perf_counter() - t0, 2), 'requests': fake.requests}
+
+        email_limits.set_store(email_limits.MemoryLimitStore())
+        before = fake.requests
+        t0 = time.perf_counter()
+        nu.send_bulk_email(recipients, subject, body, html_body=html_body)
+        report['bulk'] = {'seconds': round(time.perf_counter() - t0, 2), 'requests': fake.requests - before}
+
+    for mode in ('per_recipient', 'bulk'):
+        r = report[mode]
+        r['emails_per_second'] = round(n / r['seconds'], 1) if r['seconds'] else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency-ms', type=float, default=0, help='simulated round trip per request')
+    parser.add_argument('--bench', type=int, metavar='N', help='benchmark a fan-out to N recipients and exit')
+    args = parser.parse_args()
+
+    if args.bench:
+        json.dump(bench(args.bench, args.latency_ms), sys.stdout, indent=2)
+        print()
+        return 0
+
+    fake = FakeSendGrid(port=args.port, latency_ms=args.latency_ms)
+    print(f'fake SendGrid listening on {fake.url} (SENDGRID_API_BASE={fake.url})')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'{fake.requests} requests, {fake.recipients} recipients, {fake.rejected} rejected')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""Load harness for the mobile API: seeded population, replayed traffic mix, scaling report.
+
+Boots the /api/mobile blueprint against a disposable database seeded with a
+synthetic population (tests/query_budget.seed: users, holdings, trades,
+daily snapshots, intraday series, S&P rows, subscriptions; plus stock
+metadata and the leaderboard caches), mints a JWT per virtual user and
+replays a weighted traffic mix from --concurrency threads, phase by phase:
+
+    open     trades at the open, portfolio refreshes, push registrations
+    browse   leaderboard browsing, portfolio and chart views, subscriptions
+
+Each thread is one virtual user running requests back to back (plus
+--think-ms) through its own in-process client, so N threads stand in for N
+concurrently busy serverless instances sharing the database. The report gives,
+per endpoint and phase: throughput, p50/p95/p99 latency, errors (5xx),
+throttled (429) and SQL statements per request; the high-water mark of
+checked-out DB connections (and, on Postgres, of pg_stat_activity); and the
+SCALING_TRIGGERS.md thresholds they are judged against.
+
+    python scripts/load_test.py                                  # SQLite temp file, 1k users, 20 threads
+    python scripts/load_test.py --database-url postgresql://localhost/apes_load \\
+        --users 10000 --concurrency 200 --phases open:30,browse:120 --out load.json
+    python scripts/load_test.py --pool-size 20                   # cap connections like the Postgres plan
+
+Prices come from the in-memory price cache (re-primed while running) and
+ALPHA_VANTAGE_API_KEY is unset, so no AlphaVantage calls are made; without
+FCM / SendGrid credentials trade fan-out stays local. --market open makes
+trades execute live instead of queueing as after-hours trades.
+
+The database must be disposable: the run refuses one that already has tables
+unless --drop-existing is given (which drops the app's tables first), and at
+the end drops only the tables it created.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+os.environ.pop('ALPHA_VANTAGE_API_KEY', None)
+
+# SCALING_TRIGGERS.md, "Scaling Decision Matrix" (current limits)
+THRESHOLDS = {'concurrent_users': 1000, 'db_connections': 20, 'p95_ms': 500}
+
+# phase -> [(scenario, weight)]
+MIXES = {
+    'open': [('trade', 40), ('portfolio', 20), ('chart', 15), ('leaderboard', 10),
+             ('device_register', 10), ('subscriptions', 5)],
+    'browse': [('leaderboard', 35), ('portfolio', 25), ('chart', 25), ('subscriptions', 8),
+               ('trade', 4), ('device_register', 3)],
+}
+CHART_PERIODS = ('1D', '5D', '1M', '3M', 'YTD')
+PRIME_EVERY_S = 5
+
+
+class VirtualUser:
+    def __init__(self, user_id, n_users, token, rng):
+        self.user_id = user_id
+        self.n_users = n_users
+        self.headers = {'Authorization': f'Bearer {token}'}
+        # Unauthenticated endpoints rate-limit by IP; give each user its own.
+        self.environ = {'REMOTE_ADDR': f'10.{user_id >> 16 & 255}.{user_id >> 8 & 255}.{user_id & 255}'}
+        self.rng = rng
+        self.bought = []
+        self.registrations = 0
+
+    def other_slug(self):
+        return f'bench{self.rng.randint(1, self.n_users)}'
+
+
+def _leaderboard(vu):
+    import query_budget
+    return 'GET', f'/api/mobile/leaderboard?period={vu.rng.choice(query_budget.LEADERBOARD_PERIODS)}', None
+
+
+def _portfolio(vu):
+    return 'GET', f'/api/mobile/portfolio/{vu.other_slug()}', None
+
+
+def _chart(vu):
+    return 'GET', f'/api/mobile/portfolio/{vu.other_slug()}/chart?period={vu.rng.choice(CHART_PERIODS)}', None
+
+
+def _subscriptions(vu):
+    return 'GET', '/api/mobile/subscriptions', None
+
+
+def _trade(vu):
+    """Alternate buys of one share with sells of an earlier buy, so holdings
+    stay bounded however long the run is."""
+    import query_budget
+    if vu.bought and vu.rng.random() < 0.5:
+        return 'POST', '/api/mobile/portfolio/trade', {'ticker': vu.bought.pop(), 'quantity': 1, 'type': 'sell'}
+    ticker = vu.rng.choice(query_budget.TICKERS)
+    vu.bought.append(ticker)
+    return 'POST', '/api/mobile/portfolio/trade', {'ticker': ticker, 'quantity': 1, 'type': 'buy'}
+
+
+def _device_register(vu):
+    vu.registrations += 1
+    return 'POST', '/api/mobile/device/register', {
+        'token': f'load-{vu.user_id}-{vu.registrations}', 'platform': vu.rng.choice(('ios', 'android')),
+        'device_id': f'load-device-{vu.user_id}', 'app_version': '1.0.0', 'os_version': 'load',
+    }
+
+
+SCENARIOS = {
+    'leaderboard': _leaderboard,
+    'portfolio': _portfolio,
+    'chart': _chart,
+    'subscriptions': _subscriptions,
+    'trade': _trade,
+    'device_register': _device_register,
+}
+
+
+class Recorder:
+    """Thread-safe per (phase, scenario) samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)     # (phase, scenario) -> [(ms, status, queries)]
+
+    def add(self, phase, scenario, ms, status, queries):
+        with self._lock:
+            self.samples[(phase, scenario)].append((ms, status, queries))
+
+
+class ConnectionGauge:
+    """High-water mark of connections checked out of the app engine's pool
+    (every pool class, NullPool included), plus a pg_stat_activity sampler on
+    its own engine when running against Postgres."""
+
+    def __init__(self, engine, database_url):
+        from sqlalchemy import event
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.high_water = 0
+        self.pg_high_water = None
+        self._pg_engine = None
+        if engine.dialect.name == 'postgresql':
+            from sqlalchemy import create_engine
+            from sqlalchemy.pool import NullPool
+            self._pg_engine = create_engine(database_url, poolclass=NullPool)
+            self.pg_high_water = 0
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def _checkout(self, *args):
+        with self._lock:
+            self.in_use += 1
+            self.high_water = max(self.high_water, self.in_use)
+
+    def _checkin(self, *args):
+        with self._lock:
+            self.in_use -= 1
+
+    def sample(self):
+        if self._pg_engine is None:
+            return
+        from sqlalchemy import text
+        try:
+            with self._pg_engine.connect() as conn:
+                n = conn.execute(text(
+                    "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")).scalar()
+            self.pg_high_water = max(self.pg_high_water, int(n) - 1)   # minus the sampler itself
+        except Exception:
+            pass
+
+
+def make_app(database_url, pool_size=None):
+    """The mobile blueprint on an engine that matches production (NullPool:
+    a fresh connection per session, index.py) unless --pool-size caps it."""
+    import query_budget
+    from sqlalchemy.pool import NullPool, QueuePool
+    if pool_size:
+        options = {'poolclass': QueuePool, 'pool_size': pool_size, 'max_overflow': 0, 'pool_timeout': 30}
+    else:
+        options = {'poolclass': NullPool}
+    if database_url.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False, 'timeout': 30}
+    return query_budget.make_app(database_url, engine_options=options)
+
+
+def seed(n_users, days, sessions, subs_per_user):
+    import query_budget
+    from models import db, StockInfo
+    from leaderboard_utils import update_leaderboard_cache
+    query_budget.seed(n_users, days=days, sessions=sessions, subs_per_user=subs_per_user)
+    # Metadata for every tradable ticker, so buys never trigger the
+    # populate_stock_info lookup.
+    db.session.execute(StockInfo.__table__.insert(), [
+        {'ticker': t, 'company_name': t, 'sector': 'Technology', 'industry': 'Software',
+         'market_cap': 50_000_000_000, 'cap_classification': 'large', 'is_active': True}
+        for t in query_budget.TICKERS
+    ])
+    db.session.commit()
+    query_budget.prime_price_cache()
+    with contextlib.redirect_stdout(io.StringIO()):
+        update_leaderboard_cache(periods=query_budget.LEADERBOARD_PERIODS)
+
+
+def _run_vu(app, vu, phase, mix, stop_at, think_ms, recorder):
+    import perf_tracing
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    client = app.test_client()
+    while time.monotonic() < stop_at:
+        scenario = vu.rng.choices(names, weights)[0]
+        method, path, body = SCENARIOS[scenario](vu)
+        with perf_tracing.capture(scenario) as trace:
+            t0 = time.perf_counter()
+            try:
+                status = client.open(path, method=method, json=body, headers=vu.headers,
+                                     environ_base=vu.environ).status_code
+            except Exception:
+                status = 599
+            ms = (time.perf_counter() - t0) * 1000
+        recorder.add(phase, scenario, ms, status, trace.query_count)
+        if think_ms:
+            time.sleep(vu.rng.uniform(0, 2 * think_ms) / 1000)
+
+
+def _summarize(samples, seconds):
+    """Throughput over every request; latency and SQL over the ones the app
+    actually served (429s are answered before any work)."""
+    from perf_tracing import percentile
+    served = [s for s in samples if s[1] != 429] or samples
+    latencies = [ms for ms, _, _ in served]
+    queries = [q for _, _, q in served]
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / seconds, 1) if seconds else 0.0,
+        'errors': sum(1 for _, status, _ in samples if status >= 500),
+        'throttled': sum(1 for _, status, _ in samples if status == 429),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'queries_avg': round(sum(queries) / len(queries), 1),
+        'queries_max': max(queries),
+    }
+
+
+def run(database_url=None, users=1000, concurrency=20, phases=(('open', 10), ('browse', 30)),
+        think_ms=0, pool_size=None, market='open', days=30, sessions=5, subs_per_user=3, seed_rng=7,
+        drop_existing=False):
+    """Seed, replay every (phase, seconds) with `concurrency` virtual users
+    and return the report dict. Refuses (SystemExit) a database that already
+    has tables unless drop_existing."""
+    import query_budget
+    import timezone_utils
+    from models import db
+    from mobile_api import generate_jwt_token
+
+    database_url = database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load.db')
+    app = make_app(database_url, pool_size)
+    recorder = Recorder()
+    report = {
+        'generated_at': datetime.utcnow().isoformat() + 'Z',
+        'config': {'users': users, 'concurrency': concurrency, 'phases': dict(phases), 'think_ms': think_ms,
+                   'pool_size': pool_size, 'market': market, 'days': days, 'sessions': sessions,
+                   'subs_per_user': subs_per_user},
+        'thresholds': THRESHOLDS,
+        'phases': {},
+    }
+    real_is_market_hours = timezone_utils.is_market_hours
+    with app.app_context():
+        created = query_budget.create_tables(drop_existing)
+        try:
+            report['database'] = db.engine.dialect.name
+            t0 = time.perf_counter()
+            seed(users, days, sessions, subs_per_user)
+            report['seed_s'] = round(time.perf_counter() - t0, 1)
+            query_budget.reset_instance_state()
+            db.session.remove()
+
+            rng = random.Random(seed_rng)
+            vus = []
+            for i in range(concurrency):
+                uid = rng.randint(1, users)
+                vus.append(VirtualUser(uid, users, generate_jwt_token(uid, f'bench{uid}@example.com'),
+                                       random.Random(seed_rng * 1000 + i)))
+            if market != 'auto':
+                timezone_utils.is_market_hours = lambda *a, **k: market == 'open'
+
+            gauge = ConnectionGauge(db.engine, database_url)
+            for phase, seconds in phases:
+                stop_at = time.monotonic() + seconds
+                threads = [threading.Thread(target=_run_vu, daemon=True,
+                                            args=(app, vu, phase, MIXES[phase], stop_at, think_ms, recorder))
+                           for vu in vus]
+                started = time.perf_counter()
+                for t in threads:
+                    t.start()
+                next_prime = 0.0
+                while any(t.is_alive() for t in threads):
+                    if time.monotonic() >= next_prime:
+                        query_budget.prime_price_cache()
+                        next_prime = time.monotonic() + PRIME_EVERY_S
+                    gauge.sample()
+                    time.sleep(0.25)
+                elapsed = time.perf_counter() - started
+                endpoints = {scenario: _summarize(samples, elapsed)
+                             for (p, scenario), samples in sorted(recorder.samples.items()) if p == phase}
+                everything = [s for (p, _), samples in recorder.samples.items() if p == phase for s in samples]
+                report['phases'][phase] = {
+                    'seconds': round(elapsed, 1),
+                    'total': _summarize(everything, elapsed) if everything else None,
+                    'endpoints': endpoints,
+                }
+            report['db_connections'] = {'pool_high_water': gauge.high_water,
+                                        'server_high_water': gauge.pg_high_water}
+        finally:
+            timezone_utils.is_market_hours = real_is_market_hours
+            query_budget.drop_tables(created)
+
+    worst_p95 = max((e['p95_ms'] for p in report['phases'].values() for e in p['endpoints'].values()),
+                    default=0.0)
+    connections = report['db_connections']['server_high_water'] or report['db_connections']['pool_high_water']
+    report['headroom'] = {
+        'p95_ms': {'worst': worst_p95, 'limit': THRESHOLDS['p95_ms'], 'ok': worst_p95 <= THRESHOLDS['p95_ms']},
+        'db_connections': {'high_water': connections, 'limit': THRESHOLDS['db_connections'],
+                           'ok': connections <= THRESHOLDS['db_connections']},
+        'concurrent_users': {'simulated': concurrency, 'limit': THRESHOLDS['concurrent_users']},
+        'errors': sum(p['total']['errors'] for p in report['phases'].values() if p['total']),
+    }
+    report['ok'] = (report['headroom']['p95_ms']['ok'] and report['headroom']['db_connections']['ok']
+                    and report['headroom']['errors'] == 0)
+    return report
+
+
+def print_report(report):
+    cfg = report['config']
+    print(f"{report['database']}: {cfg['users']} users, {cfg['concurrency']} virtual users, "
+          f"seeded in {report['seed_s']}s")
+    for phase, result in report['phases'].items():
+        print(f"\n{phase} ({result['seconds']}s)")
+        print(f"{'endpoint':18s}{'req':>8s}{'rps':>8s}{'p50 ms':>9s}{'p95 ms':>9s}{'p99 ms':>9s}"
+              f"{'5xx':>6s}{'429':>6s}{'sql':>7s}")
+        rows = list(result['endpoints'].items()) + ([('TOTAL', result['total'])] if result['total'] else [])
+        for name, r in rows:
+            print(f"{name:18s}{r['requests']:>8d}{r['rps']:>8.1f}{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}"
+                  f"{r['p99_ms']:>9.0f}{r['errors']:>6d}{r['throttled']:>6d}{r['queries_avg']:>7.1f}")
+    h = report['headroom']
+    print(f"\nworst p95 {h['p95_ms']['worst']:.0f}ms (limit {h['p95_ms']['limit']}ms); "
+          f"DB connections high-water {h['db_connections']['high_water']} (limit {h['db_connections']['limit']}); "
+          f"{h['errors']} errors")
+    print('within thresholds' if report['ok'] else 'OVER THRESHOLD')
+
+
+def _phases(spec):
+    phases = []
+    for part in spec.split(','):
+        name, _, seconds = part.strip().partition(':')
+        if name not in MIXES:
+            raise argparse.ArgumentTypeError(f"unknown phase {name!r} (choose from {', '.join(MIXES)})")
+        phases.append((name, float(seconds or 30)))
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='empty, disposable database (default: SQLite temp file)')
+    parser.add_argument('--drop-existing', action='store_true',
+                        help="drop the app's tables in --database-url first instead of refusing a non-empty one")
+    parser.add_argument('--users', type=int, default=1000, help='seeded population')
+    parser.add_argument('--concurrency', type=int, default=20, help='virtual users (threads)')
+    parser.add_argument('--phases', type=_phases, default=_phases('open:10,browse:30'),
+                        help='comma-separated phase:seconds, run in order')
+    parser.add_argument('--think-ms', type=float, default=250, help='mean pause between a user\'s requests')
+    parser.add_argument('--pool-size', type=int, help='cap the app engine at this many connections')
+    parser.add_argument('--market', choices=('open', 'closed', 'auto'), default='open',
+                        help='market state seen by the trade endpoint (auto = real clock)')
+    parser.add_argument('--days', type=int, default=30, help='daily snapshots per user')
+    parser.add_argument('--sessions', type=int, default=5, help='intraday series sessions per user')
+    parser.add_argument('--subs', type=int, default=3, help='subscriptions per user')
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    report = run(args.database_url, users=args.users, concurrency=args.concurrency, phases=args.phases,
+                 think_ms=args.think_ms, pool_size=args.pool_size, market=args.market, days=args.days,
+                 sessions=args.sessions, subs_per_user=args.subs, drop_existing=args.drop_existing)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
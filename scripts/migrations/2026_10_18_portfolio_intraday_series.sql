@@ -0,0 +1,32 @@
+-- 2026_10_18_portfolio_intraday_series.sql
+-- Compact per-user intraday series (see intraday_series.py).
+--
+-- One row per user per ET trading session instead of one
+-- portfolio_snapshot_intraday row per user per 15-minute tick. Each value
+-- column is 27 packed little-endian float64s (slot 0 = 09:30 ET ... slot 26 =
+-- 16:00 ET, NaN = empty) and slot_mask bit N marks slot N as filled.
+--
+-- Safe to deploy the code before OR after this migration: the collector's
+-- series write is best-effort and 1D/5D readers fall back to
+-- portfolio_snapshot_intraday when no series rows exist. After creating the
+-- table, backfill the retained history once with
+--   POST /api/mobile/admin/intraday-series/backfill
+-- Idempotent.
+
+CREATE TABLE IF NOT EXISTS portfolio_intraday_series (
+    id                SERIAL  PRIMARY KEY,
+    user_id           INTEGER NOT NULL REFERENCES "user"(id),
+    session_date      DATE    NOT NULL,
+    slot_mask         INTEGER NOT NULL DEFAULT 0,
+    total_values      BYTEA   NOT NULL,
+    stock_values      BYTEA   NOT NULL,
+    cash_proceeds     BYTEA   NOT NULL,
+    max_cash_deployed BYTEA   NOT NULL,
+    updated_at        TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+    CONSTRAINT uq_intraday_series_user_session UNIQUE (user_id, session_date)
+);
+
+-- The unique constraint serves per-user range reads; this one serves the
+-- collector's per-session batch load and retention pruning.
+CREATE INDEX IF NOT EXISTS ix_intraday_series_session_date
+    ON portfolio_intraday_series (session_date);
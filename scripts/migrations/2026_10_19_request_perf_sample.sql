@@ -0,0 +1,27 @@
+-- 2026_10_19_request_perf_sample.sql
+-- Per-request performance summaries (see perf_tracing.py).
+--
+-- Every /api/mobile and /api/cron request is traced (total time, SQL query
+-- count + time, AlphaVantage / FCM / email time). Each serverless instance
+-- buffers the summaries and bulk-inserts them here every
+-- PERF_TRACE_FLUSH_EVERY requests; GET /api/mobile/admin/perf/routes reads
+-- p50/p95 per route from this table. Until it exists tracing still runs and
+-- the endpoint reports the answering instance's own rolling window only.
+-- Rows older than 14 days are pruned opportunistically by the flush.
+-- Idempotent.
+
+CREATE TABLE IF NOT EXISTS request_perf_sample (
+    id           BIGSERIAL    PRIMARY KEY,
+    recorded_at  TIMESTAMP    NOT NULL,
+    method       VARCHAR(8)   NOT NULL,
+    route        VARCHAR(200) NOT NULL,   -- URL rule, e.g. /api/mobile/portfolio/<int:user_id>
+    status       SMALLINT,
+    total_ms     REAL         NOT NULL,
+    query_count  INTEGER      NOT NULL,
+    query_ms     REAL         NOT NULL,
+    external_ms  REAL         NOT NULL
+);
+
+-- Window scans for the admin report and the retention delete.
+CREATE INDEX IF NOT EXISTS ix_request_perf_sample_recorded_at
+    ON request_perf_sample (recorded_at);
@@ -0,0 +1,23 @@
+-- 2026_10_20_email_send_limits.sql
+-- Shared email rate limits and SendGrid circuit breaker (see services/email_limits.py).
+--
+-- The limiter used to live in each serverless instance's memory, so every
+-- warm instance had its own 1,600/hour budget, 50/day per-recipient cap and
+-- breaker. These two tables make them global. Counters are fixed windows
+-- (window_start = epoch seconds of the hour / UTC day); recipient keys are
+-- hashed, no addresses are stored. Until the tables exist each instance keeps
+-- using its own in-memory limits. Windows older than 2 days are pruned
+-- opportunistically by the reservations. Idempotent.
+
+CREATE TABLE IF NOT EXISTS email_send_counter (
+    counter_key   VARCHAR(64)  NOT NULL,   -- 'global' or 'rcpt:<sha1 prefix>'
+    window_start  BIGINT       NOT NULL,
+    hits          INTEGER      NOT NULL DEFAULT 0,
+    PRIMARY KEY (counter_key, window_start)
+);
+
+CREATE TABLE IF NOT EXISTS email_circuit_state (
+    name                  VARCHAR(32) PRIMARY KEY,   -- 'sendgrid'
+    consecutive_failures  INTEGER     NOT NULL DEFAULT 0,
+    open_until            BIGINT      NOT NULL DEFAULT 0   -- epoch seconds
+);
@@ -0,0 +1,28 @@
+-- 2026_10_21_trade_day_counter.sql
+-- Backfill trade_limit as the per-user, per-day trade counter (see subscription_utils.py).
+--
+-- trade_limit (user_id, date, trade_count) is now bumped atomically by every
+-- buy/sell in cash_tracking.process_transaction, and tier pricing and the
+-- daily-cap check read it instead of counting rows. Existing rows were counts
+-- of holdings rows from the old web add-stock path; this rewrites the last 8
+-- UTC days from the transaction ledger so 7-day averages are right from day one.
+--
+-- Run AFTER deploying the code that increments the counter: the recount then
+-- includes every trade made so far. Re-running is safe (it recounts again);
+-- subscription_utils.rebuild_trade_counts() does the same from Python.
+
+BEGIN;
+
+-- Clear the window first (as rebuild_trade_counts does) so days whose
+-- trades were corrected away don't keep stale counts.
+DELETE FROM trade_limit WHERE date >= CURRENT_DATE - INTERVAL '7 days';
+
+INSERT INTO trade_limit (user_id, date, trade_count, created_at)
+SELECT user_id, CAST(timestamp AS DATE), COUNT(*), NOW()
+FROM stock_transaction
+WHERE transaction_type IN ('buy', 'sell')
+  AND timestamp >= CURRENT_DATE - INTERVAL '7 days'
+GROUP BY user_id, CAST(timestamp AS DATE)
+ON CONFLICT (user_id, date) DO UPDATE SET trade_count = EXCLUDED.trade_count;
+
+COMMIT;
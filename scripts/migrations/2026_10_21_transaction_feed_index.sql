@@ -0,0 +1,14 @@
+-- 2026_10_21_transaction_feed_index.sql
+-- Index for the keyset-paginated trade-alerts feed (GET /api/mobile/notifications/history).
+--
+-- The feed now reads each followed trader's newest buy/sell rows with
+-- ORDER BY timestamp DESC, id DESC LIMIT n, continuing from a (timestamp, id)
+-- cursor, instead of a COUNT(*) plus an OFFSET scan over every trade. This
+-- index turns each per-trader probe into a short backward range scan.
+--
+-- CONCURRENTLY so stock_transaction stays writable while it builds; it cannot
+-- run inside a transaction block, so run this file on its own (psql -f).
+-- The endpoint works without it, just slower. Idempotent.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_stock_transaction_user_ts
+    ON stock_transaction (user_id, timestamp DESC, id DESC);
@@ -0,0 +1,60 @@
+-- 2026_10_22_influencer_ranking.sql
+-- Materialized /api/mobile/top-influencers ranking (see influencer_ranking.py).
+--
+-- One row per creator with subscribers under industry_key '*', plus one per
+-- industry holding >= 5% of their portfolio (lowercased name). The endpoint
+-- reads the top N with one range scan of (industry_key, total_subscribers
+-- DESC) instead of aggregating every subscription per request. Rows are
+-- rewritten per creator on every ORM flush that touches their subscriptions,
+-- gifted subs or portfolio stats, and rebuilt nightly by the market-close cron.
+--
+-- Until this runs the endpoint keeps aggregating per request. The backfill
+-- below mirrors influencer_ranking.rebuild(); running that from Python after
+-- deploy does the same. Idempotent (the backfill replaces all rows).
+
+CREATE TABLE IF NOT EXISTS influencer_ranking (
+    id                 SERIAL PRIMARY KEY,
+    user_id            INTEGER      NOT NULL,     -- no FK: derived data, readers join "user"
+    industry_key       VARCHAR(100) NOT NULL,     -- '*' or lower(industry)
+    industry           VARCHAR(100),
+    total_subscribers  INTEGER      NOT NULL DEFAULT 0,   -- active real + gifted
+    has_fractional     BOOLEAN,
+    updated_at         TIMESTAMP    DEFAULT NOW(),
+    CONSTRAINT uq_influencer_ranking_user_industry UNIQUE (user_id, industry_key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_influencer_ranking_industry_total
+    ON influencer_ranking (industry_key, total_subscribers DESC, user_id);
+
+BEGIN;
+
+DELETE FROM influencer_ranking;
+
+WITH totals AS (
+    SELECT uid, SUM(n)::INTEGER AS total
+    FROM (
+        SELECT subscribed_to_id AS uid, COUNT(*) AS n
+        FROM mobile_subscription WHERE status = 'active' GROUP BY subscribed_to_id
+        UNION ALL
+        SELECT portfolio_user_id, SUM(bonus_subscriber_count)
+        FROM admin_subscription WHERE bonus_subscriber_count > 0 GROUP BY portfolio_user_id
+    ) s
+    GROUP BY uid
+    HAVING SUM(n) > 0
+),
+ranked AS (
+    SELECT t.uid, t.total, ups.industry_mix, ups.has_fractional_holdings
+    FROM totals t
+    JOIN "user" u ON u.id = t.uid
+    LEFT JOIN user_portfolio_stats ups ON ups.user_id = t.uid
+)
+INSERT INTO influencer_ranking (user_id, industry_key, industry, total_subscribers, has_fractional, updated_at)
+SELECT uid, '*', NULL, total, has_fractional_holdings, NOW() FROM ranked
+UNION ALL
+SELECT DISTINCT ON (r.uid, LOWER(LEFT(TRIM(m.key), 100)))
+       r.uid, LOWER(LEFT(TRIM(m.key), 100)), LEFT(m.key, 100), r.total, r.has_fractional_holdings, NOW()
+FROM ranked r
+CROSS JOIN LATERAL json_each_text(r.industry_mix::json) AS m(key, value)
+WHERE m.value::NUMERIC >= 5 AND TRIM(m.key) <> '';
+
+COMMIT;
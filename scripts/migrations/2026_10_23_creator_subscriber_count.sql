@@ -0,0 +1,47 @@
+-- 2026_10_23_creator_subscriber_count.sql
+-- Per-creator subscriber counters (see subscriber_counts.py).
+--
+-- One row per creator: active real subscriptions (mobile_subscription) and
+-- gifted subscribers (admin_subscription bonus > 0). The milestone check,
+-- /payouts, /subscriptions, the portfolio page, the leaderboard, the admin
+-- revenue summary and the top-influencers ranking read it by primary key
+-- instead of aggregating. Every ORM flush that changes a subscription bumps
+-- the creator's row in the same transaction; the market-close cron reconciles
+-- it against the aggregates and repairs drift.
+--
+-- Until this runs, readers keep aggregating. Run AFTER deploying the code
+-- that maintains the counter: the backfill then includes every change so far.
+-- Re-running is safe (it recounts); subscriber_counts.reconcile() does the
+-- same from Python.
+
+CREATE TABLE IF NOT EXISTS creator_subscriber_count (
+    user_id                  INTEGER PRIMARY KEY,    -- no FK: derived data, readers join "user"
+    real_subscriber_count    INTEGER   NOT NULL DEFAULT 0,
+    gifted_subscriber_count  INTEGER   NOT NULL DEFAULT 0,
+    total_subscriber_count   INTEGER   NOT NULL DEFAULT 0,   -- real + gifted
+    updated_at               TIMESTAMP DEFAULT NOW()
+);
+
+INSERT INTO creator_subscriber_count
+    (user_id, real_subscriber_count, gifted_subscriber_count, total_subscriber_count, updated_at)
+SELECT uid, SUM(real_n)::INTEGER, SUM(gifted_n)::INTEGER, SUM(real_n + gifted_n)::INTEGER, NOW()
+FROM (
+    SELECT subscribed_to_id AS uid, COUNT(*) AS real_n, 0 AS gifted_n
+    FROM mobile_subscription WHERE status = 'active' GROUP BY subscribed_to_id
+    UNION ALL
+    SELECT portfolio_user_id, 0, SUM(bonus_subscriber_count)
+    FROM admin_subscription WHERE bonus_subscriber_count > 0 GROUP BY portfolio_user_id
+) s
+GROUP BY uid
+ON CONFLICT (user_id) DO UPDATE SET
+    real_subscriber_count   = EXCLUDED.real_subscriber_count,
+    gifted_subscriber_count = EXCLUDED.gifted_subscriber_count,
+    total_subscriber_count  = EXCLUDED.total_subscriber_count,
+    updated_at              = EXCLUDED.updated_at;
+
+-- Creators whose subscriptions all lapsed keep a row; zero it.
+UPDATE creator_subscriber_count c
+SET real_subscriber_count = 0, gifted_subscriber_count = 0, total_subscriber_count = 0, updated_at = NOW()
+WHERE NOT EXISTS (SELECT 1 FROM mobile_subscription m WHERE m.subscribed_to_id = c.user_id AND m.status = 'active')
+  AND NOT EXISTS (SELECT 1 FROM admin_subscription a WHERE a.portfolio_user_id = c.user_id AND a.bonus_subscriber_count > 0)
+  AND c.total_subscriber_count <> 0;
@@ -0,0 +1,30 @@
+-- 2026_10_24_market_close_checkpoint.sql
+-- Durable checkpoints for the market-close pipeline (see market_close_pipeline.py).
+--
+-- One row per (trading_date, phase): status, the user_id watermark of chunked
+-- phases (snapshots), chunk / record counters, attempts and summed timings.
+-- The phase = 'pipeline' row of each day carries the run lease so two
+-- overlapping invocations never run the same day. /api/cron/market-close
+-- resumes from these rows; /api/cron/market-close/status reads them.
+--
+-- Until this runs, /api/cron/market-close keeps checkpoints in memory only and
+-- runs every phase in one pass (no resume, no lease). Re-running is safe.
+
+CREATE TABLE IF NOT EXISTS market_close_checkpoint (
+    id            SERIAL PRIMARY KEY,
+    trading_date  DATE         NOT NULL,
+    phase         VARCHAR(40)  NOT NULL,
+    status        VARCHAR(20)  NOT NULL DEFAULT 'pending',
+    watermark     INTEGER,
+    chunks        INTEGER      NOT NULL DEFAULT 0,
+    records       INTEGER      NOT NULL DEFAULT 0,
+    attempts      INTEGER      NOT NULL DEFAULT 0,
+    duration_ms   INTEGER      NOT NULL DEFAULT 0,
+    started_at    TIMESTAMP,
+    finished_at   TIMESTAMP,
+    lease_until   TIMESTAMP,
+    error         TEXT,
+    details       JSON,
+    updated_at    TIMESTAMP DEFAULT NOW(),
+    CONSTRAINT uq_market_close_checkpoint_date_phase UNIQUE (trading_date, phase)
+);
@@ -0,0 +1,24 @@
+-- 2026_10_25_benchmark_series_cache.sql
+-- Shared S&P 500 benchmark series cache (see benchmark_series.py).
+--
+-- Every benchmark consumer (performance calculator, leaderboard sparklines,
+-- public portfolio charts) reads the SPY_SP500 daily closes and SPY_INTRADAY
+-- ticks through benchmark_series, which keeps each series here as packed
+-- float64 arrays (date ordinals, naive-UTC epoch seconds, closes) so one
+-- instance builds it from market_data and the rest of the fleet reuses it.
+-- Writers of market_data benchmark rows delete the affected rows; `version`
+-- lets a payload format change ignore old rows without a migration.
+--
+-- Until this runs, benchmark_series keeps series in per-instance memory only.
+-- Idempotent.
+
+CREATE TABLE IF NOT EXISTS benchmark_series_cache (
+    series_key  VARCHAR(64) PRIMARY KEY,
+    version     INTEGER     NOT NULL,
+    kind        VARCHAR(10) NOT NULL,
+    points      INTEGER     NOT NULL DEFAULT 0,
+    dates       BYTEA       NOT NULL,
+    stamps      BYTEA       NOT NULL,
+    closes      BYTEA       NOT NULL,
+    updated_at  TIMESTAMP   NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
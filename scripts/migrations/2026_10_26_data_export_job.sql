@@ -0,0 +1,34 @@
+-- 2026_10_26_data_export_job.sql
+-- Background GDPR data-export jobs (see data_export.py).
+--
+-- POST /api/mobile/auth/data-export queues one row per request; the
+-- data-exports cron streams the user's sections into a gzip-compressed NDJSON
+-- artifact stored in `artifact`, records progress and per-section timings,
+-- and emails a link to /api/mobile/data-export/<token>. Artifacts are dropped
+-- (status 'expired') after data_export.LINK_TTL_DAYS. `lease_until` keeps
+-- overlapping cron runs off the same job.
+--
+-- Until this runs, the endpoint builds the export in-request and emails it
+-- in the body, as before. Idempotent.
+
+CREATE TABLE IF NOT EXISTS data_export_job (
+    id             SERIAL PRIMARY KEY,
+    user_id        INTEGER      NOT NULL REFERENCES "user"(id),
+    token          VARCHAR(64)  NOT NULL UNIQUE,
+    status         VARCHAR(20)  NOT NULL DEFAULT 'queued',
+    attempts       INTEGER      NOT NULL DEFAULT 0,
+    lease_until    TIMESTAMP,
+    progress       JSON,
+    sections       JSON,
+    artifact       BYTEA,
+    size_bytes     INTEGER,
+    error          TEXT,
+    created_at     TIMESTAMP    NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    started_at     TIMESTAMP,
+    finished_at    TIMESTAMP,
+    expires_at     TIMESTAMP,
+    downloaded_at  TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_data_export_job_user_id ON data_export_job (user_id);
+CREATE INDEX IF NOT EXISTS ix_data_export_job_status ON data_export_job (status) WHERE status IN ('queued', 'running');
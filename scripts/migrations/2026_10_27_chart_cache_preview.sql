@@ -0,0 +1,19 @@
+-- 2026_10_27_chart_cache_preview.sql
+-- Downsampled chart previews on user_portfolio_chart_cache (see chart_previews.py).
+--
+-- Next to the full chart_data each row keeps a preview (every dataset cut to
+-- chart_previews.PREVIEW_POINTS points), the full chart's value range and
+-- the generated_at the preview was built from. A models mapper hook writes
+-- them whenever chart_data is written. The web leaderboard hydrates all its
+-- entries from these columns in one query and sizes the shared y-axis from
+-- y_min / y_max.
+--
+-- Run before deploying: the model maps these columns. Existing rows start
+-- with NULL previews; readers summarize their chart_data on the fly until the
+-- next cache rebuild rewrites them. Idempotent.
+
+ALTER TABLE user_portfolio_chart_cache
+    ADD COLUMN IF NOT EXISTS preview_data TEXT NULL,
+    ADD COLUMN IF NOT EXISTS y_min        DOUBLE PRECISION NULL,
+    ADD COLUMN IF NOT EXISTS y_max        DOUBLE PRECISION NULL,
+    ADD COLUMN IF NOT EXISTS preview_of   TIMESTAMP WITHOUT TIME ZONE NULL;
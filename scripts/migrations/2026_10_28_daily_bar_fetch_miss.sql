@@ -0,0 +1,22 @@
+-- 2026_10_28_daily_bar_fetch_miss.sql
+-- Negative cache for /api/cron/refresh-daily-bars (see bot_data_hub.py).
+--
+-- A ticker AV answers with no usable TIME_SERIES_DAILY bars (delisted or
+-- renamed symbol) has no daily_price_bar rows, so stale-first selection put
+-- it at the front of every */3 run and a handful of dead symbols could spend
+-- the whole per-minute budget. Each such answer now records a row here and
+-- the ticker is skipped until retry_after (12h, doubling per miss, capped at
+-- 7 days). A successful fetch deletes the row.
+--
+-- Until this runs, the cron skips the negative cache and behaves as before.
+-- Idempotent.
+
+CREATE TABLE IF NOT EXISTS daily_bar_fetch_miss (
+    ticker           VARCHAR(20) PRIMARY KEY,
+    misses           INTEGER     NOT NULL DEFAULT 1,
+    last_attempt_at  TIMESTAMP   NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    retry_after      TIMESTAMP   NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_daily_bar_fetch_miss_retry_after
+    ON daily_bar_fetch_miss (retry_after);
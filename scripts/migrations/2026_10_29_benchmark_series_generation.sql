@@ -0,0 +1,21 @@
+-- 2026_10_29_benchmark_series_generation.sql
+-- Generation-stamped benchmark series cache (see benchmark_series.py).
+--
+-- invalidate() deleted the shared rows, but an instance already rebuilding a
+-- series from market_data could write its pre-invalidation result back
+-- afterwards, and that stale row then served the whole fleet for the L2 TTL.
+-- Each kind now has a generation counter that invalidate() bumps; rows are
+-- stamped with the generation they were built under, readers ignore rows
+-- from an older generation, and writes only replace a row while the
+-- generation they started under is still current.
+--
+-- Until this runs, benchmark_series keeps series in per-instance memory only
+-- (shared-cache reads and writes fail and are skipped). Idempotent.
+
+ALTER TABLE benchmark_series_cache
+    ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS benchmark_series_generation (
+    kind        VARCHAR(10) PRIMARY KEY,
+    generation  INTEGER     NOT NULL DEFAULT 0
+);
@@ -0,0 +1,129 @@
+"""Import-time profile of the serverless entry point (api/index.py).
+
+Runs `python -X importtime` on a fresh interpreter that imports the app the
+way api/vercel.py does, then reports where the import time goes:
+
+  * what api/index.py pulls in, by cumulative cost (the first importer of a
+    module pays for it, so this is "what would we save by not importing X
+    here")
+  * the most expensive modules by self time
+  * self time rolled up per top-level package
+
+    python scripts/profile_imports.py                      # both startup modes
+    python scripts/profile_imports.py --mode mobile --top 30
+    python scripts/profile_imports.py --json > imports.json
+
+Numbers are from a warm bytecode cache; a real Vercel cold start adds disk
+reads, so treat them as relative. See lazy_routes.py for APP_STARTUP_MODE.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOTSTRAP = (
+    "import sys; sys.path.insert(0, {api!r}); sys.path.insert(0, {root!r}); "
+    "from index import app"
+).format(api=os.path.join(ROOT, 'api'), root=ROOT)
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_importtime(mode):
+    env = dict(os.environ, APP_STARTUP_MODE=mode)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOTSTRAP],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f'import failed in mode={mode}:\n{proc.stderr[-2000:]}')
+    return proc.stderr
+
+
+def parse(stderr):
+    """Return [(module, self_us, cumulative_us, depth)] in -X importtime order
+    (children are printed before their parent)."""
+    rows = []
+    for line in stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)),
+                         len(m.group(3)) // 2))
+    return rows
+
+
+def summarize(rows, top):
+    by_name = {name: (self_us, cum_us, depth) for name, self_us, cum_us, depth in rows}
+    index = by_name.get('index')
+    if index is None:
+        raise SystemExit('index was not imported; is the bootstrap path right?')
+    index_depth = index[2]
+
+    # Direct children of `index` are the rows at depth+1 that precede it
+    # since the previous row at its own depth.
+    children = []
+    pos = [r[0] for r in rows].index('index')
+    for name, self_us, cum_us, depth in reversed(rows[:pos]):
+        if depth <= index_depth:
+            break
+        if depth == index_depth + 1:
+            children.append((name, cum_us))
+    children.sort(key=lambda c: c[1], reverse=True)
+
+    packages = defaultdict(int)
+    for name, self_us, _cum, _depth in rows:
+        packages[name.split('.')[0]] += self_us
+
+    return {
+        'total_ms': round(sum(r[1] for r in rows) / 1000, 1),
+        'index_cumulative_ms': round(index[1] / 1000, 1),
+        'index_self_ms': round(index[0] / 1000, 1),
+        'imported_by_index': [{'module': n, 'cumulative_ms': round(c / 1000, 1)}
+                              for n, c in children[:top]],
+        'top_self': [{'module': n, 'self_ms': round(s / 1000, 1)}
+                     for n, s, _c, _d in sorted(rows, key=lambda r: r[1], reverse=True)[:top]],
+        'packages': [{'package': p, 'self_ms': round(s / 1000, 1)}
+                     for p, s in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]],
+        'module_count': len(rows),
+    }
+
+
+def print_report(mode, report):
+    print(f'== APP_STARTUP_MODE={mode}: {report["module_count"]} modules, '
+          f'{report["total_ms"]} ms total, index {report["index_cumulative_ms"]} ms '
+          f'(self {report["index_self_ms"]} ms) ==')
+    print('  imported by api/index.py (cumulative):')
+    for r in report['imported_by_index']:
+        print(f'    {r["cumulative_ms"]:8.1f} ms  {r["module"]}')
+    print('  top modules (self):')
+    for r in report['top_self']:
+        print(f'    {r["self_ms"]:8.1f} ms  {r["module"]}')
+    print('  per package (self):')
+    for r in report['packages']:
+        print(f'    {r["self_ms"]:8.1f} ms  {r["package"]}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('full', 'mobile', 'both'), default='both')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--json', action='store_true', help='emit JSON instead of text')
+    args = parser.parse_args()
+
+    modes = ('full', 'mobile') if args.mode == 'both' else (args.mode,)
+    reports = {m: summarize(parse(run_importtime(m)), args.top) for m in modes}
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+    else:
+        for mode, report in reports.items():
+            print_report(mode, report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
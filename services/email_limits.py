@@ -0,0 +1,342 @@
+"""
+Shared email send limits and SendGrid circuit breaker.
+
+The limiter used to be module globals in notification_utils, so every warm
+serverless instance had its own 1,600/hour budget, 50/day per-recipient cap
+and breaker: a burst spread over N instances could send N x the SendGrid
+quota, and a breaker tripped on one instance left the others hammering a
+failing API.
+
+DbLimitStore keeps that state in Postgres, in fixed windows updated with
+atomic upserts:
+
+  * reserve(recipients) books the global hourly budget and every recipient's
+    daily cap for a whole batch in ONE statement (up to 1,000 recipients, one
+    SendGrid request's worth) and reads the shared breaker in the same round
+    trip;
+  * record_failure() counts towards the shared breaker; record_success()
+    only writes when a failure streak is known to exist.
+
+Rejected reservations are not refunded, so the counters err on the side of
+sending less. Old windows are deleted by prune(), from the weekly intraday
+cleanup cron. MemoryLimitStore is the old per-instance behaviour; the DB
+store falls back to it when its tables are missing
+(scripts/migrations/2026_10_20_email_send_limits.sql) or the database is
+unreachable, so the limiter can never be the reason an email fails.
+EMAIL_LIMIT_BACKEND=memory forces it. Per-send overhead:
+scripts/benchmark_email_limits.py.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_EMAILS_PER_USER_PER_DAY = 50
+MAX_EMAILS_PER_HOUR_GLOBAL = 1600  # SendGrid Essentials 50K/mo ≈ 1,667/day ≈ safe hourly burst
+CIRCUIT_BREAKER_FAILURES = 5       # consecutive failures before tripping
+CIRCUIT_OPEN_SECONDS = 300
+MAX_RESERVATION = 1000             # recipients per reservation statement
+BACKEND = os.environ.get('EMAIL_LIMIT_BACKEND', 'db').strip().lower()
+
+GLOBAL_KEY = 'global'
+BREAKER_NAME = 'sendgrid'
+_RETENTION_SECONDS = 2 * 86400
+
+
+def recipient_key(email):
+    """Counter key for a recipient. Hashed: the counter table holds no addresses."""
+    digest = hashlib.sha1((email or '').strip().lower().encode()).hexdigest()
+    return f'rcpt:{digest[:24]}'
+
+
+def _windows(now):
+    now = int(now)
+    return now - now % 3600, now - now % 86400
+
+
+def _result(allowed=(), rate_limited=(), circuit_open=False):
+    return {'allowed': list(allowed), 'rate_limited': list(rate_limited), 'circuit_open': circuit_open}
+
+
+class MemoryLimitStore:
+    """Per-instance counters and breaker (the pre-shared behaviour)."""
+
+    name = 'memory'
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counts = {}          # (key, window_start) -> hits
+        self._failures = 0
+        self._open_until = 0
+
+    def circuit_open(self):
+        return self._clock() < self._open_until
+
+    def reserve(self, recipients):
+        recipients = list(dict.fromkeys(recipients))
+        now = self._clock()
+        hour, day = _windows(now)
+        allowed, limited = [], []
+        with self._lock:
+            if now < self._open_until:
+                return _result(circuit_open=True)
+            if (GLOBAL_KEY, hour) not in self._counts:
+                # New hour: drop windows nothing can read any more.
+                self._counts = {k: v for k, v in self._counts.items() if k[1] >= day - 86400}
+            for email in recipients:
+                if self._counts.get((GLOBAL_KEY, hour), 0) >= MAX_EMAILS_PER_HOUR_GLOBAL:
+                    limited.append(email)
+                    continue
+                self._counts[(GLOBAL_KEY, hour)] = self._counts.get((GLOBAL_KEY, hour), 0) + 1
+                key = (recipient_key(email), day)
+                if self._counts.get(key, 0) >= MAX_EMAILS_PER_USER_PER_DAY:
+                    limited.append(email)
+                    continue
+                self._counts[key] = self._counts.get(key, 0) + 1
+                allowed.append(email)
+        if limited:
+            logger.warning(f"Email rate limit hit for {len(limited)} of {len(recipients)} recipients")
+        return _result(allowed, limited)
+
+    def record_success(self):
+        self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= CIRCUIT_BREAKER_FAILURES:
+                self._open_until = self._clock() + CIRCUIT_OPEN_SECONDS
+                logger.error(f"Email circuit breaker OPENED after {self._failures} consecutive failures")
+
+    def stats(self):
+        hour, _day = _windows(self._clock())
+        return {'backend': self.name, 'sent_this_hour': self._counts.get((GLOBAL_KEY, hour), 0),
+                'consecutive_failures': self._failures, 'circuit_open': self.circuit_open()}
+
+
+_UPSERT = ("INSERT INTO email_send_counter (counter_key, window_start, hits) VALUES {values} "
+           "ON CONFLICT (counter_key, window_start) "
+           "DO UPDATE SET hits = email_send_counter.hits + EXCLUDED.hits "
+           "RETURNING counter_key, hits")
+_BREAKER_SELECT = ("SELECT 'breaker' AS counter_key, consecutive_failures AS hits, open_until "
+                   "FROM email_circuit_state WHERE name = :breaker")
+
+
+class DbLimitStore:
+    """Counters and breaker shared by every instance through the database.
+
+    Uses its own connection (engine.begin()), never the caller's session, so
+    a reservation can't commit or roll back the request's work.
+    """
+
+    name = 'db'
+
+    def __init__(self, engine_getter, fallback=None, clock=time.time):
+        self._engine_getter = engine_getter
+        self._clock = clock
+        self.fallback = fallback or MemoryLimitStore(clock=clock)
+        self.disabled = False           # tables missing: fallback for this instance
+        self._open_until = 0            # last seen shared breaker state
+        self._failures = 0
+        self._warned = False
+
+    def _degrade(self, error):
+        msg = str(error).lower()
+        if ('email_send_counter' in msg or 'email_circuit_state' in msg) and \
+                ('does not exist' in msg or 'no such table' in msg):
+            self.disabled = True
+            logger.info("email limit tables missing; using per-instance email limits")
+        elif not self._warned:
+            self._warned = True
+            logger.warning(f"Shared email limits unavailable, using per-instance limits: {error}")
+
+    def circuit_open(self):
+        if self.disabled:
+            return self.fallback.circuit_open()
+        return self._clock() < self._open_until
+
+    def reserve(self, recipients):
+        recipients = list(dict.fromkeys(recipients))
+        if self.disabled:
+            return self.fallback.reserve(recipients)
+        if not recipients:
+            return _result()
+        if self.circuit_open():
+            return _result(circuit_open=True)
+        out = _result()
+        for start in range(0, len(recipients), MAX_RESERVATION):
+            chunk = recipients[start:start + MAX_RESERVATION]
+            try:
+                part = self._reserve_chunk(chunk)
+            except Exception as e:
+                self._degrade(e)
+                part = self.fallback.reserve(chunk)
+            out['allowed'] += part['allowed']
+            out['rate_limited'] += part['rate_limited']
+            out['circuit_open'] = out['circuit_open'] or part['circuit_open']
+        if out['rate_limited']:
+            logger.warning(f"Email rate limit hit for {len(out['rate_limited'])} of {len(recipients)} recipients")
+        return out
+
+    def _reserve_chunk(self, recipients):
+        from sqlalchemy import text
+        now = self._clock()
+        hour, day = _windows(now)
+        # One row per distinct key, in key order: addresses differing only in
+        # case/whitespace share a key (Postgres rejects a statement that
+        # updates a row twice), and concurrent fan-outs sharing recipients
+        # must take the row locks in the same order or they can deadlock.
+        rcpt_keys = [recipient_key(email) for email in recipients]
+        counts = Counter(rcpt_keys)
+        ordered = sorted(counts)
+        params = {f'k{i}': key for i, key in enumerate(ordered)}
+        params.update({f'c{i}': counts[key] for i, key in enumerate(ordered)})
+        params.update(day=day, hour=hour, n=len(recipients), g=GLOBAL_KEY, breaker=BREAKER_NAME)
+        per_recipient = _UPSERT.format(values=', '.join(f'(:k{i}, :day, :c{i})' for i in range(len(ordered))))
+        total = _UPSERT.format(values='(:g, :hour, :n)')
+
+        engine = self._engine_getter()
+        with engine.begin() as conn:
+            if engine.dialect.name == 'postgresql':
+                rows = conn.execute(text(
+                    f"WITH r AS ({per_recipient}), g AS ({total}) "
+                    "SELECT counter_key, hits, CAST(NULL AS BIGINT) AS open_until FROM r "
+                    "UNION ALL SELECT counter_key, hits, NULL FROM g "
+                    f"UNION ALL {_BREAKER_SELECT}"
+                ), params).fetchall()
+            else:
+                # Same three parts as separate statements (SQLite: tests, benchmark).
+                rows = [tuple(r) + (None,) for r in conn.execute(text(per_recipient), params)]
+                rows += [tuple(r) + (None,) for r in conn.execute(text(total), params)]
+                rows += list(conn.execute(text(_BREAKER_SELECT), params))
+
+        hits = {}
+        for key, count, open_until in rows:
+            if key == 'breaker':
+                self._failures, self._open_until = count or 0, open_until or 0
+            else:
+                hits[key] = count
+        if now < self._open_until:
+            return _result(circuit_open=True)
+
+        # Map the post-increment totals back to recipients: the j-th of c
+        # recipients sharing a key was send number hits - c + j that day.
+        seen = Counter()
+        under_cap = []
+        for email, key in zip(recipients, rcpt_keys):
+            seen[key] += 1
+            if hits.get(key, 0) - counts[key] + seen[key] <= MAX_EMAILS_PER_USER_PER_DAY:
+                under_cap.append(email)
+        budget = MAX_EMAILS_PER_HOUR_GLOBAL - (hits.get(GLOBAL_KEY, 0) - len(recipients))
+        allowed = under_cap[:max(0, budget)]
+        allowed_set = set(allowed)
+        return _result(allowed, [e for e in recipients if e not in allowed_set])
+
+    def record_success(self):
+        if self.disabled:
+            return self.fallback.record_success()
+        if not self._failures:
+            return
+        from sqlalchemy import text
+        try:
+            with self._engine_getter().begin() as conn:
+                conn.execute(text(
+                    "UPDATE email_circuit_state SET consecutive_failures = 0 "
+                    "WHERE name = :breaker AND consecutive_failures > 0"
+                ), {'breaker': BREAKER_NAME})
+            self._failures = 0
+        except Exception as e:
+            self._degrade(e)
+            self.fallback.record_success()
+
+    def record_failure(self):
+        if self.disabled:
+            return self.fallback.record_failure()
+        from sqlalchemy import text
+        now = int(self._clock())
+        try:
+            with self._engine_getter().begin() as conn:
+                failures, open_until = conn.execute(text(
+                    "INSERT INTO email_circuit_state (name, consecutive_failures, open_until) "
+                    "VALUES (:breaker, 1, CASE WHEN :threshold <= 1 THEN :reopen ELSE 0 END) "
+                    "ON CONFLICT (name) DO UPDATE SET "
+                    "consecutive_failures = email_circuit_state.consecutive_failures + 1, "
+                    "open_until = CASE WHEN email_circuit_state.consecutive_failures + 1 >= :threshold "
+                    "THEN :reopen ELSE email_circuit_state.open_until END "
+                    "RETURNING consecutive_failures, open_until"
+                ), {'breaker': BREAKER_NAME, 'threshold': CIRCUIT_BREAKER_FAILURES,
+                    'reopen': now + CIRCUIT_OPEN_SECONDS}).one()
+            self._failures, self._open_until = failures, open_until
+            if failures == CIRCUIT_BREAKER_FAILURES:
+                logger.error(f"Email circuit breaker OPENED (all instances) after {failures} consecutive failures")
+        except Exception as e:
+            self._degrade(e)
+            self.fallback.record_failure()
+
+    def stats(self):
+        if self.disabled:
+            return dict(self.fallback.stats(), backend='memory (db tables missing)')
+        return {'backend': self.name, 'consecutive_failures': self._failures,
+                'circuit_open': self.circuit_open()}
+
+
+def _default_engine():
+    from models import db
+    return db.engine
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MemoryLimitStore() if BACKEND == 'memory' else DbLimitStore(_default_engine)
+    return _store
+
+
+def set_store(store):
+    """Swap the backend (tests, benchmarks, or a future Redis store with the
+    same reserve / record_success / record_failure / circuit_open methods)."""
+    global _store
+    _store = store
+    return store
+
+
+def reserve(recipients):
+    """Book one send per recipient. Returns {'allowed': [...],
+    'rate_limited': [...], 'circuit_open': bool}; when the breaker is open
+    nothing is allowed."""
+    return get_store().reserve(recipients)
+
+
+def record_success():
+    get_store().record_success()
+
+
+def record_failure():
+    get_store().record_failure()
+
+
+def prune(engine, now=None):
+    """Delete counter windows older than two days. Run by the intraday cleanup
+    cron (/api/cron/cleanup-intraday-data), not per reservation. Returns rows
+    deleted; 0 when the table is missing."""
+    from sqlalchemy import text
+    now = time.time() if now is None else now
+    try:
+        with engine.begin() as conn:
+            return conn.execute(text("DELETE FROM email_send_counter WHERE window_start < :cut"),
+                                {'cut': int(now) - _RETENTION_SECONDS}).rowcount
+    except Exception as e:
+        logger.warning(f"email counter retention failed: {e}")
+        return 0
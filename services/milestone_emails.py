@@ -22,27 +22,16 @@ def check_subscription_milestones(influencer_user_id, new_subscriber_id):
         influencer_user_id: The portfolio owner who just got a new subscriber
         new_subscriber_id: The user who just subscribed
     """
-    from models import db, User, MobileSubscription, AdminSubscription
+    from models import db, User
+    import subscriber_counts
 
     influencer = User.query.get(influencer_user_id)
     if not influencer:
         return
 
-    # Count total active subscribers (real + gifted)
-    real_count = MobileSubscription.query.filter_by(
-        subscribed_to_id=influencer_user_id,
-        status='active'
-    ).count()
-
-    gifted_count = 0
-    try:
-        admin_sub = AdminSubscription.query.filter_by(
-            portfolio_user_id=influencer_user_id
-        ).first()
-        if admin_sub:
-            gifted_count = admin_sub.bonus_subscriber_count or 0
-    except Exception:
-        pass
+    # Total active subscribers (real + gifted): the maintained counter row.
+    counts = subscriber_counts.get(influencer_user_id)
+    real_count, gifted_count = counts.real, counts.gifted
 
     total_subs = real_count + gifted_count
 
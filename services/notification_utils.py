@@ -1,82 +1,80 @@
 """
 Email notification service via SendGrid API v3.
-Includes BCC monitoring, per-user daily rate limiting, and global circuit breaker.
-Designed for 10K users scale.
+Includes BCC monitoring, per-user daily rate limiting, and global circuit breaker
+(shared across serverless instances, see services/email_limits.py).
+Designed for 10K users scale: subscriber fan-out goes out as multi-personalization
+requests (send_bulk_email) over one pooled HTTP session, not one request per
+subscriber. scripts/fake_sendgrid.py stands in for SendGrid when benchmarking.
 """
 import os
 import logging
-import time
-from datetime import datetime, timedelta
 from threading import Lock
 
-logger = logging.getLogger(__name__)
-
-# ── Rate limiting (in-memory, resets on deploy) ─────────────────────────────
-_user_send_counts = {}  # {user_email: {'count': N, 'reset_at': timestamp}}
-_global_lock = Lock()
-_global_sends_this_hour = 0
-_global_hour_reset = 0
+from perf_tracing import span
+from services import email_limits
 
-MAX_EMAILS_PER_USER_PER_DAY = 50
-MAX_EMAILS_PER_HOUR_GLOBAL = 1600  # SendGrid Essentials 50K/mo ≈ 1,667/day ≈ safe hourly burst
-CIRCUIT_BREAKER_FAILURES = 5       # consecutive failures before tripping
-_consecutive_failures = 0
-_circuit_open_until = 0
+logger = logging.getLogger(__name__)
 
 BCC_EMAIL = 'fordutilityapps@gmail.com'
 FROM_EMAIL_DEFAULT = 'notifications@apestogether.ai'
 FROM_NAME_DEFAULT = 'ApesTogether'
-
-
-def _check_rate_limit(to_email):
-    """Returns True if sending is allowed, False if rate-limited."""
-    global _global_sends_this_hour, _global_hour_reset
-
-    now = time.time()
-
-    # Global hourly limit
-    with _global_lock:
-        if now > _global_hour_reset:
-            _global_sends_this_hour = 0
-            _global_hour_reset = now + 3600
-        if _global_sends_this_hour >= MAX_EMAILS_PER_HOUR_GLOBAL:
-            logger.warning("Global email rate limit hit")
-            return False
-        _global_sends_this_hour += 1
-
-    # Per-user daily limit
-    entry = _user_send_counts.get(to_email)
-    if entry and now < entry['reset_at']:
-        if entry['count'] >= MAX_EMAILS_PER_USER_PER_DAY:
-            logger.warning(f"Per-user email rate limit hit for {to_email[:8]}...")
-            return False
-        entry['count'] += 1
-    else:
-        _user_send_counts[to_email] = {'count': 1, 'reset_at': now + 86400}
-
-    return True
-
-
-def _check_circuit_breaker():
-    """Returns True if circuit is closed (OK to send), False if open."""
-    global _circuit_open_until
-    if time.time() < _circuit_open_until:
-        logger.warning("Email circuit breaker is OPEN — skipping send")
-        return False
-    return True
+SENDGRID_API_BASE_DEFAULT = 'https://api.sendgrid.com'
+MAX_PERSONALIZATIONS_PER_REQUEST = 1000  # SendGrid's hard limit per /v3/mail/send
+
+# One pooled session per instance: the fan-out reuses the TLS connection
+# instead of handshaking per request.
+_http_session = None
+_http_session_lock = Lock()
+
+
+def _session():
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def _mail_send_url():
+    base = os.environ.get('SENDGRID_API_BASE', SENDGRID_API_BASE_DEFAULT).rstrip('/')
+    return f'{base}/v3/mail/send'
+
+
+def _mail_payload(personalizations, body, html_body, from_email, reply_to=None):
+    content = [{'type': 'text/plain', 'value': body}]
+    if html_body:
+        content.append({'type': 'text/html', 'value': html_body})
+
+    data = {
+        'personalizations': personalizations,
+        'from': {'email': from_email, 'name': FROM_NAME_DEFAULT},
+        'content': content,
+        # Everything sent through this util is transactional. SendGrid's
+        # click tracking rewrites every link into an unreadable
+        # url4305.apestogether.ai redirect (especially ugly in the
+        # plain-text part), so it's off; open tracking stays default.
+        'tracking_settings': {
+            'click_tracking': {'enable': False, 'enable_text': False},
+        },
+    }
+    if reply_to:
+        data['reply_to'] = {'email': reply_to}
+    return data
 
 
 def _record_success():
-    global _consecutive_failures
-    _consecutive_failures = 0
+    email_limits.record_success()
 
 
 def _record_failure():
-    global _consecutive_failures, _circuit_open_until
-    _consecutive_failures += 1
-    if _consecutive_failures >= CIRCUIT_BREAKER_FAILURES:
-        _circuit_open_until = time.time() + 300  # open for 5 minutes
-        logger.error(f"Email circuit breaker OPENED after {_consecutive_failures} consecutive failures")
+    email_limits.record_failure()
 
 
 def send_email(to_email, subject, body, html_body=None, bcc=True, reply_to=None):
@@ -102,15 +100,14 @@ def send_email(to_email, subject, body, html_body=None, bcc=True, reply_to=None)
         logger.warning("SendGrid API key not configured — email not sent")
         return {'status': 'failed', 'error': 'SendGrid not configured'}
 
-    if not _check_circuit_breaker():
+    reservation = email_limits.reserve([to_email])
+    if reservation['circuit_open']:
+        logger.warning("Email circuit breaker is OPEN — skipping send")
         return {'status': 'circuit_open', 'error': 'Circuit breaker is open'}
-
-    if not _check_rate_limit(to_email):
+    if not reservation['allowed']:
         return {'status': 'rate_limited', 'error': 'Rate limit exceeded'}
 
     try:
-        import requests
-
         personalizations = {
             'to': [{'email': to_email}],
             'subject': subject,
@@ -118,34 +115,18 @@ def send_email(to_email, subject, body, html_body=None, bcc=True, reply_to=None)
         if bcc:
             personalizations['bcc'] = [{'email': BCC_EMAIL}]
 
-        content = [{'type': 'text/plain', 'value': body}]
-        if html_body:
-            content.append({'type': 'text/html', 'value': html_body})
-
-        data = {
-            'personalizations': [personalizations],
-            'from': {'email': from_email, 'name': FROM_NAME_DEFAULT},
-            'content': content,
-            # Everything sent through this util is transactional. SendGrid's
-            # click tracking rewrites every link into an unreadable
-            # url4305.apestogether.ai redirect (especially ugly in the
-            # plain-text part), so it's off; open tracking stays default.
-            'tracking_settings': {
-                'click_tracking': {'enable': False, 'enable_text': False},
-            },
-        }
-        if reply_to:
-            data['reply_to'] = {'email': reply_to}
-
-        response = requests.post(
-            'https://api.sendgrid.com/v3/mail/send',
-            headers={
-                'Authorization': f'Bearer {sendgrid_api_key}',
-                'Content-Type': 'application/json',
-            },
-            json=data,
-            timeout=10,
-        )
+        data = _mail_payload([personalizations], body, html_body, from_email, reply_to=reply_to)
+
+        with span('sendgrid_send', kind='email'):
+            response = _session().post(
+                _mail_send_url(),
+                headers={
+                    'Authorization': f'Bearer {sendgrid_api_key}',
+                    'Content-Type': 'application/json',
+                },
+                json=data,
+                timeout=10,
+            )
 
         if response.status_code == 202:
             message_id = response.headers.get('X-Message-Id', 'unknown')
@@ -164,6 +145,76 @@ def send_email(to_email, subject, body, html_body=None, bcc=True, reply_to=None)
         return {'status': 'failed', 'error': str(e)}
 
 
+def send_bulk_email(recipients, subject, body, html_body=None, bcc=True):
+    """
+    Send the same email to many recipients, up to
+    MAX_PERSONALIZATIONS_PER_REQUEST per SendGrid request (one personalization
+    per recipient, so nobody sees anyone else's address). Rate limits and the
+    circuit breaker apply per recipient / per request as in send_email, booked
+    with one email_limits.reserve() round trip per request.
+    The monitoring BCC goes on the first personalization of each request only,
+    so the BCC inbox gets one sample per batch rather than one per recipient.
+
+    Returns:
+        {recipient_email: result dict as returned by send_email}
+    """
+    sendgrid_api_key = os.environ.get('SENDGRID_API_KEY')
+    from_email = os.environ.get('SENDGRID_FROM_EMAIL', FROM_EMAIL_DEFAULT)
+    results = {}
+
+    if not sendgrid_api_key:
+        logger.warning("SendGrid API key not configured — email not sent")
+        return {email: {'status': 'failed', 'error': 'SendGrid not configured'} for email in recipients}
+
+    recipients = list(dict.fromkeys(recipients))
+    for start in range(0, len(recipients), MAX_PERSONALIZATIONS_PER_REQUEST):
+        # One shared-limit reservation per SendGrid request, not per recipient.
+        reservation = email_limits.reserve(recipients[start:start + MAX_PERSONALIZATIONS_PER_REQUEST])
+        if reservation['circuit_open']:
+            for email in recipients[start:start + MAX_PERSONALIZATIONS_PER_REQUEST]:
+                results[email] = {'status': 'circuit_open', 'error': 'Circuit breaker is open'}
+            continue
+        for email in reservation['rate_limited']:
+            results[email] = {'status': 'rate_limited', 'error': 'Rate limit exceeded'}
+        batch = reservation['allowed']
+        if not batch:
+            continue
+
+        personalizations = [{'to': [{'email': email}], 'subject': subject} for email in batch]
+        if bcc:
+            personalizations[0]['bcc'] = [{'email': BCC_EMAIL}]
+
+        try:
+            with span('sendgrid_send_bulk', kind='email'):
+                response = _session().post(
+                    _mail_send_url(),
+                    headers={
+                        'Authorization': f'Bearer {sendgrid_api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    json=_mail_payload(personalizations, body, html_body, from_email),
+                    timeout=(5, 30),
+                )
+            if response.status_code == 202:
+                message_id = response.headers.get('X-Message-Id', 'unknown')
+                _record_success()
+                logger.info(f"Bulk email sent to {len(batch)} recipients subj='{subject[:40]}' id={message_id}")
+                result = {'status': 'sent', 'message_id': message_id}
+            else:
+                _record_failure()
+                err = f'SendGrid {response.status_code}: {response.text[:200]}'
+                logger.error(f"Bulk email send failed ({len(batch)} recipients): {err}")
+                result = {'status': 'failed', 'error': err}
+        except Exception as e:
+            _record_failure()
+            logger.error(f"Bulk email send exception ({len(batch)} recipients): {e}")
+            result = {'status': 'failed', 'error': str(e)}
+
+        for email in batch:
+            results[email] = result
+    return results
+
+
 def format_qty(quantity):
     """Display-format a share quantity: whole numbers without decimals,
     fractional ones to at most 4 decimals with trailing zeros trimmed
@@ -283,9 +334,9 @@ def send_trade_confirmation_email(user, action, ticker, quantity, price, positio
     return send_email(user.email, subject, body, html_body=html_body)
 
 
-def send_trade_notification_to_subscriber(subscriber_email, trader_username, action, ticker, quantity, price, position_pct=None, scale_factor=None):
+def build_subscriber_trade_email(trader_username, action, ticker, quantity, price, position_pct=None, scale_factor=None):
     """
-    Send trade alert email to a subscriber about a trader's activity.
+    Build the subscriber-facing trade alert and return (subject, body, html_body).
     When the subscriber has set a scale for this creator, quantity is
     converted to THEIR proportional amount (position_pct and per-share
     price are scale-invariant and stay as-is).
@@ -306,79 +357,95 @@ def send_trade_notification_to_subscriber(subscriber_email, trader_username, act
         f"<p style='color:#888;font-size:12px;margin-top:20px'>— ApesTogether</p>"
         f"</div>"
     )
+    return subject, body, html_body
+
 
+def send_trade_notification_to_subscriber(subscriber_email, trader_username, action, ticker, quantity, price, position_pct=None, scale_factor=None):
+    """
+    Send trade alert email to a subscriber about a trader's activity.
+    """
+    subject, body, html_body = build_subscriber_trade_email(
+        trader_username, action, ticker, quantity, price, position_pct, scale_factor=scale_factor,
+    )
     return send_email(subscriber_email, subject, body, html_body=html_body)
 
 
 def notify_subscribers_via_email(db, trader_user_id, action, ticker, quantity, price, position_pct=None):
     """
     Fan-out email notifications to all subscribers of a trader who have email notifications enabled.
-    Returns summary dict.
+
+    Subscribers are loaded in one query and grouped by rendered content (only
+    the scale factor changes it), so a creator with 2,000 subscribers costs a
+    handful of SendGrid requests instead of 2,000. NotificationLog rows are
+    written in one bulk insert. Returns summary dict.
     """
-    from models import User, MobileSubscription
+    from models import User, MobileSubscription, NotificationLog
 
     trader = User.query.get(trader_user_id)
     if not trader:
         return {'sent': 0, 'failed': 0, 'error': 'trader_not_found'}
 
-    active_subs = MobileSubscription.query.filter_by(
-        subscribed_to_id=trader_user_id,
-        status='active',
+    rows = db.session.query(
+        User.id, User.email, User.email_notifications_enabled, MobileSubscription.scale_factor,
+    ).join(
+        MobileSubscription, MobileSubscription.subscriber_id == User.id,
+    ).filter(
+        MobileSubscription.subscribed_to_id == trader_user_id,
+        MobileSubscription.status == 'active',
     ).all()
 
-    if not active_subs:
+    if not rows:
         return {'sent': 0, 'failed': 0, 'skipped': 'no_subscribers'}
 
-    sent = 0
-    failed = 0
-    rate_limited = 0
-
     # Use public_name (display_name or username fallback) so subscribers see the
     # portfolio's public-facing name in the email subject/body, not the internal handle.
     trader_name = getattr(trader, 'public_name', None) or trader.username
 
-    for sub in active_subs:
-        subscriber = User.query.get(sub.subscriber_id)
-        if not subscriber or not subscriber.email:
-            continue
-
+    # Group recipients by the email they will get. One email per subscriber
+    # even if they hold more than one active subscription row.
+    groups = {}
+    seen = set()
+    for user_id, email, email_enabled, scale_factor in rows:
         # Check user-level email preference
-        if getattr(subscriber, 'email_notifications_enabled', True) is False:
+        if not email or email_enabled is False or user_id in seen:
             continue
-
-        result = send_trade_notification_to_subscriber(
-            subscriber.email, trader_name, action, ticker, quantity, price, position_pct,
-            scale_factor=getattr(sub, 'scale_factor', None),
+        seen.add(user_id)
+        content = build_subscriber_trade_email(
+            trader_name, action, ticker, quantity, price, position_pct, scale_factor=scale_factor,
         )
-        if result['status'] == 'sent':
-            sent += 1
-        elif result['status'] == 'rate_limited':
-            rate_limited += 1
-        else:
-            failed += 1
+        groups.setdefault(content, []).append((user_id, email))
 
-        # Log to NotificationLog
-        try:
-            from models import NotificationLog
-            log = NotificationLog(
-                user_id=subscriber.id,
-                portfolio_owner_id=trader_user_id,
+    sent = 0
+    failed = 0
+    rate_limited = 0
+    logs = []
+
+    for (subject, body, html_body), recipients in groups.items():
+        results = send_bulk_email([email for _uid, email in recipients], subject, body, html_body=html_body)
+        for user_id, email in recipients:
+            result = results[email]
+            if result['status'] == 'sent':
+                sent += 1
+            elif result['status'] == 'rate_limited':
+                rate_limited += 1
+            else:
+                failed += 1
+            logs.append({
+                'user_id': user_id,
+                'portfolio_owner_id': trader_user_id,
                 # NotificationLog.subscription_id FKs to the legacy `subscription`
-                # (Stripe) table. `sub` here is a MobileSubscription, whose id does
-                # NOT map to that table — passing it caused an FK violation that made
-                # the batch commit() below fail under `except: pass`, silently dropping
-                # ALL notification logs for the fan-out. Leave NULL (column is nullable).
-                subscription_id=None,
-                notification_type='email',
-                status=result['status'],
-                sendgrid_message_id=result.get('message_id'),
-                error_message=result.get('error'),
-            )
-            db.session.add(log)
-        except Exception as log_err:
-            logger.warning(f"Failed to log notification: {log_err}")
+                # (Stripe) table; a MobileSubscription id does NOT map to it, so
+                # leave it NULL (column is nullable).
+                'subscription_id': None,
+                'notification_type': 'email',
+                'status': result['status'],
+                'sendgrid_message_id': result.get('message_id'),
+                'error_message': (result.get('error') or '')[:500] or None,
+            })
 
     try:
+        if logs:
+            db.session.bulk_insert_mappings(NotificationLog, logs)
         db.session.commit()
     except Exception as commit_err:
         # Don't let a logging-table failure mask the fact that emails were already
@@ -389,4 +456,5 @@ def notify_subscribers_via_email(db, trader_user_id, action, ticker, quantity, p
         except Exception:
             pass
 
-    return {'sent': sent, 'failed': failed, 'rate_limited': rate_limited}
+    return {'sent': sent, 'failed': failed, 'rate_limited': rate_limited,
+            'groups': len(groups)}
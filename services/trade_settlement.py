@@ -0,0 +1,297 @@
+"""
+Market-open batch settlement of queued after-hours trades (QueuedEmailTrade).
+
+Trades queued while the market is closed (email trades and the queued path of
+/portfolio/trade) used to settle one at a time: per trade a User lookup, a
+Stock lookup, process_transaction under its own user row lock, a commit, and
+the subscriber push/email fan-out inline before the next trade started. At
+the open the whole backlog lands at once.
+
+settle_queued_trades() instead:
+
+  1. loads the backlog once, ordered (user_id, queued_at, id), so every run
+     settles the same trades in the same order;
+  2. takes one batch price snapshot for every ticker in it;
+  3. settles each user's trades in ONE transaction under ONE user row lock:
+     positions loaded once, each trade validated and applied in order (cash
+     via cash_tracking.apply_cash_flow), the Transaction rows written in one
+     multi-row insert and the day's trade counter bumped once, then a single
+     commit. A trade that fails validation (no price, not enough shares)
+     fails alone; an unexpected error rolls the user's batch back and fails
+     all of it;
+  4. after every commit, sends the trader confirmations / failure emails and
+     the subscriber fan-out (cash_tracking.notify_trade) as one batch.
+
+Returns per-trade results alongside the executed/failed/total counts.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+PRICE_SOURCE = 'queued_email'
+TRADE_REPLY_TO = 'trade@trade.apestogether.ai'
+PRICE_UNAVAILABLE = 'Price unavailable at market open'
+
+
+class SettledTrade(NamedTuple):
+    queued_id: int
+    user_id: int
+    user_email: str
+    ticker: str
+    action: str
+    quantity: float
+    queued_at: datetime
+    status: str                          # 'executed' or 'failed'
+    price: Optional[float] = None
+    error: Optional[str] = None
+    position_before_qty: Optional[float] = None
+
+    def as_dict(self):
+        return {
+            'id': self.queued_id,
+            'user_id': self.user_id,
+            'ticker': self.ticker,
+            'action': self.action,
+            'quantity': self.quantity,
+            'status': self.status,
+            'price': self.price,
+            'error': self.error,
+        }
+
+
+def fetch_prices(tickers):
+    """One batch price snapshot for `tickers` ({ticker: price}; {} on failure)."""
+    if not tickers:
+        return {}
+    try:
+        from portfolio_performance import PortfolioPerformanceCalculator
+        return PortfolioPerformanceCalculator().get_batch_stock_data(sorted(tickers)) or {}
+    except Exception as e:
+        logger.error(f"Bulk price fetch failed for queued trades: {e}")
+        return {}
+
+
+def _result(qt, status, price=None, error=None, position_before_qty=None):
+    return SettledTrade(qt.id, qt.user_id, qt.user_email, qt.ticker, qt.action, qt.quantity,
+                        qt.queued_at, status, price, error, position_before_qty)
+
+
+def _apply(qt, price, positions, user):
+    """Validate and apply one queued trade to the user's in-memory positions
+    and cash. Returns position_before_qty; raises ValueError if it can't fill."""
+    from sqlalchemy import inspect
+    from models import db, Stock
+    from cash_tracking import apply_cash_flow
+
+    if qt.action not in ('buy', 'sell'):
+        raise ValueError(f"Invalid action: {qt.action}")
+    existing = positions.get(qt.ticker)
+    position_before_qty = existing.quantity if existing and qt.action == 'sell' else None
+    if qt.action == 'sell':
+        if not existing or existing.quantity < qt.quantity:
+            available = existing.quantity if existing else 0
+            raise ValueError(f"Insufficient shares: have {available}, need {qt.quantity}")
+        existing.quantity -= qt.quantity
+        if existing.quantity == 0:
+            # A position opened earlier in this batch is still pending.
+            if inspect(existing).pending:
+                db.session.expunge(existing)
+            else:
+                db.session.delete(existing)
+            del positions[qt.ticker]
+    elif existing:
+        total_cost = (existing.purchase_price * existing.quantity) + (price * qt.quantity)
+        existing.quantity += qt.quantity
+        existing.purchase_price = total_cost / existing.quantity if existing.quantity > 0 else price
+    else:
+        positions[qt.ticker] = Stock(ticker=qt.ticker, quantity=qt.quantity, purchase_price=price,
+                                     user_id=qt.user_id)
+        db.session.add(positions[qt.ticker])
+    apply_cash_flow(user, qt.ticker, qt.quantity, price, qt.action)
+    return position_before_qty
+
+
+def settle_user(user_id, trades, prices, now):
+    """
+    Settle one user's queued trades (in order) in a single transaction under
+    one row lock on the user. Returns ([SettledTrade], trades_today or None).
+    """
+    from sqlalchemy import insert
+    from models import db, User, Stock, Transaction
+
+    results = []
+    ledger = []
+    trades_today = None
+    try:
+        user = db.session.query(User).filter(User.id == user_id).with_for_update().first()
+        if not user:
+            raise ValueError(f"User {user_id} not found")
+        positions = {}
+        for stock in Stock.query.filter(
+                Stock.user_id == user_id, Stock.ticker.in_({qt.ticker for qt in trades})
+        ).order_by(Stock.id):
+            positions.setdefault(stock.ticker, stock)
+
+        for i, qt in enumerate(trades):
+            price = prices.get(qt.ticker)
+            if not price:
+                results.append(_result(qt, 'failed', error=PRICE_UNAVAILABLE))
+                continue
+            try:
+                before = _apply(qt, price, positions, user)
+            except ValueError as e:
+                results.append(_result(qt, 'failed', price=price, error=str(e)))
+                continue
+            # Distinct, ordered timestamps keep the ledger replay order equal
+            # to the settlement order.
+            ledger.append({'user_id': user_id, 'ticker': qt.ticker, 'quantity': qt.quantity, 'price': price,
+                           'transaction_type': qt.action, 'timestamp': now + timedelta(microseconds=i),
+                           'price_source': PRICE_SOURCE})
+            results.append(_result(qt, 'executed', price=price, position_before_qty=before))
+
+        executed = len(ledger)
+        if executed:
+            db.session.execute(insert(Transaction.__table__), ledger)
+            try:
+                from subscription_utils import record_trade
+                with db.session.begin_nested():
+                    trades_today = record_trade(user_id, now, n=executed)
+            except Exception as e:
+                logger.warning(f"Trade counter update failed (non-fatal): {e}")
+        _mark(trades, results, now)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Queued trades for user {user_id} failed: {e}")
+        results = [_result(qt, 'failed', price=prices.get(qt.ticker), error=str(e)) for qt in trades]
+        trades_today = None
+        try:
+            _mark(trades, results, now)
+            db.session.commit()
+        except Exception as mark_err:
+            db.session.rollback()
+            logger.error(f"Could not mark queued trades of user {user_id} failed: {mark_err}")
+    return results, trades_today
+
+
+def _mark(trades, results, now):
+    for qt, result in zip(trades, results):
+        qt.status = result.status
+        qt.error_message = result.error
+        qt.executed_at = now
+
+
+def _send_email(to, subject, body, **kw):
+    from services.notification_utils import send_email
+    kw.setdefault('reply_to', TRADE_REPLY_TO)
+    return send_email(to, subject, body, **kw)
+
+
+def _format_qty(quantity):
+    return int(quantity) if quantity == int(quantity) else quantity
+
+
+def notify(results, trades_today=None):
+    """Post-commit fan-out for a settled batch, in settlement order: the
+    trader's executed / failed email, then subscriber push + email for every
+    executed trade. Never raises."""
+    from models import db, User
+    from cash_tracking import notify_trade
+    from services.notification_utils import build_trade_confirmation_email
+
+    trades_today = trades_today or {}
+    executed_ids = {r.user_id for r in results if r.status == 'executed'}
+    users = {u.id: u for u in User.query.filter(User.id.in_(executed_ids))} if executed_ids else {}
+    for r in results:
+        try:
+            if r.status == 'failed':
+                if r.error == PRICE_UNAVAILABLE:
+                    reason = (f"could not be executed because we were unable to fetch a price for {r.ticker}.\n\n"
+                              f"Please try again manually.")
+                else:
+                    reason = f"failed: {r.error}\n\nPlease try again manually."
+                _send_email(r.user_email, f"Queued Trade Failed – {r.ticker}",
+                            f"Your queued trade ({r.action.upper()} {_format_qty(r.quantity)} {r.ticker}) {reason}")
+                continue
+
+            position_pct = None
+            if r.action == 'sell' and r.position_before_qty and r.position_before_qty > 0:
+                position_pct = round((r.quantity / r.position_before_qty) * 100, 1)
+            footer = (
+                f"Your queued trade has been executed at market open. "
+                f"Originally queued at {r.queued_at.strftime('%b %d, %I:%M %p')} UTC."
+            )
+            subject, body, html = build_trade_confirmation_email(
+                r.action, r.ticker, r.quantity, r.price, position_pct=position_pct,
+                heading="Queued Trade Executed", subject_label="Queued Trade Executed",
+                footer_note=footer,
+            )
+            _send_email(r.user_email, subject, body, html_body=html)
+
+            user = users.get(r.user_id)
+            if user is not None:
+                # We sent our own "Queued Trade Executed" email above; the
+                # subscriber fan-out still fires.
+                notify_trade(db, user, r.action, r.ticker, r.quantity, r.price,
+                             position_before_qty=r.position_before_qty, suppress_trader_email=True,
+                             trades_today=trades_today.get(r.user_id))
+        except Exception as e:
+            logger.warning(f"Queued trade notification failed for #{r.queued_id}: {e}")
+
+
+def settle_queued_trades(prices=None, send_notifications=True):
+    """
+    Settle every queued after-hours trade (see module docstring).
+
+    Args:
+        prices: {ticker: price} snapshot to settle at; fetched in one batch if None.
+        send_notifications: False skips the post-commit emails and pushes.
+
+    Returns:
+        dict with executed, failed, total and per-trade `results`.
+    """
+    from models import QueuedEmailTrade
+
+    queued = QueuedEmailTrade.query.filter_by(status='queued').order_by(
+        QueuedEmailTrade.user_id, QueuedEmailTrade.queued_at, QueuedEmailTrade.id
+    ).all()
+    if not queued:
+        logger.info("No queued email trades to process")
+        return {'executed': 0, 'failed': 0, 'total': 0, 'results': []}
+
+    if prices is None:
+        prices = fetch_prices({qt.ticker for qt in queued})
+    now = datetime.utcnow()
+
+    results = []
+    trades_today = {}
+    for user_id, trades in groupby(queued, key=lambda qt: qt.user_id):
+        settled, today = settle_user(user_id, list(trades), prices, now)
+        results.extend(settled)
+        if today is not None:
+            trades_today[user_id] = today
+
+    executed = sum(1 for r in results if r.status == 'executed')
+    if send_notifications:
+        notify(results, trades_today)
+
+    # Founding Trader badge: a user whose FIRST trade was queued after-hours
+    # only gets a Transaction row now (settle time), so the execute_trade
+    # first-trade hook never fired for them. Run the idempotent, cap-100
+    # sweep once per settle batch. Non-blocking — never fail the cron.
+    if executed:
+        try:
+            from mobile_api import _award_founding_trader_badges
+            _award_founding_trader_badges()
+        except Exception as badge_err:
+            logger.warning(f"Non-blocking: founding-trader sweep failed: {badge_err}")
+
+    result = {'executed': executed, 'failed': len(results) - executed, 'total': len(results),
+              'results': [r.as_dict() for r in results]}
+    logger.info(f"Queued trade processing complete: executed={executed} failed={result['failed']} "
+                f"total={result['total']}")
+    return result
@@ -365,143 +365,11 @@ def process_queued_trades():
     Execute all queued after-hours email trades.
     Called by the market-open cron job.
 
+    Settles in batch (services/trade_settlement.py): one transaction and one
+    row lock per user, one price snapshot, notifications after commit.
+
     Returns:
-        dict with counts: executed, failed, total
+        dict with counts: executed, failed, total (+ per-trade results)
     """
-    from models import db, QueuedEmailTrade, User, Stock
-    from services.notification_utils import send_email as _send_email, notify_subscribers_via_email
-    from cash_tracking import process_transaction
-
-    TRADE_REPLY_TO = 'trade@trade.apestogether.ai'
-    def send_email(to, subj, body, **kw):
-        kw.setdefault('reply_to', TRADE_REPLY_TO)
-        return _send_email(to, subj, body, **kw)
-
-    queued = QueuedEmailTrade.query.filter_by(status='queued').all()
-    if not queued:
-        logger.info("No queued email trades to process")
-        return {'executed': 0, 'failed': 0, 'total': 0}
-
-    # Batch-fetch prices for all unique tickers
-    tickers = list({q.ticker for q in queued})
-    try:
-        from portfolio_performance import PortfolioPerformanceCalculator
-        pp = PortfolioPerformanceCalculator()
-        prices = pp.get_batch_stock_data(tickers)
-    except Exception as e:
-        logger.error(f"Bulk price fetch failed for queued trades: {e}")
-        prices = {}
-
-    executed = 0
-    failed = 0
-
-    for qt in queued:
-        price = prices.get(qt.ticker)
-        if not price:
-            qt.status = 'failed'
-            qt.error_message = 'Price unavailable at market open'
-            qt.executed_at = datetime.utcnow()
-            db.session.commit()
-            failed += 1
-            send_email(
-                qt.user_email,
-                f"Queued Trade Failed – {qt.ticker}",
-                f"Your queued trade ({qt.action.upper()} {int(qt.quantity) if qt.quantity == int(qt.quantity) else qt.quantity} {qt.ticker}) "
-                f"could not be executed because we were unable to fetch a price for {qt.ticker}.\n\n"
-                f"Please try again manually."
-            )
-            continue
-
-        try:
-            user = User.query.get(qt.user_id)
-            if not user:
-                raise ValueError(f"User {qt.user_id} not found")
-
-            existing = Stock.query.filter_by(user_id=qt.user_id, ticker=qt.ticker).first()
-            position_before_qty = existing.quantity if existing and qt.action == 'sell' else None
-
-            if qt.action == 'sell':
-                if not existing or existing.quantity < qt.quantity:
-                    available = existing.quantity if existing else 0
-                    raise ValueError(f"Insufficient shares: have {available}, need {qt.quantity}")
-                existing.quantity -= qt.quantity
-                if existing.quantity == 0:
-                    db.session.delete(existing)
-            else:
-                if existing:
-                    total_cost = (existing.purchase_price * existing.quantity) + (price * qt.quantity)
-                    existing.quantity += qt.quantity
-                    existing.purchase_price = total_cost / existing.quantity if existing.quantity > 0 else price
-                else:
-                    stock = Stock(ticker=qt.ticker, quantity=qt.quantity, purchase_price=price, user_id=qt.user_id)
-                    db.session.add(stock)
-
-            process_transaction(
-                db, qt.user_id, qt.ticker, qt.quantity, price, qt.action,
-                timestamp=datetime.utcnow(),
-                price_source='queued_email',
-                position_before_qty=position_before_qty,
-                # We send our own "Queued Trade Executed" email below; suppress
-                # process_transaction's generic trader confirmation so the user
-                # gets a single email per fill (subscriber fan-out still fires).
-                suppress_trader_email=True
-            )
-
-            qt.status = 'executed'
-            qt.executed_at = datetime.utcnow()
-            db.session.commit()
-            executed += 1
-
-            # Confirmation email
-            position_pct = None
-            if qt.action == 'sell' and position_before_qty and position_before_qty > 0:
-                position_pct = round((qt.quantity / position_before_qty) * 100, 1)
-
-            from services.notification_utils import build_trade_confirmation_email
-            footer = (
-                f"Your queued trade has been executed at market open. "
-                f"Originally queued at {qt.queued_at.strftime('%b %d, %I:%M %p')} UTC."
-            )
-            subject, q_body, q_html = build_trade_confirmation_email(
-                qt.action, qt.ticker, qt.quantity, price, position_pct=position_pct,
-                heading="Queued Trade Executed", subject_label="Queued Trade Executed",
-                footer_note=footer,
-            )
-            send_email(qt.user_email, subject, q_body, html_body=q_html)
-
-            # Subscriber push + email notifications already fired by
-            # process_transaction's internal fan-out above (cash_tracking.py).
-            # Duplicate fan-out used to live here and caused two pushes per
-            # trade. Single source of truth: process_transaction.
-
-            logger.info(f"Queued trade executed: {user.username} {qt.action} {qt.quantity} {qt.ticker} @ ${price:.2f}")
-
-        except Exception as e:
-            db.session.rollback()
-            qt.status = 'failed'
-            qt.error_message = str(e)
-            qt.executed_at = datetime.utcnow()
-            db.session.commit()
-            failed += 1
-            logger.error(f"Queued trade failed: {e}")
-            send_email(
-                qt.user_email,
-                f"Queued Trade Failed – {qt.ticker}",
-                f"Your queued trade ({qt.action.upper()} {int(qt.quantity) if qt.quantity == int(qt.quantity) else qt.quantity} {qt.ticker}) "
-                f"failed: {e}\n\nPlease try again manually."
-            )
-
-    # Founding Trader badge: a user whose FIRST trade was queued after-hours
-    # only gets a Transaction row now (settle time), so the execute_trade
-    # first-trade hook never fired for them. Run the idempotent, cap-100
-    # sweep once per settle batch. Non-blocking — never fail the cron.
-    if executed:
-        try:
-            from mobile_api import _award_founding_trader_badges
-            _award_founding_trader_badges()
-        except Exception as badge_err:
-            logger.warning(f"Non-blocking: founding-trader sweep failed: {badge_err}")
-
-    result = {'executed': executed, 'failed': failed, 'total': len(queued)}
-    logger.info(f"Queued trade processing complete: {result}")
-    return result
+    from services.trade_settlement import settle_queued_trades
+    return settle_queued_trades()
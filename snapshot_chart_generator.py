@@ -12,21 +12,16 @@ def generate_chart_from_snapshots(user_id, period):
     from models import PortfolioSnapshot
     from leaderboard_utils import get_last_market_day
     import json
+    import trading_calendar
     
     # Use same date calculation logic as leaderboard_utils
     today = get_last_market_day()
     
     if period == '1D':
-        start_date = today - timedelta(days=1)
+        start_date = trading_calendar.previous_session(today)
     elif period == '5D':
-        # Get 5 business days back (same logic as leaderboards)
-        business_days_back = 0
-        check_date = today
-        while business_days_back < 5:
-            check_date = check_date - timedelta(days=1)
-            if check_date.weekday() < 5:  # Monday=0, Friday=4
-                business_days_back += 1
-        start_date = check_date
+        # 5 trading sessions back (same logic as leaderboards)
+        start_date = trading_calendar.sessions_back(today, 5)
     elif period == '1M':
         start_date = today - timedelta(days=30)
     elif period == '3M':
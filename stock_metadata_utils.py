@@ -1,78 +1,85 @@
 """
 Stock metadata utilities for populating and maintaining comprehensive stock information
 Includes market cap, sector, industry, NAICS codes, and exchange data
+
+Bulk refreshes go through ingest_stock_info(): OVERVIEW fetched concurrently
+under the shared AV governor (no fixed sleeps), existing rows resolved with one
+IN query, fresh rows skipped, and StockInfo upserted in bulk.
 """
-import requests
 import time
 from datetime import datetime, timedelta
 import os
 
-def get_alpha_vantage_company_overview(ticker):
+from av_rate_governor import av_get, is_throttle_response, AVBudgetExhausted
+
+OVERVIEW_URL = "https://www.alphavantage.co/query"
+STOCK_INFO_MAX_AGE_DAYS = 7  # rows refreshed more recently than this are skipped
+METADATA_FETCH_WORKERS = int(os.environ.get('AV_FETCH_WORKERS', '8'))
+STOCK_INFO_UPSERT_CHUNK = 500
+
+
+def fetch_overview(ticker, deadline=None):
     """
-    Get comprehensive company data from Alpha Vantage OVERVIEW function
-    Returns market cap, sector, industry, exchange, and other metadata
+    One Alpha Vantage OVERVIEW call. Does not touch the database, so it is
+    safe in a worker thread; the caller logs the call.
+
+    Returns (data or None, status, response_time_ms) where status is
+    'success', 'rate_limited', 'error', or 'deferred' when no AV slot opened
+    before `deadline` (time.monotonic()). response_time_ms is None when no
+    call was made.
     """
     api_key = os.getenv('ALPHA_VANTAGE_API_KEY')
     if not api_key:
         print("Warning: ALPHA_VANTAGE_API_KEY not found")
-        return None
-    
-    url = f"https://www.alphavantage.co/query"
+        return None, 'error', None
+
     params = {
         'function': 'OVERVIEW',
         'symbol': ticker.upper(),
         'apikey': api_key
     }
-    
     start_time = time.time()
-    
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response_time_ms = int((time.time() - start_time) * 1000)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check for API limit or error
-            if 'Note' in data or 'Error Message' in data:
-                try:
-                    from admin_metrics import log_alpha_vantage_call
-                    log_alpha_vantage_call('OVERVIEW', ticker, 'rate_limited', response_time_ms)
-                except ImportError:
-                    print(f"API rate limited for {ticker}")
-                return None
-            
-            # Check if we got valid data
-            if 'Symbol' not in data or data.get('Symbol') != ticker.upper():
-                try:
-                    from admin_metrics import log_alpha_vantage_call
-                    log_alpha_vantage_call('OVERVIEW', ticker, 'error', response_time_ms)
-                except ImportError:
-                    print(f"Invalid data for {ticker}")
-                return None
-            
-            try:
-                from admin_metrics import log_alpha_vantage_call
-                log_alpha_vantage_call('OVERVIEW', ticker, 'success', response_time_ms)
-            except ImportError:
-                print(f"Successfully fetched data for {ticker}")
-            return data
-        else:
-            try:
-                from admin_metrics import log_alpha_vantage_call
-                log_alpha_vantage_call('OVERVIEW', ticker, 'error', response_time_ms)
-            except ImportError:
-                print(f"HTTP error for {ticker}: {response.status_code}")
-            return None
-            
+        response = av_get(OVERVIEW_URL, params=params, timeout=10, deadline=deadline)
+    except AVBudgetExhausted:
+        return None, 'deferred', None
     except Exception as e:
-        response_time_ms = int((time.time() - start_time) * 1000)
+        print(f"Error fetching overview for {ticker}: {str(e)}")
+        return None, 'error', int((time.time() - start_time) * 1000)
+    response_time_ms = int((time.time() - start_time) * 1000)
+
+    if response.status_code != 200:
+        print(f"HTTP error for {ticker}: {response.status_code}")
+        return None, 'error', response_time_ms
+    try:
+        data = response.json()
+    except ValueError:
+        return None, 'error', response_time_ms
+
+    # Check for API limit or error
+    if is_throttle_response(data) or 'Error Message' in data:
+        print(f"API rate limited for {ticker}")
+        return None, 'rate_limited', response_time_ms
+    # Check if we got valid data
+    if 'Symbol' not in data or data.get('Symbol') != ticker.upper():
+        print(f"Invalid data for {ticker}")
+        return None, 'error', response_time_ms
+    return data, 'success', response_time_ms
+
+
+def get_alpha_vantage_company_overview(ticker):
+    """
+    Get comprehensive company data from Alpha Vantage OVERVIEW function
+    Returns market cap, sector, industry, exchange, and other metadata
+    """
+    data, status, response_time_ms = fetch_overview(ticker)
+    if response_time_ms is not None:
         try:
             from admin_metrics import log_alpha_vantage_call
-            log_alpha_vantage_call('OVERVIEW', ticker, 'error', response_time_ms)
+            log_alpha_vantage_call('OVERVIEW', ticker, status, response_time_ms)
         except ImportError:
-            print(f"Error fetching overview for {ticker}: {str(e)}")
-        return None
+            pass
+    return data
 
 def classify_market_cap(market_cap_str):
     """
@@ -242,6 +249,48 @@ def map_industry_to_naics(industry):
     
     return None
 
+def overview_fields(ticker, overview_data):
+    """StockInfo column values for one OVERVIEW response."""
+    ticker_upper = ticker.upper()
+    fields = {
+        'ticker': ticker_upper,
+        'company_name': (overview_data.get('Name') or ticker_upper)[:200],
+        'sector': (normalize_sector_name(overview_data.get('Sector')) or None),
+        'industry': (overview_data.get('Industry') or None),
+        'exchange': (overview_data.get('Exchange') or None),
+        'country': (overview_data.get('Country') or 'US')[:5],
+    }
+    for key, size in (('sector', 100), ('industry', 100), ('exchange', 10)):
+        if fields[key]:
+            fields[key] = fields[key][:size]
+
+    # Handle market cap
+    market_cap_str = overview_data.get('MarketCapitalization')
+    fields['market_cap'] = None
+    fields['cap_classification'] = 'unknown'
+    if market_cap_str and market_cap_str != 'None':
+        try:
+            fields['market_cap'] = int(market_cap_str)
+            fields['cap_classification'] = classify_market_cap(market_cap_str)
+        except (ValueError, TypeError):
+            pass
+
+    # Map industry to NAICS code
+    fields['naics_code'] = map_industry_to_naics(fields['industry'])
+    fields['last_updated'] = datetime.now()
+    return fields
+
+
+def fallback_fields(ticker):
+    """StockInfo values for an ETF / manually overridden ticker, or None."""
+    ticker_upper = ticker.upper()
+    sector = get_etf_sector_fallback(ticker_upper)
+    if not sector:
+        return None
+    return {'ticker': ticker_upper, 'company_name': ticker_upper, 'sector': sector,
+            'last_updated': datetime.now()}
+
+
 def populate_stock_info(ticker, force_update=False):
     """
     Populate or update stock info for a given ticker
@@ -256,7 +305,7 @@ def populate_stock_info(ticker, force_update=False):
     
     if stock_info and not force_update:
         # Skip if updated within last 7 days
-        if stock_info.last_updated > datetime.now() - timedelta(days=7):
+        if stock_info.last_updated > datetime.now() - timedelta(days=STOCK_INFO_MAX_AGE_DAYS):
             print(f"Stock info for {ticker_upper} is recent, skipping")
             return stock_info
     
@@ -267,17 +316,17 @@ def populate_stock_info(ticker, force_update=False):
     
     if not overview_data:
         # Alpha Vantage has no data — try manual/ETF fallback
-        fallback_sector = get_etf_sector_fallback(ticker_upper)
-        if fallback_sector:
+        fallback = fallback_fields(ticker_upper)
+        if fallback:
             if not stock_info:
                 stock_info = StockInfo(ticker=ticker_upper)
                 db.session.add(stock_info)
-            stock_info.company_name = stock_info.company_name or ticker_upper
-            stock_info.sector = fallback_sector
-            stock_info.last_updated = datetime.now()
+            stock_info.company_name = stock_info.company_name or fallback['company_name']
+            stock_info.sector = fallback['sector']
+            stock_info.last_updated = fallback['last_updated']
             try:
                 db.session.commit()
-                print(f"✓ Used manual fallback for {ticker_upper}: {fallback_sector}")
+                print(f"✓ Used manual fallback for {ticker_upper}: {fallback['sector']}")
                 return stock_info
             except Exception as e:
                 db.session.rollback()
@@ -292,29 +341,8 @@ def populate_stock_info(ticker, force_update=False):
         db.session.add(stock_info)
     
     # Update fields from Alpha Vantage data
-    stock_info.company_name = overview_data.get('Name', ticker_upper)
-    stock_info.sector = normalize_sector_name(overview_data.get('Sector'))
-    stock_info.industry = overview_data.get('Industry')
-    stock_info.exchange = overview_data.get('Exchange')
-    stock_info.country = overview_data.get('Country', 'US')
-    
-    # Handle market cap
-    market_cap_str = overview_data.get('MarketCapitalization')
-    if market_cap_str and market_cap_str != 'None':
-        try:
-            stock_info.market_cap = int(market_cap_str)
-            stock_info.cap_classification = classify_market_cap(market_cap_str)
-        except (ValueError, TypeError):
-            stock_info.market_cap = None
-            stock_info.cap_classification = 'unknown'
-    else:
-        stock_info.market_cap = None
-        stock_info.cap_classification = 'unknown'
-    
-    # Map industry to NAICS code
-    stock_info.naics_code = map_industry_to_naics(stock_info.industry)
-    
-    stock_info.last_updated = datetime.now()
+    for field, value in overview_fields(ticker_upper, overview_data).items():
+        setattr(stock_info, field, value)
     
     try:
         db.session.commit()
@@ -325,45 +353,185 @@ def populate_stock_info(ticker, force_update=False):
         print(f"Error saving stock info for {ticker_upper}: {str(e)}")
         return None
 
+
+def _normalize_tickers(tickers):
+    """Upper-cased, de-duplicated tickers in first-seen order (list or comma-separated string)."""
+    if isinstance(tickers, str):
+        tickers = tickers.split(',')
+    seen = {}
+    for t in tickers:
+        t = str(t or '').strip().upper()
+        if t:
+            seen.setdefault(t, None)
+    return list(seen)
+
+
+def portfolio_tickers():
+    """Every distinct ticker held in a user portfolio, upper-cased."""
+    from models import db, Stock
+    return _normalize_tickers(t for (t,) in db.session.query(Stock.ticker).distinct())
+
+
+def stale_tickers(tickers, force_update=False, max_age_days=STOCK_INFO_MAX_AGE_DAYS):
+    """The `tickers` with no StockInfo row or one older than `max_age_days`
+    (all of them if force_update), resolved with one IN query."""
+    from models import db, StockInfo
+    tickers = _normalize_tickers(tickers)
+    if force_update or not tickers:
+        return tickers
+    threshold = datetime.now() - timedelta(days=max_age_days)
+    updated = {}
+    for ticker, last_updated in db.session.query(StockInfo.ticker, StockInfo.last_updated).filter(
+            StockInfo.ticker.in_(tickers)):
+        updated[(ticker or '').upper()] = last_updated
+    return [t for t in tickers if not updated.get(t) or updated[t] < threshold]
+
+
+def write_stock_info(rows, fallback=False):
+    """
+    Upsert StockInfo rows (dicts keyed by column) on ticker in chunked
+    multi-row statements. Fallback rows only set sector / last_updated and
+    keep an existing company_name. Does not commit. Returns rows written.
+    """
+    from sqlalchemy import func
+    from models import db, StockInfo
+    if not rows:
+        return 0
+    table = StockInfo.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        existing = {s.ticker: s for s in StockInfo.query.filter(StockInfo.ticker.in_([r['ticker'] for r in rows]))}
+        for row in rows:
+            info = existing.get(row['ticker'])
+            if info is None:
+                info = StockInfo(ticker=row['ticker'])
+                db.session.add(info)
+            for field, value in row.items():
+                if fallback and field == 'company_name' and info.company_name:
+                    continue
+                setattr(info, field, value)
+        return len(rows)
+    for start in range(0, len(rows), STOCK_INFO_UPSERT_CHUNK):
+        stmt = insert(table)
+        if fallback:
+            set_ = {'sector': stmt.excluded.sector, 'last_updated': stmt.excluded.last_updated,
+                    'company_name': func.coalesce(func.nullif(table.c.company_name, ''),
+                                                  stmt.excluded.company_name)}
+        else:
+            set_ = {c: stmt.excluded[c] for c in rows[0] if c != 'ticker'}
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['ticker'], set_=set_),
+                           rows[start:start + STOCK_INFO_UPSERT_CHUNK])
+    return len(rows)
+
+
+def _log_overview_calls(calls):
+    """Bulk-insert AlphaVantageAPILog rows for [(ticker, status, response_time_ms)]."""
+    from sqlalchemy import insert
+    from models import db, AlphaVantageAPILog
+    if not calls:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(AlphaVantageAPILog.__table__), [
+        {'endpoint': 'OVERVIEW', 'symbol': t, 'response_status': status, 'response_time_ms': ms,
+         'timestamp': now} for t, status, ms in calls])
+
+
+def ingest_stock_info(tickers=None, force_update=False, max_workers=None, deadline=None):
+    """
+    Refresh StockInfo for `tickers` (every portfolio ticker if None).
+
+      1. one IN query drops tickers refreshed within STOCK_INFO_MAX_AGE_DAYS
+         (unless force_update);
+      2. ETF / manually overridden tickers take their fallback sector without
+         an AV call (OVERVIEW has no data for them);
+      3. the rest are fetched concurrently, paced only by the shared AV
+         governor (AV_CALLS_PER_MINUTE); tickers with no slot before
+         `deadline` (time.monotonic()) are deferred to the next run;
+      4. StockInfo is upserted in bulk, the AV calls logged in one insert,
+         and the session committed once.
+
+    Returns counts plus per-ticker `results` ({'ticker', 'status'}) where
+    status is 'fresh', 'updated', 'fallback', 'failed' or 'deferred'.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from models import db
+    from perf_tracing import bind
+
+    universe = portfolio_tickers() if tickers is None else _normalize_tickers(tickers)
+    due = stale_tickers(universe, force_update=force_update)
+    due_set = set(due)
+    status = {t: 'fresh' for t in universe if t not in due_set}
+
+    fallback_rows = [row for row in (fallback_fields(t) for t in due) if row]
+    fallback_set = {row['ticker'] for row in fallback_rows}
+    to_fetch = [t for t in due if t not in fallback_set]
+
+    rows = []
+    calls = []
+    if to_fetch:
+        workers = max(1, min(max_workers or METADATA_FETCH_WORKERS, len(to_fetch)))
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetch = bind(fetch_overview)
+            fetched = list(executor.map(lambda t: fetch(t, deadline), to_fetch))
+        for ticker, (data, call_status, ms) in zip(to_fetch, fetched):
+            if ms is not None:
+                calls.append((ticker, call_status, ms))
+            if data:
+                rows.append(overview_fields(ticker, data))
+                status[ticker] = 'updated'
+            else:
+                status[ticker] = 'deferred' if call_status == 'deferred' else 'failed'
+        print(f"OVERVIEW ingest: {len(rows)}/{len(to_fetch)} fetched in {time.time() - started:.1f}s "
+              f"({workers} workers)")
+    for ticker in fallback_set:
+        status[ticker] = 'fallback'
+
+    try:
+        write_stock_info(rows)
+        write_stock_info(fallback_rows, fallback=True)
+        _log_overview_calls(calls)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving stock info batch: {str(e)}")
+        for ticker in list(status):
+            if status[ticker] in ('updated', 'fallback'):
+                status[ticker] = 'failed'
+
+    counts = {s: 0 for s in ('fresh', 'updated', 'fallback', 'failed', 'deferred')}
+    for s in status.values():
+        counts[s] += 1
+    return {
+        'success_count': counts['fresh'] + counts['updated'] + counts['fallback'],
+        'failed_count': counts['failed'] + counts['deferred'],
+        'fresh_count': counts['fresh'],
+        'updated_count': counts['updated'],
+        'fallback_count': counts['fallback'],
+        'deferred_count': counts['deferred'],
+        'total_processed': len(universe),
+        'tickers_processed': universe,
+        'results': [{'ticker': t, 'status': status[t]} for t in universe],
+    }
+
 def populate_all_user_stocks():
     """
     Populate stock info for all stocks held by users
     """
-    # Import models locally to avoid circular dependencies
-    from models import db, Stock
-    
-    # Get all unique tickers from user portfolios
-    unique_tickers = db.session.query(Stock.ticker).distinct().all()
-    tickers = [ticker[0] for ticker in unique_tickers]
-    
-    print(f"Found {len(tickers)} unique tickers to populate")
-    
-    success_count = 0
-    failed_count = 0
-    
-    for i, ticker in enumerate(tickers, 1):
-        print(f"\n[{i}/{len(tickers)}] Processing {ticker}...")
-        
-        result = populate_stock_info(ticker)
-        
-        if result:
-            success_count += 1
-        else:
-            failed_count += 1
-        
-        # Rate limiting - Alpha Vantage allows 5 calls per minute for free tier
-        if i < len(tickers):  # Don't sleep after the last one
-            print("Waiting 12 seconds for API rate limit...")
-            time.sleep(12)
+    result = ingest_stock_info()
     
     print(f"\n=== STOCK INFO POPULATION COMPLETE ===")
-    print(f"Successfully populated: {success_count}")
-    print(f"Failed: {failed_count}")
-    print(f"Total processed: {len(tickers)}")
+    print(f"Successfully populated: {result['success_count']}")
+    print(f"Failed: {result['failed_count']}")
+    print(f"Total processed: {result['total_processed']}")
     
-    return success_count, failed_count
+    return result['success_count'], result['failed_count']
 
-def populate_user_stocks_batch(limit=None, offset=0, tickers=None, force_update=False, sleep_seconds=12):
+def populate_user_stocks_batch(limit=None, offset=0, tickers=None, force_update=False, sleep_seconds=None):
     """
     Populate stock info for a subset of stocks to support batching.
 
@@ -372,23 +540,16 @@ def populate_user_stocks_batch(limit=None, offset=0, tickers=None, force_update=
     - offset: number of tickers to skip from the start
     - tickers: optional explicit list of tickers (list[str] or comma-separated string)
     - force_update: if True, ignore 7-day freshness window
-    - sleep_seconds: delay between API calls to respect rate limits
+    - sleep_seconds: ignored; calls are paced by the shared AV governor
     """
-    from models import db, Stock
-
     # Build base ticker list from user portfolios
-    unique_tickers = db.session.query(Stock.ticker).distinct().all()
-    all_tickers = [t[0] for t in unique_tickers]
+    all_tickers = portfolio_tickers()
 
     # If explicit tickers provided, normalize and filter to known
     if tickers:
-        if isinstance(tickers, str):
-            tickers = [t.strip().upper() for t in tickers.split(',') if t.strip()]
-        else:
-            tickers = [str(t).strip().upper() for t in tickers]
         # keep only those present in portfolios to avoid wasted calls
         ticker_set = set(all_tickers)
-        selected = [t for t in tickers if t in ticker_set]
+        selected = [t for t in _normalize_tickers(tickers) if t in ticker_set]
     else:
         selected = all_tickers
 
@@ -399,29 +560,7 @@ def populate_user_stocks_batch(limit=None, offset=0, tickers=None, force_update=
         selected = selected[:limit]
 
     print(f"Batch populate: {len(selected)} tickers (offset={offset}, limit={limit})")
-
-    processed = []
-    success_count = 0
-    failed_count = 0
-
-    for i, ticker in enumerate(selected, 1):
-        print(f"\n[{i}/{len(selected)}] Processing {ticker}...")
-        res = populate_stock_info(ticker, force_update=force_update)
-        processed.append(ticker)
-        if res:
-            success_count += 1
-        else:
-            failed_count += 1
-        if i < len(selected) and sleep_seconds and sleep_seconds > 0:
-            print(f"Waiting {sleep_seconds} seconds for API rate limit...")
-            time.sleep(sleep_seconds)
-
-    return {
-        'success_count': success_count,
-        'failed_count': failed_count,
-        'total_processed': len(selected),
-        'tickers_processed': processed
-    }
+    return ingest_stock_info(selected, force_update=force_update)
 
 def get_remaining_tickers(force_update=False):
     """
@@ -432,32 +571,13 @@ def get_remaining_tickers(force_update=False):
       - force_update is True, OR
       - last_updated is older than 7 days
     """
-    from models import db, Stock, StockInfo
-    from datetime import datetime, timedelta
-
-    all_portfolio_tickers = [t[0] for t in db.session.query(Stock.ticker).distinct().all()]
-    remaining = []
-
-    threshold = datetime.now() - timedelta(days=7)
-    # Fetch all existing StockInfo rows into a dict for quick lookup
-    infos = StockInfo.query.filter(StockInfo.ticker.in_([t.upper() for t in all_portfolio_tickers])).all()
-    info_by_ticker = {s.ticker.upper(): s for s in infos}
-
-    for t in all_portfolio_tickers:
-        key = (t or '').upper()
-        si = info_by_ticker.get(key)
-        if not si:
-            remaining.append(key)
-        else:
-            if force_update or (not si.last_updated or si.last_updated < threshold):
-                remaining.append(key)
+    return stale_tickers(portfolio_tickers(), force_update=force_update)
 
-    return remaining
-
-def populate_user_stocks_resume(limit=None, offset=0, force_update=False, sleep_seconds=12):
+def populate_user_stocks_resume(limit=None, offset=0, force_update=False, sleep_seconds=None):
     """
     Populate only the remaining/unprocessed tickers determined by get_remaining_tickers().
     Supports limit/offset and returns the list processed for transparency.
+    sleep_seconds is ignored; calls are paced by the shared AV governor.
     """
     remaining = get_remaining_tickers(force_update=force_update)
 
@@ -467,29 +587,9 @@ def populate_user_stocks_resume(limit=None, offset=0, force_update=False, sleep_
     if isinstance(limit, int) and limit > 0:
         remaining = remaining[:limit]
 
-    processed = []
-    success_count = 0
-    failed_count = 0
-
-    for i, ticker in enumerate(remaining, 1):
-        print(f"\n[resume {i}/{len(remaining)}] Processing {ticker}...")
-        res = populate_stock_info(ticker, force_update=force_update)
-        processed.append(ticker)
-        if res:
-            success_count += 1
-        else:
-            failed_count += 1
-        if i < len(remaining) and sleep_seconds and sleep_seconds > 0:
-            print(f"Waiting {sleep_seconds} seconds for API rate limit...")
-            time.sleep(sleep_seconds)
-
-    return {
-        'success_count': success_count,
-        'failed_count': failed_count,
-        'total_processed': len(remaining),
-        'tickers_processed': processed,
-        'remaining_total': len(get_remaining_tickers(force_update=force_update))
-    }
+    result = ingest_stock_info(remaining, force_update=True)
+    result['remaining_total'] = len(get_remaining_tickers(force_update=force_update))
+    return result
 
 def get_stocks_by_industry(naics_code=None, industry_name=None):
     """
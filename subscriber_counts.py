@@ -0,0 +1,309 @@
+"""
+Per-creator subscriber counters (creator_subscriber_count table).
+
+Real subscribers (active MobileSubscription rows) and gifted subscribers
+(AdminSubscription bonus counts > 0) used to be aggregated on every read: the
+milestone check, /payouts, /subscriptions, the portfolio page, the leaderboard
+and the admin revenue summary each ran a COUNT over mobile_subscription plus
+an admin_subscription lookup (several of them taking only the first gifted
+row). Now one row per creator holds the counts and readers do a primary-key
+read.
+
+Counters are maintained on write: a Session hook turns every flush that
+creates, deletes or changes the status / creator / bonus of a subscription
+into per-creator deltas and applies them with one atomic UPSERT increment in
+the flush's own transaction, so a count commits or rolls back with the
+subscription change that caused it, and concurrent subscribes can't lose an
+update. When a change's previous value isn't loaded, the creator is recounted
+under a row lock instead. Writes that bypass the ORM unit of work (bulk
+Query.update, raw SQL) aren't seen: reconcile() recounts everything, repairs
+drifted rows and runs in the market-close cron. Until
+scripts/migrations/2026_10_23_creator_subscriber_count.sql has run, the hook
+is a no-op and readers aggregate as before.
+"""
+
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = 'subscriber_counts_pending'
+
+# Unknown rows start at the delta (floored at zero: a decrement for a creator
+# without a row is drift, left for reconcile()); known rows add it atomically.
+_INCREMENT_SQL = text(
+    "INSERT INTO creator_subscriber_count "
+    "(user_id, real_subscriber_count, gifted_subscriber_count, total_subscriber_count, updated_at) "
+    "VALUES (:user_id, :real_floor, :gifted_floor, :real_floor + :gifted_floor, :now) "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    "real_subscriber_count = creator_subscriber_count.real_subscriber_count + :real, "
+    "gifted_subscriber_count = creator_subscriber_count.gifted_subscriber_count + :gifted, "
+    "total_subscriber_count = creator_subscriber_count.total_subscriber_count + :real + :gifted, "
+    "updated_at = EXCLUDED.updated_at"
+)
+
+_SET_SQL = text(
+    "INSERT INTO creator_subscriber_count "
+    "(user_id, real_subscriber_count, gifted_subscriber_count, total_subscriber_count, updated_at) "
+    "VALUES (:user_id, :real, :gifted, :real + :gifted, :now) "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    "real_subscriber_count = EXCLUDED.real_subscriber_count, "
+    "gifted_subscriber_count = EXCLUDED.gifted_subscriber_count, "
+    "total_subscriber_count = EXCLUDED.total_subscriber_count, "
+    "updated_at = EXCLUDED.updated_at"
+)
+
+
+class SubscriberCounts(NamedTuple):
+    real: int = 0
+    gifted: int = 0
+
+    @property
+    def total(self):
+        return self.real + self.gifted
+
+
+ZERO = SubscriberCounts()
+
+
+def _gifted(bonus):
+    """A gifted-subscriber row counts its bonus when positive (as every reader did)."""
+    return bonus if bonus and bonus > 0 else 0
+
+
+def aggregate(executor, user_ids=None):
+    """{creator_id: SubscriberCounts} recounted from the subscription tables,
+    for `user_ids` or every creator with any. `executor` is a Connection or
+    Session (a Session autoflushes first)."""
+    from sqlalchemy import func, select
+    from models import MobileSubscription as MS, AdminSubscription as AS
+    real = select(MS.subscribed_to_id, func.count(MS.id)).where(MS.status == 'active')
+    gifted = select(AS.portfolio_user_id, func.sum(AS.bonus_subscriber_count)).where(
+        AS.bonus_subscriber_count > 0)
+    if user_ids is not None:
+        real = real.where(MS.subscribed_to_id.in_(user_ids))
+        gifted = gifted.where(AS.portfolio_user_id.in_(user_ids))
+    counts = {}
+    for uid, n in executor.execute(real.group_by(MS.subscribed_to_id)):
+        counts[uid] = SubscriberCounts(int(n or 0), 0)
+    for uid, n in executor.execute(gifted.group_by(AS.portfolio_user_id)):
+        counts[uid] = counts.get(uid, ZERO)._replace(gifted=int(n or 0))
+    return counts
+
+
+def stored(executor, user_ids=None, for_update=False):
+    """{creator_id: SubscriberCounts} from the counter table (primary-key reads)."""
+    from sqlalchemy import select
+    from models import CreatorSubscriberCount as C
+    query = select(C.user_id, C.real_subscriber_count, C.gifted_subscriber_count)
+    if user_ids is not None:
+        ids = list(user_ids)
+        query = query.where(C.user_id == ids[0]) if len(ids) == 1 else query.where(C.user_id.in_(ids))
+    if for_update:
+        query = query.with_for_update()
+    return {uid: SubscriberCounts(real or 0, gifted or 0) for uid, real, gifted in executor.execute(query)}
+
+
+def read(conn, user_ids=None):
+    """Counters for `user_ids` (or everyone) on `conn`: the table once migrated,
+    otherwise the aggregate."""
+    if table_ready(conn):
+        return stored(conn, user_ids)
+    return aggregate(conn, user_ids)
+
+
+def _set(conn, counts):
+    now = datetime.utcnow()
+    conn.execute(_SET_SQL, [{'user_id': uid, 'real': c.real, 'gifted': c.gifted, 'now': now}
+                            for uid, c in sorted(counts.items())])
+
+
+def recount(conn, user_ids):
+    """Rewrite the counters of `user_ids` from the subscription tables, inside
+    `conn`'s transaction. Locks the existing rows first so increments from
+    concurrent transactions queue behind the recount instead of being lost."""
+    user_ids = sorted({uid for uid in user_ids if uid is not None})
+    if not user_ids:
+        return {}
+    stored(conn, user_ids, for_update=True)
+    fresh = aggregate(conn, user_ids)
+    counts = {uid: fresh.get(uid, ZERO) for uid in user_ids}
+    _set(conn, counts)
+    return counts
+
+
+def reconcile(engine=None, repair=True):
+    """
+    Compare every stored counter with a fresh aggregate and, with `repair`,
+    rewrite the drifted ones (recounted under row locks). Returns
+    [(user_id, stored SubscriberCounts, expected SubscriberCounts)].
+    """
+    if engine is None:
+        from models import db
+        engine = db.engine
+    with engine.begin() as conn:
+        expected = aggregate(conn)
+        current = stored(conn)
+        drift = [(uid, current.get(uid, ZERO), expected.get(uid, ZERO))
+                 for uid in sorted(set(expected) | set(current))
+                 if current.get(uid, ZERO) != expected.get(uid, ZERO)]
+        if drift and repair:
+            recount(conn, [uid for uid, _, _ in drift])
+    if drift:
+        logger.warning(f"subscriber counters drifted for {len(drift)} creators"
+                       f"{' (repaired)' if repair else ''}: {[uid for uid, _, _ in drift][:20]}")
+    return drift
+
+
+def table_ready(conn):
+    import db_tables
+    return db_tables.table_ready(
+        conn, 'creator_subscriber_count',
+        missing="creator_subscriber_count table missing; subscriber counts read the aggregates")
+
+
+# ── Session hooks ────────────────────────────────────────────────────────────
+
+def _committed(obj, attr):
+    """(value before this flush, known?) of a column attribute."""
+    from sqlalchemy import inspect
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0], True
+    if history.unchanged:
+        return history.unchanged[0], True
+    return None, False        # overwritten without the old value ever loaded
+
+
+def _contribution(obj, committed):
+    """(creator_id, SubscriberCounts) one subscription row adds, as of before
+    this flush (`committed`) or as it will be written; None if unknown."""
+    from models import MobileSubscription
+    if isinstance(obj, MobileSubscription):
+        fields = ('subscribed_to_id', 'status')
+    else:
+        fields = ('portfolio_user_id', 'bonus_subscriber_count')
+    if committed:
+        values = [_committed(obj, f) for f in fields]
+        if not all(known for _, known in values):
+            return None
+        uid, value = (v for v, _ in values)
+    else:
+        uid, value = (getattr(obj, f) for f in fields)
+    if isinstance(obj, MobileSubscription):
+        return uid, SubscriberCounts(1 if value == 'active' else 0, 0)
+    return uid, SubscriberCounts(0, _gifted(value))
+
+
+def _collect(session, flush_context, instances):
+    from sqlalchemy import inspect
+    from models import MobileSubscription, AdminSubscription
+    tracked = (MobileSubscription, AdminSubscription)
+    # Replaced on every flush: a flush that failed never reached _apply, and
+    # its changes are re-collected (or rolled back) before the next one.
+    # New rows may only get their creator id and status default during the
+    # flush; keep the objects and read them afterwards.
+    pending = {'new': [obj for obj in session.new if isinstance(obj, tracked)],
+               'deltas': [], 'recount': set()}
+    for obj in session.dirty:
+        if not isinstance(obj, tracked):
+            continue
+        attrs = (('subscribed_to_id', 'status') if isinstance(obj, MobileSubscription)
+                 else ('portfolio_user_id', 'bonus_subscriber_count'))
+        state = inspect(obj)
+        if not any(state.attrs[a].history.has_changes() for a in attrs):
+            continue
+        before = _contribution(obj, committed=True)
+        after = _contribution(obj, committed=False)
+        if before is None:
+            pending['recount'].update((after[0], _committed(obj, attrs[0])[0]))
+        else:
+            pending['deltas'] += [(before[0], -1, before[1]), (after[0], 1, after[1])]
+    for obj in session.deleted:
+        if isinstance(obj, tracked):
+            before = _contribution(obj, committed=True)
+            if before is None:
+                pending['recount'].add(_contribution(obj, committed=False)[0])
+            else:
+                pending['deltas'].append((before[0], -1, before[1]))
+    session.info[_PENDING_KEY] = pending
+
+
+def _apply(session, flush_context):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    deltas = pending['deltas']
+    for obj in pending['new']:
+        uid, counts = _contribution(obj, committed=False)
+        deltas.append((uid, 1, counts))
+    recounted = {uid for uid in pending['recount'] if uid is not None}
+    net = {}
+    for uid, sign, counts in deltas:
+        if uid is None or uid in recounted:
+            continue
+        real, gifted = net.get(uid, (0, 0))
+        net[uid] = (real + sign * counts.real, gifted + sign * counts.gifted)
+    net = {uid: d for uid, d in net.items() if d != (0, 0)}
+    if not net and not recounted:
+        return
+    from models import CreatorSubscriberCount
+    # Only sessions bound to the models' metadata (not app.py's legacy db).
+    conn = session.connection(bind_arguments={'mapper': CreatorSubscriberCount.__mapper__})
+    if not table_ready(conn):
+        return
+    if recounted:
+        recount(conn, recounted)
+    if net:
+        now = datetime.utcnow()
+        conn.execute(_INCREMENT_SQL, [
+            {'user_id': uid, 'real': real, 'gifted': gifted,
+             'real_floor': max(real, 0), 'gifted_floor': max(gifted, 0), 'now': now}
+            for uid, (real, gifted) in sorted(net.items())])
+
+
+_hooks_installed = False
+
+
+def install_session_hooks():
+    """Listen on the Session class so every flush, whichever code path made it,
+    keeps the counters current. Idempotent; installed before the influencer
+    ranking's hooks, which read these counters in the same flush."""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    event.listen(Session, 'before_flush', _collect)
+    event.listen(Session, 'after_flush_postexec', _apply)
+    _hooks_installed = True
+
+
+# ── Reads ────────────────────────────────────────────────────────────────────
+
+def get_many(user_ids):
+    """{creator_id: SubscriberCounts} for `user_ids` (every id present, zeros
+    for creators without subscribers) on the current db.session."""
+    from models import db, CreatorSubscriberCount
+    user_ids = sorted({uid for uid in user_ids if uid is not None})
+    if not user_ids:
+        return {}
+    conn = db.session.connection(bind_arguments={'mapper': CreatorSubscriberCount.__mapper__})
+    counts = stored(db.session, user_ids) if table_ready(conn) else aggregate(db.session, user_ids)
+    return {uid: counts.get(uid, ZERO) for uid in user_ids}
+
+
+def get(user_id):
+    """SubscriberCounts of one creator: a primary-key read."""
+    return get_many([user_id]).get(user_id, ZERO)
+
+
+def get_all():
+    """{creator_id: SubscriberCounts} for every creator with any subscribers."""
+    from models import db, CreatorSubscriberCount
+    conn = db.session.connection(bind_arguments={'mapper': CreatorSubscriberCount.__mapper__})
+    counts = stored(db.session) if table_ready(conn) else aggregate(db.session)
+    return {uid: c for uid, c in counts.items() if c.total > 0}
@@ -2,46 +2,78 @@
 Subscription tier utilities for dynamic pricing and trade limits
 """
 from datetime import datetime, date, timedelta
-from models import db, SubscriptionTier, TradeLimit, Stock, User
+from models import db, SubscriptionTier, TradeLimit, User
 from flask import current_app
+from sqlalchemy import func, text
 import logging
 
+# Upper bound of the 7-day average trades/day for each tier, lowest first.
+TIER_THRESHOLDS = [
+    (3, 'Light'),
+    (6, 'Standard'),
+    (12, 'Active'),
+    (25, 'Pro'),
+    (None, 'Elite'),
+]
+
+# trade_limit is the per-user, per-day trade counter: one row per (user_id,
+# date), bumped atomically by record_trade() inside the trade's own
+# transaction. Reads are primary-key / unique-index lookups instead of
+# COUNT(*) scans over the holdings table.
+_INCREMENT_SQL = text(
+    "INSERT INTO trade_limit (user_id, date, trade_count, created_at) "
+    "VALUES (:user_id, :day, :n, :now) "
+    "ON CONFLICT (user_id, date) DO UPDATE SET trade_count = "
+    "COALESCE(trade_limit.trade_count, 0) + EXCLUDED.trade_count "
+    "RETURNING trade_count"
+)
+
+def _trade_day(when=None):
+    """Counter day for a trade: the UTC date, matching Transaction.timestamp."""
+    if when is None:
+        return datetime.utcnow().date()
+    return when.date() if isinstance(when, datetime) else when
+
+def record_trade(user_id, day=None, n=1):
+    """
+    Count `n` trades for `user_id` on `day` (UTC today by default) and return
+    that day's new total. One UPSERT on the caller's session and transaction,
+    so the count commits or rolls back with the trade itself. Does not commit.
+    """
+    return db.session.execute(_INCREMENT_SQL, {
+        'user_id': user_id, 'day': _trade_day(day), 'n': n, 'now': datetime.utcnow(),
+    }).scalar()
+
 def get_user_trade_count(user_id, days=1):
-    """Get trade count for a user over the specified number of days"""
-    start_date = date.today() - timedelta(days=days-1)
-    
-    trade_count = Stock.query.filter(
-        Stock.user_id == user_id,
-        Stock.purchase_date >= datetime.combine(start_date, datetime.min.time())
-    ).count()
-    
-    return trade_count
+    """Get trade count for a user over the specified number of days (UTC, today inclusive)"""
+    start_date = _trade_day() - timedelta(days=days-1)
+    query = db.session.query(func.coalesce(func.sum(TradeLimit.trade_count), 0)).filter(
+        TradeLimit.user_id == user_id
+    )
+    if days == 1:
+        query = query.filter(TradeLimit.date == start_date)
+    else:
+        query = query.filter(TradeLimit.date >= start_date)
+    return int(query.scalar() or 0)
 
 def get_user_avg_trades_per_day(user_id, days=7):
     """Get average trades per day over the specified period"""
     total_trades = get_user_trade_count(user_id, days)
     return total_trades / days
 
+def tier_name_for(avg_trades_per_day):
+    """Tier name for a 7-day average trades/day"""
+    for ceiling, tier_name in TIER_THRESHOLDS:
+        if ceiling is None or avg_trades_per_day <= ceiling:
+            return tier_name
+
 def determine_subscription_tier(user_id, lookback_days=7):
     """
     Determine the appropriate subscription tier based on recent trading activity
     Uses 7-day average to prevent gaming the system with single-day spikes
     """
     avg_trades_per_day = get_user_avg_trades_per_day(user_id, lookback_days)
-    
-    # Tier thresholds based on average daily trades
-    if avg_trades_per_day <= 3:
-        tier_name = 'Light'
-    elif avg_trades_per_day <= 6:
-        tier_name = 'Standard'
-    elif avg_trades_per_day <= 12:
-        tier_name = 'Active'
-    elif avg_trades_per_day <= 25:
-        tier_name = 'Pro'
-    else:
-        tier_name = 'Elite'
-    
-    tier = SubscriptionTier.query.filter_by(tier_name=tier_name).first()
+    tier = SubscriptionTier.query.filter_by(tier_name=tier_name_for(avg_trades_per_day)).first()
     return tier, avg_trades_per_day
 
 def update_user_subscription_price(user_id):
@@ -71,28 +103,71 @@ def update_user_subscription_price(user_id):
     
     return False
 
+def retier_all_users(lookback_days=7):
+    """
+    Re-tier every priced user (subscription_price set) from the trade counter
+    in one statement: a windowed SUM over trade_limit feeds a CASE on
+    TIER_THRESHOLDS, joined to subscription_tier, and one UPDATE ... FROM sets
+    the price and Stripe price id of the users whose price changes. Users
+    without counter rows fall into the lowest tier. Returns users re-priced.
+    """
+    from sqlalchemy import case, update
+    start_date = _trade_day() - timedelta(days=lookback_days-1)
+    counts = db.session.query(
+        TradeLimit.user_id.label('user_id'), func.sum(TradeLimit.trade_count).label('trades')
+    ).filter(TradeLimit.date >= start_date).group_by(TradeLimit.user_id).subquery()
+
+    trades = func.coalesce(counts.c.trades, 0)
+    # avg <= ceiling  <=>  trades <= ceiling * lookback_days
+    tier_name = case(*[(trades <= ceiling * lookback_days, name)
+                       for ceiling, name in TIER_THRESHOLDS if ceiling is not None],
+                     else_=TIER_THRESHOLDS[-1][1])
+    wanted = db.session.query(User.id.label('user_id'), tier_name.label('tier_name')).outerjoin(
+        counts, counts.c.user_id == User.id
+    ).filter(User.subscription_price.isnot(None)).subquery()
+
+    users, tiers = User.__table__, SubscriptionTier.__table__
+    result = db.session.execute(
+        update(users)
+        .where(users.c.id == wanted.c.user_id, tiers.c.tier_name == wanted.c.tier_name,
+               users.c.subscription_price != tiers.c.price)
+        .values(subscription_price=tiers.c.price, stripe_price_id=tiers.c.stripe_price_id)
+    )
+    db.session.commit()
+    if result.rowcount:
+        current_app.logger.info(f"Re-priced {result.rowcount} users from {lookback_days}-day trade counts")
+    return result.rowcount
+
 def update_trade_limit_count(user_id):
-    """Update or create today's trade limit count for a user"""
-    today = date.today()
-    
-    # Get or create today's trade limit record
-    trade_limit = TradeLimit.query.filter_by(user_id=user_id, date=today).first()
-    if not trade_limit:
-        trade_limit = TradeLimit(user_id=user_id, date=today, trade_count=0)
-        db.session.add(trade_limit)
-    
-    # Count today's trades
-    today_start = datetime.combine(today, datetime.min.time())
-    trades_today = Stock.query.filter(
-        Stock.user_id == user_id,
-        Stock.purchase_date >= today_start
-    ).count()
-    
-    trade_limit.trade_count = trades_today
+    """Count one trade for today and return today's trade count"""
+    trades_today = record_trade(user_id)
     db.session.commit()
-    
     return trades_today
 
+def rebuild_trade_counts(days=8):
+    """
+    Recount the last `days` days of trade_limit from the transaction ledger
+    (buy/sell rows). Reconciliation for the counter: after manual ledger
+    fixes, or once after deploying the counter. Returns rows rewritten.
+    """
+    from models import Transaction
+    start = datetime.combine(_trade_day() - timedelta(days=days-1), datetime.min.time())
+    day = func.date(Transaction.timestamp)
+    rows = db.session.query(Transaction.user_id, day, func.count(Transaction.id)).filter(
+        Transaction.timestamp >= start,
+        Transaction.transaction_type.in_(['buy', 'sell'])
+    ).group_by(Transaction.user_id, day).all()
+
+    TradeLimit.query.filter(TradeLimit.date >= start.date()).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(TradeLimit, [
+        {'user_id': user_id, 'date': d if isinstance(d, date) else date.fromisoformat(d),
+         'trade_count': n, 'created_at': now}
+        for user_id, d, n in rows
+    ])
+    db.session.commit()
+    return len(rows)
+
 def check_trade_limit_exceeded(user_id):
     """
     Check if user has exceeded their daily trade limit based on their current tier
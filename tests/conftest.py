@@ -0,0 +1,32 @@
+"""
+Shared pytest fixtures.
+
+`app` is the /api/mobile blueprint on a fresh in-memory SQLite database
+(query_budget.make_app) with every table created, inside an app context;
+the tables are dropped afterwards. Cached table checks (db_tables) are
+reset first, since every in-memory database has the same URL. A module that needs more setup overrides
+it with a fixture of the same name that takes `app` and builds on it.
+"""
+
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.dirname(TESTS))
+
+
+@pytest.fixture
+def app():
+    import db_tables
+    import query_budget
+    from models import db
+    db_tables.reset()
+    app = query_budget.make_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,374 @@
+"""
+Query-count and wall-time budgets for the hot read paths as the user base grows.
+
+Seeds N users (holdings, a buy per holding, one daily snapshot per trading
+day, the compact intraday series for the last sessions, K subscriptions per
+user, portfolio stats, S&P rows) into SQLite or Postgres, then measures
+
+  * update_leaderboard_cache()              (market-close / collector rebuild)
+  * the intraday collector's per-tick work  (held tickers + live values + series write)
+  * GET /api/mobile/leaderboard
+  * GET /api/mobile/portfolio/<slug>
+  * GET /api/mobile/portfolio/<slug>/chart  (1D, 1W, 1M)
+  * GET /api/mobile/subscriptions
+
+counting SQL statements with perf_tracing.capture(). Each scenario has a
+budget `base + per_user * N` for statements and for milliseconds: request
+paths must be flat in N (per_user = 0); batch jobs get a fixed per-user cost,
+so a new per-user query anywhere fails the budget.
+
+    python tests/query_budget.py                         # N = 100, 1000, 10000
+    python tests/query_budget.py --sizes 100,500 --out report.json
+    python tests/query_budget.py --database-url postgresql://localhost/apes_bench
+
+The database must be disposable: a run refuses one that already has tables
+unless --drop-existing is given (which drops the app's tables first), and
+drops only the tables it created.
+Prices come from the in-memory price cache, so no AlphaVantage calls are made.
+tests/test_query_budget.py runs the small sizes on every pytest run.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('JWT_SECRET', 'query-budget-secret')
+
+TICKERS = [f'TK{i:02d}' for i in range(40)] + ['AAPL', 'MSFT', 'NVDA', 'SPY']
+HOLDINGS_PER_USER = 5
+CHART_PERIODS = ('1D', '1W', '1M')
+LEADERBOARD_PERIODS = ['1D', '5D', '1M']
+
+# scenario -> {'queries': (base, per_user), 'ms': (base, per_user)}
+BUDGETS = {
+    'update_leaderboard_cache': {'queries': (60, 11), 'ms': (2000, 30)},
+    'intraday_collector':       {'queries': (10, 3),  'ms': (1000, 8)},
+    'leaderboard':              {'queries': (40, 0),  'ms': (1500, 0)},
+    'portfolio':                {'queries': (40, 0),  'ms': (1500, 0)},
+    'chart_1D':                 {'queries': (15, 0),  'ms': (1000, 0)},
+    'chart_1W':                 {'queries': (15, 0),  'ms': (1000, 0)},
+    'chart_1M':                 {'queries': (15, 0),  'ms': (1000, 0)},
+    'subscriptions':            {'queries': (10, 0),  'ms': (1000, 0)},
+}
+
+
+def make_app(database_url='sqlite://', engine_options=None):
+    from flask import Flask
+    from sqlalchemy.pool import StaticPool
+    from models import db
+    from mobile_api import mobile_api
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if engine_options is not None:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    elif database_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': StaticPool,
+                                                   'connect_args': {'check_same_thread': False}}
+    db.init_app(app)
+    app.register_blueprint(mobile_api, url_prefix='/api/mobile')
+    return app
+
+
+def trading_days(end, count):
+    days = []
+    d = end
+    while len(days) < count:
+        if d.weekday() < 5:
+            days.append(d)
+        d -= timedelta(days=1)
+    return sorted(days)
+
+
+def seed(n_users, days=30, sessions=5, subs_per_user=3):
+    """Bulk-load a synthetic user base. Returns the viewer (user 1) and the
+    slug of a portfolio with subscribers."""
+    from models import (db, User, Stock, Transaction, PortfolioSnapshot, MarketData,
+                        PortfolioIntradaySeries, UserPortfolioStats, InAppPurchase,
+                        MobileSubscription)
+    from leaderboard_utils import get_last_market_day
+    from intraday_series import SLOT_COUNT, pack
+
+    today = get_last_market_day()
+    joined = datetime.combine(today - timedelta(days=400), datetime.min.time())
+    daily = trading_days(today, days)
+    recent = daily[-sessions:]
+    insert = lambda model, rows: rows and db.session.execute(model.__table__.insert(), rows)
+
+    insert(User, [{
+        'id': u, 'email': f'bench{u}@example.com', 'username': f'bench{u}',
+        'portfolio_slug': f'bench{u}', 'role': 'user', 'created_by': 'human',
+        'created_at': joined, 'max_cash_deployed': 10000.0, 'cash_proceeds': float(u % 7 * 25),
+        'leaderboard_eligible': True, 'email_notifications_enabled': True,
+        'push_notifications_enabled': True, 'subscription_price': 4.99, 'extra_data': {},
+    } for u in range(1, n_users + 1)])
+
+    stocks, txns, stats = [], [], []
+    for u in range(1, n_users + 1):
+        held = [TICKERS[(u * 7 + h * 3) % len(TICKERS)] for h in range(HOLDINGS_PER_USER)]
+        for h, ticker in enumerate(dict.fromkeys(held)):
+            qty = 10.0 + (u + h) % 5
+            stocks.append({'user_id': u, 'ticker': ticker, 'quantity': qty,
+                           'purchase_price': 100.0, 'purchase_date': joined})
+            txns.append({'user_id': u, 'ticker': ticker, 'quantity': qty, 'price': 100.0,
+                         'transaction_type': 'buy', 'timestamp': joined + timedelta(minutes=h)})
+        stats.append({'user_id': u, 'avg_trades_per_week': 1.0, 'total_trades': len(held),
+                      'unique_stocks_count': len(set(held)), 'large_cap_percent': 60.0,
+                      'small_cap_percent': 40.0, 'industry_mix': {'Technology': 100.0},
+                      'subscriber_count': 0, 'last_updated': datetime.utcnow()})
+    insert(Stock, stocks)
+    insert(Transaction, txns)
+    insert(UserPortfolioStats, stats)
+
+    snapshots = []
+    for u in range(1, n_users + 1):
+        for i, d in enumerate(daily):
+            value = 10000.0 * (1 + ((u % 13) - 6) / 1000 * i)
+            snapshots.append({'user_id': u, 'date': d, 'total_value': value, 'stock_value': value,
+                              'cash_proceeds': 0.0, 'max_cash_deployed': 10000.0, 'cash_flow': 0.0})
+    insert(PortfolioSnapshot, snapshots)
+
+    series = []
+    for u in range(1, n_users + 1):
+        for d in recent:
+            values = [10000.0 + (u % 11) * s for s in range(SLOT_COUNT)]
+            series.append({'user_id': u, 'session_date': d, 'slot_mask': (1 << SLOT_COUNT) - 1,
+                           'total_values': pack(values), 'stock_values': pack(values),
+                           'cash_proceeds': pack([0.0] * SLOT_COUNT),
+                           'max_cash_deployed': pack([10000.0] * SLOT_COUNT),
+                           'updated_at': datetime.utcnow()})
+    insert(PortfolioIntradaySeries, series)
+
+    market = [{'ticker': 'SPY_SP500', 'date': d, 'close_price': 5000.0 + i, 'created_at': datetime.utcnow()}
+              for i, d in enumerate(daily)]
+    for d in recent:
+        open_at = datetime.combine(d, datetime.min.time()) + timedelta(hours=13, minutes=30)
+        market += [{'ticker': 'SPY_INTRADAY', 'date': d, 'timestamp': open_at + timedelta(minutes=15 * s),
+                    'close_price': 5000.0 + s, 'created_at': datetime.utcnow()} for s in range(SLOT_COUNT)]
+    insert(MarketData, market)
+
+    # K subscriptions per user, each backed by a purchase; creator 2 is the
+    # viewer's first subscription and has the most subscribers.
+    purchases, subs = [], []
+    expires = datetime.utcnow() + timedelta(days=30)
+    for u in range(1, n_users + 1):
+        for k in range(min(subs_per_user, n_users - 1)):
+            creator = (u + k) % n_users + 1
+            pid = len(purchases) + 1
+            purchases.append({'id': pid, 'subscriber_id': u, 'subscribed_to_id': creator,
+                              'platform': 'apple', 'product_id': 'sub.s01.monthly',
+                              'transaction_id': f'bench-{pid}', 'original_transaction_id': f'bench-{pid}',
+                              'status': 'active', 'purchase_date': joined, 'expires_date': expires,
+                              'price': 4.99, 'influencer_payout': 3.60, 'platform_revenue': 0.64,
+                              'store_fee': 0.75, 'created_at': joined})
+            subs.append({'subscriber_id': u, 'subscribed_to_id': creator, 'in_app_purchase_id': pid,
+                         'status': 'active', 'created_at': joined, 'expires_at': expires,
+                         'slot': k + 1, 'push_notifications_enabled': True})
+    insert(InAppPurchase, purchases)
+    insert(MobileSubscription, subs)
+    db.session.commit()
+    return User.query.get(1), 'bench2'
+
+
+def prime_price_cache():
+    from portfolio_performance import stock_price_cache
+    now = datetime.now()
+    for i, ticker in enumerate(TICKERS):
+        stock_price_cache[ticker] = {'price': 100.0 + i, 'timestamp': now}
+
+
+def reset_instance_state():
+    """Per-instance memos that would otherwise leak between sizes."""
+    import activity_sink
+    import db_tables
+    import mobile_api
+    mobile_api._rate_limit_store.clear()
+    activity_sink.reset()
+    db_tables.reset()
+
+
+def run_collector_tick():
+    """The intraday collector's per-tick database work (route minus the quote
+    fetch, which the primed price cache stands in for)."""
+    from models import db, User
+    from cash_tracking import held_tickers, live_portfolio_values
+    from intraday_series import MARKET_TZ, record_tick
+
+    users = User.query.all()
+    held_tickers()
+    values, errors = live_portfolio_values(users)
+    if errors:
+        raise AssertionError(errors[:3])
+    record_tick(datetime.now(MARKET_TZ), {
+        uid: (v['total_value'], v['stock_value'], v['cash_proceeds'], 10000.0)
+        for uid, v in values.items() if v['total_value'] > 0
+    })
+    db.session.commit()
+
+
+def budget_for(name, n):
+    b = BUDGETS[name]
+    return {'queries': b['queries'][0] + b['queries'][1] * n,
+            'ms': b['ms'][0] + b['ms'][1] * n}
+
+
+def create_tables(drop_existing=False):
+    """Create the app's tables in the current app context's database and
+    return them, for drop_tables(). Refuses (SystemExit) a database that
+    already has tables unless drop_existing, which drops the app's tables
+    first; tables the app doesn't define are never touched."""
+    from sqlalchemy import inspect
+    from models import db
+    existing = inspect(db.engine).get_table_names()
+    if existing and not drop_existing:
+        raise SystemExit(f"refusing to use {db.engine.url!r}: it already has {len(existing)} tables "
+                         f"({', '.join(sorted(existing)[:5])}); point --database-url at an empty "
+                         f"database or pass --drop-existing if this one is disposable")
+    if existing:
+        db.drop_all()
+        existing = set(inspect(db.engine).get_table_names())
+    created = [t for t in db.metadata.sorted_tables if t.name not in existing]
+    db.metadata.create_all(bind=db.engine, tables=created)
+    return created
+
+
+def drop_tables(tables):
+    """Drop the tables create_tables() created."""
+    from models import db
+    db.session.remove()
+    db.metadata.drop_all(bind=db.engine, tables=tables)
+
+
+def run_size(n, database_url='sqlite://', days=30, sessions=5, subs_per_user=3, drop_existing=False):
+    """Seed a fresh database with `n` users and measure every scenario.
+    Returns {scenario: {'queries', 'ms', 'budget', 'ok', ...}}. Refuses
+    (SystemExit) a database that already has tables unless drop_existing."""
+    import perf_tracing
+    from models import db
+    from mobile_api import generate_jwt_token
+
+    app = make_app(database_url)
+    results = {}
+    with app.app_context():
+        created = create_tables(drop_existing)
+        try:
+            t0 = time.perf_counter()
+            viewer, slug = seed(n, days=days, sessions=sessions, subs_per_user=subs_per_user)
+            seed_ms = round((time.perf_counter() - t0) * 1000, 1)
+            prime_price_cache()
+            reset_instance_state()
+            headers = {'Authorization': f'Bearer {generate_jwt_token(viewer.id, viewer.email)}'}
+            client = app.test_client()
+
+            def request_scenario(path):
+                def call():
+                    resp = client.get(path, headers=headers)
+                    if resp.status_code != 200:
+                        raise AssertionError(f'GET {path} -> {resp.status_code}: {resp.get_data(as_text=True)[:300]}')
+                    return resp
+                return call
+
+            from leaderboard_utils import update_leaderboard_cache
+            scenarios = [
+                ('update_leaderboard_cache', lambda: update_leaderboard_cache(periods=LEADERBOARD_PERIODS)),
+                ('intraday_collector', run_collector_tick),
+                ('leaderboard', request_scenario('/api/mobile/leaderboard?period=1W')),
+                ('portfolio', request_scenario(f'/api/mobile/portfolio/{slug}')),
+            ] + [
+                (f'chart_{p}', request_scenario(f'/api/mobile/portfolio/{slug}/chart?period={p}'))
+                for p in CHART_PERIODS
+            ] + [
+                ('subscriptions', request_scenario('/api/mobile/subscriptions')),
+            ]
+
+            for name, fn in scenarios:
+                db.session.remove()
+                # update_leaderboard_cache() narrates to stdout
+                with perf_tracing.capture(name) as trace, contextlib.redirect_stdout(io.StringIO()):
+                    fn()
+                ms = round(trace.elapsed_ms(), 1)
+                budget = budget_for(name, n)
+                results[name] = {
+                    'queries': trace.query_count,
+                    'query_ms': round(trace.query_ms, 1),
+                    'ms': ms,
+                    'budget': budget,
+                    'ok': trace.query_count <= budget['queries'] and ms <= budget['ms'],
+                }
+            results['_seed'] = {'ms': seed_ms}
+        finally:
+            drop_tables(created)
+    return results
+
+
+def build_report(sizes, database_url='sqlite://', drop_existing=False, **seed_args):
+    report = {
+        'generated_at': datetime.utcnow().isoformat() + 'Z',
+        'database': database_url.split('://')[0],
+        'python': platform.python_version(),
+        'seed': dict({'days': 30, 'sessions': 5, 'subs_per_user': 3,
+                      'holdings_per_user': HOLDINGS_PER_USER}, **seed_args),
+        'budgets': BUDGETS,
+        'sizes': {},
+    }
+    for n in sizes:
+        report['sizes'][str(n)] = run_size(n, database_url, drop_existing=drop_existing, **seed_args)
+    report['ok'] = all(r['ok'] for size in report['sizes'].values()
+                       for name, r in size.items() if not name.startswith('_'))
+    return report
+
+
+def print_report(report):
+    sizes = list(report['sizes'])
+    print(f"{'scenario':26s}" + ''.join(f'{"N=" + n:>22s}' for n in sizes))
+    for name in BUDGETS:
+        cols = []
+        for n in sizes:
+            r = report['sizes'][n][name]
+            flag = '' if r['ok'] else ' !'
+            cols.append(f"{r['queries']}q/{r['ms']:.0f}ms{flag}")
+        print(f'{name:26s}' + ''.join(f'{c:>22s}' for c in cols))
+    print('within budget' if report['ok'] else 'OVER BUDGET (marked !)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma-separated user counts')
+    parser.add_argument('--database-url', default='sqlite://', help='empty, disposable database')
+    parser.add_argument('--drop-existing', action='store_true',
+                        help="drop the app's tables in --database-url first instead of refusing a non-empty one")
+    parser.add_argument('--days', type=int, default=30, help='daily snapshots per user')
+    parser.add_argument('--sessions', type=int, default=5, help='intraday series sessions per user')
+    parser.add_argument('--subs', type=int, default=3, help='subscriptions per user')
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    report = build_report(sizes, args.database_url, drop_existing=args.drop_existing, days=args.days,
+                          sessions=args.sessions, subs_per_user=args.subs)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Tests for the buffered activity / DAU sink (activity_sink.py).
+
+Run with: pytest tests/test_activity_sink.py -v
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import activity_sink
+import perf_tracing
+
+
+@pytest.fixture
+def app(app):
+    activity_sink.reset()
+    yield app
+    activity_sink.reset()
+
+
+def _users(n, prefix='u'):
+    from models import db, User
+    users = [User(email=f'{prefix}{i}@example.com', username=f'{prefix}{i}') for i in range(n)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [u.id for u in users]
+
+
+def _active_rows():
+    from models import UserActivity
+    return sorted(UserActivity.query.filter_by(activity_type='mobile_active')
+                  .with_entities(UserActivity.user_id).all())
+
+
+class TestDailyActive:
+    def test_one_row_per_user_per_day_and_no_request_io(self, app):
+        from models import db
+        ids = _users(3)
+        with perf_tracing.capture('requests') as trace:
+            for _ in range(5):
+                for user_id in ids:
+                    activity_sink.mark_active(user_id)
+        assert trace.query_count == 0
+        assert activity_sink.buffer.pending() == 3
+        assert activity_sink.flush(db.engine) == 3
+        assert _active_rows() == [(i,) for i in ids]
+
+    def test_rows_from_other_instances_are_not_duplicated(self, app):
+        from models import db, UserActivity
+        a, b = _users(2)
+        db.session.add(UserActivity(user_id=a, activity_type='mobile_active'))
+        db.session.commit()
+        activity_sink.mark_active(a)
+        activity_sink.mark_active(b)
+        assert activity_sink.flush(db.engine) == 1
+        assert _active_rows() == [(a,), (b,)]
+
+    def test_flush_statements_do_not_grow_with_batch(self, app):
+        from models import db
+        counts = []
+        for ids in (_users(2, 'a'), _users(40, 'b')):
+            for user_id in ids:
+                activity_sink.mark_active(user_id)
+                activity_sink.record_page_view(page='/')
+            with perf_tracing.capture('flush') as trace:
+                activity_sink.flush(db.engine)
+            counts.append(trace.query_count)
+        assert counts[0] == counts[1]
+
+    def test_failed_flush_requeues_on_next_ping(self, app):
+        from models import db
+        user_id, = _users(1)
+        activity_sink.mark_active(user_id)
+        db.drop_all()
+        assert activity_sink.flush(db.engine) == 0
+        db.create_all()
+        _users(1)
+        activity_sink.mark_active(user_id)
+        assert activity_sink.flush(db.engine) == 1
+
+
+class TestAnalyticsRows:
+    def test_page_views_and_clicks_keep_their_event_time(self, app):
+        from models import db, PageView, LinkClick
+        before = datetime.utcnow()
+        activity_sink.record_page_view(page='/p/slug', ip_hash='abc')
+        activity_sink.record_link_click(platform='apple', source_page='/')
+        assert PageView.query.count() == 0
+        assert activity_sink.flush(db.engine) == 2
+        view = PageView.query.one()
+        assert view.page == '/p/slug' and before <= view.created_at < before + timedelta(seconds=5)
+        assert LinkClick.query.one().platform == 'apple'
+
+    def test_due_buffer_flushes_inline_without_request_hook(self, app, monkeypatch):
+        from models import PageView, UserActivity
+        monkeypatch.setattr(activity_sink, 'FLUSH_EVERY', 3)
+        monkeypatch.setattr(activity_sink, '_engine_getter', None)
+        activity_sink.record_page_view()
+        activity_sink.record_page_view()
+        assert not activity_sink.buffer.flush_due() and PageView.query.count() == 0
+        activity_sink.record_activity(_users(1)[0], 'login')
+        assert activity_sink.buffer.pending() == 0
+        assert PageView.query.count() == 2 and UserActivity.query.count() == 1
+
+
+class TestRequestPath:
+    def test_authenticated_request_does_not_write_activity(self, app):
+        from models import db
+        from mobile_api import generate_jwt_token
+        user_id, = _users(1)
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {generate_jwt_token(user_id, "u0@example.com")}'}
+        client.get('/api/mobile/notifications/history', headers=headers)
+        assert _active_rows() == []
+        activity_sink.flush(db.engine)
+        assert _active_rows() == [(user_id,)]
+
+    def test_request_teardown_leaves_nothing_buffered(self, app, monkeypatch):
+        from models import db, PageView
+        monkeypatch.setattr(activity_sink, '_engine_getter', None)
+        monkeypatch.setattr(activity_sink.atexit, 'register', lambda fn: None)
+        activity_sink.init_app(app, engine_getter=lambda: db.engine)
+        app.add_url_rule('/p/<slug>', 'portfolio_page',
+                         lambda slug: activity_sink.record_page_view(page=f'/p/{slug}') or 'ok')
+        assert app.test_client().get('/p/one').status_code == 200
+        # Flushed at the end of the request, not left for a later request or
+        # atexit (which a frozen serverless instance never runs).
+        assert activity_sink.buffer.pending() == 0
+        assert PageView.query.one().page == '/p/one'
@@ -0,0 +1,115 @@
+"""
+Tests for the aggregate admin metrics (admin_metrics.py) and the revenue
+summary endpoint built on them.
+
+Run with: pytest tests/test_admin_metrics.py -v
+"""
+
+from datetime import datetime, timedelta
+
+import perf_tracing
+
+
+def _users(n, prefix='u', **fields):
+    from models import db, User
+    users = [User(email=f'{prefix}{i}@example.com', username=f'{prefix}{i}', **fields) for i in range(n)]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+class TestPlatformMetrics:
+    def test_active_users_for_all_windows_in_one_query(self, app):
+        from models import db, UserActivity
+        import admin_metrics
+        now = datetime.utcnow()
+        users = _users(4)
+        for user, age_days in zip(users, (0.5, 3, 20, 60)):
+            db.session.add(UserActivity(user_id=user.id, activity_type='login',
+                                        timestamp=now - timedelta(days=age_days)))
+        db.session.add(UserActivity(user_id=users[0].id, activity_type='mobile_active',
+                                    timestamp=now - timedelta(hours=1)))   # same user twice
+        db.session.add(UserActivity(user_id=users[3].id, activity_type='login',
+                                    timestamp=now - timedelta(days=120)))  # outside every window
+        db.session.commit()
+        with perf_tracing.capture('active') as trace:
+            assert admin_metrics.active_users_by_window(now=now) == {1: 1, 7: 2, 30: 3, 90: 4}
+        assert trace.query_count == 1
+        assert admin_metrics.get_active_users_count(7) == 2
+
+    def test_api_calls_rolled_up_per_minute(self, app):
+        from models import db, AlphaVantageAPILog
+        import admin_metrics
+        busy = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(hours=2)
+        stamps = [busy + timedelta(seconds=s) for s in (1, 10, 20, 50)]
+        stamps += [busy - timedelta(minutes=5), busy + timedelta(minutes=3), datetime.utcnow() - timedelta(days=9)]
+        db.session.add_all([AlphaVantageAPILog(endpoint='GLOBAL_QUOTE', response_status='success', timestamp=t)
+                            for t in stamps])
+        db.session.commit()
+        total, avg, peak, peak_time = admin_metrics.calculate_api_call_metrics(7)
+        assert (total, peak, peak_time) == (6, 4, busy)
+        assert avg == round(6 / (7 * 24 * 60), 2)
+
+    def test_unique_stocks_across_tables(self, app):
+        from models import db, Stock, StockInfo
+        import admin_metrics
+        user, = _users(1)
+        db.session.add_all([Stock(ticker='aapl', quantity=1, purchase_price=1, user_id=user.id),
+                            Stock(ticker='MSFT', quantity=1, purchase_price=1, user_id=user.id),
+                            StockInfo(ticker='AAPL'), StockInfo(ticker='NVDA')])
+        db.session.commit()
+        assert admin_metrics.calculate_unique_stocks_count() == 3
+
+    def test_daily_rollup_upserts_todays_row(self, app):
+        from models import PlatformMetrics
+        import admin_metrics
+        assert admin_metrics.update_daily_metrics() and admin_metrics.update_daily_metrics()
+        assert PlatformMetrics.query.count() == 1
+        assert admin_metrics.get_admin_dashboard_metrics()['cached'] is True
+
+
+class TestRevenueSummary:
+    def _seed(self, creators, tag=''):
+        from models import db, MobileSubscription, AdminSubscription
+        subscriber, = _users(1, prefix=f'sub{tag}-')
+        humans = _users(creators, prefix=f'creator{tag}-')
+        bot, = _users(1, prefix=f'bot{tag}-', role='agent')
+        for i, creator in enumerate(humans + [bot]):
+            for _ in range(i % 3 + 1):
+                db.session.add(MobileSubscription(subscriber_id=subscriber.id, subscribed_to_id=creator.id,
+                                                  in_app_purchase_id=1, status='active'))
+            db.session.add(MobileSubscription(subscriber_id=subscriber.id, subscribed_to_id=creator.id,
+                                              in_app_purchase_id=1, status='canceled'))
+        db.session.add(AdminSubscription(portfolio_user_id=humans[0].id, bonus_subscriber_count=5))
+        db.session.add(AdminSubscription(portfolio_user_id=humans[0].id, bonus_subscriber_count=2))
+        db.session.add(AdminSubscription(portfolio_user_id=bot.id, bonus_subscriber_count=4))
+        db.session.commit()
+        return [h.id for h in humans], bot.id
+
+    def test_counts_and_constant_query_count(self, app):
+        import admin_metrics
+        counts = []
+        for creators in (3, 30):
+            humans, bot = self._seed(creators, tag=creators)
+            with perf_tracing.capture('revenue') as trace:
+                rows = {uid: (real, gifted) for uid, _user, real, gifted in admin_metrics.subscriber_counts_by_creator()}
+            counts.append(trace.query_count)
+            assert rows[humans[0]] == (1, 7)
+            assert rows[humans[1]] == (2, 0)
+            assert rows[bot] == ((len(humans)) % 3 + 1, 4)
+        assert counts == [1, 1]
+
+    def test_endpoint(self, app, monkeypatch):
+        monkeypatch.setenv('ADMIN_API_KEY', 'test-admin-key')
+        monkeypatch.delenv('ADMIN_TOTP_SECRET', raising=False)
+        humans, bot = self._seed(3)
+        resp = app.test_client().get('/api/mobile/admin/bot/revenue-summary',
+                                     headers={'X-Admin-Key': 'test-admin-key'})
+        body = resp.get_json()
+        assert resp.status_code == 200, body
+        assert body['real_subscriptions'] == 1 + 2 + 3 + 1
+        assert body['gifted_subscriptions'] == 11
+        by_user = {i['user_id']: i for i in body['influencers']}
+        assert by_user[bot]['is_company_bot'] and by_user[bot]['total_payout'] == 0.0
+        assert by_user[humans[0]]['total_subs'] == 8
+        assert body['bot_revenue']['real_subs'] == 1 and body['bot_revenue']['gifted_subs'] == 4
@@ -8,7 +8,9 @@ sign a JWS with the leaf, and assert the verifier:
   * rejects a tampered payload (bad signature),
   * rejects a chain that terminates at an untrusted root,
   * rejects a broken chain (leaf not signed by the presented intermediate),
-  * reports ROOT_NOT_CONFIGURED when the trust anchor file is absent.
+  * reports ROOT_NOT_CONFIGURED when the trust anchor file is absent,
+  * serves repeat chains from the verified-chain cache without weakening any
+    of the above.
 
 Run directly:  python tests/test_apple_jws_verifier.py
 """
@@ -179,6 +181,85 @@ def test_integration_with_iap_service():
     print('PASS integration: bundleId mismatch rejected')
 
 
+def test_repeat_chain_skips_parsing_but_still_checks_signature():
+    _, _, leaf_key, root, intermediate, leaf = build_chain()
+    _write_root(root)
+    v.reset_chain_cache()
+    v._load_root_cert()
+    parsed = []
+    real_load = v._load_cert
+    v._load_cert = lambda data: parsed.append(1) or real_load(data)
+    try:
+        for i in range(5):
+            out = v.verify_and_decode(_make_jws(dict(PAYLOAD, transactionId=str(i)), leaf_key,
+                                                [leaf, intermediate, root]))
+            assert out['transactionId'] == str(i), out
+        assert len(parsed) == 3, parsed  # one chain parse, then cache hits
+        info = v.chain_cache_info()
+        assert (info['hits'], info['misses'], info['size']) == (4, 1, 1), info
+
+        h, p, s = _make_jws(PAYLOAD, leaf_key, [leaf, intermediate, root]).split('.')
+        forged = base64.urlsafe_b64encode(json.dumps(dict(PAYLOAD, transactionId='999')).encode()).decode().rstrip('=')
+        try:
+            v.verify_and_decode(f'{h}.{forged}.{s}')
+            assert False, 'tampered payload accepted from a cached chain!'
+        except v.AppleJWSVerificationError as e:
+            assert 'signature' in str(e), e
+    finally:
+        v._load_cert = real_load
+    print('PASS repeat chain served from cache; signature still enforced')
+
+
+def test_cached_chain_expires_with_its_certificates():
+    _, _, leaf_key, root, intermediate, leaf = build_chain()
+    _write_root(root)
+    v.reset_chain_cache()
+    x5c = [_der_b64(c) for c in (leaf, intermediate, root)]
+    v.verify_and_decode(_make_jws(PAYLOAD, leaf_key, [leaf, intermediate, root]))
+    key = v.chain_cache_key(x5c, v._load_root_cert())
+    assert v.cached_leaf_key(key) is not None
+    assert v.cached_leaf_key(key, now=leaf.not_valid_after_utc + timedelta(seconds=1)) is None
+    assert v.chain_cache_info()['size'] == 0
+    print('PASS cached chain dropped outside its validity window')
+
+
+def test_chain_cache_is_bounded_and_keyed_by_pinned_root():
+    v.reset_chain_cache()
+    other_root_key = _key()
+    other_root = _cert('Attacker Root', other_root_key, other_root_key)
+    for _ in range(v.CHAIN_CACHE_SIZE + 3):
+        _, _, leaf_key, root, intermediate, leaf = build_chain()
+        _write_root(root)
+        v.verify_and_decode(_make_jws(PAYLOAD, leaf_key, [leaf, intermediate, root]))
+    assert v.chain_cache_info()['size'] == v.CHAIN_CACHE_SIZE
+    # The most recent chain, re-presented under a different pinned root, is
+    # not a cache hit: it is re-verified and rejected.
+    _write_root(other_root)
+    try:
+        v.verify_and_decode(_make_jws(PAYLOAD, leaf_key, [leaf, intermediate, root]))
+        assert False, 'cached chain accepted under a different root!'
+    except v.AppleJWSVerificationError as e:
+        assert str(e) == 'untrusted_root', e
+    print('PASS chain cache bounded and keyed by pinned root')
+
+
+def test_webhook_verifier_shares_the_cache():
+    import iap_webhooks
+    _, _, leaf_key, root, intermediate, leaf = build_chain()
+    os.environ['APPLE_ROOT_CA_G3_PEM'] = root.public_bytes(serialization.Encoding.PEM).decode()
+    v.reset_chain_cache()
+    try:
+        for i in range(3):
+            out = iap_webhooks.verify_apple_jws(_make_jws(dict(PAYLOAD, transactionId=str(i)), leaf_key,
+                                                          [leaf, intermediate, root]))
+            assert out['transactionId'] == str(i), out
+    finally:
+        del os.environ['APPLE_ROOT_CA_G3_PEM']
+    info = v.chain_cache_info()
+    assert (info['hits'], info['misses']) == (2, 1), info
+    print('PASS webhook verification reuses verified chains')
+
+
 def main():
     test_accepts_authentic_jws()
     test_rejects_tampered_payload()
@@ -186,6 +267,10 @@ def main():
     test_rejects_broken_chain()
     test_reports_not_configured_when_missing()
     test_integration_with_iap_service()
+    test_repeat_chain_skips_parsing_but_still_checks_signature()
+    test_cached_chain_expires_with_its_certificates()
+    test_chain_cache_is_bounded_and_keyed_by_pinned_root()
+    test_webhook_verifier_shares_the_cache()
     print('\nALL APPLE JWS VERIFIER TESTS PASSED')
 
 
@@ -0,0 +1,145 @@
+"""
+Tests for av_rate_governor (shared AlphaVantage rate budget).
+
+Drives the governor with a fake clock so the 60s sliding window and the
+throttle backoff can be checked without sleeping.
+
+Run with: pytest tests/test_av_rate_governor.py -v
+"""
+
+from datetime import date
+
+from av_rate_governor import AVRateGovernor, is_throttle_response
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.now += s
+
+
+def _gov(max_calls=3, window_s=60.0):
+    clock = FakeClock()
+    return AVRateGovernor(max_calls=max_calls, window_s=window_s,
+                          clock=clock, sleep=clock.sleep), clock
+
+
+class TestSlidingWindow:
+    def test_burst_up_to_budget_without_waiting(self):
+        gov, clock = _gov(max_calls=3)
+        for _ in range(3):
+            assert gov.acquire()
+        assert clock.slept == []
+        assert gov.remaining() == 0
+
+    def test_next_call_waits_for_oldest_to_age_out(self):
+        gov, clock = _gov(max_calls=3)
+        gov.acquire()
+        clock.now += 10
+        gov.acquire()
+        gov.acquire()
+        start = clock.now
+        assert gov.acquire()
+        # Oldest call was at t=1000, so the 4th slot opens at t=1060.
+        assert clock.now == start + 50
+
+    def test_deadline_returns_false_without_recording(self):
+        gov, clock = _gov(max_calls=1)
+        gov.acquire()
+        assert gov.acquire(deadline=clock.now + 5) is False
+        assert gov.total_calls == 1
+
+
+class TestThrottleBackoff:
+    def test_throttle_pauses_and_doubles(self):
+        gov, clock = _gov(max_calls=100)
+        gov.report_throttle()
+        start = clock.now
+        gov.acquire()
+        assert clock.now - start >= 2.0
+        gov.report_throttle()
+        assert gov.stats()['backoff_s'] == 4.0
+
+    def test_success_resets_backoff(self):
+        gov, _ = _gov()
+        gov.report_throttle()
+        gov.report_success()
+        assert gov.stats()['backoff_s'] == 0.0
+
+    def test_throttle_envelope_detection(self):
+        assert is_throttle_response({'Note': 'Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute'})
+        assert is_throttle_response({'Information': 'You have exceeded the rate limit per minute for your plan'})
+        assert not is_throttle_response({'Information': 'This is a premium endpoint.'})
+        assert not is_throttle_response({'Time Series (Daily)': {}})
+        assert not is_throttle_response('symbol,name\n')
+
+
+class TestDailyBarRows:
+    def test_rows_match_frame(self):
+        import pandas as pd
+        from bot_data_hub import daily_bar_rows
+        df = pd.DataFrame(
+            {'Open': [1.0, 2.0], 'High': [1.5, 2.5], 'Low': [0.5, 1.5],
+             'Close': [1.2, 2.2], 'Volume': [100.0, 200.0]},
+            index=pd.to_datetime(['2026-10-15', '2026-10-16']),
+        )
+        rows = daily_bar_rows('AAPL', df, fetched_at='now')
+        assert [r['date'] for r in rows] == [date(2026, 10, 15), date(2026, 10, 16)]
+        assert rows[1]['close'] == 2.2 and rows[1]['volume'] == 200.0
+        assert all(r['ticker'] == 'AAPL' and r['source'] == 'av' for r in rows)
+        assert isinstance(rows[0]['open'], float)
+
+
+class TestRequestPathDeadline:
+    def test_user_requests_get_a_short_deadline(self):
+        import time
+        from flask import Flask
+        import av_rate_governor
+        app = Flask(__name__)
+        assert av_rate_governor._default_deadline() is None
+        with app.test_request_context('/api/mobile/portfolio'):
+            deadline = av_rate_governor._default_deadline()
+            assert deadline is not None
+            assert deadline - time.monotonic() <= av_rate_governor.AV_REQUEST_MAX_WAIT_S
+        for path in ('/api/cron/refresh-daily-bars', '/admin/stocks'):
+            with app.test_request_context(path):
+                assert av_rate_governor._default_deadline() is None
+
+    def test_wait_is_accounted(self):
+        gov, clock = _gov(max_calls=1)
+        gov.acquire()
+        gov.acquire()
+        assert gov.stats()['total_wait_s'] == 60.0
+
+
+class TestDailyBarNegativeCache:
+    def test_backoff_doubles_and_caps(self):
+        from datetime import timedelta
+        from bot_data_hub import daily_bar_miss_backoff
+        assert daily_bar_miss_backoff(1) == timedelta(hours=12)
+        assert daily_bar_miss_backoff(2) == timedelta(hours=24)
+        assert daily_bar_miss_backoff(20) == timedelta(days=7)
+
+    def test_misses_are_skipped_until_retry_after(self, app):
+        from datetime import datetime, timedelta
+        from models import db, DailyBarFetchMiss
+        from bot_data_hub import backed_off_daily_bar_tickers, record_daily_bar_misses
+        now = datetime(2026, 10, 19, 21, 0)
+        record_daily_bar_misses({'DEAD', 'GONE'}, set(), now)
+        db.session.commit()
+        assert backed_off_daily_bar_tickers(['DEAD', 'GONE', 'AAPL'], now) == {'DEAD', 'GONE'}
+
+        later = now + timedelta(hours=13)
+        assert backed_off_daily_bar_tickers(['DEAD', 'GONE'], later) == set()
+        record_daily_bar_misses({'DEAD'}, {'GONE'}, later)
+        db.session.commit()
+        dead = db.session.get(DailyBarFetchMiss, 'DEAD')
+        assert dead.misses == 2 and dead.retry_after == later + timedelta(hours=24)
+        assert db.session.get(DailyBarFetchMiss, 'GONE') is None
@@ -0,0 +1,162 @@
+"""
+Tests for the shared S&P 500 benchmark series (benchmark_series.py).
+
+Run with: pytest tests/test_benchmark_series.py -v
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import perf_tracing
+
+
+@pytest.fixture
+def app(app):
+    import benchmark_series
+    benchmark_series._local.clear()
+    yield app
+    benchmark_series._local.clear()
+
+
+@pytest.fixture
+def today(monkeypatch):
+    import portfolio_performance
+    day = date(2026, 10, 16)   # Friday
+    monkeypatch.setattr(portfolio_performance, 'get_market_date', lambda: day)
+    return day
+
+
+def _daily(closes):
+    from models import db, MarketData
+    for day, close in closes.items():
+        db.session.add(MarketData(ticker='SPY_SP500', date=day, close_price=close))
+    db.session.commit()
+
+
+def _ticks(day, closes, start_utc_hour=13, start_minute=30):
+    from models import db, MarketData
+    base = datetime.combine(day, datetime.min.time()) + timedelta(hours=start_utc_hour, minutes=start_minute)
+    for i, close in enumerate(closes):
+        db.session.add(MarketData(ticker='SPY_INTRADAY', date=day, timestamp=base + timedelta(minutes=15 * i),
+                                  close_price=close))
+    db.session.commit()
+
+
+def _week(end=date(2026, 10, 16), n=30, start=6000.0):
+    import trading_calendar
+    days = trading_calendar.sessions_between(end - timedelta(days=60), end)[-n:]
+    return {d: start + 10 * i for i, d in enumerate(days)}
+
+
+class TestSeries:
+    def test_period_windows_and_returns(self, app, today):
+        import benchmark_series
+        closes = _week()
+        _daily(closes)
+        series = benchmark_series.for_period('5D')      # no ticks: daily fallback
+        assert [p.date for p in series.points] == sorted(closes)[-5:]
+        first, last = closes[series.points[0].date], closes[today]
+        assert series.period_return() == round((last - first) / first * 100, 2)
+        assert series.pct_changes()[0] == 0.0
+        assert benchmark_series.simple_return(date(2026, 10, 1), today) == pytest.approx(
+            (closes[today] - closes[date(2026, 10, 1)]) / closes[date(2026, 10, 1)] * 100)
+
+    def test_intraday_ticks_and_single_tick_base(self, app, today):
+        import benchmark_series
+        _daily({date(2026, 10, 15): 6000.0})
+        _ticks(today, [6030.0])
+        one = benchmark_series.for_period('1D')
+        assert one.pct_changes() == [0.0, 0.5]
+        benchmark_series.invalidate()
+        _ticks(today, [6060.0, 6090.0], start_minute=45)
+        ticks = benchmark_series.for_period('1D')
+        assert ticks.kind == 'intraday' and [p.close_price for p in ticks.points] == [6030.0, 6060.0, 6090.0]
+        assert ticks.points[0].timestamp == datetime(2026, 10, 16, 13, 30)
+        assert benchmark_series.simple_return(today, today) == pytest.approx(60 / 6030 * 100)
+
+    def test_other_instances_reuse_the_shared_copy(self, app, today, monkeypatch):
+        import benchmark_series
+        _daily(_week())
+        _ticks(today, [6000.0, 6012.0])
+        built = (benchmark_series.daily().points, benchmark_series.for_period('1D').points)
+
+        benchmark_series._local.clear()           # a cold instance
+        monkeypatch.setattr(benchmark_series, '_load_daily', lambda: pytest.fail('rebuilt daily series'))
+        monkeypatch.setattr(benchmark_series, '_load_intraday', lambda s, e: pytest.fail('rebuilt ticks'))
+        assert (benchmark_series.daily().points, benchmark_series.for_period('1D').points) == built
+
+    def test_stale_format_version_is_ignored(self, app, today, monkeypatch):
+        import benchmark_series
+        _daily({today: 6000.0})
+        benchmark_series.daily()
+        benchmark_series._local.clear()
+        monkeypatch.setattr(benchmark_series, 'FORMAT_VERSION', benchmark_series.FORMAT_VERSION + 1)
+        calls = []
+        original = benchmark_series._load_daily
+        monkeypatch.setattr(benchmark_series, '_load_daily', lambda: calls.append(1) or original())
+        assert len(benchmark_series.daily()) == 1 and calls == [1]
+
+    def test_repeat_reads_do_not_query_market_data(self, app, today):
+        import benchmark_series
+        _daily(_week())
+        benchmark_series.for_period('1M')
+        with perf_tracing.capture('bench') as trace:
+            for period in ('1M', '3M', 'YTD', '1Y'):
+                benchmark_series.for_period(period)
+                benchmark_series.simple_return(today - timedelta(days=20), today)
+        assert trace.query_count == 0
+
+
+class TestUpsert:
+    def test_bulk_upsert_and_invalidate(self, app, today):
+        import benchmark_series
+        from models import db, MarketData
+        _daily({date(2026, 10, 14): 6000.0, date(2026, 10, 15): 6010.0})
+        assert benchmark_series.daily().on(date(2026, 10, 15)).close_price == 6010.0
+        counts = benchmark_series.upsert_daily({date(2026, 10, 14): 6000.0, date(2026, 10, 15): 6020.0,
+                                                today: 6030.0})
+        db.session.commit()
+        assert counts == (1, 1, 1)
+        benchmark_series.invalidate('daily')
+        assert [p.close_price for p in benchmark_series.daily().points] == [6000.0, 6020.0, 6030.0]
+        assert MarketData.query.filter_by(ticker='SPY_SP500').count() == 3
+
+    def test_build_in_flight_during_invalidate_is_not_served(self, app, today, monkeypatch):
+        import benchmark_series
+        from models import db
+        _daily({today: 6000.0})
+        original = benchmark_series._load_daily
+
+        def load_then_invalidate():
+            # Instance B read the old data; instance A then commits new closes
+            # and invalidates before B writes its result back.
+            stale = original()
+            benchmark_series.upsert_daily({today: 6050.0})
+            db.session.commit()
+            benchmark_series.invalidate('daily')
+            return stale
+
+        monkeypatch.setattr(benchmark_series, '_load_daily', load_then_invalidate)
+        assert benchmark_series.daily().on(today).close_price == 6000.0   # B's own answer
+        monkeypatch.setattr(benchmark_series, '_load_daily', original)
+        benchmark_series._local.clear()           # any other instance
+        assert benchmark_series.daily().on(today).close_price == 6050.0
+        benchmark_series._local.clear()           # ...and the rebuilt copy is shared
+        monkeypatch.setattr(benchmark_series, '_load_daily', lambda: pytest.fail('rebuilt daily series'))
+        assert benchmark_series.daily().on(today).close_price == 6050.0
+
+    def test_statements_flat_in_dates(self, app):
+        import benchmark_series
+        from models import db
+        counts = []
+        for n in (5, 400):
+            closes = {date(2020, 1, 1) + timedelta(days=i): 3000.0 + i for i in range(n)}
+            _daily(dict(list(closes.items())[:n // 2]))
+            with perf_tracing.capture('upsert') as trace:
+                assert benchmark_series.upsert_daily({d: c + 1 for d, c in closes.items()})[:2] == (n - n // 2, n // 2)
+            db.session.rollback()
+            counts.append(trace.query_count)
+            db.session.execute(db.text("DELETE FROM market_data"))
+            db.session.commit()
+        assert counts[0] == counts[1] == 3
@@ -0,0 +1,157 @@
+"""
+Tests for the chart-cache previews (chart_previews.py) and the web
+leaderboard page that hydrates them in one query.
+
+Run with: pytest tests/test_chart_previews.py -v
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import perf_tracing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Endpoints base.html / leaderboard.html link to (the real ones live in api/index.py)
+PAGE_ENDPOINTS = ('dashboard', 'delete_account_info', 'explore', 'index', 'login', 'logout',
+                  'privacy_policy', 'register', 'subscriptions', 'terms_of_service',
+                  'notification_settings', 'debug_env')
+
+
+def _chart(n, base=0.0):
+    return {
+        'labels': [f'd{i}' for i in range(n)],
+        'datasets': [
+            {'label': 'Your Portfolio', 'data': [base + i * 0.1 for i in range(n)], 'borderColor': 'rgb(40, 167, 69)'},
+            {'label': 'S&P 500', 'data': [None] + [-i * 0.05 for i in range(1, n)]},
+        ],
+        'period': 'YTD',
+    }
+
+
+def _population(n, points=200, period='YTD'):
+    from models import db, User, UserPortfolioChartCache, LeaderboardCache
+    users = [User(email=f'lb{i}@example.com', username=f'lb{i}') for i in range(n)]
+    db.session.add_all(users)
+    db.session.flush()
+    now = datetime.now()
+    for i, u in enumerate(users):
+        db.session.add(UserPortfolioChartCache(user_id=u.id, period=period, generated_at=now,
+                                               chart_data=json.dumps(_chart(points, base=i))))
+    ranking = [{'user_id': u.id, 'username': u.username, 'performance_percent': 10.0 - i,
+                'portfolio_value': 1000.0, 'small_cap_percent': 0.0, 'large_cap_percent': 100.0,
+                'avg_trades_per_week': 1.0, 'subscriber_count': 0} for i, u in enumerate(users)]
+    db.session.add(LeaderboardCache(period=f'{period}_all', leaderboard_data=json.dumps(ranking),
+                                    generated_at=now))
+    db.session.commit()
+    return users
+
+
+class TestPreviews:
+    def test_written_with_the_chart(self, app):
+        import chart_previews
+        from models import db, UserPortfolioChartCache
+        user = _population(1, points=250)[0]
+        row = UserPortfolioChartCache.query.filter_by(user_id=user.id).one()
+        preview = json.loads(row.preview_data)
+        assert len(preview['labels']) == chart_previews.PREVIEW_POINTS
+        assert all(len(ds['data']) == chart_previews.PREVIEW_POINTS for ds in preview['datasets'])
+        assert preview['labels'][0] == 'd0' and preview['labels'][-1] == 'd249'
+        assert (row.y_min, row.y_max) == (pytest.approx(-249 * 0.05), pytest.approx(24.9))
+        assert row.preview_of == row.generated_at
+
+        row.chart_data = json.dumps(_chart(10, base=100))
+        row.generated_at = datetime.now() + timedelta(seconds=1)
+        db.session.commit()
+        assert len(json.loads(row.preview_data)['labels']) == 10
+        assert row.y_max == pytest.approx(100.9) and row.preview_of == row.generated_at
+
+    def test_hook_installs_on_a_second_mapping(self, app):
+        # api/index.py maps user_portfolio_chart_cache on its own SQLAlchemy().
+        import chart_previews
+        from sqlalchemy import Column, DateTime, Float, Integer, String, Text
+        from sqlalchemy.orm import Session, declarative_base
+        from models import db, UserPortfolioChartCache
+
+        class DuplicateChartCache(declarative_base()):
+            __tablename__ = 'user_portfolio_chart_cache'
+            id = Column(Integer, primary_key=True)
+            user_id = Column(Integer, nullable=False)
+            period = Column(String(10), nullable=False)
+            chart_data = Column(Text, nullable=False)
+            generated_at = Column(DateTime, nullable=False)
+            preview_data = Column(Text)
+            y_min = Column(Float)
+            y_max = Column(Float)
+            preview_of = Column(DateTime)
+
+        chart_previews.install_hooks(DuplicateChartCache)
+        user = _population(1)[0]
+        with Session(db.engine) as session:
+            row = session.query(DuplicateChartCache).filter_by(user_id=user.id).one()
+            row.chart_data = json.dumps(_chart(5, base=50))
+            row.generated_at = datetime.now() + timedelta(seconds=1)
+            session.commit()
+        db.session.expire_all()
+        row = UserPortfolioChartCache.query.filter_by(user_id=user.id).one()
+        assert row.preview_of == row.generated_at and row.y_max == pytest.approx(50.4)
+        assert len(json.loads(row.preview_data)['labels']) == 5
+
+    def test_load_is_one_query_and_handles_stale_rows(self, app):
+        import chart_previews
+        from models import db
+        users = _population(20)
+        # A writer outside the mapper (no hook): preview no longer matches.
+        db.session.execute(db.text(
+            "UPDATE user_portfolio_chart_cache SET chart_data = :c, generated_at = :g WHERE user_id = :u"),
+            {'c': json.dumps(_chart(5, base=50)), 'g': datetime.now() + timedelta(minutes=5), 'u': users[3].id})
+        db.session.commit()
+        user_ids = [u.id for u in users]
+
+        with perf_tracing.capture('load') as trace:
+            previews = chart_previews.load(user_ids, 'YTD')
+        assert trace.query_count == 1
+        assert len(previews) == 20
+        assert previews[users[3].id].y_max == pytest.approx(50.4)
+        assert len(previews[users[3].id].chart['labels']) == 5
+        assert chart_previews.load(user_ids, '1M') == {}
+
+    def test_y_axis_range_from_bounds_matches_full_scan(self, app):
+        from leaderboard_utils import calculate_chart_y_axis_range, y_axis_range_from_bounds
+        import chart_previews
+        charts = [_chart(120, base=b) for b in (0, 3, -7)]
+        bounds = [chart_previews.value_range(c) for c in charts]
+        assert y_axis_range_from_bounds(bounds) == calculate_chart_y_axis_range(charts)
+        assert y_axis_range_from_bounds([(None, None)]) == {'min': -10, 'max': 10}
+
+
+class TestLeaderboardPage:
+    @pytest.fixture
+    def client(self, app):
+        from flask_login import LoginManager
+        from leaderboard_routes import leaderboard_bp
+        app.template_folder = os.path.join(ROOT, 'templates')
+        for name in PAGE_ENDPOINTS:
+            app.add_url_rule(f'/{name}', name, lambda: '')
+        app.add_url_rule('/profile/<username>', 'profile', lambda username: '')
+        LoginManager(app).user_loader(lambda user_id: None)
+        app.register_blueprint(leaderboard_bp)
+        return app.test_client()
+
+    def test_fixed_query_count(self, client):
+        _population(20)
+        counts = []
+        for _ in range(3):
+            with perf_tracing.capture('leaderboard_home') as trace:
+                started = time.perf_counter()
+                resp = client.get('/leaderboard/?period=YTD')
+                elapsed_ms = (time.perf_counter() - started) * 1000
+            assert resp.status_code == 200
+            counts.append(trace.query_count)
+        html = resp.get_data(as_text=True)
+        assert html.count('data-chart-json=') == 20 and 'lb19' in html
+        assert counts[1] == counts[2] <= 4      # rate limiter + ranking + charts
+        assert elapsed_ms < 500
@@ -0,0 +1,199 @@
+"""
+Tests for the background GDPR data export (data_export.py).
+
+SendGrid is stubbed; job leasing, streaming sections, the compressed
+artifact, progress and expiry run against SQLite.
+
+Run with: pytest tests/test_data_export.py -v
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    from services import notification_utils
+    sent = []
+    monkeypatch.setattr(notification_utils, 'send_email',
+                        lambda **kw: sent.append(kw) or {'status': 'sent'})
+    return sent
+
+
+def _trader(n_trades=0, n_stocks=0, name='trader'):
+    from models import db, User, Stock, Transaction
+    user = User(email=f'{name}@example.com', username=name)
+    db.session.add(user)
+    db.session.flush()
+    t0 = datetime(2024, 1, 2, 15, 0)
+    db.session.add_all(Stock(user_id=user.id, ticker=f'T{i}', quantity=i + 1, purchase_price=10.0)
+                       for i in range(n_stocks))
+    db.session.add_all(Transaction(user_id=user.id, ticker='AAPL', quantity=1, price=100.0 + i,
+                                   transaction_type='buy' if i % 2 == 0 else 'sell',
+                                   timestamp=t0 + timedelta(minutes=i))
+                       for i in range(n_trades))
+    db.session.commit()
+    return user
+
+
+def _lines(job):
+    return [json.loads(line) for line in gzip.decompress(job.artifact).decode('utf-8').splitlines()]
+
+
+class FakeClock:
+    def __init__(self, step=0.0):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class TestJobs:
+    def test_enqueue_is_idempotent_while_pending(self, app):
+        import data_export
+        user = _trader()
+        job = data_export.enqueue(user)
+        assert data_export.enqueue(user).id == job.id
+        assert data_export.status(user.id)['status'] == 'queued'
+
+    def test_builds_streamed_artifact_and_emails_link(self, app, sent, monkeypatch):
+        import data_export
+        from models import DataExportJob
+        monkeypatch.setattr(data_export, 'BATCH_SIZE', 7)
+        user = _trader(n_trades=50, n_stocks=3)
+        job = data_export.enqueue(user)
+
+        summary = data_export.run_pending()
+        assert summary['ready'] == [job.id]
+        job = DataExportJob.query.get(job.id)
+        lines = _lines(job)
+        assert lines[0]['type'] == 'export' and lines[0]['user_id'] == user.id
+        trades = [line['data'] for line in lines if line.get('section') == 'transactions' and 'data' in line]
+        assert len(trades) == 50 and [t['price'] for t in trades] == sorted(t['price'] for t in trades)
+        assert {'section': 'transactions', 'records': 50} in lines
+        assert not any(line.get('section') == 'sms_settings' for line in lines)   # omitted, no row
+        assert job.sections['transactions']['records'] == 50 and 'ms' in job.sections['holdings']
+        assert job.progress['sections_done'] == job.progress['sections_total']
+        assert job.size_bytes == len(job.artifact) and job.expires_at > datetime.utcnow()
+        assert len(sent) == 1 and data_export.download_url(job) in sent[0]['body']
+
+        assert data_export.fetch(job.token).id == job.id
+        assert data_export.fetch('nope') is None
+
+    def test_failing_section_degrades_to_error_line(self, app, sent, monkeypatch):
+        import data_export
+        from models import DataExportJob
+
+        def broken(user):
+            raise RuntimeError('relation "device_token" does not exist')
+            yield
+
+        monkeypatch.setattr(data_export, 'SECTIONS', tuple(
+            (name, broken if name == 'devices' else fn) for name, fn in data_export.SECTIONS))
+        job = data_export.enqueue(_trader(n_trades=2))
+        assert data_export.run_pending()['ready'] == [job.id]
+        job = DataExportJob.query.get(job.id)
+        assert {'section': 'devices', 'error': data_export.SECTION_ERROR} in _lines(job)
+        assert 'error' in job.sections['devices'] and job.sections['transactions']['records'] == 2
+
+    def test_out_of_time_requeues_then_completes(self, app, sent, monkeypatch):
+        import data_export
+        from models import DataExportJob
+        monkeypatch.setattr(data_export, 'BATCH_SIZE', 5)
+        job = data_export.enqueue(_trader(n_trades=40))
+
+        clock = FakeClock(step=1.0)
+        summary = data_export.run_pending(deadline=8.0, clock=clock)
+        assert summary['requeued'] == [job.id]
+        job = DataExportJob.query.get(job.id)
+        assert job.status == 'queued' and job.error == 'out_of_time' and job.lease_until is None
+        assert not sent
+
+        assert data_export.run_pending()['ready'] == [job.id]
+        # The timed-out run moved the cursor, so it isn't a failed attempt.
+        assert DataExportJob.query.get(job.id).attempts == 1
+
+    def test_out_of_time_resumes_from_checkpoint(self, app, sent, monkeypatch):
+        import data_export
+        from models import DataExportJob
+        monkeypatch.setattr(data_export, 'BATCH_SIZE', 5)
+        job = data_export.enqueue(_trader(n_trades=40, n_stocks=2))
+
+        assert data_export.run_pending(deadline=8.0, clock=FakeClock(step=1.0))['requeued'] == [job.id]
+        job = DataExportJob.query.get(job.id)
+        assert job.progress['cursor'] == {'section': 2, 'offset': 35}
+        assert job.progress['section'] == 'transactions' and job.sections['transactions']['records'] == 35
+        partial = _lines(job)
+        assert partial[0]['type'] == 'export' and len(partial) == 1 + 2 + 3 + 35
+
+        built = []
+        monkeypatch.setattr(data_export.NdjsonWriter, 'write', (
+            lambda write: lambda self, obj: built.append(obj) or write(self, obj))(data_export.NdjsonWriter.write))
+        assert data_export.run_pending()['ready'] == [job.id]
+        rewritten = [o['section'] for o in built if 'data' in o]
+        assert rewritten == ['transactions'] * 5 + ['tax_w9', 'portfolio_snapshots']
+        job = DataExportJob.query.get(job.id)
+        lines = _lines(job)
+        assert sum(1 for line in lines if line.get('type') == 'export') == 1
+        trades = [line['data']['price'] for line in lines if line.get('section') == 'transactions' and 'data' in line]
+        assert trades == [100.0 + i for i in range(40)]
+        assert {'section': 'transactions', 'records': 40} in lines
+        assert job.sections['transactions']['records'] == 40 and job.attempts == 1
+
+    def test_stuck_job_gives_up(self, app, sent, monkeypatch):
+        import data_export
+        from models import DataExportJob
+
+        def stuck(user):
+            raise data_export.OutOfTime()
+            yield
+
+        monkeypatch.setattr(data_export, 'SECTIONS', tuple(
+            (name, stuck if name == 'holdings' else fn) for name, fn in data_export.SECTIONS))
+        job = data_export.enqueue(_trader())
+        # Only the first run moves the cursor (past 'profile'); the rest count.
+        for _ in range(data_export.MAX_ATTEMPTS + 2):
+            data_export.run_pending()
+        job = DataExportJob.query.get(job.id)
+        assert job.status == 'failed' and job.error == 'gave_up'
+
+    def test_oversized_export_fails(self, app, sent, monkeypatch):
+        import data_export
+        from models import DataExportJob
+        monkeypatch.setattr(data_export, 'MAX_ARTIFACT_BYTES', 200)
+        job = data_export.enqueue(_trader(n_trades=500))
+        assert data_export.run_pending()['failed'] == [job.id]
+        job = DataExportJob.query.get(job.id)
+        assert job.status == 'failed' and job.error == 'too_large' and job.artifact is None
+        assert data_export.describe(job)['message'] == data_export.TOO_LARGE_MESSAGE
+        assert not sent
+
+    def test_leased_job_is_skipped_and_links_expire(self, app, sent):
+        import data_export
+        from models import db, DataExportJob
+        leased = data_export.enqueue(_trader(name='a'))
+        assert data_export._claim(leased.id, datetime.utcnow())
+        assert data_export.run_pending() == {'ready': [], 'requeued': [], 'failed': [], 'expired': 0}
+
+        done = data_export.enqueue(_trader(name='b'))
+        data_export.run_pending()
+        job = DataExportJob.query.get(done.id)
+        job.expires_at = datetime.utcnow() - timedelta(minutes=1)
+        db.session.commit()
+        assert data_export.run_pending()['expired'] == 1
+        assert data_export.fetch(job.token) is None
+        assert DataExportJob.query.get(done.id).artifact is None
+
+
+class TestWriter:
+    def test_uncompressed_inline_export(self, app, sent):
+        import data_export
+        user = _trader(n_trades=3)
+        assert data_export.export_inline(user)['status'] == 'sent'
+        body = sent[0]['body']
+        assert body.count('"section":"transactions","data"') == 3
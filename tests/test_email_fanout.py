@@ -0,0 +1,114 @@
+"""
+Tests for the batched subscriber email fan-out (services/notification_utils.py)
+against the local fake SendGrid (scripts/fake_sendgrid.py).
+
+Run with: pytest tests/test_email_fanout.py -v
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from fake_sendgrid import FakeSendGrid
+from services import email_limits, notification_utils as nu
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    with FakeSendGrid() as server:
+        monkeypatch.setenv('SENDGRID_API_BASE', server.url)
+        monkeypatch.setenv('SENDGRID_API_KEY', 'test-key')
+        monkeypatch.setattr(email_limits, 'MAX_EMAILS_PER_HOUR_GLOBAL', 10 ** 6)
+        monkeypatch.setattr(email_limits, '_store', email_limits.MemoryLimitStore())
+        yield server
+
+
+@pytest.fixture
+def app():
+    from models import db
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _seed(db):
+    from models import User, MobileSubscription
+    trader = User(email='trader@example.com', username='trader1', display_name='Trader Joe')
+    subs = [User(email=f'sub{i}@example.com', username=f'sub{i}') for i in range(5)]
+    subs[3].email_notifications_enabled = False
+    db.session.add_all([trader] + subs)
+    db.session.flush()
+
+    def subscribe(user, scale=None, status='active'):
+        db.session.add(MobileSubscription(subscriber_id=user.id, subscribed_to_id=trader.id,
+                                          in_app_purchase_id=1, status=status, scale_factor=scale))
+
+    subscribe(subs[0])
+    subscribe(subs[1])
+    subscribe(subs[1])                # second active slot row: still one email
+    subscribe(subs[2], scale=0.5)     # scaled quantity: different content
+    subscribe(subs[3])                # email notifications off
+    subscribe(subs[4], status='canceled')
+    db.session.commit()
+    return trader, subs
+
+
+class TestSendBulkEmail:
+    def test_chunks_at_sendgrid_personalization_limit(self, fake):
+        recipients = [f'r{i}@example.com' for i in range(2500)]
+        results = nu.send_bulk_email(recipients, 'subj', 'body')
+        assert fake.requests == 3 and fake.recipients == 2500 and fake.rejected == 0
+        assert {r['status'] for r in results.values()} == {'sent'}
+        # Monitoring BCC once per request, not once per recipient.
+        assert [sum('bcc' in p for p in payload['personalizations']) for payload in fake.payloads] == [1, 1, 1]
+
+    def test_rate_limited_recipients_are_not_sent(self, fake):
+        for _ in range(email_limits.MAX_EMAILS_PER_USER_PER_DAY):
+            email_limits.reserve(['busy@example.com'])
+        results = nu.send_bulk_email(['busy@example.com', 'ok@example.com'], 'subj', 'body')
+        assert results['busy@example.com']['status'] == 'rate_limited'
+        assert results['ok@example.com']['status'] == 'sent'
+        assert fake.recipients == 1
+
+
+class TestNotifySubscribers:
+    def test_groups_by_content_and_bulk_logs(self, app, fake):
+        from models import db, NotificationLog
+        trader, subs = _seed(db)
+
+        summary = nu.notify_subscribers_via_email(db, trader.id, 'buy', 'AAPL', 10, 182.5)
+
+        assert summary == {'sent': 3, 'failed': 0, 'rate_limited': 0, 'groups': 2}
+        assert fake.requests == 2
+        by_recipient = {p['to'][0]['email']: p['subject']
+                        for payload in fake.payloads for p in payload['personalizations']}
+        assert by_recipient == {
+            'sub0@example.com': '\U0001F7E2 Trader Joe BUY 10 AAPL',
+            'sub1@example.com': '\U0001F7E2 Trader Joe BUY 10 AAPL',
+            'sub2@example.com': '\U0001F7E2 Trader Joe BUY 5 AAPL',
+        }
+        logs = NotificationLog.query.order_by(NotificationLog.user_id).all()
+        assert [(l.user_id, l.status) for l in logs] == [(s.id, 'sent') for s in subs[:3]]
+        assert all(l.sendgrid_message_id for l in logs)
+
+    def test_sendgrid_failure_is_logged_per_recipient(self, app, fake):
+        from models import db, NotificationLog
+        trader, _subs = _seed(db)
+        fake.stop()
+
+        summary = nu.notify_subscribers_via_email(db, trader.id, 'sell', 'AAPL', 10, 182.5)
+
+        assert summary['sent'] == 0 and summary['failed'] == 3
+        assert {l.status for l in NotificationLog.query.all()} == {'failed'}
@@ -0,0 +1,149 @@
+"""
+Tests for the shared email limiter / circuit breaker (services/email_limits.py).
+
+Two DbLimitStore instances on one database stand in for two serverless
+instances.
+
+Run with: pytest tests/test_email_limits.py -v
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+import perf_tracing
+from benchmark_email_limits import create_tables
+from services import email_limits
+from services.email_limits import DbLimitStore, MemoryLimitStore
+
+
+class Clock:
+    def __init__(self, now=1_800_000_007):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    create_tables(engine)
+    return engine
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def _instances(engine, clock, n=2):
+    return [DbLimitStore(lambda: engine, clock=clock) for _ in range(n)]
+
+
+class TestSharedCounters:
+    def test_global_budget_is_shared_across_instances(self, engine, clock, monkeypatch):
+        monkeypatch.setattr(email_limits, 'MAX_EMAILS_PER_HOUR_GLOBAL', 5)
+        a, b = _instances(engine, clock)
+        assert len(a.reserve([f'a{i}@x.com' for i in range(3)])['allowed']) == 3
+        second = b.reserve([f'b{i}@x.com' for i in range(3)])
+        assert second['allowed'] == ['b0@x.com', 'b1@x.com'] and second['rate_limited'] == ['b2@x.com']
+        clock.now += 3600  # next hour window
+        assert len(b.reserve(['b2@x.com'])['allowed']) == 1
+
+    def test_per_recipient_cap_is_shared(self, engine, clock, monkeypatch):
+        monkeypatch.setattr(email_limits, 'MAX_EMAILS_PER_USER_PER_DAY', 2)
+        a, b = _instances(engine, clock)
+        assert a.reserve(['Sub@Example.com'])['allowed']
+        assert b.reserve(['sub@example.com'])['allowed']
+        assert a.reserve(['sub@example.com', 'other@example.com']) == {
+            'allowed': ['other@example.com'], 'rate_limited': ['sub@example.com'], 'circuit_open': False}
+
+    def test_case_variants_in_one_batch_share_one_counter_row(self, engine, clock, monkeypatch):
+        from sqlalchemy import event
+        monkeypatch.setattr(email_limits, 'MAX_EMAILS_PER_USER_PER_DAY', 2)
+        store = _instances(engine, clock, 1)[0]
+        statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, stmt, params, ctx, many: statements.append((stmt, params)))
+        out = store.reserve(['zed@x.com', 'Sub@x.com', ' sub@x.com', 'SUB@x.com', 'abc@x.com'])
+        assert out['allowed'] == ['zed@x.com', 'Sub@x.com', ' sub@x.com', 'abc@x.com']
+        assert out['rate_limited'] == ['SUB@x.com']
+        assert not store._warned and not store.disabled  # no fallback to memory
+        with engine.connect() as conn:
+            hits = dict(conn.execute(text('SELECT counter_key, hits FROM email_send_counter')).fetchall())
+        assert hits[email_limits.recipient_key('sub@x.com')] == 3
+        # One row per distinct key, in key order (consistent lock order).
+        upsert = next(p for st, p in statements if st.startswith('INSERT INTO email_send_counter'))
+        keys = [v for v in upsert if str(v).startswith('rcpt:')]
+        assert keys == sorted(keys) and len(keys) == 3
+
+    def test_counters_store_no_addresses(self, engine, clock):
+        _instances(engine, clock, 1)[0].reserve(['private@example.com'])
+        with engine.connect() as conn:
+            keys = [k for (k,) in conn.execute(text('SELECT counter_key FROM email_send_counter'))]
+        assert not any('private' in k for k in keys)
+
+    def test_statements_do_not_grow_with_batch_size(self, engine, clock):
+        store = _instances(engine, clock, 1)[0]
+        counts = []
+        for batch in (1, 500):
+            with perf_tracing.capture('reserve') as trace:
+                store.reserve([f'{batch}-{i}@x.com' for i in range(batch)])
+            counts.append(trace.query_count)
+        assert counts[0] == counts[1] == 3  # Postgres: one combined statement
+
+    def test_prune_deletes_windows_past_retention(self, engine, clock):
+        store = _instances(engine, clock, 1)[0]
+        store.reserve(['old@x.com'])
+        clock.now += 3 * 86400
+        store.reserve(['new@x.com'])
+        assert email_limits.prune(engine, now=clock.now) == 2  # old recipient day + old global hour
+        with engine.connect() as conn:
+            keys = {k for (k,) in conn.execute(text('SELECT counter_key FROM email_send_counter'))}
+        assert keys == {email_limits.recipient_key('new@x.com'), email_limits.GLOBAL_KEY}
+        assert email_limits.prune(create_engine('sqlite://')) == 0  # table missing
+
+
+class TestSharedBreaker:
+    def test_breaker_tripped_on_one_instance_blocks_the_others(self, engine, clock):
+        a, b = _instances(engine, clock)
+        for _ in range(email_limits.CIRCUIT_BREAKER_FAILURES):
+            a.record_failure()
+        assert a.circuit_open()
+        assert b.reserve(['x@x.com']) == {'allowed': [], 'rate_limited': [], 'circuit_open': True}
+        clock.now += email_limits.CIRCUIT_OPEN_SECONDS + 1
+        assert b.reserve(['x@x.com'])['allowed'] == ['x@x.com']
+
+    def test_success_resets_the_shared_streak(self, engine, clock):
+        a, b = _instances(engine, clock)
+        for _ in range(email_limits.CIRCUIT_BREAKER_FAILURES - 1):
+            a.record_failure()
+        b.reserve(['x@x.com'])        # b learns about the streak
+        b.record_success()
+        a.record_failure()
+        assert not a.circuit_open()
+
+
+class TestFallback:
+    def test_missing_tables_fall_back_to_memory(self, clock):
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        store = DbLimitStore(lambda: engine, clock=clock)
+        assert store.reserve(['x@x.com'])['allowed'] == ['x@x.com']
+        assert store.disabled
+        for _ in range(email_limits.CIRCUIT_BREAKER_FAILURES):
+            store.record_failure()
+        assert store.circuit_open() and store.fallback.circuit_open()
+
+    def test_memory_store_limits(self, clock, monkeypatch):
+        monkeypatch.setattr(email_limits, 'MAX_EMAILS_PER_HOUR_GLOBAL', 2)
+        store = MemoryLimitStore(clock=clock)
+        assert store.reserve(['a@x.com', 'b@x.com', 'c@x.com'])['rate_limited'] == ['c@x.com']
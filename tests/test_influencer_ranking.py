@@ -0,0 +1,102 @@
+"""
+Tests for the materialized top-influencers ranking (influencer_ranking.py)
+and GET /api/mobile/top-influencers.
+
+Run with: pytest tests/test_influencer_ranking.py -v
+"""
+
+import perf_tracing
+
+
+def _creator(name, mix=None, fractional=None, subs=0):
+    from models import db, User, UserPortfolioStats, MobileSubscription
+    user = User(email=f'{name}@example.com', username=name)
+    db.session.add(user)
+    db.session.flush()
+    if mix is not None:
+        db.session.add(UserPortfolioStats(user_id=user.id, industry_mix=mix, unique_stocks_count=3,
+                                          has_fractional_holdings=fractional))
+    for _ in range(subs):
+        db.session.add(MobileSubscription(subscriber_id=user.id, subscribed_to_id=user.id,
+                                          in_app_purchase_id=1, status='active'))
+    db.session.commit()
+    return user.id
+
+
+def _ranking():
+    from models import InfluencerRanking
+    return {(r.user_id, r.industry_key): r.total_subscribers for r in InfluencerRanking.query.all()}
+
+
+class TestIncrementalMaintenance:
+    def test_subscribe_unsubscribe_and_bonus_update_rows(self, app):
+        from models import db, MobileSubscription, AdminSubscription
+        uid = _creator('alpha', mix={'Technology': 60, 'Energy': 3}, subs=2)
+        assert _ranking() == {(uid, '*'): 2, (uid, 'technology'): 2}
+
+        sub = MobileSubscription.query.first()
+        sub.status = 'canceled'
+        db.session.commit()
+        assert _ranking()[(uid, '*')] == 1
+
+        bonus = AdminSubscription(portfolio_user_id=uid, bonus_subscriber_count=4)
+        db.session.add(bonus)
+        db.session.commit()
+        assert _ranking()[(uid, '*')] == 5
+        bonus.bonus_subscriber_count = 0
+        MobileSubscription.query.filter_by(status='active').one().status = 'expired'
+        db.session.commit()
+        assert _ranking() == {}
+
+    def test_stats_change_moves_industry_rows(self, app):
+        from models import db, UserPortfolioStats
+        uid = _creator('beta', mix={'Technology': 60}, subs=1)
+        UserPortfolioStats.query.one().industry_mix = {'Healthcare': 80, 'Technology': 4}
+        db.session.commit()
+        assert _ranking() == {(uid, '*'): 1, (uid, 'healthcare'): 1}
+
+    def test_rebuild_matches_incremental_rows(self, app):
+        import influencer_ranking
+        from models import db
+        _creator('gamma', mix={'Energy': 50, 'Utilities': 50}, subs=3)
+        _creator('delta', subs=1)
+        before = _ranking()
+        influencer_ranking.rebuild(db.engine)
+        assert _ranking() == before
+
+
+class TestTopInfluencersEndpoint:
+    def _get(self, app, uid, qs=''):
+        from mobile_api import generate_jwt_token
+        headers = {'Authorization': f'Bearer {generate_jwt_token(uid, "viewer@example.com")}'}
+        return app.test_client().get(f'/api/mobile/top-influencers?{qs}', headers=headers).get_json()
+
+    def test_ranking_filters_and_industries(self, app):
+        a = _creator('a', mix={'Technology': 70, 'Healthcare': 30}, subs=3)
+        b = _creator('b', mix={'Healthcare': 90}, fractional=True, subs=5)
+        c = _creator('c', subs=1)                       # no stats row yet
+        _creator('nobody', mix={'Energy': 100})         # no subscribers: not ranked
+
+        body = self._get(app, a)
+        assert [e['user']['id'] for e in body['entries']] == [b, a, c]
+        assert [e['rank'] for e in body['entries']] == [1, 2, 3]
+        assert body['available_industries'] == ['Healthcare', 'Technology']
+        assert body['entries'][1]['top_industries'][0] == {'name': 'Technology', 'percent': 70}
+
+        assert [e['user']['id'] for e in self._get(app, a, 'industry=Healthcare')['entries']] == [b, a]
+        assert [e['user']['id'] for e in self._get(app, a, 'industry=tech')['entries']] == [a]
+        assert [e['user']['id'] for e in self._get(app, a, 'hide_fractional=1')['entries']] == [a, c]
+        assert self._get(app, a, 'limit=1')['total'] == 1
+
+    def test_query_count_is_flat_in_creators(self, app):
+        counts, seeded = [], 0
+        viewer = _creator('viewer')
+        for batch in (3, 40):
+            for i in range(batch):
+                _creator(f'c{batch}-{i}', mix={'Technology': 100}, subs=i % 4 + 1)
+            seeded += batch
+            with perf_tracing.capture('top') as trace:
+                body = self._get(app, viewer, 'industry=Technology&limit=20')
+            assert len(body['entries']) == min(20, seeded)
+            counts.append(trace.query_count)
+        assert counts[0] == counts[1]
@@ -0,0 +1,163 @@
+"""
+Tests for the compact per-user intraday series (intraday_series.py).
+
+Covers slot mapping (DST-safe, with the +/- 3 min cron tolerance), the
+collector's batched slot write, reads, rebuilding from legacy
+PortfolioSnapshotIntraday rows, and retention pruning.
+
+Run with: pytest tests/test_intraday_series.py -v
+"""
+
+import os
+import sys
+from datetime import date, datetime
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import intraday_series as series
+
+
+def _make_app():
+    from models import db
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app, db
+
+
+def _mk_user(db, name='trader1'):
+    from models import User
+    u = User(email=f"{name}@example.com", username=name)
+    db.session.add(u)
+    db.session.commit()
+    return u
+
+
+class TestSlots:
+    def test_open_and_close_slots_in_edt_and_est(self):
+        # 13:30 UTC = 09:30 EDT (October); 14:30 UTC = 09:30 EST (December).
+        assert series.slot_for(datetime(2026, 10, 14, 13, 30)) == (date(2026, 10, 14), 0)
+        assert series.slot_for(datetime(2026, 12, 14, 14, 30)) == (date(2026, 12, 14), 0)
+        assert series.slot_for(datetime(2026, 10, 14, 20, 0)) == (date(2026, 10, 14), 26)
+
+    def test_tolerance(self):
+        assert series.slot_for(datetime(2026, 10, 14, 13, 27)) == (date(2026, 10, 14), 0)
+        assert series.slot_for(datetime(2026, 10, 14, 14, 2)) == (date(2026, 10, 14), 2)
+        assert series.slot_for(datetime(2026, 10, 14, 14, 7)) is None
+        assert series.slot_for(datetime(2026, 10, 14, 20, 5)) is None
+
+    def test_slot_timestamp_roundtrip(self):
+        ts = series.slot_timestamp(date(2026, 10, 14), 5)
+        assert ts == datetime(2026, 10, 14, 14, 45)
+        assert series.slot_for(ts) == (date(2026, 10, 14), 5)
+
+    def test_pack_roundtrip(self):
+        vals = [float(i) for i in range(series.SLOT_COUNT)]
+        assert series.unpack(series.pack(vals)) == vals
+        assert len(series.pack(vals)) == 8 * series.SLOT_COUNT
+
+
+class TestSeriesStore:
+    def test_ticks_update_one_row_per_session(self):
+        from models import PortfolioIntradaySeries
+        app, db = _make_app()
+        with app.app_context():
+            db.create_all()
+            u1, u2 = _mk_user(db, 'a'), _mk_user(db, 'b')
+            series.record_tick(datetime(2026, 10, 14, 13, 30), {
+                u1.id: (100.0, 90.0, 10.0, 100.0), u2.id: (50.0, 50.0, 0.0, 50.0)})
+            series.record_tick(datetime(2026, 10, 14, 13, 45, 40), {
+                u1.id: (101.0, 91.0, 10.0, 100.0)})
+            db.session.commit()
+
+            assert PortfolioIntradaySeries.query.count() == 2
+            pts, missing = series.load_points(u1.id, date(2026, 10, 14), date(2026, 10, 14))
+            assert missing == []
+            assert [p.slot for p in pts] == [0, 1]
+            assert pts[1].total_value == 101.0 and pts[1].date == date(2026, 10, 14)
+            assert pts[1].timestamp == datetime(2026, 10, 14, 13, 45)
+            assert series.load_points(u1.id, date(2026, 10, 15), date(2026, 10, 16)) == (
+                [], [date(2026, 10, 15), date(2026, 10, 16)])
+
+    def test_off_slot_tick_is_skipped(self):
+        app, db = _make_app()
+        with app.app_context():
+            db.create_all()
+            u = _mk_user(db)
+            assert series.record_tick(datetime(2026, 10, 14, 14, 7), {u.id: (1.0, 1.0, 0.0, 1.0)}) == 0
+
+    def test_rebuild_from_legacy(self):
+        from models import PortfolioSnapshotIntraday
+        app, db = _make_app()
+        with app.app_context():
+            db.create_all()
+            u = _mk_user(db)
+            for ts, v in [(datetime(2026, 10, 13, 19, 45), 10.0),
+                          (datetime(2026, 10, 14, 13, 30), 11.0),
+                          (datetime(2026, 10, 14, 13, 46), 12.0),
+                          (datetime(2026, 10, 14, 22, 0), 99.0)]:  # after hours: dropped
+                db.session.add(PortfolioSnapshotIntraday(
+                    user_id=u.id, timestamp=ts, total_value=v,
+                    stock_value=v, cash_proceeds=0.0, max_cash_deployed=10.0))
+            db.session.commit()
+
+            assert series.rebuild_from_legacy([u.id]) == 2
+            db.session.commit()
+            pts, _ = series.load_points(u.id, date(2026, 10, 13), date(2026, 10, 14))
+            assert [(p.date, p.slot, p.total_value) for p in pts] == [
+                (date(2026, 10, 13), 25, 10.0),
+                (date(2026, 10, 14), 0, 11.0),
+                (date(2026, 10, 14), 1, 12.0),
+            ]
+
+    def test_partially_covered_range_fills_missing_sessions_from_legacy(self):
+        from models import PortfolioSnapshotIntraday
+        from performance_calculator import calculate_portfolio_performance
+        app, db = _make_app()
+        with app.app_context():
+            db.create_all()
+            u = _mk_user(db)
+            # Mon 10/12 only in the legacy table; Tue 10/13 in both.
+            for ts, v in [(datetime(2026, 10, 12, 13, 30), 100.0),
+                          (datetime(2026, 10, 12, 20, 0), 104.0),
+                          (datetime(2026, 10, 13, 13, 30), 104.0),
+                          (datetime(2026, 10, 13, 20, 0), 110.0)]:
+                db.session.add(PortfolioSnapshotIntraday(
+                    user_id=u.id, timestamp=ts, total_value=v,
+                    stock_value=v, cash_proceeds=0.0, max_cash_deployed=100.0))
+            db.session.commit()
+            series.rebuild_from_legacy([u.id], start_date=date(2026, 10, 13))
+            db.session.commit()
+
+            pts, missing = series.load_points(u.id, date(2026, 10, 10), date(2026, 10, 13))
+            assert missing == [date(2026, 10, 12)]
+            assert [p.date for p in pts] == [date(2026, 10, 13)] * 2
+
+            result = calculate_portfolio_performance(
+                u.id, date(2026, 10, 12), date(2026, 10, 13), include_chart_data=True, period='5D')
+            assert result['metadata']['snapshots_count'] == 4
+            assert result['portfolio_return'] == 10.0
+
+    def test_cleanup_prunes_sessions_before_cutoff(self):
+        from datetime import timedelta
+        from models import PortfolioIntradaySeries
+        from api.cleanup_intraday import cleanup_old_intraday_data
+        app, db = _make_app()
+        with app.app_context():
+            db.create_all()
+            u = _mk_user(db)
+            today = date.today()
+            for days_ago in (20, 15, 14, 1):
+                db.session.add(PortfolioIntradaySeries(
+                    user_id=u.id, session_date=today - timedelta(days=days_ago),
+                    total_values=b'', stock_values=b'', cash_proceeds=b'', max_cash_deployed=b''))
+            db.session.commit()
+
+            results = cleanup_old_intraday_data(days_to_keep=14)
+
+            assert results['errors'] == [] and results['series_deleted'] == 2
+            kept = sorted((today - r.session_date).days for r in PortfolioIntradaySeries.query.all())
+            assert kept == [1, 14]
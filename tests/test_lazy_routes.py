@@ -0,0 +1,139 @@
+"""
+Tests for deferred route registration (lazy_routes.py, APP_STARTUP_MODE=mobile).
+
+Run with: pytest tests/test_lazy_routes.py -v
+"""
+
+import os
+import sys
+
+from flask import Blueprint, Flask, url_for
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lazy_routes import DeferredRoutes, LazyObject
+
+
+def _make_app():
+    app = Flask(__name__)
+    routes = DeferredRoutes(app)
+
+    @app.route('/api/mobile/ping')
+    def ping():
+        return 'pong'
+
+    @app.route('/api/mobile/needs-login')
+    def needs_login():
+        return url_for('login')
+
+    @app.route('/login')
+    def login():
+        return 'login page'
+
+    loaded_modules = []
+
+    def load_admin():
+        bp = Blueprint('admin', __name__)
+
+        @bp.route('/users')
+        def users():
+            return 'users'
+
+        app.register_blueprint(bp, url_prefix='/admin')
+        loaded_modules.append('admin')
+
+    routes.defer('admin', load_admin)
+    return app, routes, loaded_modules
+
+
+class TestDeferredRoutes:
+    def test_mobile_requests_do_not_load_deferred_routes(self):
+        app, routes, loaded = _make_app()
+        client = app.test_client()
+        assert client.get('/api/mobile/ping').data == b'pong'
+        assert not routes.loaded and loaded == []
+        assert routes.stats()['deferred_rules'] == 1
+        assert '/login' not in {r.rule for r in app.url_map.iter_rules()}
+
+    def test_first_other_request_loads_after_app_has_served(self):
+        app, routes, loaded = _make_app()
+        client = app.test_client()
+        client.get('/api/mobile/ping')  # Flask now refuses normal setup calls
+        assert client.get('/admin/users').data == b'users'
+        assert client.get('/login').data == b'login page'
+        assert routes.loaded and loaded == ['admin']
+        assert routes.load_reason == '/admin/users'
+
+    def test_url_for_deferred_endpoint_loads(self):
+        app, routes, _ = _make_app()
+        assert app.test_client().get('/api/mobile/needs-login').data == b'/login'
+        assert routes.loaded
+
+    def test_load_is_idempotent(self):
+        app, routes, loaded = _make_app()
+        assert routes.load() is True
+        assert routes.load() is False
+        assert loaded == ['admin']
+        assert len([r for r in app.url_map.iter_rules() if r.rule == '/admin/users']) == 1
+
+
+class TestLazyObject:
+    def test_builds_once_on_first_attribute(self):
+        calls = []
+
+        class Client:
+            name = 'google'
+
+        def factory():
+            calls.append(1)
+            return Client()
+
+        proxy = LazyObject(factory)
+        assert calls == []
+        assert proxy.name == 'google' and proxy.name == 'google'
+        assert calls == [1]
+
+
+class TestConcurrentFirstRequest:
+    def test_requests_during_load_wait_for_the_full_url_map(self):
+        import threading
+        app = Flask(__name__)
+        routes = DeferredRoutes(app)
+
+        @app.route('/api/mobile/ping')
+        def ping():
+            return 'pong'
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow_loader():
+            started.set()
+            release.wait(5)
+            bp = Blueprint('late', __name__)
+
+            @bp.route('/late')
+            def late():
+                return 'late'
+
+            app.register_blueprint(bp)
+
+        routes.defer('slow', slow_loader)
+        app.test_client().get('/api/mobile/ping')
+
+        results = {}
+
+        def fetch(name):
+            results[name] = app.test_client().get('/late').status_code
+
+        first = threading.Thread(target=fetch, args=('first',))
+        first.start()
+        assert started.wait(5)
+        second = threading.Thread(target=fetch, args=('second',))
+        second.start()
+        second.join(0.2)
+        assert not routes.loaded and second.is_alive()
+        release.set()
+        first.join(5)
+        second.join(5)
+        assert results == {'first': 200, 'second': 200}
+        assert '_check_setup_finished' not in vars(app)  # Flask's guard is back
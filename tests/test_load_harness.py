@@ -0,0 +1,46 @@
+"""
+Smoke test for the mobile API load harness (scripts/load_test.py): a tiny
+population, two virtual users and a second per phase against SQLite.
+Run the real thing by hand:
+
+    python scripts/load_test.py --database-url postgresql://localhost/apes_load --users 10000 --concurrency 200
+
+Run with: pytest tests/test_load_harness.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import load_test
+
+
+class TestLoadHarness:
+    def test_replays_every_phase_and_reports_headroom(self):
+        report = load_test.run(users=30, concurrency=2, phases=[('open', 1.0), ('browse', 1.0)], think_ms=0)
+        assert set(report['phases']) == {'open', 'browse'}
+        for phase in report['phases'].values():
+            total = phase['total']
+            assert total['requests'] > 0 and total['errors'] == 0
+            assert total['p50_ms'] <= total['p95_ms'] <= total['p99_ms']
+        assert 'trade' in report['phases']['open']['endpoints']
+        assert report['db_connections']['pool_high_water'] >= 1
+        assert report['headroom']['db_connections']['limit'] == load_test.THRESHOLDS['db_connections']
+
+    def test_refuses_a_database_with_tables_and_keeps_foreign_ones(self, tmp_path):
+        from sqlalchemy import create_engine, inspect, text
+        url = f"sqlite:///{tmp_path / 'prod.db'}"
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE keep_me (id INTEGER PRIMARY KEY)'))
+            conn.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY)'))
+        with pytest.raises(SystemExit, match='refusing'):
+            load_test.run(url, users=5, concurrency=1, phases=[('browse', 0.1)])
+        assert set(inspect(engine).get_table_names()) == {'keep_me', 'user'}
+
+        load_test.run(url, users=5, concurrency=1, phases=[('browse', 0.1)], drop_existing=True)
+        assert inspect(engine).get_table_names() == ['keep_me']
@@ -0,0 +1,165 @@
+"""
+Tests for the checkpointed market-close pipeline (market_close_pipeline.py).
+
+Prices, valuations, dividends and the leaderboard rebuild are stubbed; the
+checkpointing, chunking, resume and lease logic run against SQLite.
+
+Run with: pytest tests/test_market_close_pipeline.py -v
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+DAY = date(2026, 10, 16)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    import cash_tracking
+    import dividend_tracker
+    import leaderboard_utils
+    import market_close_pipeline
+    from portfolio_performance import PortfolioPerformanceCalculator
+    calls = {'valued': [], 'dividends': 0, 'leaderboard': 0, 'fail': set(), 'clock': FakeClock(), 'tick': 0}
+
+    def value(user_id, as_of):
+        calls['valued'].append(user_id)
+        calls['clock'].now += calls['tick']
+        return {'total_value': 1000.0 + user_id, 'stock_value': 900.0, 'cash_proceeds': 100.0 + user_id}
+
+    def dividends(db, target_date=None):
+        calls['dividends'] += 1
+        return {'dividends_found': 0, 'dividends_recorded': 0, 'total_amount': 0.0}
+
+    def leaderboard():
+        calls['leaderboard'] += 1
+        if 'leaderboard' in calls['fail']:
+            raise RuntimeError('leaderboard down')
+        return 7
+
+    monkeypatch.setattr(cash_tracking, 'calculate_portfolio_value_with_cash', value)
+    monkeypatch.setattr(dividend_tracker, 'process_dividends_for_date', dividends)
+    monkeypatch.setattr(leaderboard_utils, 'update_leaderboard_cache', leaderboard)
+    monkeypatch.setattr(PortfolioPerformanceCalculator, 'get_batch_stock_data',
+                        lambda self, tickers: {t: 500.0 if t == 'SPY' else 10.0 for t in tickers})
+    monkeypatch.setattr(market_close_pipeline, 'SNAPSHOT_CHUNK', 4)
+    monkeypatch.setattr(market_close_pipeline.time, 'sleep', lambda s: None)
+    return calls
+
+
+def _users(n):
+    from models import db, User, Stock
+    for i in range(n):
+        user = User(email=f'close{i}@example.com', username=f'close{i}', max_cash_deployed=500.0)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Stock(user_id=user.id, ticker='AAPL', quantity=1, purchase_price=10.0))
+    db.session.commit()
+
+
+def _phases(summary):
+    return {cp['phase']: cp['status'] for cp in summary['checkpoints']}
+
+
+class TestRun:
+    def test_full_run_then_noop(self, app, calls):
+        from models import PortfolioSnapshot, MarketData
+        import market_close_pipeline
+        _users(10)
+
+        first = market_close_pipeline.run(DAY)
+
+        assert first['status'] == 'complete'
+        assert set(_phases(first).values()) == {'done'}
+        assert PortfolioSnapshot.query.filter_by(date=DAY).count() == 10
+        assert MarketData.query.filter_by(ticker='SPY_SP500', date=DAY).one().close_price == 5000.0
+        assert first['results']['snapshots_created'] == 10
+        assert first['results']['sp500_verification'] == 'SUCCESS'
+        snapshots = next(cp for cp in first['checkpoints'] if cp['phase'] == 'snapshots')
+        assert (snapshots['chunks'], snapshots['records']) == (3, 10)
+
+        second = market_close_pipeline.run(DAY)
+        assert second['status'] == 'complete' and second['phases_run'] == []
+        assert (calls['dividends'], calls['leaderboard'], len(calls['valued'])) == (1, 1, 10)
+
+    def test_deadline_mid_snapshots_resumes_from_watermark(self, app, calls):
+        from models import PortfolioSnapshot, User
+        import market_close_pipeline
+        _users(10)
+        clock = calls['clock']
+        calls['tick'] = 1.0
+        # Each valuation takes 1s: two chunks of four users fit before the
+        # remaining time drops under MIN_PHASE_SECONDS.
+        first = market_close_pipeline.run(DAY, deadline=12.5, clock=clock)
+
+        assert first['status'] == 'incomplete' and first['next_phase'] == 'snapshots'
+        assert _phases(first)['snapshots'] == 'partial'
+        assert PortfolioSnapshot.query.filter_by(date=DAY).count() == 8
+        ids = [u.id for u in User.query.order_by(User.id)]
+        snapshots = next(cp for cp in first['checkpoints'] if cp['phase'] == 'snapshots')
+        assert snapshots['watermark'] == ids[7]
+
+        calls['valued'].clear()
+        second = market_close_pipeline.run(DAY, deadline=clock.now + 100, clock=clock)
+        assert second['status'] == 'complete'
+        assert calls['valued'] == ids[8:]
+        assert calls['dividends'] == 1
+        assert PortfolioSnapshot.query.filter_by(date=DAY).count() == 10
+
+    def test_noncritical_failure_is_recorded_and_retried(self, app, calls):
+        import market_close_pipeline
+        _users(3)
+        calls['fail'].add('leaderboard')
+        first = market_close_pipeline.run(DAY)
+        assert first['status'] == 'incomplete' and first['next_phase'] == 'leaderboard'
+        assert _phases(first)['leaderboard'] == 'failed'
+        assert _phases(first)['verify_sp500'] == 'done'
+        assert any('leaderboard down' in e for e in first['results']['errors'])
+
+        calls['fail'].clear()
+        second = market_close_pipeline.run(DAY)
+        assert second['status'] == 'complete' and second['phases_run'] == ['leaderboard']
+
+    def test_failure_gives_up_after_max_attempts(self, app, calls):
+        import market_close_pipeline
+        _users(1)
+        calls['fail'].add('leaderboard')
+        for _ in range(market_close_pipeline.MAX_ATTEMPTS + 1):
+            summary = market_close_pipeline.run(DAY)
+        assert summary['status'] == 'partial' and summary['phases_run'] == []
+        assert calls['leaderboard'] == market_close_pipeline.MAX_ATTEMPTS
+
+    def test_live_lease_makes_overlapping_run_busy(self, app, calls):
+        from models import db, MarketCloseCheckpoint
+        import market_close_pipeline
+        _users(1)
+        market_close_pipeline.run(DAY)
+        lease = MarketCloseCheckpoint.query.filter_by(trading_date=DAY, phase='pipeline').one()
+        lease.lease_until = datetime.utcnow() + timedelta(seconds=60)
+        db.session.commit()
+
+        assert market_close_pipeline.run(DAY, force=True)['status'] == 'busy'
+        lease.lease_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert market_close_pipeline.run(DAY, force=True)['status'] == 'complete'
+        assert calls['leaderboard'] == 2
+
+    def test_status_reports_each_day(self, app, calls):
+        import market_close_pipeline
+        _users(2)
+        market_close_pipeline.run(DAY - timedelta(days=1))
+        market_close_pipeline.run(DAY, deadline=0, clock=calls['clock'])
+        report = market_close_pipeline.status()
+        assert [d['trading_date'] for d in report] == [DAY.isoformat(), (DAY - timedelta(days=1)).isoformat()]
+        assert (report[0]['status'], report[0]['next_phase']) == ('incomplete', 'dividends')
+        assert (report[1]['status'], report[1]['next_phase'], report[1]['invocations']) == ('complete', None, 1)
+        assert [p['phase'] for p in report[1]['phases']] == [p.name for p in market_close_pipeline.PHASES]
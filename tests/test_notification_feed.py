@@ -0,0 +1,111 @@
+"""
+Tests for the keyset-paginated trade-alerts feed
+(GET /api/mobile/notifications/history).
+
+Run with: pytest tests/test_notification_feed.py -v
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import perf_tracing
+
+T0 = datetime(2026, 10, 1, 14, 0)
+
+
+@pytest.fixture
+def feed(app):
+    """Viewer following two traders since T0, with interleaved and tied trades."""
+    from models import db, User, Transaction, MobileSubscription
+    from mobile_api import generate_jwt_token
+
+    viewer = User(email='viewer@example.com', username='viewer')
+    a = User(email='a@example.com', username='trader_a')
+    b = User(email='b@example.com', username='trader_b')
+    other = User(email='o@example.com', username='not_followed')
+    db.session.add_all([viewer, a, b, other])
+    db.session.flush()
+    for trader in (a, b):
+        db.session.add(MobileSubscription(subscriber_id=viewer.id, subscribed_to_id=trader.id,
+                                          in_app_purchase_id=1, status='active', created_at=T0))
+
+    def trade(user, minutes, kind='buy'):
+        db.session.add(Transaction(user_id=user.id, ticker='AAPL', quantity=1, price=100.0,
+                                   transaction_type=kind, timestamp=T0 + timedelta(minutes=minutes)))
+
+    trade(a, -5)                          # before the subscription: hidden
+    trade(a, 1, kind='initial')           # seed row: hidden
+    trade(other, 3)                       # not followed: hidden
+    for m in range(10):
+        trade(a, m, kind='sell' if m % 3 else 'buy')
+        trade(b, m)                       # same timestamp as a's: ties on (timestamp, id)
+    db.session.commit()
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {generate_jwt_token(viewer.id, viewer.email)}'}
+    return lambda qs='': client.get(f'/api/mobile/notifications/history?{qs}', headers=headers)
+
+
+def _all_ids():
+    from models import Transaction
+    rows = (Transaction.query
+            .filter(Transaction.user_id.in_([2, 3]), Transaction.timestamp >= T0,
+                    Transaction.transaction_type.in_(['buy', 'sell']))
+            .order_by(Transaction.timestamp.desc(), Transaction.id.desc()).all())
+    return [f'trade-{t.id}' for t in rows]
+
+
+class TestCursorPagination:
+    def test_walks_the_whole_feed_without_gaps_or_repeats(self, feed):
+        seen, cursor = [], None
+        while True:
+            body = feed('limit=3' + (f'&cursor={cursor}' if cursor else '')).get_json()
+            seen += [n['id'] for n in body['notifications']]
+            if not body['has_more']:
+                assert body['next_cursor'] is None
+                break
+            cursor = body['next_cursor']
+        assert seen == _all_ids() and len(seen) == 20
+
+    def test_excludes_pre_subscription_seed_and_unfollowed_trades(self, feed):
+        body = feed('limit=100').get_json()
+        assert len(body['notifications']) == 20
+        assert {n['trader_username'] for n in body['notifications']} == {'trader_a', 'trader_b'}
+        assert body['has_more'] is False
+
+    def test_bad_cursor_is_rejected(self, feed):
+        assert feed('cursor=not-a-cursor').status_code == 400
+
+
+class TestLegacyOffset:
+    def test_offset_pages_and_total_keep_old_clients_paging(self, feed):
+        first = feed('limit=8&offset=0').get_json()
+        last = feed('limit=8&offset=16').get_json()
+        assert [n['id'] for n in first['notifications']] == _all_ids()[:8]
+        assert [n['id'] for n in last['notifications']] == _all_ids()[16:]
+        # Shipped clients load more while offset + count < total.
+        assert first['total'] > 8 and first['limit'] == 8 and first['offset'] == 0
+        assert last['total'] == 20 and last['has_more'] is False
+
+    def test_offset_paging_depth_is_capped(self, feed, monkeypatch):
+        import mobile_api
+        monkeypatch.setattr(mobile_api, 'FEED_MAX_OFFSET', 12)
+        page = feed('limit=8&offset=8').get_json()
+        assert [n['id'] for n in page['notifications']] == _all_ids()[8:12]
+        assert page['has_more'] is False and page['total'] == 12
+        beyond = feed('limit=8&offset=16').get_json()
+        assert beyond['notifications'] == [] and beyond['has_more'] is False
+        # Cursor paging is not capped.
+        cursor = feed('limit=12').get_json()['next_cursor']
+        assert len(feed(f'limit=8&cursor={cursor}').get_json()['notifications']) == 8
+
+
+class TestQueryCount:
+    def test_deep_pages_cost_the_same_statements(self, app, feed):
+        counts = []
+        cursor = feed('limit=2').get_json()['next_cursor']
+        for qs in ('limit=2', f'limit=2&cursor={cursor}'):
+            with perf_tracing.capture('feed') as trace:
+                assert feed(qs).status_code == 200
+            counts.append(trace.query_count)
+        assert 0 < counts[0] == counts[1] <= 4
@@ -0,0 +1,181 @@
+"""
+Tests for set-based month-end payout generation
+(mobile_api._generate_payout_records_for_period) and the batched Xero sync
+(xero_service.sync_payout_records_to_xero).
+
+Run with: pytest tests/test_payout_batch.py -v
+"""
+
+from datetime import datetime, date
+from types import SimpleNamespace
+
+import perf_tracing
+
+MONTH = (2026, 9)
+
+
+def _seed(creators, tag=''):
+    """`creators` creators with one September purchase each; every third one
+    has a W-9 on file, the first also has two gifted rows, plus a bot."""
+    from models import db, User, InAppPurchase, AdminSubscription, TaxpayerProfile
+    subscriber = User(email=f'sub{tag}@example.com', username=f'sub{tag}')
+    humans = [User(email=f'c{tag}-{i}@example.com', username=f'c{tag}-{i}') for i in range(creators)]
+    bot = User(email=f'bot{tag}@example.com', username=f'bot{tag}', role='agent')
+    db.session.add_all([subscriber, bot] + humans)
+    db.session.flush()
+    for i, creator in enumerate(humans + [bot]):
+        db.session.add(InAppPurchase(
+            subscriber_id=subscriber.id, subscribed_to_id=creator.id, platform='apple',
+            product_id='sub.s01.monthly', transaction_id=f'T{tag}-{i}', status='active',
+            purchase_date=datetime(2026, 9, 10), price=9.0, store_fee=1.35,
+            platform_revenue=1.15, influencer_payout=6.5))
+        if i % 3 == 0 and creator is not bot:
+            db.session.add(TaxpayerProfile(user_id=creator.id, status='on_file', tin_last4='1234',
+                                           xero_contact_id=f'XC-{creator.id}'))
+    db.session.add(AdminSubscription(portfolio_user_id=humans[0].id, bonus_subscriber_count=2))
+    db.session.add(AdminSubscription(portfolio_user_id=humans[0].id, bonus_subscriber_count=1))
+    db.session.commit()
+    return [h.id for h in humans], bot.id
+
+
+class TestGeneration:
+    def test_records_holds_and_gifted_totals(self, app):
+        from models import XeroPayoutRecord, AdminSubscription
+        from mobile_api import _generate_payout_records_for_period
+        humans, bot = _seed(4)
+        result = _generate_payout_records_for_period(*MONTH)
+        assert result['records_created'] == 4
+        records = {r.portfolio_user_id: r for r in XeroPayoutRecord.query.all()}
+        assert bot not in records
+        first = records[humans[0]]
+        assert (first.real_subscriber_count, first.bonus_subscriber_count) == (1, 3)
+        assert first.bonus_payout == round(3 * AdminSubscription.INFLUENCER_PAYOUT_PER_SUB, 2)
+        assert first.payment_status == 'pending' and first.xero_contact_id == f'XC-{humans[0]}'
+        assert records[humans[1]].payment_status == 'held'
+        assert result['held_pending_w9'] == 2
+
+    def test_query_count_does_not_grow_with_creators(self, app):
+        from models import db, XeroPayoutRecord
+        from mobile_api import _generate_payout_records_for_period
+        counts, seeded = [], 0
+        for n in (3, 40):
+            _seed(n, tag=n)
+            seeded += n
+            with perf_tracing.capture('payouts') as trace:
+                assert _generate_payout_records_for_period(*MONTH)['records_created'] == seeded
+            counts.append(trace.query_count)
+            XeroPayoutRecord.query.delete()
+            db.session.commit()
+        assert counts[0] == counts[1]
+
+    def test_second_run_and_conflicting_rows_are_idempotent(self, app):
+        from models import db, XeroPayoutRecord
+        from mobile_api import _generate_payout_records_for_period, _insert_payout_records
+        humans, _bot = _seed(2)
+        _generate_payout_records_for_period(*MONTH)
+        assert _generate_payout_records_for_period(*MONTH)['already_exists'] is True
+        row = {'portfolio_user_id': humans[0], 'period_start': date(2026, 9, 1), 'period_end': date(2026, 9, 30)}
+        assert _insert_payout_records([row]) == set()
+        db.session.commit()
+        assert XeroPayoutRecord.query.count() == 2
+
+    def test_refund_after_payment_is_netted_once(self, app):
+        from models import db, InAppPurchase, XeroPayoutRecord
+        from mobile_api import _generate_payout_records_for_period
+        humans, _bot = _seed(1)
+        creator = humans[0]
+        db.session.add(XeroPayoutRecord(portfolio_user_id=creator, period_start=date(2026, 8, 1),
+                                        period_end=date(2026, 8, 31), payment_status='paid'))
+        refund = InAppPurchase(subscriber_id=creator, subscribed_to_id=creator, platform='apple',
+                               product_id='sub.s01.monthly', transaction_id='R1', status='refunded',
+                               purchase_date=datetime(2026, 8, 5), price=9.0, influencer_payout=6.5)
+        db.session.add(refund)
+        db.session.commit()
+        result = _generate_payout_records_for_period(*MONTH)
+        assert result['refund_clawback_applied'] == 6.5
+        sept = XeroPayoutRecord.query.filter_by(portfolio_user_id=creator, period_start=date(2026, 9, 1)).one()
+        assert sept.influencer_payout == 0.0
+        assert db.session.get(InAppPurchase, refund.id).payout_reversed_at is not None
+
+
+class FakeXero:
+    """Stands in for requests.get/post/put against the Xero API."""
+
+    def __init__(self, existing=()):
+        self.calls = []
+        self.existing = {name: f'XC-{name}' for name in existing}
+
+    def _resp(self, body, status=200):
+        return SimpleNamespace(status_code=status, json=lambda: body, text='', headers={})
+
+    def get(self, url, **kw):
+        self.calls.append(('GET', url.rsplit('/', 1)[-1]))
+        if url.endswith('ContactGroups'):
+            return self._resp({'ContactGroups': [{'Name': '1099 Contractors', 'Status': 'ACTIVE',
+                                                  'ContactGroupID': 'G1'}]})
+        where = kw['params']['where']
+        return self._resp({'Contacts': [{'Name': n, 'ContactID': cid} for n, cid in self.existing.items()
+                                        if f'Name=="{n}"' in where]})
+
+    def post(self, url, json=None, **kw):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls.append(('POST', endpoint))
+        if endpoint == 'Contacts':
+            return self._resp({'Contacts': [{'Name': c['Name'], 'ContactID': c.get('ContactID') or f'NEW-{c["Name"]}'}
+                                            for c in json['Contacts']]})
+        return self._resp({'Invoices': [{'InvoiceID': f'INV-{i["Reference"]}'} for i in json['Invoices']]})
+
+    def put(self, url, json=None, **kw):
+        self.calls.append(('PUT', url.rsplit('/', 1)[-1]))
+        return self._resp({})
+
+
+class TestXeroSync:
+    def test_bills_are_batched_and_contacts_resolved_in_bulk(self, app, monkeypatch):
+        import xero_service
+        from models import XeroPayoutRecord, XeroSyncLog
+        from mobile_api import _generate_payout_records_for_period
+        humans, _bot = _seed(7)
+        _generate_payout_records_for_period(*MONTH)
+        XeroPayoutRecord.query.update({'payment_status': 'pending'})
+        fake = FakeXero(existing=['c-1'])
+        monkeypatch.setattr(xero_service, 'get_valid_token',
+                            lambda: SimpleNamespace(access_token='a', tenant_id='t'))
+        monkeypatch.setattr(xero_service, '_1099_group_id_cache', None)
+        monkeypatch.setattr(xero_service, 'XERO_BATCH_SIZE', 3)
+        monkeypatch.setattr(xero_service.requests, 'get', fake.get)
+        monkeypatch.setattr(xero_service.requests, 'post', fake.post)
+        monkeypatch.setattr(xero_service.requests, 'put', fake.put)
+
+        result = xero_service.sync_payout_records_to_xero(date(2026, 9, 1), date(2026, 9, 30))
+
+        assert len(result['synced']) == 7 and not result['failed']
+        assert fake.calls.count(('POST', 'Invoices')) == 3           # ceil(7 / 3)
+        assert fake.calls.count(('GET', 'Contacts')) == 1            # 4 creators without a cached contact
+        assert fake.calls.count(('PUT', 'Contacts')) == 2            # ceil(4 / 3) group adds
+        records = {r.portfolio_user_id: r for r in XeroPayoutRecord.query.all()}
+        assert records[humans[1]].xero_contact_id == 'XC-c-1'
+        assert records[humans[2]].xero_contact_id == 'NEW-c-2'
+        assert records[humans[0]].xero_contact_id == f'XC-{humans[0]}'
+        assert all(r.xero_sync_status == 'synced' for r in records.values())
+        assert XeroSyncLog.query.filter_by(status='success').count() == 7
+
+    def test_rejected_invoice_fails_only_its_record(self, app, monkeypatch):
+        import xero_service
+        from models import XeroPayoutRecord
+        from mobile_api import _generate_payout_records_for_period
+        _seed(3)
+        _generate_payout_records_for_period(*MONTH)
+        XeroPayoutRecord.query.update({'payment_status': 'pending', 'xero_contact_id': 'XC'})
+        fake = FakeXero()
+
+        def post(url, json=None, **kw):
+            invoices = json['Invoices']
+            return fake._resp({'Invoices': [{'HasErrors': True, 'ValidationErrors': [{'Message': 'bad'}]}]
+                                            + [{'InvoiceID': 'INV'} for _ in invoices[1:]]})
+        monkeypatch.setattr(xero_service, 'get_valid_token',
+                            lambda: SimpleNamespace(access_token='a', tenant_id='t'))
+        monkeypatch.setattr(xero_service.requests, 'post', post)
+        result = xero_service.sync_payout_records_to_xero()
+        assert len(result['synced']) == 2 and len(result['failed']) == 1
+        assert result['failed'][0]['error'] == 'Xero API error: bad'
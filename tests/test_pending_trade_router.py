@@ -0,0 +1,139 @@
+"""
+Tests for the single-pass pending-trade router (pending_trade_router.py,
+POST /api/mobile/admin/bot/process-pending-trades).
+
+Replays the recorded batches in tests/fixtures/pending_trade_batches.json
+through the endpoint and asserts the routing decisions recorded from the
+per-cluster router it replaced.
+
+Run with: pytest tests/test_pending_trade_router.py -v
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import perf_tracing
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pending_trade_batches.json')
+ENDPOINT = '/api/mobile/admin/bot/process-pending-trades'
+
+with open(FIXTURES) as fh:
+    RECORDED = json.load(fh)
+
+
+@pytest.fixture
+def app(monkeypatch, app):
+    import mobile_api
+    monkeypatch.setenv('CRON_SECRET', 'router-test-secret')
+    monkeypatch.delenv('BOT_EMAIL_TRADE_PAUSED', raising=False)
+    # Routing is under test, not execution (live prices, fan-out).
+    monkeypatch.setattr(mobile_api, '_execute_single_bot_trade', lambda *a, **kw: {'status': 'executed'})
+    monkeypatch.setattr(mobile_api, '_is_duplicate_trade_suspect', lambda *a, **kw: False)
+    monkeypatch.setattr(mobile_api, '_notify_admin_unroutable_trades', lambda *a, **kw: None)
+    return app
+
+
+def _seed(batch, extra_bots=0):
+    """Load one recorded batch. Returns ({bot key: id}, [pending ids])."""
+    from models import db, User, Stock, Transaction, PendingTrade
+    start = datetime.utcnow() - timedelta(minutes=20)
+    bots = {}
+    for key, spec in list(RECORDED['bots'].items()) + [(f'extra{i}', {'username': f'extra{i}', 'copytrade': True})
+                                                        for i in range(extra_bots)]:
+        user = User(email=f"{spec['username']}@example.com", username=spec['username'], role='agent',
+                    extra_data={'copytrade_bot': True} if spec.get('copytrade') else {})
+        db.session.add(user)
+        db.session.flush()
+        bots[key] = user.id
+        if key.startswith('extra'):
+            db.session.add(Stock(user_id=user.id, ticker=f'X{user.id}', quantity=1, purchase_price=1.0))
+    for key, holdings in batch['holdings'].items():
+        for ticker, qty in holdings.items():
+            db.session.add(Stock(user_id=bots[key], ticker=ticker, quantity=qty, purchase_price=10.0))
+    for a in batch['anchors']:
+        db.session.add(Transaction(user_id=bots[a['bot']], ticker=a['ticker'], quantity=1, price=10.0,
+                                   transaction_type=a['type'], price_source=a['source'],
+                                   timestamp=start + timedelta(seconds=a['at'])))
+    pending = []
+    for i, p in enumerate(batch['pending']):
+        created = start + timedelta(seconds=p['at'])
+        pt = PendingTrade(email_batch_id=f"{batch['name']}-{i}", ticker=p['ticker'], action=p['action'],
+                          quantity=p['qty'], created_at=created,
+                          expires_at=(datetime.utcnow() - timedelta(minutes=1)) if p.get('expired')
+                          else created + timedelta(minutes=30))
+        db.session.add(pt)
+        pending.append(pt)
+    db.session.commit()
+    return bots, [pt.id for pt in pending]
+
+
+def _post(app, remote_addr='10.0.0.1'):
+    resp = app.test_client().post(ENDPOINT, headers={'X-Cron-Secret': 'router-test-secret'},
+                                  environ_base={'REMOTE_ADDR': remote_addr})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def _replay(app, batch):
+    """Run one batch through the endpoint; returns (decisions, response json)."""
+    from models import PendingTrade
+    _bots, ids = _seed(batch)
+    key_by_name = {RECORDED['bots'][k]['username']: k for k in RECORDED['bots']}
+    index = {pid: i for i, pid in enumerate(ids)}
+    body = _post(app)
+    clusters = []
+    for section in ('routed_clusters', 'ambiguous_clusters', 'no_anchor_clusters'):
+        for info in body[section]:
+            clusters.append({'trades': [index[t['id']] for t in info['trades']], 'reason': info['reason'],
+                             'bot': key_by_name.get(info.get('routed_to'))})
+    clusters.sort(key=lambda c: c['trades'][0])
+    still = sorted(index[pt.id] for pt in PendingTrade.query.filter_by(status='pending'))
+    return {'clusters': clusters, 'still_pending': still}, body
+
+
+class TestRecordedBatches:
+    @pytest.mark.parametrize('batch', RECORDED['batches'], ids=[b['name'] for b in RECORDED['batches']])
+    def test_routing_decisions_match_recording(self, app, batch):
+        decisions, body = _replay(app, batch)
+        assert decisions == batch['expected']
+        assert body['still_pending'] == len(batch['expected']['still_pending'])
+
+    def test_routed_trades_are_assigned(self, app):
+        from models import PendingTrade
+        _replay(app, RECORDED['batches'][0])
+        assert {(pt.status, pt.assigned_bot_id is not None) for pt in PendingTrade.query} == {('routed', True)}
+
+
+class TestRoundTrips:
+    def test_statements_flat_in_bots_and_clusters(self, app):
+        from models import db, PendingTrade, Transaction, Stock, User
+        batch = next(b for b in RECORDED['batches'] if b['name'] == 'multi_cluster_window_edges')
+        counts = []
+        for extra in (0, 12):
+            _seed(batch, extra_bots=extra)
+            with perf_tracing.capture('route') as trace:
+                assert _post(app, remote_addr=f'10.0.1.{extra}')['pending_clusters'] == 5
+            counts.append(trace.query_count)
+            for model in (PendingTrade, Transaction, Stock, User):
+                model.query.delete()
+            db.session.commit()
+        assert counts[0] == counts[1]
+
+
+class TestSweep:
+    def test_anchor_assignment_matches_per_window_scan(self):
+        import random
+        from pending_trade_router import assign_anchors
+        rng = random.Random(7)
+        base = datetime(2026, 10, 1, 14, 0)
+        anchors = sorted((base + timedelta(seconds=rng.randint(0, 3000)), i) for i in range(200))
+        windows = []
+        t = 0
+        while t < 3000:
+            windows.append((base + timedelta(seconds=t), base + timedelta(seconds=t + rng.randint(0, 90))))
+            t += rng.randint(0, 150)
+        got = assign_anchors(windows, anchors, key=lambda a: a[0])
+        assert got == [[a for a in anchors if start <= a[0] <= end] for start, end in windows]
@@ -0,0 +1,157 @@
+"""
+Tests for per-request performance tracing (perf_tracing.py).
+
+Run with: pytest tests/test_perf_tracing.py -v
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import perf_tracing
+from perf_tracing import RouteStats, Trace, bind, span, traced
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(perf_tracing, 'route_stats', RouteStats())
+
+
+def _in_trace(fn):
+    trace = Trace('GET', '/api/mobile/test')
+    token = perf_tracing._current.set(trace)
+    try:
+        fn()
+    finally:
+        perf_tracing._current.reset(token)
+    return trace.summary()
+
+
+class TestSpans:
+    def test_noop_outside_request(self):
+        with span('anything', kind='av'):
+            pass
+        assert perf_tracing.current_trace() is None
+
+    def test_nested_spans_and_external_time(self):
+        @traced()
+        def outer():
+            with span('av:GLOBAL_QUOTE', kind='av'):
+                pass
+            with span('av:GLOBAL_QUOTE', kind='av'):
+                pass
+
+        summary = _in_trace(outer)
+        names = [(s['depth'], s['name']) for s in summary['spans']]
+        assert names == [(1, 'av:GLOBAL_QUOTE'), (1, 'av:GLOBAL_QUOTE'), (0, 'outer')]
+        assert summary['external']['av']['calls'] == 2
+
+    def test_bind_carries_trace_into_threads(self):
+        def work():
+            with span('fcm_multicast', kind='fcm'):
+                pass
+
+        def run():
+            t = threading.Thread(target=bind(work))
+            t.start()
+            t.join()
+
+        summary = _in_trace(run)
+        assert summary['external']['fcm']['calls'] == 1
+        assert summary['spans'] == []  # worker spans add time, not tree nodes
+
+    def test_sql_queries_counted(self):
+        perf_tracing.install_sql_hooks()
+        engine = create_engine('sqlite://')
+
+        def run():
+            with engine.connect() as conn:
+                for _ in range(3):
+                    conn.execute(text('SELECT 1'))
+
+        assert _in_trace(run)['query_count'] == 3
+
+
+class TestRouteStats:
+    def test_percentiles_per_route(self):
+        stats = RouteStats()
+        for ms in range(1, 101):
+            stats.record({'method': 'GET', 'route': '/api/mobile/x', 'status': 200,
+                          'total_ms': float(ms), 'query_count': 2, 'query_ms': 1.0,
+                          'external_ms': 0.0})
+        (row,) = stats.snapshot()
+        assert row['count'] == 100
+        assert row['p50_ms'] in (50.0, 51.0)
+        assert row['p95_ms'] in (95.0, 96.0)
+        assert row['queries_max'] == 2
+
+
+def _make_app(engine):
+    app = Flask(__name__)
+    perf_tracing.init_app(app, engine_getter=lambda: engine)
+
+    @app.route('/api/mobile/items/<int:item_id>')
+    def item(item_id):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        return jsonify({'id': item_id})
+
+    @app.route('/')
+    def landing():
+        return 'hi'
+
+    return app
+
+
+class TestFlaskIntegration:
+    def test_mobile_request_is_traced_by_route_template(self):
+        engine = create_engine('sqlite://')
+        client = _make_app(engine).test_client()
+        resp = client.get('/api/mobile/items/7')
+        assert 'db;desc="1 queries"' in resp.headers['Server-Timing']
+        client.get('/api/mobile/items/8')
+        (row,) = perf_tracing.route_stats.snapshot()
+        assert row['route'] == '/api/mobile/items/<int:item_id>' and row['count'] == 2
+        assert 'Server-Timing' not in client.get('/').headers
+
+    def test_flush_writes_buffer_and_disables_on_missing_table(self, monkeypatch):
+        monkeypatch.setattr(perf_tracing, 'TRACE_FLUSH_EVERY', 2)
+        engine = create_engine('sqlite:///file:perf?mode=memory&cache=shared&uri=true')
+        keep = engine.connect()  # keep the shared in-memory db alive
+        client = _make_app(engine).test_client()
+
+        client.get('/api/mobile/items/1')
+        client.get('/api/mobile/items/2')  # flush attempt: table missing
+        assert perf_tracing.route_stats.persist is False
+
+        perf_tracing.route_stats.persist = True
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE request_perf_sample (id INTEGER PRIMARY KEY, recorded_at TIMESTAMP, "
+                "method TEXT, route TEXT, status INTEGER, total_ms REAL, query_count INTEGER, "
+                "query_ms REAL, external_ms REAL)"))
+        client.get('/api/mobile/items/3')
+        client.get('/api/mobile/items/4')
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT route, query_count FROM request_perf_sample")).fetchall()
+        keep.close()
+        assert [tuple(r) for r in rows] == [('/api/mobile/items/<int:item_id>', 1)] * 2
+
+    def test_prune_deletes_samples_past_retention(self):
+        from datetime import datetime, timedelta
+        engine = create_engine('sqlite://')
+        assert perf_tracing.prune(engine) == 0  # table missing
+        now = datetime.utcnow()
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE request_perf_sample (id INTEGER PRIMARY KEY, recorded_at TIMESTAMP)"))
+            conn.execute(text("INSERT INTO request_perf_sample (recorded_at) VALUES (:a), (:b)"),
+                         {'a': now - timedelta(days=perf_tracing.TRACE_RETENTION_DAYS + 1), 'b': now})
+        assert perf_tracing.prune(engine) == 1
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM request_perf_sample")).scalar() == 1
@@ -0,0 +1,112 @@
+"""
+Tests for the set-based portfolio stats engine (portfolio_stats.py).
+
+Run with: pytest tests/test_portfolio_stats.py -v
+"""
+
+from datetime import date, datetime, timedelta
+
+import perf_tracing
+
+
+def _stock_info():
+    from models import db, StockInfo
+    db.session.add_all([
+        StockInfo(ticker='AAPL', sector='TECHNOLOGY', market_cap=3_000_000_000_000),
+        StockInfo(ticker='SMOL', sector='Healthcare', market_cap=900_000_000),
+        StockInfo(ticker='MIDC', sector='Energy', cap_classification='mid'),
+        StockInfo(ticker='SPY', sector=''),
+    ])
+    db.session.commit()
+
+
+def _user(name, holdings=(), trades_ago=(), value=10_000.0):
+    from models import db, User, Stock, Transaction, PortfolioSnapshot
+    user = User(email=f'{name}@example.com', username=name)
+    db.session.add(user)
+    db.session.flush()
+    for ticker, qty, price in holdings:
+        db.session.add(Stock(user_id=user.id, ticker=ticker, quantity=qty, purchase_price=price))
+    now = datetime.now()
+    for days in trades_ago:
+        db.session.add(Transaction(user_id=user.id, ticker='AAPL', quantity=1, price=1,
+                                   transaction_type='buy', timestamp=now - timedelta(days=days)))
+    if value is not None:
+        db.session.add(PortfolioSnapshot(user_id=user.id, date=date.today() - timedelta(days=3), total_value=1.0))
+        db.session.add(PortfolioSnapshot(user_id=user.id, date=date.today(), total_value=value))
+    db.session.commit()
+    return user.id
+
+
+class TestCompute:
+    def test_matches_the_per_user_calculations(self, app):
+        import portfolio_stats
+        from leaderboard_utils import calculate_industry_mix, calculate_portfolio_cap_percentages
+        _stock_info()
+        mixed = _user('mixed', holdings=[('aapl', 10, 150.0), ('SMOL', 2.5, 40.0), ('MIDC', 5, 20.0),
+                                         ('SPY', 3, 400.0), ('ZZZZ', 1, 10.0)],
+                       trades_ago=[1, 2, 3, 20, 40])
+        whole = _user('whole', holdings=[('AAPL', 4, 100.0)], trades_ago=[5])
+        empty = _user('empty', value=None)
+
+        stats = portfolio_stats.compute()
+        assert set(stats) == {mixed, whole, empty}
+        for uid in (mixed, whole, empty):
+            assert stats[uid]['industry_mix'] == calculate_industry_mix(uid)
+            small, large = calculate_portfolio_cap_percentages(uid)
+            assert (stats[uid]['small_cap_percent'], stats[uid]['large_cap_percent']) == (small, large)
+        assert stats[mixed]['unique_stocks_count'] == 5
+        assert stats[mixed]['has_fractional_holdings'] is True
+        assert stats[whole]['has_fractional_holdings'] is False
+        assert (stats[mixed]['total_trades'], stats[mixed]['avg_trades_per_week']) == (5, 1.5)
+        assert stats[empty] == {**stats[empty], 'unique_stocks_count': 0, 'total_trades': 0,
+                                'industry_mix': {}, 'small_cap_percent': 0.0, 'subscriber_count': 0}
+
+    def test_subscriber_counts_include_legacy_and_gifted(self, app):
+        import portfolio_stats
+        from models import db, Subscription, MobileSubscription, AdminSubscription
+        creator, fan = _user('creator'), _user('fan')
+        db.session.add(Subscription(subscriber_id=fan, subscribed_to_id=creator,
+                                    stripe_subscription_id='sub_1', status='active'))
+        db.session.add(MobileSubscription(subscriber_id=fan, subscribed_to_id=creator,
+                                          in_app_purchase_id=1, status='active'))
+        db.session.add(AdminSubscription(portfolio_user_id=creator, bonus_subscriber_count=3))
+        db.session.commit()
+        assert portfolio_stats.compute([creator])[creator]['subscriber_count'] == 5
+
+    def test_query_count_is_flat_in_users(self, app):
+        import portfolio_stats
+        _stock_info()
+        portfolio_stats.compute()  # one-off cached table checks (db_tables)
+        counts, seeded = [], 0
+        for batch in (3, 30):
+            for i in range(batch):
+                _user(f'u{batch}-{i}', holdings=[('AAPL', i + 1, 10.0), ('SMOL', 1.5, 5.0)], trades_ago=[i])
+            seeded += batch
+            with perf_tracing.capture('stats') as trace:
+                assert len(portfolio_stats.compute()) == seeded
+            counts.append(trace.query_count)
+        assert counts[0] == counts[1]
+
+
+class TestWrite:
+    def test_bulk_upsert_inserts_then_updates(self, app):
+        import portfolio_stats
+        from models import db, Stock, UserPortfolioStats
+        _stock_info()
+        a = _user('a', holdings=[('AAPL', 1, 10.0)])
+        b = _user('b')
+        assert portfolio_stats.update_all() == 2
+        db.session.commit()
+        assert UserPortfolioStats.query.filter_by(user_id=a).one().unique_stocks_count == 1
+
+        db.session.add(Stock(user_id=a, ticker='SMOL', quantity=0.5, purchase_price=10.0))
+        db.session.commit()
+        with perf_tracing.capture('write') as trace:
+            portfolio_stats.write(portfolio_stats.compute())
+        db.session.commit()
+        assert trace.query_count <= 8
+        row = UserPortfolioStats.query.filter_by(user_id=a).one()
+        assert (row.unique_stocks_count, row.has_fractional_holdings) == (2, True)
+        assert UserPortfolioStats.query.count() == 2
+        assert UserPortfolioStats.query.filter_by(user_id=b).one().industry_mix == {}
@@ -0,0 +1,60 @@
+"""
+Query-count regression tests for the hot endpoints (harness: tests/query_budget.py).
+
+Seeds a small synthetic user base twice (SQLite, in memory) and checks every
+scenario against its budget, and that request paths issue the same number of
+statements at both sizes. Run the larger sizes by hand:
+
+    python tests/query_budget.py --sizes 100,1000,10000 --out report.json
+
+Run with: pytest tests/test_query_budget.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import query_budget
+
+SMALL, LARGE = 40, 120
+REQUEST_SCENARIOS = [name for name, b in query_budget.BUDGETS.items() if b['queries'][1] == 0]
+
+
+@pytest.fixture(scope='module')
+def results():
+    return {n: query_budget.run_size(n) for n in (SMALL, LARGE)}
+
+
+class TestQueryBudgets:
+    @pytest.mark.parametrize('name', list(query_budget.BUDGETS))
+    def test_within_budget(self, results, name):
+        for n, by_scenario in results.items():
+            r = by_scenario[name]
+            assert r['queries'] <= r['budget']['queries'], f'{name} at N={n}: {r}'
+            assert r['ms'] <= r['budget']['ms'], f'{name} at N={n}: {r}'
+
+    @pytest.mark.parametrize('name', REQUEST_SCENARIOS)
+    def test_request_paths_do_not_scale_with_users(self, results, name):
+        assert results[SMALL][name]['queries'] == results[LARGE][name]['queries']
+
+    def test_batch_jobs_stay_linear(self, results):
+        # The per-user slope, not just the total, so a new per-user query
+        # fails here even while the totals are still under budget.
+        for name in ('update_leaderboard_cache', 'intraday_collector'):
+            slope = ((results[LARGE][name]['queries'] - results[SMALL][name]['queries'])
+                     / (LARGE - SMALL))
+            assert slope <= query_budget.BUDGETS[name]['queries'][1], f'{name}: {slope:.2f}/user'
+
+
+def test_refuses_a_database_that_already_has_tables(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    url = f"sqlite:///{tmp_path / 'real.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE keep_me (id INTEGER PRIMARY KEY)'))
+    with pytest.raises(SystemExit, match='refusing'):
+        query_budget.run_size(5, url)
+    assert inspect(engine).get_table_names() == ['keep_me']
@@ -0,0 +1,55 @@
+"""
+Smoke test for /api/cron/refresh-fundamentals (api/index.py) with
+AlphaVantage mocked.
+
+api/index.py registers request hooks and module-level state on import, so
+the route runs in a subprocess: the script stubs the AV fetch, imports the
+module and calls the view inside a tests/query_budget app on SQLite.
+
+Run with: pytest tests/test_refresh_fundamentals_cron.py -v
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = r'''
+import json, sys
+sys.path[:0] = ['api', 'tests', '.']
+import bot_data_hub
+bot_data_hub.ALPHA_VANTAGE_KEY = 'test'
+bot_data_hub.get_all_tickers = lambda: ['AAPL', 'MSFT']
+bot_data_hub.fetch_overviews_concurrent = lambda tickers: {
+    'AAPL': {'pe_ratio': 30.0, 'beta': 1.2, 'sector': 'Technology', 'name': 'Apple'}}
+bot_data_hub.flush_av_logs = lambda: None
+import index
+import query_budget
+from models import db, StockFundamentals
+app = query_budget.make_app()
+with app.app_context():
+    db.create_all()
+    with app.test_request_context('/api/cron/refresh-fundamentals', headers={'Authorization': 'Bearer s3cret'}):
+        resp = index.refresh_fundamentals_cron()
+    resp = resp[0] if isinstance(resp, tuple) else resp
+    row = StockFundamentals.query.filter_by(ticker='AAPL').first()
+    print(json.dumps({'status': resp.status_code, 'body': resp.get_json(),
+                      'saved': {'pe_ratio': row.pe_ratio, 'sector': row.sector} if row else None}))
+'''
+
+
+def test_upserts_fetched_overviews(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'index.db'}", CRON_SECRET='s3cret',
+               LOG_LEVEL='ERROR')
+    env.pop('VERCEL_ENV', None)
+    proc = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env, capture_output=True,
+                          text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert result['status'] == 200, result['body']
+    body = result['body']
+    assert body['success'] and body['rows_upserted'] == 1 and body['tickers_upsert_failed'] == []
+    assert body['tickers_missing_from_av'] == ['MSFT']
+    assert result['saved'] == {'pe_ratio': 30.0, 'sector': 'Technology'}
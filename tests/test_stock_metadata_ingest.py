@@ -0,0 +1,140 @@
+"""
+Tests for bulk StockInfo ingestion (stock_metadata_utils.ingest_stock_info).
+
+AlphaVantage is replaced by a fake HTTP session behind the real governor.
+
+Run with: pytest tests/test_stock_metadata_ingest.py -v
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import perf_tracing
+
+OVERVIEWS = {
+    'AAPL': {'Symbol': 'AAPL', 'Name': 'Apple Inc', 'Sector': 'TECHNOLOGY', 'Industry': 'Consumer Electronics',
+             'Exchange': 'NASDAQ', 'Country': 'USA', 'MarketCapitalization': '3500000000000'},
+    'MRNA': {'Symbol': 'MRNA', 'Name': 'Moderna', 'Sector': 'HEALTHCARE', 'Industry': 'Biotechnology',
+             'Exchange': 'NASDAQ', 'Country': 'USA', 'MarketCapitalization': '1500000000'},
+}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status_code = 200
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeAV:
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        symbol = params['symbol']
+        with self._lock:
+            self.calls.append(symbol)
+        if symbol in OVERVIEWS:
+            return FakeResponse(OVERVIEWS[symbol])
+        if symbol.startswith('T'):
+            return FakeResponse({'Symbol': symbol, 'Name': f'{symbol} Corp', 'Sector': 'ENERGY',
+                                 'Industry': 'Oil & Gas E&P', 'MarketCapitalization': 'None'})
+        return FakeResponse({})
+
+
+@pytest.fixture
+def av(monkeypatch):
+    import av_rate_governor
+    fake = FakeAV()
+    monkeypatch.setenv('ALPHA_VANTAGE_API_KEY', 'test-key')
+    monkeypatch.setattr(av_rate_governor, '_session', fake)
+    monkeypatch.setattr(av_rate_governor, 'governor', av_rate_governor.AVRateGovernor(max_calls=1000))
+    return fake
+
+
+def _hold(*tickers):
+    from models import db, User, Stock
+    n = User.query.count()
+    user = User(email=f'holder{n}@example.com', username=f'holder{n}')
+    db.session.add(user)
+    db.session.flush()
+    for t in tickers:
+        db.session.add(Stock(user_id=user.id, ticker=t, quantity=1, purchase_price=10.0))
+    db.session.commit()
+
+
+class TestIngest:
+    def test_fetches_due_tickers_and_resolves_fallbacks(self, app, av):
+        from models import db, StockInfo, AlphaVantageAPILog
+        from stock_metadata_utils import ingest_stock_info
+        _hold('aapl', 'MRNA', 'SPY', 'NOPE', 'FRSH')
+        db.session.add(StockInfo(ticker='FRSH', sector='Energy', last_updated=datetime.now()))
+        db.session.add(StockInfo(ticker='SPY', company_name='SPDR S&P 500',
+                                 last_updated=datetime.now() - timedelta(days=30)))
+        db.session.commit()
+
+        result = ingest_stock_info()
+
+        assert {r['ticker']: r['status'] for r in result['results']} == {
+            'AAPL': 'updated', 'MRNA': 'updated', 'SPY': 'fallback', 'NOPE': 'failed', 'FRSH': 'fresh'}
+        assert sorted(av.calls) == ['AAPL', 'MRNA', 'NOPE']
+        aapl = StockInfo.query.filter_by(ticker='AAPL').one()
+        assert (aapl.sector, aapl.cap_classification, aapl.country) == ('Technology', 'mega', 'USA')
+        mrna = StockInfo.query.filter_by(ticker='MRNA').one()
+        assert (mrna.naics_code, mrna.cap_classification, mrna.market_cap) == ('541714', 'small', 1500000000)
+        spy = StockInfo.query.filter_by(ticker='SPY').one()
+        assert (spy.sector, spy.company_name) == ('Other', 'SPDR S&P 500')
+        assert spy.last_updated > datetime.now() - timedelta(minutes=1)
+        assert AlphaVantageAPILog.query.count() == 3
+        assert (result['success_count'], result['failed_count']) == (4, 1)
+
+    def test_rerun_updates_in_place(self, app, av):
+        from models import StockInfo
+        from stock_metadata_utils import ingest_stock_info
+        _hold('AAPL')
+        ingest_stock_info()
+        first = StockInfo.query.filter_by(ticker='AAPL').one().id
+        assert ingest_stock_info()['fresh_count'] == 1
+        assert ingest_stock_info(force_update=True)['updated_count'] == 1
+        assert [s.id for s in StockInfo.query] == [first]
+
+    def test_statements_flat_in_tickers(self, app, av):
+        from models import Stock
+        from stock_metadata_utils import ingest_stock_info
+        counts = []
+        for n in (3, 40):
+            _hold(*[f'T{n}X{i}' for i in range(n)])
+            with perf_tracing.capture('ingest') as trace:
+                assert ingest_stock_info(force_update=True)['updated_count'] == len(Stock.query.all())
+            counts.append(trace.query_count)
+        assert counts[0] == counts[1]
+
+    def test_tickers_without_a_slot_are_deferred(self, app, av, monkeypatch):
+        import av_rate_governor
+        from stock_metadata_utils import ingest_stock_info, get_remaining_tickers
+        monkeypatch.setattr(av_rate_governor, 'governor', av_rate_governor.AVRateGovernor(max_calls=2))
+        _hold('T1', 'T2', 'T3', 'T4')
+        # Two slots in the window; the deadline passes before a third opens.
+        result = ingest_stock_info(max_workers=1, deadline=0)
+        assert (result['updated_count'], result['deferred_count']) == (2, 2)
+        assert len(av.calls) == 2
+        assert sorted(get_remaining_tickers()) == sorted(r['ticker'] for r in result['results']
+                                                         if r['status'] == 'deferred')
+
+
+class TestBatchHelpers:
+    def test_batch_and_resume_do_not_sleep(self, app, av, monkeypatch):
+        import stock_metadata_utils
+        monkeypatch.setattr(stock_metadata_utils.time, 'sleep',
+                            lambda s: pytest.fail('fixed sleep between tickers'))
+        _hold('AAPL', 'MRNA', 'T9')
+        result = stock_metadata_utils.populate_user_stocks_batch(tickers='aapl,mrna,ZZZZ', sleep_seconds=12)
+        assert result['tickers_processed'] == ['AAPL', 'MRNA'] and result['success_count'] == 2
+        resumed = stock_metadata_utils.populate_user_stocks_resume()
+        assert resumed['tickers_processed'] == ['T9'] and resumed['remaining_total'] == 0
@@ -0,0 +1,153 @@
+"""
+Tests for the per-creator subscriber counters (subscriber_counts.py):
+maintenance on write, reconciliation, and the readers that use them.
+
+Run with: pytest tests/test_subscriber_counts.py -v
+"""
+
+
+def _users(*names):
+    from models import db, User
+    users = [User(email=f'{n}@example.com', username=n) for n in names]
+    db.session.add_all(users)
+    db.session.commit()
+    return [u.id for u in users]
+
+
+def _subscribe(creator, subscriber, status='active'):
+    from models import db, MobileSubscription
+    sub = MobileSubscription(subscriber_id=subscriber, subscribed_to_id=creator,
+                             in_app_purchase_id=1, status=status)
+    db.session.add(sub)
+    db.session.commit()
+    return sub
+
+
+def _stored():
+    from models import CreatorSubscriberCount
+    return {c.user_id: (c.real_subscriber_count, c.gifted_subscriber_count, c.total_subscriber_count)
+            for c in CreatorSubscriberCount.query.all()}
+
+
+class TestMaintainedOnWrite:
+    def test_subscribe_cancel_and_gifted_changes(self, app):
+        from models import db, AdminSubscription
+        creator, fan = _users('creator', 'fan')
+        first = _subscribe(creator, fan)
+        _subscribe(creator, fan, status='expired')
+        _subscribe(creator, fan)
+        assert _stored() == {creator: (2, 0, 2)}
+
+        first.status                               # loaded: applied as a delta
+        first.status = 'canceled'
+        db.session.commit()
+        assert _stored() == {creator: (1, 0, 1)}
+
+        bonus = AdminSubscription(portfolio_user_id=creator, bonus_subscriber_count=5)
+        db.session.add(bonus)
+        db.session.add(AdminSubscription(portfolio_user_id=creator, bonus_subscriber_count=-2))
+        db.session.commit()
+        assert _stored() == {creator: (1, 5, 6)}
+
+        bonus.bonus_subscriber_count = 3           # expired after commit: recounted
+        db.session.commit()
+        assert _stored() == {creator: (1, 3, 4)}
+
+        db.session.delete(bonus)
+        first.status = 'active'
+        db.session.commit()
+        assert _stored() == {creator: (2, 0, 2)}
+
+    def test_moving_a_subscription_between_creators(self, app):
+        from models import db
+        a, b, fan = _users('a', 'b', 'fan')
+        sub = _subscribe(a, fan)
+        sub.subscribed_to_id
+        sub.subscribed_to_id = b
+        db.session.commit()
+        assert _stored() == {a: (0, 0, 0), b: (1, 0, 1)}
+
+    def test_rollback_discards_the_increment(self, app):
+        from models import db, MobileSubscription
+        creator, fan = _users('creator', 'fan')
+        _subscribe(creator, fan)
+        db.session.add(MobileSubscription(subscriber_id=fan, subscribed_to_id=creator,
+                                          in_app_purchase_id=1, status='active'))
+        db.session.flush()
+        assert _stored()[creator][0] == 2
+        db.session.rollback()
+        assert _stored() == {creator: (1, 0, 1)}
+
+
+class TestReconcile:
+    def test_detects_and_repairs_drift_from_bulk_writes(self, app):
+        import subscriber_counts
+        from models import db, MobileSubscription
+        a, b, fan = _users('a', 'b', 'fan')
+        for _ in range(3):
+            _subscribe(a, fan)
+        _subscribe(b, fan)
+        assert subscriber_counts.reconcile(db.engine) == []
+
+        # Bulk UPDATE bypasses the unit of work, so the hook never sees it.
+        MobileSubscription.query.filter_by(subscribed_to_id=a).update(
+            {'status': 'expired'}, synchronize_session=False)
+        db.session.commit()
+        assert _stored()[a] == (3, 0, 3)
+
+        drift = subscriber_counts.reconcile(db.engine, repair=False)
+        assert [(uid, s.total, e.total) for uid, s, e in drift] == [(a, 3, 0)]
+        assert _stored()[a] == (3, 0, 3)
+        subscriber_counts.reconcile(db.engine)
+        assert _stored() == {a: (0, 0, 0), b: (1, 0, 1)}
+        assert subscriber_counts.reconcile(db.engine) == []
+
+
+class TestReaders:
+    def _client(self, app, uid):
+        from mobile_api import generate_jwt_token
+        headers = {'Authorization': f'Bearer {generate_jwt_token(uid, "viewer@example.com")}'}
+        return app.test_client(), headers
+
+    def test_get_is_a_single_primary_key_read(self, app):
+        import subscriber_counts
+        import perf_tracing
+        from models import db, AdminSubscription
+        creator, other, fan = _users('creator', 'other', 'fan')
+        _subscribe(creator, fan)
+        db.session.add(AdminSubscription(portfolio_user_id=creator, bonus_subscriber_count=4))
+        db.session.commit()
+        with perf_tracing.capture('counts') as trace:
+            counts = subscriber_counts.get(creator)
+        assert (counts.real, counts.gifted, counts.total) == (1, 4, 5)
+        assert trace.query_count == 1
+        assert subscriber_counts.get(other) == subscriber_counts.ZERO
+        assert subscriber_counts.get_many([creator, other]) == {
+            creator: (1, 4), other: (0, 0)}
+
+    def test_payouts_and_subscriptions_use_the_counter(self, app):
+        from models import db, AdminSubscription
+        creator, fan = _users('creator', 'fan')
+        for _ in range(2):
+            _subscribe(creator, fan)
+        db.session.add(AdminSubscription(portfolio_user_id=creator, bonus_subscriber_count=3))
+        db.session.commit()
+        client, headers = self._client(app, creator)
+
+        body = client.get('/api/mobile/subscriptions', headers=headers).get_json()
+        assert body['subscriber_count'] == 5
+        resp = client.get('/api/mobile/payouts', headers=headers)
+        assert resp.status_code == 200, resp.get_json()
+
+    def test_milestone_check_reads_the_counter(self, app, monkeypatch):
+        from models import db, AdminSubscription
+        from services import milestone_emails
+        sent = []
+        monkeypatch.setattr(milestone_emails, '_send_milestone_email',
+                            lambda user, milestone, total, real, gifted: sent.append((milestone, total, real, gifted)))
+        creator, fan = _users('creator', 'fan')
+        _subscribe(creator, fan)
+        db.session.add(AdminSubscription(portfolio_user_id=creator, bonus_subscriber_count=9))
+        db.session.commit()
+        milestone_emails.check_subscription_milestones(creator, fan)
+        assert sent == [(10, 10, 1, 9)]
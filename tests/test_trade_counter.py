@@ -0,0 +1,110 @@
+"""
+Tests for the per-user, per-day trade counter (trade_limit) and the
+set-based tier re-pricing in subscription_utils.py.
+
+Run with: pytest tests/test_trade_counter.py -v
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import perf_tracing
+
+
+@pytest.fixture
+def app(app):
+    from models import db, SubscriptionTier
+    db.session.add_all([
+        SubscriptionTier(tier_name=name, price=price, max_trades_per_day=cap, stripe_price_id=f'price_{name}')
+        for name, price, cap in [('Light', 8.0, 3), ('Standard', 12.0, 6), ('Active', 20.0, 12),
+                                 ('Pro', 30.0, 25), ('Elite', 50.0, 50)]
+    ])
+    db.session.commit()
+    return app
+
+
+def _users(n, price=8.0):
+    from models import db, User
+    users = [User(email=f'u{i}@example.com', username=f'u{i}', subscription_price=price,
+                  max_cash_deployed=0, cash_proceeds=0) for i in range(n)]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+class TestCounter:
+    def test_record_trade_upserts_and_returns_the_day_total(self, app):
+        import subscription_utils as su
+        user, = _users(1)
+        assert [su.record_trade(user.id) for _ in range(3)] == [1, 2, 3]
+        su.record_trade(user.id, datetime.utcnow() - timedelta(days=2), n=4)
+        su.record_trade(user.id, datetime.utcnow() - timedelta(days=9), n=100)  # outside the window
+        assert su.get_user_trade_count(user.id, 1) == 3
+        assert su.get_user_trade_count(user.id, 7) == 7
+
+    def test_process_transaction_counts_buys_and_sells_only(self, app):
+        from models import db
+        import subscription_utils as su
+        from cash_tracking import process_transaction
+        user, = _users(1)
+        for kind in ('initial', 'buy', 'sell', 'buy'):
+            process_transaction(db, user.id, 'AAPL', 1, 100.0, kind, suppress_notifications=True)
+        db.session.commit()
+        assert su.get_user_trade_count(user.id, 1) == 3
+
+    def test_rolled_back_trade_is_not_counted(self, app):
+        from models import db
+        import subscription_utils as su
+        from cash_tracking import process_transaction
+        user, = _users(1)
+        process_transaction(db, user.id, 'AAPL', 1, 100.0, 'buy', suppress_notifications=True)
+        db.session.rollback()
+        assert su.get_user_trade_count(user.id, 1) == 0
+
+    def test_rebuild_recounts_from_the_ledger(self, app):
+        from models import db, Transaction
+        import subscription_utils as su
+        user, = _users(1)
+        su.record_trade(user.id, n=99)
+        db.session.add_all([Transaction(user_id=user.id, ticker='AAPL', quantity=1, price=1.0,
+                                        transaction_type=kind, timestamp=datetime.utcnow())
+                            for kind in ('buy', 'sell', 'initial')])
+        db.session.commit()
+        assert su.rebuild_trade_counts() == 1
+        assert su.get_user_trade_count(user.id, 1) == 2
+
+
+class TestTiering:
+    def test_retier_is_one_statement(self, app):
+        from models import db, User
+        import subscription_utils as su
+        light, active, elite, unchanged = _users(4)
+        su.record_trade(active.id, n=50)                     # 50/7 ~ 7.1 a day
+        su.record_trade(elite.id, n=200)
+        su.record_trade(unchanged.id, n=21)                  # exactly 3 a day: still Light
+        su.record_trade(light.id, datetime.utcnow() - timedelta(days=8), n=500)   # outside the window
+        db.session.commit()
+        with perf_tracing.capture('retier') as trace:
+            assert su.retier_all_users() == 2
+        assert trace.query_count == 1
+        prices = dict(db.session.query(User.id, User.subscription_price))
+        assert prices == {light.id: 8.0, active.id: 20.0, elite.id: 50.0, unchanged.id: 8.0}
+        assert db.session.get(User, elite.id).stripe_price_id == 'price_Elite'
+
+    def test_retier_drops_users_without_recent_trades(self, app):
+        from models import db, User
+        import subscription_utils as su
+        user, = _users(1, price=30.0)
+        assert su.retier_all_users() == 1
+        assert db.session.get(User, user.id).subscription_price == 8.0
+
+    def test_daily_cap_check_reads_one_row(self, app):
+        from models import db
+        import subscription_utils as su
+        user, = _users(1)
+        su.record_trade(user.id, n=5)
+        db.session.expire_all()
+        with perf_tracing.capture('cap') as trace:
+            assert su.check_trade_limit_exceeded(user.id) == (True, 5, 3, 'Light')
+        assert trace.query_count == 3  # user, tier, counter row
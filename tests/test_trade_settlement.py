@@ -0,0 +1,120 @@
+"""
+Tests for market-open batch settlement of queued trades
+(services/trade_settlement.py, services.trading_email.process_queued_trades).
+
+Run with: pytest tests/test_trade_settlement.py -v
+"""
+
+from datetime import datetime, timedelta
+
+import perf_tracing
+
+
+def _user(name, holdings=()):
+    from models import db, User, Stock
+    user = User(email=f'{name}@example.com', username=name, max_cash_deployed=0.0, cash_proceeds=0.0)
+    db.session.add(user)
+    db.session.flush()
+    for ticker, qty, price in holdings:
+        db.session.add(Stock(user_id=user.id, ticker=ticker, quantity=qty, purchase_price=price))
+    db.session.commit()
+    return user.id
+
+
+def _queue(user_id, *trades):
+    from models import db, QueuedEmailTrade
+    start = datetime.utcnow() - timedelta(hours=12)
+    for i, (action, ticker, qty) in enumerate(trades):
+        db.session.add(QueuedEmailTrade(user_id=user_id, user_email=f'u{user_id}@example.com', ticker=ticker,
+                                        action=action, quantity=qty, queued_at=start + timedelta(minutes=i)))
+    db.session.commit()
+
+
+PRICES = {'AAPL': 100.0, 'MSFT': 50.0}
+
+
+class TestSettlement:
+    def test_per_user_order_and_per_trade_results(self, app):
+        from models import User, Stock, Transaction, QueuedEmailTrade
+        from services.trade_settlement import settle_queued_trades
+        alice = _user('alice', holdings=[('AAPL', 5, 80.0)])
+        bob = _user('bob')
+        _queue(bob, ('buy', 'MSFT', 4), ('sell', 'MSFT', 1))
+        _queue(alice, ('sell', 'AAPL', 5), ('buy', 'AAPL', 2), ('sell', 'AAPL', 9), ('buy', 'NOPE', 1))
+
+        result = settle_queued_trades(prices=PRICES, send_notifications=False)
+
+        assert (result['executed'], result['failed'], result['total']) == (4, 2, 6)
+        assert [(r['user_id'], r['action'], r['ticker'], r['status']) for r in result['results']] == [
+            (alice, 'sell', 'AAPL', 'executed'), (alice, 'buy', 'AAPL', 'executed'),
+            (alice, 'sell', 'AAPL', 'failed'), (alice, 'buy', 'NOPE', 'failed'),
+            (bob, 'buy', 'MSFT', 'executed'), (bob, 'sell', 'MSFT', 'executed'),
+        ]
+        assert result['results'][2]['error'] == 'Insufficient shares: have 2.0, need 9.0'
+        assert result['results'][3]['error'] == 'Price unavailable at market open'
+
+        a, b = User.query.get(alice), User.query.get(bob)
+        assert (a.cash_proceeds, a.max_cash_deployed) == (300.0, 0.0)      # +500 sale, -200 buy
+        assert (b.cash_proceeds, b.max_cash_deployed) == (50.0, 200.0)
+        assert [(s.ticker, s.quantity) for s in Stock.query.filter_by(user_id=alice)] == [('AAPL', 2)]
+        assert [(s.ticker, s.quantity) for s in Stock.query.filter_by(user_id=bob)] == [('MSFT', 3)]
+        ledger = Transaction.query.filter_by(user_id=alice).order_by(Transaction.timestamp).all()
+        assert [(t.transaction_type, t.price_source) for t in ledger] == [('sell', 'queued_email'),
+                                                                           ('buy', 'queued_email')]
+        assert {q.status for q in QueuedEmailTrade.query} == {'executed', 'failed'}
+        assert settle_queued_trades(prices=PRICES)['total'] == 0
+
+    def test_position_opened_and_closed_in_one_batch(self, app):
+        from models import Stock, Transaction
+        from services.trade_settlement import settle_queued_trades
+        uid = _user('frank')
+        _queue(uid, ('buy', 'AAPL', 3), ('sell', 'AAPL', 3), ('buy', 'AAPL', 1))
+        assert settle_queued_trades(prices=PRICES, send_notifications=False)['executed'] == 3
+        assert [(s.ticker, s.quantity) for s in Stock.query.filter_by(user_id=uid)] == [('AAPL', 1)]
+        assert Transaction.query.filter_by(user_id=uid).count() == 3
+
+    def test_trade_counter_bumped_once_per_user(self, app):
+        from services.trade_settlement import settle_queued_trades
+        from subscription_utils import get_user_trade_count
+        uid = _user('carol')
+        _queue(uid, *[('buy', 'AAPL', 1)] * 3)
+        settle_queued_trades(prices=PRICES, send_notifications=False)
+        assert get_user_trade_count(uid, 1) == 3
+
+    def test_statements_per_user_do_not_grow_with_trades(self, app):
+        from services.trade_settlement import settle_queued_trades
+        counts = []
+        for n in (2, 20):
+            uid = _user(f'trader{n}', holdings=[('AAPL', 100, 90.0)])
+            _queue(uid, *[('buy', 'AAPL', 1), ('sell', 'AAPL', 1)] * (n // 2))
+            with perf_tracing.capture('settle') as trace:
+                assert settle_queued_trades(prices=PRICES, send_notifications=False)['executed'] == n
+            counts.append(trace.query_count)
+        assert counts[0] == counts[1]
+
+    def test_notifications_run_after_commit_in_order(self, app, monkeypatch):
+        import cash_tracking
+        from models import db, QueuedEmailTrade
+        from services import trade_settlement
+        events = []
+
+        def fake_email(to, subject, body, **kw):
+            committed = db.session.execute(db.select(QueuedEmailTrade.status)).scalars().all()
+            events.append(('email', 'failed' if 'Failed' in subject else 'executed', 'queued' not in committed))
+
+        monkeypatch.setattr(trade_settlement, '_send_email', fake_email)
+        monkeypatch.setattr(cash_tracking, 'notify_trade',
+                            lambda db, user, action, ticker, *a, **kw: events.append(('fanout', action, ticker)))
+        uid = _user('dave', holdings=[('MSFT', 1, 10.0)])
+        _queue(uid, ('buy', 'AAPL', 1), ('sell', 'MSFT', 5))
+        trade_settlement.settle_queued_trades(prices=PRICES)
+        assert events[0][2] and events[2][2]
+        assert [e[:2] for e in events] == [('email', 'executed'), ('fanout', 'buy'), ('email', 'failed')]
+
+    def test_process_queued_trades_delegates(self, app, monkeypatch):
+        from services import trade_settlement, trading_email
+        monkeypatch.setattr(trade_settlement, 'fetch_prices', lambda tickers: dict(PRICES))
+        monkeypatch.setattr(trade_settlement, 'notify', lambda results, trades_today=None: None)
+        _queue(_user('erin'), ('buy', 'AAPL', 2))
+        result = trading_email.process_queued_trades()
+        assert (result['executed'], result['failed'], result['total']) == (1, 0, 1)
@@ -0,0 +1,100 @@
+"""
+Tests for the exchange trading calendar (trading_calendar.py) and the
+period / gate helpers built on it.
+
+Run with: pytest tests/test_trading_calendar.py -v
+"""
+
+import os
+import sys
+from datetime import date, datetime, time, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import trading_calendar as tc
+
+ET = tc.MARKET_TZ
+
+# Published NYSE schedules.
+NYSE_HOLIDAYS = {
+    2024: ['2024-01-01', '2024-01-15', '2024-02-19', '2024-03-29', '2024-05-27', '2024-06-19',
+           '2024-07-04', '2024-09-02', '2024-11-28', '2024-12-25'],
+    2026: ['2026-01-01', '2026-01-19', '2026-02-16', '2026-04-03', '2026-05-25', '2026-06-19',
+           '2026-07-03', '2026-09-07', '2026-11-26', '2026-12-25'],
+    2027: ['2027-01-01', '2027-01-18', '2027-02-15', '2027-03-26', '2027-05-31', '2027-06-18',
+           '2027-07-05', '2027-09-06', '2027-11-25', '2027-12-24'],
+}
+EARLY_CLOSES = ['2024-07-03', '2024-11-29', '2024-12-24', '2026-11-27', '2026-12-24', '2027-11-26']
+
+
+def d(s):
+    return date.fromisoformat(s)
+
+
+class TestSessions:
+    @pytest.mark.parametrize('year', sorted(NYSE_HOLIDAYS))
+    def test_holidays_match_exchange_schedule(self, year):
+        assert sorted(tc.holidays(year)) == [d(s) for s in NYSE_HOLIDAYS[year]]
+        for s in NYSE_HOLIDAYS[year]:
+            assert tc.is_holiday(d(s)) and not tc.is_session(d(s))
+
+    def test_saturday_new_year_is_not_made_up(self):
+        assert tc.is_session(d('2021-12-31'))
+        assert tc.is_holiday(d('2025-01-09'))   # special closure
+
+    def test_weekends_are_neither_sessions_nor_holidays(self):
+        assert not tc.is_session(d('2026-10-17')) and not tc.is_holiday(d('2026-10-17'))
+
+    @pytest.mark.parametrize('day', EARLY_CLOSES)
+    def test_early_closes(self, day):
+        assert tc.is_early_close(d(day))
+        assert tc.session_close(d(day)) == datetime.combine(d(day), time(13, 0), tzinfo=ET)
+        assert tc.minute_slots(d(day), step=15)[-1].time() == time(13, 0)
+
+    def test_navigation_skips_weekends_and_holidays(self):
+        assert tc.previous_session(d('2026-01-20')) == d('2026-01-16')     # MLK Monday
+        assert tc.next_session(d('2026-07-02')) == d('2026-07-06')
+        assert tc.session_on_or_before(d('2026-11-26')) == d('2026-11-25')  # Thanksgiving
+        assert tc.session_on_or_before(d('2026-11-25')) == d('2026-11-25')
+        assert tc.sessions_back(d('2026-11-30'), 4) == d('2026-11-23')
+        assert tc.sessions_between(d('2026-11-24'), d('2026-11-30')) == [
+            d('2026-11-24'), d('2026-11-25'), d('2026-11-27'), d('2026-11-30')]
+
+    def test_minute_slots(self):
+        slots = tc.minute_slots(d('2026-10-16'), step=15)
+        assert (slots[0].time(), slots[-1].time(), len(slots)) == (time(9, 30), time(16, 0), 27)
+        assert len(tc.minute_slots(d('2026-10-16'))) == 391
+        assert tc.minute_slots(d('2026-12-25')) == []
+
+    def test_is_open_and_last_completed_session(self):
+        assert tc.is_open(datetime(2026, 10, 16, 14, 0, tzinfo=timezone.utc))       # 10:00 ET
+        assert not tc.is_open(datetime(2026, 11, 27, 14, 0, tzinfo=ET))             # half-day
+        assert not tc.is_open(datetime(2026, 11, 26, 11, 0, tzinfo=ET))             # Thanksgiving
+        assert tc.last_completed_session(datetime(2026, 11, 30, 10, 0, tzinfo=ET)) == d('2026-11-27')
+        assert tc.last_completed_session(datetime(2026, 11, 27, 13, 5, tzinfo=ET)) == d('2026-11-27')
+
+    def test_outside_table_raises(self):
+        with pytest.raises(ValueError):
+            tc.session_on_or_before(date(tc.LAST_YEAR + 1, 1, 2))
+        with pytest.raises(ValueError):
+            tc.session_close(d('2026-12-25'))
+
+    def test_matches_weekday_scan(self):
+        day, sessions = d('2026-01-01'), []
+        while day.year == 2026:
+            if day.weekday() < 5 and day not in tc.holidays(2026):
+                sessions.append(day)
+            day = date.fromordinal(day.toordinal() + 1)
+        assert tc.sessions_between(d('2026-01-01'), d('2026-12-31')) == sessions
+
+
+class TestPeriodWindows:
+    def test_5d_window_spans_five_sessions(self, monkeypatch):
+        import portfolio_performance
+        from performance_calculator import get_period_dates
+        monkeypatch.setattr(portfolio_performance, 'get_market_date', lambda: d('2026-11-28'))
+        assert get_period_dates('5D') == (d('2026-11-20'), d('2026-11-27'))
+        assert get_period_dates('1D') == (d('2026-11-27'), d('2026-11-27'))
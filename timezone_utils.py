@@ -35,24 +35,14 @@ def get_market_hours_utc():
     }
 
 def is_market_hours(dt=None):
-    """Check if given datetime (or now) is during market hours - simplified"""
+    """Check if given datetime (or now; naive = UTC) is inside an exchange
+    session: holidays and 1 PM early closes per trading_calendar, DST-aware"""
+    import trading_calendar
     if dt is None:
         dt = datetime.now(timezone.utc)
     elif dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
-    
-    # Convert to Eastern time (subtract 4 hours for EDT)
-    eastern_time = dt - timedelta(hours=4)
-    
-    # Check if it's a weekday and within market hours
-    if eastern_time.weekday() >= 5:  # Saturday = 5, Sunday = 6
-        return False
-    
-    # Market hours: 9:30 AM - 4:00 PM Eastern
-    market_start = eastern_time.replace(hour=9, minute=30, second=0, microsecond=0)
-    market_end = eastern_time.replace(hour=16, minute=0, second=0, microsecond=0)
-    
-    return market_start <= eastern_time <= market_end
+    return trading_calendar.is_open(dt)
 
 def get_cron_schedule_for_market_hours():
     """Generate cron schedules that automatically adjust for DST"""
@@ -0,0 +1,250 @@
+"""
+NYSE trading calendar: sessions, holidays and 1 PM early closes.
+
+Period windows, chart ranges and cron gates used to do their own weekday
+arithmetic (Mon-Fri = open), so crons ran and collected intraday points on
+market holidays, 5D windows spanned closed days and half-days were treated
+as full 9:30-16:00 sessions.
+
+The session table for FIRST_YEAR..LAST_YEAR is computed once at import from
+the exchange's holiday rules (plus the ad hoc closures in SPECIAL_CLOSURES):
+no network, no database, safe for bot_agent.py on GitHub Actions. Every
+lookup is a dict / list index:
+
+    is_session(d)                 regular or early-close trading day
+    is_holiday(d)                 weekday the exchange is closed
+    session_on_or_before(d)       last market day as of d
+    previous_session(d)           strictly before d
+    next_session(d)               strictly after d
+    sessions_back(d, n)           n sessions before session_on_or_before(d)
+    sessions_between(start, end)  sessions in [start, end]
+    session_open(d) / session_close(d) / is_early_close(d)
+    minute_slots(d, step)         open..close every `step` minutes (ET)
+    is_open(dt)                   dt inside a session
+    last_completed_session(dt)    most recent session whose close has passed
+
+Dates are exchange-local (America/New_York). Functions taking `d` also
+accept a datetime (aware ones are converted to ET first).
+"""
+
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+MARKET_TZ = ZoneInfo('America/New_York')
+
+FIRST_YEAR = 2000
+LAST_YEAR = 2050
+
+REGULAR_OPEN = time(9, 30)
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+# Unscheduled full-day closures (not derivable from the rules).
+SPECIAL_CLOSURES = {
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),  # 9/11
+    date(2004, 6, 11),   # President Reagan's funeral
+    date(2007, 1, 2),    # President Ford's funeral
+    date(2012, 10, 29), date(2012, 10, 30),  # Hurricane Sandy
+    date(2018, 12, 5),   # President G.H.W. Bush's funeral
+    date(2025, 1, 9),    # President Carter's funeral
+}
+
+
+def _nth_weekday(year, month, weekday, n):
+    """n-th (1-based) `weekday` of the month; n=-1 for the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+def _observed(day):
+    """Saturday holidays close the Friday before, Sunday ones the Monday after."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def holidays(year):
+    """Full-day exchange holidays of `year` (observed dates)."""
+    days = {
+        _nth_weekday(year, 2, 0, 3),                 # Washington's Birthday
+        _easter(year) - timedelta(days=2),           # Good Friday
+        _nth_weekday(year, 5, 0, -1),                # Memorial Day
+        _observed(date(year, 7, 4)),                 # Independence Day
+        _nth_weekday(year, 9, 0, 1),                 # Labor Day
+        _nth_weekday(year, 11, 3, 4),                # Thanksgiving
+        _observed(date(year, 12, 25)),               # Christmas
+    }
+    # New Year's Day on a Saturday is not made up on Dec 31.
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 1998:
+        days.add(_nth_weekday(year, 1, 0, 3))        # Martin Luther King Jr. Day
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))       # Juneteenth
+    return {d for d in days if d.year == year and d.weekday() < 5}
+
+
+def _early_closes(year, closed):
+    """1 PM closes: July 3, the day after Thanksgiving and Christmas Eve,
+    when those are otherwise trading days."""
+    candidates = [date(year, 7, 3), _nth_weekday(year, 11, 3, 4) + timedelta(days=1), date(year, 12, 24)]
+    return {d for d in candidates if d.weekday() < 5 and d not in closed}
+
+
+def _build():
+    closed = set(SPECIAL_CLOSURES)
+    early = set()
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        closed |= holidays(year)
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        early |= _early_closes(year, closed)
+
+    first, last = date(FIRST_YEAR, 1, 1), date(LAST_YEAR, 12, 31)
+    sessions, floor = [], []
+    day = first
+    while day <= last:
+        if day.weekday() < 5 and day not in closed:
+            sessions.append(day)
+        floor.append(len(sessions) - 1)   # index of the session on or before `day`
+        day += timedelta(days=1)
+    return sessions, {d: i for i, d in enumerate(sessions)}, floor, frozenset(early)
+
+
+_SESSIONS, _INDEX, _FLOOR, _EARLY = _build()
+_BASE = date(FIRST_YEAR, 1, 1).toordinal()
+
+
+def _day(d):
+    if isinstance(d, datetime):
+        return (d.astimezone(MARKET_TZ) if d.tzinfo else d).date()
+    return d
+
+
+def _floor(d):
+    offset = d.toordinal() - _BASE
+    if not 0 <= offset < len(_FLOOR):
+        raise ValueError(f"{d} is outside the trading calendar ({FIRST_YEAR}-{LAST_YEAR})")
+    return _FLOOR[offset]
+
+
+def _session(i):
+    if not 0 <= i < len(_SESSIONS):
+        raise ValueError(f"session index out of the trading calendar ({FIRST_YEAR}-{LAST_YEAR})")
+    return _SESSIONS[i]
+
+
+def is_session(d):
+    """True if the exchange trades on `d` (including early-close days)."""
+    return _day(d) in _INDEX
+
+
+def is_holiday(d):
+    """True if `d` is a weekday on which the exchange is closed."""
+    d = _day(d)
+    return d.weekday() < 5 and d not in _INDEX
+
+
+def is_early_close(d):
+    return _day(d) in _EARLY
+
+
+def session_on_or_before(d):
+    """`d` if it is a session, else the last session before it."""
+    return _session(_floor(_day(d)))
+
+
+def previous_session(d):
+    d = _day(d)
+    i = _floor(d)
+    return _session(i - 1 if _SESSIONS[i] == d else i)
+
+
+def next_session(d):
+    return _session(_floor(_day(d)) + 1)
+
+
+def sessions_back(d, n):
+    """The session `n` sessions before session_on_or_before(d) (n=0: itself)."""
+    return _session(_floor(_day(d)) - n)
+
+
+def sessions_between(start, end):
+    """Sessions in [start, end], oldest first."""
+    start, end = _day(start), _day(end)
+    if end < start:
+        return []
+    i = _floor(start)
+    if i < 0 or _SESSIONS[i] != start:
+        i += 1
+    return _SESSIONS[i:_floor(end) + 1]
+
+
+def _require(d):
+    d = _day(d)
+    if d not in _INDEX:
+        raise ValueError(f"{d} is not a trading session")
+    return d
+
+
+def session_open(d):
+    """Opening bell of session `d` (aware ET datetime)."""
+    return datetime.combine(_require(d), REGULAR_OPEN, tzinfo=MARKET_TZ)
+
+
+def session_close(d):
+    """Closing bell of session `d` (aware ET datetime): 16:00, or 13:00 on early-close days."""
+    d = _require(d)
+    return datetime.combine(d, EARLY_CLOSE if d in _EARLY else REGULAR_CLOSE, tzinfo=MARKET_TZ)
+
+
+def minute_slots(d, step=1):
+    """ET datetimes from the open to the close of session `d` every `step`
+    minutes (close included when on the grid). [] when `d` is not a session."""
+    if not is_session(d):
+        return []
+    slot, close = session_open(d), session_close(d)
+    slots = []
+    while slot <= close:
+        slots.append(slot)
+        slot += timedelta(minutes=step)
+    return slots
+
+
+def _now(dt):
+    if dt is None:
+        return datetime.now(MARKET_TZ)
+    # Naive datetimes are taken as ET wall-clock time.
+    return dt.astimezone(MARKET_TZ) if dt.tzinfo else dt.replace(tzinfo=MARKET_TZ)
+
+
+def is_open(dt=None):
+    """True if `dt` (default now) falls between a session's open and close."""
+    dt = _now(dt)
+    d = dt.date()
+    return d in _INDEX and session_open(d) <= dt <= session_close(d)
+
+
+def last_completed_session(dt=None):
+    """Most recent session whose close is at or before `dt` (default now)."""
+    dt = _now(dt)
+    d = session_on_or_before(dt.date())
+    return d if session_close(d) <= dt else previous_session(d)
@@ -34,7 +34,10 @@ import hashlib
 import secrets
 import logging
 import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from urllib.parse import urlencode
 
 logger = logging.getLogger(__name__)
@@ -45,6 +48,14 @@ XERO_TOKEN_URL = 'https://identity.xero.com/connect/token'
 XERO_CONNECTIONS_URL = 'https://api.xero.com/connections'
 XERO_API_BASE = 'https://api.xero.com/api.xro/2.0'
 
+# Bulk payout sync. Xero allows 5 concurrent calls and 60 calls/minute per
+# tenant, and up to 50 contacts or invoices per POST, so month-end sends bills
+# in batches over a small worker pool instead of one call per creator.
+XERO_MAX_CONCURRENCY = max(1, min(5, int(os.environ.get('XERO_MAX_CONCURRENCY', '4'))))
+XERO_BATCH_SIZE = 50
+XERO_CONTACT_LOOKUP_CHUNK = 25   # Name=="..." OR ... clauses per GET (URL length)
+XERO_RATE_LIMIT_RETRIES = 3
+
 # Xero OAuth2 scopes (granular — app created after March 2, 2026)
 # Ref: https://developer.xero.com/documentation/guides/oauth2/scopes/
 # PKCE (code_challenge + code_verifier) is required.
@@ -285,17 +296,40 @@ def _xero_get(endpoint, token):
     return resp
 
 
-def _xero_post(endpoint, token, json_data):
+def _xero_post(endpoint, token, json_data, params=None):
     """POST request to Xero API with auto token refresh."""
     resp = requests.post(
         f"{XERO_API_BASE}/{endpoint}",
         headers=_xero_headers(token),
         json=json_data,
+        params=params,
         timeout=15,
     )
     return resp
 
 
+def _xero_request(method, endpoint, token, json=None, params=None):
+    """Bulk-path Xero call: `method` is requests.get/post/put. Waits out a 429
+    (Retry-After) up to XERO_RATE_LIMIT_RETRIES times before giving up."""
+    for attempt in range(XERO_RATE_LIMIT_RETRIES + 1):
+        resp = method(
+            f"{XERO_API_BASE}/{endpoint}",
+            headers=_xero_headers(token),
+            json=json,
+            params=params,
+            timeout=30,
+        )
+        if resp.status_code != 429 or attempt == XERO_RATE_LIMIT_RETRIES:
+            return resp
+        try:
+            wait = float(resp.headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            wait = 1.0
+        logger.warning(f"Xero rate limit on {endpoint}; retrying in {wait:.0f}s")
+        time.sleep(min(wait, 60))
+    return resp
+
+
 # ── Contact Group for 1099 Filtering ─────────────────────────────────────
 
 _1099_group_id_cache = None
@@ -354,6 +388,24 @@ def _add_contact_to_1099_group(token, contact_id):
     return False
 
 
+def _add_contacts_to_1099_group(token, contact_ids):
+    """Add many contacts to the '1099 Contractors' group, XERO_BATCH_SIZE per PUT."""
+    if not contact_ids:
+        return True
+    group_id = get_or_create_1099_contact_group(token)
+    if not group_id:
+        return False
+    ok = True
+    for i in range(0, len(contact_ids), XERO_BATCH_SIZE):
+        chunk = contact_ids[i:i + XERO_BATCH_SIZE]
+        resp = _xero_request(requests.put, f'ContactGroups/{group_id}/Contacts', token,
+                             json={'Contacts': [{'ContactID': cid} for cid in chunk]})
+        if resp.status_code != 200:
+            ok = False
+            logger.warning(f"Failed to add {len(chunk)} contacts to 1099 group: {resp.status_code} {resp.text}")
+    return ok
+
+
 # ── Contact Management ─────────────────────────────────────────────────────
 
 def find_or_create_contact(token, username, email=None):
@@ -419,6 +471,65 @@ def find_or_create_contact(token, username, email=None):
     return None
 
 
+def _where_name_in(names):
+    return ' OR '.join('Name=="{}"'.format(n.replace('"', '\\"')) for n in names)
+
+
+def find_contacts_by_name(token, names):
+    """Look up many contacts by Name in a few GETs. Returns {name: ContactID}."""
+    found = {}
+    names = sorted(set(names))
+    for i in range(0, len(names), XERO_CONTACT_LOOKUP_CHUNK):
+        chunk = names[i:i + XERO_CONTACT_LOOKUP_CHUNK]
+        resp = _xero_request(requests.get, 'Contacts', token, params={'where': _where_name_in(chunk)})
+        if resp.status_code != 200:
+            logger.warning(f"Xero contact lookup failed for {len(chunk)} names: {resp.status_code} {resp.text[:200]}")
+            continue
+        for c in resp.json().get('Contacts', []):
+            found.setdefault(c.get('Name'), c.get('ContactID'))
+    return found
+
+
+def find_or_create_contacts(token, people):
+    """Batched find_or_create_contact for many creators.
+
+    `people` is {username: email}. One lookup GET per XERO_CONTACT_LOOKUP_CHUNK
+    names, one create/update POST per XERO_BATCH_SIZE contacts, and a single
+    '1099 Contractors' group PUT for everyone. Returns {username: ContactID};
+    names Xero rejected are missing from the result.
+    """
+    existing = find_contacts_by_name(token, people)
+    payload = []
+    for username, email in people.items():
+        contact = {'Name': username, 'ContactStatus': 'ACTIVE', 'IsSupplier': True}
+        if email:
+            contact['EmailAddress'] = email
+        if existing.get(username):
+            contact['ContactID'] = existing[username]
+        payload.append(contact)
+
+    contact_ids = {}
+    for i in range(0, len(payload), XERO_BATCH_SIZE):
+        chunk = payload[i:i + XERO_BATCH_SIZE]
+        resp = _xero_request(requests.post, 'Contacts', token, json={'Contacts': chunk},
+                             params={'summarizeErrors': 'false'})
+        if resp.status_code != 200:
+            logger.error(f"Xero contact batch failed ({len(chunk)} contacts): {resp.status_code} {resp.text[:500]}")
+            # Updates to contacts we already found don't block billing.
+            contact_ids.update({c['Name']: c['ContactID'] for c in chunk if c.get('ContactID')})
+            continue
+        for sent, got in zip(chunk, resp.json().get('Contacts', [])):
+            if got.get('HasValidationErrors') or got.get('ValidationErrors'):
+                logger.error(f"Xero rejected contact {sent['Name']}: {got.get('ValidationErrors')}")
+                if sent.get('ContactID'):
+                    contact_ids[sent['Name']] = sent['ContactID']
+                continue
+            contact_ids[sent['Name']] = got.get('ContactID') or sent.get('ContactID')
+
+    _add_contacts_to_1099_group(token, list(contact_ids.values()))
+    return contact_ids
+
+
 def contact_has_tax_number(username):
     """Check if a Xero contact has a TaxNumber (TIN) on file.
     
@@ -544,27 +655,9 @@ def update_contact_tax_info(username, email, w9):
 
 # ── Bill Creation ──────────────────────────────────────────────────────────
 
-def create_bill_for_payout(token, payout_record, username, email=None):
-    """Create a bill (Accounts Payable) in Xero for an influencer payout.
-    
-    Args:
-        token: Valid XeroOAuthToken
-        payout_record: XeroPayoutRecord instance
-        username: Influencer's username
-        email: Influencer's email (optional)
-    
-    Returns:
-        dict with 'invoice_id' and 'contact_id' on success, or 'error' on failure
-    """
-    from models import AdminSubscription
-    
-    # Ensure we have a contact (with W-9 data if available)
-    contact_id = payout_record.xero_contact_id
-    if not contact_id:
-        contact_id = find_or_create_contact(token, username, email)
-        if not contact_id:
-            return {'error': f'Failed to find/create Xero contact for {username}'}
-    
+def _payout_bill(payout_record, username, contact_id):
+    """The ACCPAY invoice payload for one payout record, or None when there
+    is nothing to bill (zero net payout)."""
     # Build line items from the record's ACTUAL dollar amounts (transaction-driven
     # and already net of any refund clawback), NOT count×rate — annual subs and
     # clawbacks make the per-sub rate wrong as a multiplier.
@@ -598,24 +691,47 @@ def create_bill_for_payout(token, payout_record, username, email=None):
         })
     
     if not line_items:
-        return {'error': 'No line items to bill (zero net payout)'}
+        return None
     
     # Due date: 30 days from now
     due_date = (datetime.utcnow() + timedelta(days=30)).strftime('%Y-%m-%d')
     period_label = f"{payout_record.period_start.strftime('%b %Y')}"
     
-    bill_data = {
-        'Invoices': [{
-            'Type': 'ACCPAY',  # Accounts Payable = bill
-            'Contact': {'ContactID': contact_id},
-            'Date': datetime.utcnow().strftime('%Y-%m-%d'),
-            'DueDate': due_date,
-            'Reference': f'Payout-{username}-{period_label}',
-            'Status': 'AUTHORISED',
-            'CurrencyCode': 'USD',
-            'LineItems': line_items,
-        }]
+    return {
+        'Type': 'ACCPAY',  # Accounts Payable = bill
+        'Contact': {'ContactID': contact_id},
+        'Date': datetime.utcnow().strftime('%Y-%m-%d'),
+        'DueDate': due_date,
+        'Reference': f'Payout-{username}-{period_label}',
+        'Status': 'AUTHORISED',
+        'CurrencyCode': 'USD',
+        'LineItems': line_items,
     }
+
+
+def create_bill_for_payout(token, payout_record, username, email=None):
+    """Create a bill (Accounts Payable) in Xero for an influencer payout.
+    
+    Args:
+        token: Valid XeroOAuthToken
+        payout_record: XeroPayoutRecord instance
+        username: Influencer's username
+        email: Influencer's email (optional)
+    
+    Returns:
+        dict with 'invoice_id' and 'contact_id' on success, or 'error' on failure
+    """
+    # Ensure we have a contact (with W-9 data if available)
+    contact_id = payout_record.xero_contact_id
+    if not contact_id:
+        contact_id = find_or_create_contact(token, username, email)
+        if not contact_id:
+            return {'error': f'Failed to find/create Xero contact for {username}'}
+    
+    invoice = _payout_bill(payout_record, username, contact_id)
+    if invoice is None:
+        return {'error': 'No line items to bill (zero net payout)'}
+    bill_data = {'Invoices': [invoice]}
     
     resp = _xero_post('Invoices', token, bill_data)
     
@@ -635,9 +751,38 @@ def create_bill_for_payout(token, payout_record, username, email=None):
 
 # ── Sync Payout Records to Xero ───────────────────────────────────────────
 
+def _post_bill_batch(token, batch):
+    """POST one batch of (record_id, username, invoice) bills. Runs in a worker
+    thread, so it touches no ORM state. Returns [(record_id, invoice_id, error)]."""
+    try:
+        resp = _xero_request(requests.post, 'Invoices', token,
+                             json={'Invoices': [invoice for _rid, _name, invoice in batch]},
+                             params={'summarizeErrors': 'false'})
+    except Exception as e:
+        return [(rid, None, f'Xero request failed: {e}') for rid, _name, _inv in batch]
+    if resp.status_code != 200:
+        error = f'Xero API error {resp.status_code}: {resp.text[:500]}'
+        return [(rid, None, error) for rid, _name, _inv in batch]
+    out = []
+    for (rid, username, _inv), got in zip(batch, resp.json().get('Invoices', [])):
+        errors = got.get('ValidationErrors') or []
+        if got.get('HasErrors') or errors or not got.get('InvoiceID'):
+            message = '; '.join(e.get('Message', '') for e in errors) or 'Xero returned no InvoiceID'
+            out.append((rid, None, f'Xero API error: {message}'[:500]))
+        else:
+            out.append((rid, got['InvoiceID'], None))
+    return out
+
+
 def sync_payout_records_to_xero(period_start=None, period_end=None):
     """Sync pending XeroPayoutRecord entries as bills in Xero.
     
+    Records and their creators load in one query; contacts for creators
+    without a cached xero_contact_id are resolved in bulk
+    (find_or_create_contacts); bills go out XERO_BATCH_SIZE per POST on up to
+    XERO_MAX_CONCURRENCY threads. Workers only make HTTP calls — all record
+    updates and sync-log rows are applied here and committed once.
+    
     Args:
         period_start: Only sync records for this period (date)
         period_end: Only sync records for this period (date)
@@ -650,17 +795,20 @@ def sync_payout_records_to_xero(period_start=None, period_end=None):
     token = get_valid_token()
     if not token:
         return {'error': 'No valid Xero token — connect at /api/mobile/admin/xero/connect first'}
+    # Plain copy for the worker threads (no lazy loads off the request thread).
+    creds = SimpleNamespace(access_token=token.access_token, tenant_id=token.tenant_id)
     
     # Get pending payout records (skip held — those need tax info first)
-    query = XeroPayoutRecord.query.filter_by(xero_sync_status='pending').filter(
-        XeroPayoutRecord.payment_status != 'held'
+    query = db.session.query(XeroPayoutRecord, User).outerjoin(
+        User, User.id == XeroPayoutRecord.portfolio_user_id
+    ).filter(
+        XeroPayoutRecord.xero_sync_status == 'pending',
+        XeroPayoutRecord.payment_status != 'held',
     )
     if period_start:
-        query = query.filter_by(period_start=period_start)
+        query = query.filter(XeroPayoutRecord.period_start == period_start)
     if period_end:
-        query = query.filter_by(period_end=period_end)
-    
-    records = query.all()
+        query = query.filter(XeroPayoutRecord.period_end == period_end)
     
     results = {
         'synced': [],
@@ -670,70 +818,91 @@ def sync_payout_records_to_xero(period_start=None, period_end=None):
         'total_amount': 0.0,
     }
     
-    for record in records:
-        user = User.query.get(record.portfolio_user_id)
-        if not user:
+    to_bill = []
+    for record, user in query.all():
+        # Skip missing users and bots
+        if not user or getattr(user, 'role', None) == 'agent':
             results['skipped'] += 1
             continue
-        
-        # Skip bots
-        if hasattr(user, 'role') and user.role == 'agent':
-            results['skipped'] += 1
+        to_bill.append((record, user))
+    
+    need_contact = {user.username: getattr(user, 'email', None)
+                    for record, user in to_bill if not record.xero_contact_id}
+    contact_ids = find_or_create_contacts(creds, need_contact) if need_contact else {}
+    
+    by_id = {}
+    outcomes = []
+    batch = []
+    for record, user in to_bill:
+        by_id[record.id] = (record, user)
+        contact_id = record.xero_contact_id or contact_ids.get(user.username)
+        if not contact_id:
+            outcomes.append((record.id, None, f'Failed to find/create Xero contact for {user.username}'))
+            continue
+        record.xero_contact_id = contact_id
+        invoice = _payout_bill(record, user.username, contact_id)
+        if invoice is None:
+            outcomes.append((record.id, None, 'No line items to bill (zero net payout)'))
             continue
-        
-        email = getattr(user, 'email', None)
-        bill_result = create_bill_for_payout(token, record, user.username, email)
-        
-        if 'error' in bill_result:
+        batch.append((record.id, user.username, invoice))
+    
+    batches = [batch[i:i + XERO_BATCH_SIZE] for i in range(0, len(batch), XERO_BATCH_SIZE)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(XERO_MAX_CONCURRENCY, len(batches))) as pool:
+            for batch_outcomes in pool.map(lambda b: _post_bill_batch(creds, b), batches):
+                outcomes.extend(batch_outcomes)
+    
+    now = datetime.utcnow()
+    for record_id, invoice_id, error in outcomes:
+        record, user = by_id[record_id]
+        if error:
             record.xero_sync_status = 'failed'
-            record.xero_error = bill_result['error']
+            record.xero_error = error
             results['failed'].append({
                 'user_id': record.portfolio_user_id,
                 'username': user.username,
-                'error': bill_result['error'],
+                'error': error,
             })
             
             # Log failure
-            log = XeroSyncLog(
+            db.session.add(XeroSyncLog(
                 sync_type='monthly_payout',
                 entity_id=record.id,
                 entity_type='xero_payout_record',
                 amount=record.total_payout,
                 status='failed',
-                error_message=bill_result['error'],
-            )
-            db.session.add(log)
+                error_message=error,
+            ))
         else:
-            record.xero_invoice_id = bill_result['invoice_id']
-            record.xero_contact_id = bill_result['contact_id']
+            record.xero_invoice_id = invoice_id
             record.xero_sync_status = 'synced'
-            record.xero_synced_at = datetime.utcnow()
+            record.xero_synced_at = now
             results['synced'].append({
                 'user_id': record.portfolio_user_id,
                 'username': user.username,
-                'invoice_id': bill_result['invoice_id'],
+                'invoice_id': invoice_id,
                 'amount': record.total_payout,
             })
             results['total_amount'] += record.total_payout
             
             # Log success
-            log = XeroSyncLog(
+            db.session.add(XeroSyncLog(
                 sync_type='monthly_payout',
                 entity_id=record.id,
                 entity_type='xero_payout_record',
-                xero_invoice_id=bill_result['invoice_id'],
-                xero_contact_id=bill_result['contact_id'],
+                xero_invoice_id=invoice_id,
+                xero_contact_id=record.xero_contact_id,
                 amount=record.total_payout,
                 status='success',
-            )
-            db.session.add(log)
+            ))
     
     db.session.commit()
     
     logger.info(
         f"Xero sync complete: {len(results['synced'])} synced, "
         f"{len(results['failed'])} failed, {results['skipped']} skipped, "
-        f"${results['total_amount']:.2f} total"
+        f"${results['total_amount']:.2f} total "
+        f"({len(batches)} bill batches, {XERO_MAX_CONCURRENCY} max concurrent)"
     )
     
     return results